@@ -84,6 +84,14 @@ class UserAdmin(BaseUserAdmin):
     
     readonly_fields = ('uid',)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Name / student_id / email go through the indexed search_text column (core.user_search)
+        from .user_search import search_users
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return search_users(queryset, search_term) | queryset.filter(uid=search_term), False
+
     add_fieldsets = (
         (None, {
             'classes': ('wide',),
@@ -0,0 +1,1041 @@
+"""
+Compiled answer keys for Reading and Listening scoring.
+
+A test's parts -> questions -> options tree is loaded once per revision
+(`test.updated_at`) and turned into plain key objects: normalized answer
+alternatives as frozensets, per-question scoring mode and points, and
+gap/table/matching sub-key maps. Scoring a session is then a single pass
+over the compiled questions with no ORM access and no JSON re-parsing.
+
+The breakdown format is the one `create_detailed_breakdown` has always
+returned, so results, exports and AI feedback read it unchanged.
+"""
+import logging
+import re
+import threading
+from contextlib import contextmanager
+
+from django.db.models import Prefetch
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache_utils import TTLCache
+from .models import (
+    ListeningTest, ListeningPart, ListeningQuestion, ListeningAnswerOption,
+    ReadingTest, ReadingPart, ReadingQuestion, ReadingAnswerOption,
+)
+
+logger = logging.getLogger(__name__)
+
+GAP_RE = re.compile(r'\[\[(\d+)\]\]')
+_NON_ANSWER_CHARS_RE = re.compile(r'[^A-Za-z0-9 \n]')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+MULTIPLE_RESPONSE_TYPES = ['multiple_response', 'checkbox', 'multi_select', 'multipleresponse']
+SINGLE_CHOICE_TYPES = ['multiple_choice', 'single_choice', 'radio', 'true_false_not_given', 'true_false', 'yes_no_not_given']
+GAP_FILL_TYPES = ['gap_fill', 'gapfill', 'sentence_completion', 'summary_completion', 'note_completion', 'flow_chart', 'short_answer', 'shortanswer']
+TABLE_TYPES = ['table', 'table_completion', 'tablecompletion', 'form', 'form_completion']
+
+# (test_type, test_id) -> AnswerKey; a stale revision is recompiled on next use.
+_compiled_keys = TTLCache(maxsize=256)
+
+
+def normalize_answer(ans):
+    if not isinstance(ans, str):
+        return ''
+    ans = _NON_ANSWER_CHARS_RE.sub('', ans)
+    ans = _WHITESPACE_RE.sub(' ', ans.replace('\n', ' '))
+    return ans.strip().upper()
+
+
+def compile_alternatives(correct_answer_text):
+    """Normalized set of accepted answers; alternatives are separated by |."""
+    if not isinstance(correct_answer_text, str):
+        correct_answer_text = str(correct_answer_text) if correct_answer_text else ''
+    return frozenset(normalize_answer(alt) for alt in correct_answer_text.split('|'))
+
+
+def check_alternative_answers(user_answer, correct_answer_text):
+    """
+    Проверяет ответ пользователя против правильного ответа с поддержкой альтернатив.
+    Если в correct_answer_text есть |, то проверяются все альтернативы.
+
+    Args:
+        user_answer: ответ пользователя
+        correct_answer_text: правильный ответ, может содержать альтернативы через |
+
+    Returns:
+        bool: True если ответ правильный
+    """
+    return normalize_answer(user_answer) in compile_alternatives(correct_answer_text)
+
+
+def format_alternative_answers_display(correct_answer_text):
+    """
+    Форматирует альтернативные ответы для отображения в UI.
+    Если есть альтернативы через |, показывает их через " / ".
+
+    Args:
+        correct_answer_text: правильный ответ, может содержать альтернативы через |
+
+    Returns:
+        str: отформатированная строка для отображения
+    """
+    if not isinstance(correct_answer_text, str):
+        return str(correct_answer_text) if correct_answer_text else ''
+
+    if '|' in correct_answer_text:
+        alternatives = [alt.strip() for alt in correct_answer_text.split('|')]
+        # Заменяем пустые альтернативы на "(empty)" для отображения
+        formatted_alternatives = [alt if alt else "(empty)" for alt in alternatives]
+        return ' / '.join(formatted_alternatives)
+    else:
+        return correct_answer_text
+
+
+def normalize_correct_answers_for_gaps(correct_answers, question_type):
+    """
+    Нормализует correct_answers для gap_fill типов вопросов.
+    Для reading СОХРАНЯЕТ оригинальные номера gap'ов.
+    Для listening нормализует к последовательности 1,2,3...
+
+    Args:
+        correct_answers: может быть списком строк ['text1', 'text2'] или списком словарей [{'number': 1, 'answer': 'text1'}]
+        question_type: тип вопроса
+
+    Returns:
+        list: список словарей с ключами 'number' и 'answer'
+    """
+    if question_type not in ['gap_fill', 'gapfill', 'sentence_completion', 'summary_completion', 'note_completion', 'flow_chart']:
+        return correct_answers
+
+    if not isinstance(correct_answers, list):
+        return []
+
+    normalized = []
+    for idx, item in enumerate(correct_answers):
+        if isinstance(item, str):
+            # Простая строка - делаем словарь с последовательным номером
+            normalized.append({
+                'number': idx + 1,
+                'answer': item
+            })
+        elif isinstance(item, dict):
+            # Словарь - СОХРАНЯЕМ оригинальный номер для reading
+            if 'answer' in item:
+                original_number = item.get('number', idx + 1)
+                # Конвертируем строковые номера в числа
+                if isinstance(original_number, str):
+                    try:
+                        original_number = int(original_number)
+                    except:
+                        original_number = idx + 1
+                normalized.append({
+                    'number': original_number,  # СОХРАНЯЕМ оригинальный номер!
+                    'answer': item['answer']
+                })
+            else:
+                # Неизвестный формат - пытаемся извлечь как строку
+                answer_text = str(item) if item else ''
+                normalized.append({
+                    'number': idx + 1,
+                    'answer': answer_text
+                })
+        else:
+            # Не строка и не словарь - конвертируем в строку
+            normalized.append({
+                'number': idx + 1,
+                'answer': str(item) if item is not None else ''
+            })
+
+    return normalized
+
+
+def _is_user_match(user_answer, alternatives):
+    return normalize_answer(user_answer) in alternatives
+
+
+class QuestionKey:
+    """
+    Scoring data for one question. Subclasses precompute everything that
+    depends only on the question in `compile()` and implement `score()`,
+    which returns (sub_questions, correct_sub_questions, total_sub_questions).
+    """
+
+    def __init__(self, question, options, test_type):
+        self.question = question
+        self.options = options
+        self.test_type = test_type
+        self.qid = str(question.id)
+        if test_type == 'reading':
+            scoring_mode = getattr(question, 'reading_scoring_type', 'total')
+        else:
+            scoring_mode = getattr(question, 'scoring_mode', 'total')
+        self.info = {
+            'question_id': question.id,
+            'question_text': question.question_text or '',
+            'question_type': question.question_type,
+            'header': getattr(question, 'header', ''),
+            'instruction': getattr(question, 'instruction', ''),
+            'image_url': getattr(question, 'image_url', getattr(question, 'image', None)),
+            'points': getattr(question, 'points', 1),
+            'scoring_mode': scoring_mode,
+        }
+        self.compile()
+
+    def compile(self):
+        pass
+
+    def score(self, answers):
+        raise NotImplementedError
+
+    def error_entry(self, error):
+        question = self.question
+        return {
+            'question_id': question.id,
+            'question_text': question.question_text or '',
+            'question_type': question.question_type,
+            'header': getattr(question, 'header', ''),
+            'instruction': getattr(question, 'instruction', ''),
+            'sub_questions': [{
+                'sub_id': 'error',
+                'label': 'Error processing question',
+                'user_answer': 'Error',
+                'correct_answer': 'Error',
+                'is_correct': False,
+                'error': str(error)
+            }],
+            'correct_sub_questions': 0,
+            'total_sub_questions': 1,
+            'points': 0
+        }
+
+    def evaluate(self, answers):
+        try:
+            sub_questions, correct, total = self.score(answers)
+        except Exception as e:
+            logger.exception('Error processing question %s', self.question.id)
+            return self.error_entry(e)
+        info = self.info
+        return {
+            'question_id': info['question_id'],
+            'question_text': info['question_text'],
+            'question_type': info['question_type'],
+            'header': info['header'],
+            'instruction': info['instruction'],
+            'image_url': info['image_url'],
+            'sub_questions': sub_questions,
+            'correct_sub_questions': correct,
+            'total_sub_questions': total,
+            'points': info['points'],
+            'scoring_mode': info['scoring_mode'],
+        }
+
+
+class BrokenQuestionKey(QuestionKey):
+    """A question whose stored key could not be compiled; always scores as an error."""
+
+    def __init__(self, question, options, test_type, error):
+        self.error = error
+        super().__init__(question, options, test_type)
+
+    def score(self, answers):
+        raise self.error
+
+
+class UnsupportedQuestionKey(QuestionKey):
+    def score(self, answers):
+        return [{
+            'sub_id': 'unknown', 'label': 'Unknown question type', 'user_answer': '',
+            'correct_answer': '', 'is_correct': False,
+            'error': f'Unsupported question type: {self.question.question_type}'
+        }], 0, 0
+
+
+class ReadingMultipleResponseKey(QuestionKey):
+    """Reading multiple_response: answers[qid] is a list of selected option texts."""
+
+    def compile(self):
+        question = self.question
+        self.mode = question.reading_scoring_type
+        self.correct_labels = frozenset(opt.label for opt in self.options if opt.is_correct)
+        self.option_rows = [(opt.label, opt.text, opt.is_correct, opt.reading_points) for opt in self.options]
+        if self.mode == 'all_or_nothing':
+            self.max_score = question.points
+        else:
+            self.max_score = sum(points for _, _, is_correct, points in self.option_rows if is_correct)
+
+    def score(self, answers):
+        raw = answers.get(self.qid)
+        selected = set()
+        if isinstance(raw, list):
+            chosen_texts = {value for value in raw if isinstance(value, str)}
+            selected = {label for label, text, _, _ in self.option_rows if text in chosen_texts}
+
+        is_question_correct = selected == self.correct_labels
+        if self.mode == 'all_or_nothing':
+            earned = self.max_score if is_question_correct else 0
+        else:
+            earned = sum(
+                points for label, _, is_correct, points in self.option_rows
+                if is_correct and label in selected
+            )
+
+        options_data = [{
+            'label': label,
+            'text': text,
+            'student_selected': label in selected,
+            'is_correct_option': is_correct,
+            'points': points
+        } for label, text, is_correct, points in self.option_rows]
+
+        return [{
+            'type': 'multiple_response',
+            'is_correct': is_question_correct,
+            'scoring_mode': self.mode,
+            'selected_count': len(selected),
+            'correct_count': len(self.correct_labels),
+            'options': options_data,
+            'user_answer': f"Selected {len(selected)} option(s)",
+            'correct_answer': f"Should select {len(self.correct_labels)} option(s)"
+        }], earned, self.max_score
+
+
+class ListeningMultipleResponseKey(QuestionKey):
+    """
+    Listening multiple_response: either {qid}__{label} flags or a Reading-style
+    list of option texts under answers[qid].
+    """
+
+    def compile(self):
+        question = self.question
+        self.correct_labels = frozenset(q.strip() for q in (question.correct_answers or []))
+        self.mode = getattr(question, 'scoring_mode', 'total')
+        self.option_rows = [
+            (opt.label, opt.text, f"{question.id}__{opt.label}", getattr(opt, 'points', 1))
+            for opt in self.options
+        ]
+        self.points_by_label = {}
+        for label, _, _, points in self.option_rows:
+            self.points_by_label.setdefault(label, points)
+
+    def score(self, answers):
+        selected = set()
+        raw = answers.get(self.qid)
+        if isinstance(raw, list):
+            chosen_texts = {value for value in raw if isinstance(value, str)}
+            selected = {label for label, text, _, _ in self.option_rows if text in chosen_texts}
+        else:
+            for label, _, flag_key, _ in self.option_rows:
+                value = answers.get(flag_key)
+                if value is True or str(value).lower() == 'true' or value == label:
+                    selected.add(label)
+
+        if self.mode == 'total':
+            total = 1
+            correct = 1 if selected == self.correct_labels else 0
+        else:
+            total = len(self.correct_labels)
+            correct = sum(self.points_by_label[label] for label in selected if label in self.correct_labels)
+
+        sub_questions = []
+        for label, text, _, points in self.option_rows:
+            was_selected = label in selected
+            should_be_selected = label in self.correct_labels
+            sub_questions.append({
+                'sub_id': label,
+                'label': text,
+                'user_answer': 'Selected' if was_selected else '(not selected)',
+                'correct_answer': 'Should be selected' if should_be_selected else 'Should not be selected',
+                'is_correct': was_selected == should_be_selected,
+                'points': points
+            })
+        return sub_questions, correct, total
+
+
+class ChoiceGroupKey(QuestionKey):
+    """multiple_choice_group: several single-choice items stored in extra_data['group_items']."""
+
+    def compile(self):
+        question = self.question
+        extra_data = getattr(question, 'extra_data', {}) or {}
+        self.items = []
+        for idx, item in enumerate(extra_data.get('group_items') or []):
+            correct_label = str(item.get('correct_answer') or '').strip()
+            item_points = item.get('points', 1)
+            try:
+                item_points = float(item_points)
+            except (TypeError, ValueError):
+                item_points = 1
+            self.items.append((
+                str(item.get('id') or f'item_{idx}'),
+                item.get('prompt') or '',
+                item.get('options') or [],
+                correct_label,
+                compile_alternatives(correct_label),
+                item_points,
+            ))
+        self.total = sum(item[5] for item in self.items)
+
+    def score(self, answers):
+        raw_group_answers = answers.get(self.qid, {})
+        group_answers = {}
+        if isinstance(raw_group_answers, dict):
+            group_answers.update({str(k): v for k, v in raw_group_answers.items()})
+
+        correct = 0
+        sub_questions = []
+        for item_id, prompt, options, correct_label, alternatives, item_points in self.items:
+            if item_id in group_answers:
+                user_label = group_answers[item_id]
+            else:
+                user_label = answers.get(f"{self.qid}__{item_id}")
+            is_correct = _is_user_match(user_label, alternatives)
+            if is_correct:
+                correct += item_points
+            sub_questions.append({
+                'sub_id': item_id,
+                'label': prompt,
+                'user_answer': user_label or '(empty)',
+                'correct_answer': correct_label,
+                'is_correct': is_correct,
+                'points': item_points,
+                'options': options
+            })
+        return sub_questions, correct, self.total
+
+
+class StatementsKey(QuestionKey):
+    """Reading true_false_not_given: one sub-question per statement, answers[qid]['stmtN']."""
+
+    def compile(self):
+        extra_data = getattr(self.question, 'extra_data', {})
+        statements = extra_data.get('statements', [])
+        expected = extra_data.get('answers', [])
+        self.statements = []
+        for idx, statement in enumerate(statements):
+            correct_answer = expected[idx] if idx < len(expected) else 'True'
+            self.statements.append((
+                f"stmt{idx}", f"statement_{idx}", statement, correct_answer, compile_alternatives(correct_answer)
+            ))
+
+    def score(self, answers):
+        correct = 0
+        sub_questions = []
+        for answer_key, sub_id, statement, correct_answer, alternatives in self.statements:
+            user_answer = answers.get(self.qid, {}).get(answer_key)
+            is_correct = _is_user_match(user_answer, alternatives)
+            if is_correct:
+                correct += 1
+            sub_questions.append({
+                'sub_id': sub_id,
+                'label': statement,
+                'user_answer': user_answer or '(empty)',
+                'correct_answer': correct_answer,
+                'is_correct': is_correct
+            })
+        return sub_questions, correct, len(self.statements)
+
+
+class SingleChoiceKey(QuestionKey):
+    """multiple_choice / true_false / yes_no_not_given with one expected answer."""
+
+    def compile(self):
+        question = self.question
+        if self.test_type == 'reading' and question.question_type == 'multiple_choice':
+            correct_option = next((opt for opt in self.options if opt.is_correct), None)
+            self.correct_label = correct_option.label if correct_option else ''
+            self.reads_text_field = True
+        else:
+            ca = question.correct_answers
+            self.correct_label = str(ca[0]).strip() if (isinstance(ca, list) and ca) else str(ca).strip()
+            self.reads_text_field = False
+        self.alternatives = compile_alternatives(self.correct_label)
+        self.label = question.header or question.question_text
+        # Listening stores the chosen option as a {qid}__{label} flag.
+        self.option_flags = []
+        if self.test_type == 'listening':
+            self.option_flags = [(opt.label, f"{question.id}__{opt.label}") for opt in self.options]
+
+    def score(self, answers):
+        if self.reads_text_field:
+            question_answer = answers.get(self.qid, {})
+            user_answer_label = question_answer.get('text') if isinstance(question_answer, dict) else None
+        else:
+            user_answer_label = answers.get(self.qid)
+
+        if user_answer_label is None:
+            for label, flag_key in self.option_flags:
+                option_value = answers.get(flag_key)
+                if option_value is True or option_value == label:
+                    user_answer_label = label
+                    break
+
+        is_correct = _is_user_match(user_answer_label, self.alternatives)
+        return [{
+            'sub_id': self.question.id,
+            'label': self.label,
+            'user_answer': user_answer_label or '(empty)',
+            'correct_answer': self.correct_label,
+            'is_correct': is_correct
+        }], 1 if is_correct else 0, 1
+
+
+class GapFillKey(QuestionKey):
+    """Gap fill and its variants: answers[qid]['gapN'] or answers['{qid}__gapN']."""
+
+    def compile(self):
+        question = self.question
+        correct_answers_list = normalize_correct_answers_for_gaps(question.correct_answers, question.question_type)
+
+        if not correct_answers_list and question.question_type in ['short_answer', 'shortanswer']:
+            correct_answers_list = [{'number': 1, 'answer': str(question.correct_answers[0]) if question.correct_answers else ''}]
+
+        # Listening: номера gap'ов берутся из [[N]] в тексте вопроса
+        if self.test_type == 'listening' and question.question_text:
+            gap_matches = GAP_RE.findall(question.question_text)
+            if gap_matches and isinstance(question.correct_answers, list):
+                correct_answers_list = [
+                    {'number': int(gap_matches[idx]), 'answer': answer_text}
+                    for idx, answer_text in enumerate(question.correct_answers)
+                    if idx < len(gap_matches)
+                ]
+
+        # Убираем пустые ответы и артефакты создания (number == '1')
+        correct_answers_list = [
+            item for item in correct_answers_list
+            if item.get('answer', '').strip() and item.get('number', '') != '1'
+        ]
+
+        self.gaps = []
+        for idx, item in enumerate(correct_answers_list):
+            gap_number = str(item.get('number', idx + 1))
+            correct_val = item['answer']
+            self.gaps.append((
+                f"gap{gap_number}",
+                f"{question.id}__gap{gap_number}",
+                f"Answer {gap_number}",
+                compile_alternatives(correct_val),
+                format_alternative_answers_display(correct_val),
+            ))
+        self.single = len(self.gaps) == 1
+
+    def score(self, answers):
+        correct = 0
+        sub_questions = []
+        nested = answers.get(self.qid)
+        if not isinstance(nested, dict):
+            nested = None
+        for sub_id, flat_key, label, alternatives, display in self.gaps:
+            user_val = nested.get(sub_id) if nested is not None else None
+            if user_val is None:
+                user_val = answers.get(flat_key)
+            if user_val is None and self.single:
+                user_val = answers.get(self.qid)
+
+            is_correct = _is_user_match(user_val, alternatives)
+            if is_correct:
+                correct += 1
+            sub_questions.append({
+                'sub_id': sub_id,
+                'label': label,
+                'user_answer': user_val or '(empty)',
+                'correct_answer': display,
+                'is_correct': is_correct,
+            })
+        return sub_questions, correct, len(self.gaps)
+
+
+class TableKey(QuestionKey):
+    """Table and form completion: one point per answer cell/field."""
+
+    def compile(self):
+        question = self.question
+        correct_answers_map = {}
+        if isinstance(question.correct_answers, list) and question.correct_answers and isinstance(question.correct_answers[0], dict):
+            correct_answers_map = {item['id']: item['answer'] for item in question.correct_answers}
+
+        # Для таблиц ключи строятся как r{row}c{col}__gap{number}, как их сохраняет фронтенд
+        if question.extra_data and (question.question_type in ['table', 'table_completion', 'tablecompletion']):
+            if 'cells' in question.extra_data.get('table', {}):
+                correct_answers_map = {}
+                for r, row in enumerate(question.extra_data['table']['cells']):
+                    for c, cell in enumerate(row):
+                        cell_text = cell.get('text', '') if isinstance(cell, dict) else ''
+                        if cell_text:
+                            for match in GAP_RE.finditer(cell_text):
+                                gap_number = match.group(1)
+                                correct_gap = None
+                                if question.extra_data and 'gaps' in question.extra_data:
+                                    correct_gap = next((g for g in question.extra_data['gaps'] if str(g.get('number', '')) == gap_number), None)
+                                elif isinstance(question.correct_answers, list) and question.correct_answers:
+                                    correct_gap = next((g for g in question.correct_answers if str(g.get('number', '')) == gap_number), None)
+                                if correct_gap:
+                                    correct_answers_map[f"r{r}c{c}__gap{gap_number}"] = correct_gap.get('answer', '')
+
+        # Если карта пуста, пытаемся построить из extra_data (для других типов вопросов)
+        if not correct_answers_map and question.extra_data:
+            if 'cells' in question.extra_data.get('table', {}): # Table (Listening)
+                for r, row in enumerate(question.extra_data['table']['cells']):
+                    for c, cell in enumerate(row):
+                        cell_text = cell.get('text', '') if isinstance(cell, dict) else ''
+                        if cell_text:
+                            for match in GAP_RE.finditer(cell_text):
+                                gap_number = match.group(1)
+                                correct_gap = None
+                                if question.gaps and isinstance(question.gaps, list):
+                                    correct_gap = next((g for g in question.gaps if str(g.get('number', '')) == gap_number), None)
+                                elif question.extra_data and 'gaps' in question.extra_data:
+                                    correct_gap = next((g for g in question.extra_data['gaps'] if str(g.get('number', '')) == gap_number), None)
+                                correct_answers_map[f"r{r}c{c}__gap{gap_number}"] = correct_gap.get('answer', '') if correct_gap else ''
+                        elif cell.get('isAnswer'):
+                            correct_answers_map[f"r{r}c{c}"] = cell.get('answer', '')
+            elif 'rows' in question.extra_data: # Table (Reading)
+                for r, row in enumerate(question.extra_data['rows']):
+                    for c, cell in enumerate(row):
+                        cell_text = ''
+                        if isinstance(cell, dict):
+                            cell_text = cell.get('text', cell.get('content', ''))
+                        elif isinstance(cell, str):
+                            cell_text = cell
+
+                        if cell_text:
+                            for match in GAP_RE.finditer(cell_text):
+                                gap_number = match.group(1)
+                                correct_val = ''
+                                if question.extra_data and 'answers' in question.extra_data:
+                                    correct_val = question.extra_data['answers'].get(gap_number, '')
+                                    if not isinstance(correct_val, str):
+                                        correct_val = ''
+                                if not correct_val and question.gaps and isinstance(question.gaps, list):
+                                    correct_gap = next((g for g in question.gaps if str(g.get('number', '')) == gap_number), None)
+                                    if correct_gap:
+                                        correct_val = correct_gap.get('answer', '')
+                                elif not correct_val and question.extra_data and 'gaps' in question.extra_data:
+                                    correct_gap = next((g for g in question.extra_data['gaps'] if str(g.get('number', '')) == gap_number), None)
+                                    if correct_gap:
+                                        correct_val = correct_gap.get('answer', '')
+                                correct_answers_map[f"r{r}c{c}__gap{gap_number}"] = correct_val
+                        elif isinstance(cell, dict) and cell.get('type') == 'gap':
+                            correct_answers_map[f"r{r}c{c}"] = cell.get('answer', '')
+            elif 'fields' in question.extra_data: # Form
+                for i, field in enumerate(question.extra_data['fields']):
+                    if field.get('isAnswer'):
+                        correct_answers_map[f"field{i}"] = field.get('answer', '')
+
+        self.cells = []
+        for sub_id, correct_val in correct_answers_map.items():
+            label = sub_id
+            if '__gap' in sub_id:
+                label = f"Gap {sub_id.split('__gap')[-1]}"
+            elif sub_id.startswith('gap'):
+                label = f"Gap {sub_id.replace('gap', '')}"
+            self.cells.append((
+                sub_id,
+                f"{question.id}__{sub_id}",
+                sub_id.startswith('r') and '__gap' in sub_id,
+                label,
+                compile_alternatives(correct_val),
+                format_alternative_answers_display(correct_val),
+            ))
+
+    @staticmethod
+    def _answers_by_cell_suffix(answers):
+        """
+        Maps 'r{row}c{col}__gap{N}' to the value of the first answer key ending
+        in it, for answers saved under a different question id prefix.
+        """
+        by_suffix = {}
+        for key, value in answers.items():
+            if not isinstance(key, str):
+                continue
+            pieces = key.rsplit('__', 2)
+            if len(pieces) != 3:
+                continue
+            suffix = f"{pieces[1]}__{pieces[2]}"
+            if value and suffix not in by_suffix:
+                by_suffix[suffix] = value
+        return by_suffix
+
+    def score(self, answers):
+        correct = 0
+        sub_questions = []
+        by_suffix = None
+        for sub_id, flat_key, is_gap_cell, label, alternatives, display in self.cells:
+            user_val = answers.get(flat_key)
+            if is_gap_cell and not user_val:
+                if by_suffix is None:
+                    by_suffix = self._answers_by_cell_suffix(answers)
+                user_val = by_suffix.get(sub_id, user_val)
+
+            is_correct = _is_user_match(user_val, alternatives)
+            if is_correct:
+                correct += 1
+            sub_questions.append({
+                'sub_id': sub_id,
+                'label': label,
+                'user_answer': user_val or '(empty)',
+                'correct_answer': display,
+                'is_correct': is_correct,
+            })
+        return sub_questions, correct, len(self.cells)
+
+
+def _key_class_for(question, test_type):
+    question_type = question.question_type
+    if question_type in MULTIPLE_RESPONSE_TYPES:
+        return ReadingMultipleResponseKey if test_type == 'reading' else ListeningMultipleResponseKey
+    if question_type == 'multiple_choice_group':
+        return ChoiceGroupKey
+    if question_type in SINGLE_CHOICE_TYPES:
+        if test_type == 'reading' and question_type == 'true_false_not_given':
+            return StatementsKey
+        return SingleChoiceKey
+    if question_type in GAP_FILL_TYPES:
+        return GapFillKey
+    if question_type in TABLE_TYPES:
+        return TableKey
+    return UnsupportedQuestionKey
+
+
+def compile_question(question, options, test_type):
+    try:
+        return _key_class_for(question, test_type)(question, options, test_type)
+    except Exception as e:
+        return BrokenQuestionKey(question, options, test_type, e)
+
+
+class CompiledPart:
+    def __init__(self, part, questions):
+        self.part = part
+        self.questions = questions
+        self.info = {
+            'part_number': part.part_number,
+            'instructions': getattr(part, 'instructions', ''),
+            'passage_text': getattr(part, 'passage_text', ''),
+        }
+
+
+class AnswerKey:
+    """All compiled questions of one test revision, in scoring order."""
+
+    def __init__(self, test, test_type, parts):
+        self.test_id = test.pk
+        self.test_type = test_type
+        self.revision = test.updated_at
+        self.parts = parts
+
+    def score(self, answers):
+        """Scores an answers dict; returns {'raw_score', 'total_score', 'breakdown'}."""
+        detailed_breakdown = []
+        total_raw_score = 0
+        total_possible_score = 0
+        for compiled_part in self.parts:
+            part_data = dict(compiled_part.info)
+            part_data['questions'] = []
+            for question_key in compiled_part.questions:
+                question_data = question_key.evaluate(answers)
+                total_raw_score += question_data['correct_sub_questions']
+                total_possible_score += question_data['total_sub_questions']
+                part_data['questions'].append(question_data)
+            detailed_breakdown.append(part_data)
+        return {
+            'raw_score': total_raw_score,
+            'total_score': total_possible_score,
+            'breakdown': detailed_breakdown
+        }
+
+
+def _load_parts(test, test_type):
+    if test_type == 'reading':
+        question_model, options_name, option_model = ReadingQuestion, 'answer_options', ReadingAnswerOption
+    else:
+        question_model, options_name, option_model = ListeningQuestion, 'options', ListeningAnswerOption
+    questions_qs = question_model.objects.order_by('order', 'id').prefetch_related(
+        Prefetch(options_name, queryset=option_model.objects.order_by('id'))
+    )
+    return list(
+        test.parts.order_by('part_number', 'id')
+        .prefetch_related(Prefetch('questions', queryset=questions_qs))
+    ), options_name
+
+
+def compile_answer_key(test, test_type):
+    parts, options_name = _load_parts(test, test_type)
+    compiled_parts = []
+    for part in parts:
+        questions = [
+            compile_question(question, list(getattr(question, options_name).all()), test_type)
+            for question in part.questions.all()
+        ]
+        compiled_parts.append(CompiledPart(part, questions))
+    return AnswerKey(test, test_type, compiled_parts)
+
+
+def get_answer_key(test, test_type):
+    """
+    Returns the compiled key for `test`, compiling it on first use and again
+    whenever the test's revision (`updated_at`) changes.
+    """
+    cache_key = (test_type, test.pk)
+    answer_key = _compiled_keys.get(cache_key)
+    if answer_key is None or answer_key.revision != test.updated_at:
+        answer_key = compile_answer_key(test, test_type)
+        _compiled_keys.set(cache_key, answer_key)
+    return answer_key
+
+
+def clear_answer_key_cache():
+    _compiled_keys.clear()
+
+
+# --- Result shaping shared by the submit views and the regrade command ---
+
+
+def reading_band_score(raw_score, total_score=40):
+    # Официальная таблица IELTS Reading band score
+    # Приводим к стандартной шкале из 40 вопросов
+    if total_score != 40 and total_score > 0:
+        normalized_score = (raw_score / total_score) * 40
+    else:
+        normalized_score = raw_score
+
+    # Официальная таблица IELTS Reading
+    if normalized_score >= 39: return 9.0
+    if normalized_score >= 37: return 8.5
+    if normalized_score >= 35: return 8.0
+    if normalized_score >= 33: return 7.5
+    if normalized_score >= 30: return 7.0
+    if normalized_score >= 27: return 6.5
+    if normalized_score >= 23: return 6.0
+    if normalized_score >= 19: return 5.5
+    if normalized_score >= 15: return 5.0
+    if normalized_score >= 13: return 4.5
+    if normalized_score >= 10: return 4.0
+    if normalized_score >= 8: return 3.5
+    if normalized_score >= 6: return 3.0
+    if normalized_score >= 4: return 2.5
+    return 2.0  # Минимальный band score
+
+
+def listening_band_score(score, total=40):
+    # Эта шкала примерная и должна быть уточнена
+    if score >= 39: return 9.0
+    if score >= 37: return 8.5
+    if score >= 35: return 8.0
+    if score >= 32: return 7.5
+    if score >= 30: return 7.0
+    if score >= 27: return 6.5
+    if score >= 23: return 6.0
+    if score >= 19: return 5.5
+    if score >= 15: return 5.0
+    if score >= 12: return 4.5
+    if score >= 10: return 4.0
+    if score >= 8: return 3.5
+    if score >= 6: return 3.0
+    return 2.5
+
+
+def reading_result_breakdown(breakdown):
+    """Reshapes the per-part breakdown into the {question_id: ...} map stored on ReadingTestResult."""
+    # Преобразуем массив частей в объект с вопросами для фронтенда
+    full_breakdown = {}
+    for part in breakdown:
+        for question in part['questions']:
+            question_id = str(question['question_id'])
+
+            # Для multiple_response вопросов создаем специальную структуру
+            if question['question_type'] == 'multiple_response':
+                # Обрабатываем новую структуру multiple_response (один элемент с опциями)
+                multiple_response_data = None
+                for sub_question in question['sub_questions']:
+                    if sub_question.get('type') == 'multiple_response':
+                        multiple_response_data = sub_question
+                        break
+
+                if multiple_response_data:
+                    # Используем данные из нового формата
+                    full_breakdown[question_id] = {
+                        'question_text': question['question_text'],
+                        'question_type': question['question_type'],
+                        'header': question['header'],
+                        'instruction': question['instruction'],
+                        'part_number': part.get('part_number'),
+                        'sub_questions': [{
+                            'id': question_id,
+                            'question_text': question['question_text'],
+                            'type': 'multiple_response',
+                            'options': multiple_response_data.get('options', []),
+                            'scoring_mode': multiple_response_data.get('scoring_mode', 'total'),
+                            'final_score': question['correct_sub_questions'],
+                            'max_score': question['total_sub_questions'],
+                            'is_correct': multiple_response_data.get('is_correct', False)
+                        }]
+                    }
+                else:
+                    # Fallback для старой структуры (если она еще используется)
+                    full_breakdown[question_id] = {
+                        'question_text': question['question_text'],
+                        'question_type': question['question_type'],
+                        'header': question['header'],
+                        'instruction': question['instruction'],
+                        'part_number': part.get('part_number'),
+                        'sub_questions': [{
+                            'id': question_id,
+                            'question_text': question['question_text'],
+                            'type': 'multiple_response',
+                            'options': [],
+                            'scoring_mode': question.get('scoring_mode', 'total'),
+                            'final_score': question['correct_sub_questions'],
+                            'max_score': question['total_sub_questions']
+                        }]
+                    }
+
+                    # Добавляем опции из старой структуры
+                    for sub_question in question['sub_questions']:
+                        if 'sub_id' in sub_question:  # Проверяем что это старая структура
+                            full_breakdown[question_id]['sub_questions'][0]['options'].append({
+                                'label': sub_question['sub_id'],
+                                'text': sub_question['label'],
+                                'is_correct_option': sub_question['correct_answer'] == 'Should be selected',
+                                'student_selected': sub_question['user_answer'] == 'Selected',
+                                'points': sub_question.get('points', 1)
+                            })
+            else:
+                # Для обычных вопросов используем стандартную структуру
+                full_breakdown[question_id] = {
+                    'question_text': question['question_text'],
+                    'question_type': question['question_type'],
+                    'header': question['header'],
+                    'instruction': question['instruction'],
+                    'part_number': part.get('part_number'),
+                    'sub_questions': question['sub_questions']
+                }
+    return full_breakdown
+
+
+def build_reading_results(breakdown_result):
+    raw_score = breakdown_result['raw_score']
+    total_possible_score = breakdown_result['total_score']
+    return {
+        'raw_score': raw_score,
+        'total_score': total_possible_score,
+        'band_score': reading_band_score(raw_score, total_possible_score),
+        'breakdown': reading_result_breakdown(breakdown_result['breakdown']),
+    }
+
+
+def build_listening_results(breakdown_result):
+    """Adds band score (and the points-based fallback total) to a Listening breakdown."""
+    breakdown_data = breakdown_result.get('breakdown', [])
+    raw_score = breakdown_result.get('raw_score', 0)
+    total_score = breakdown_result.get('total_score', 0)
+
+    # 2. Считаем баллы на основе breakdown (если не посчитано)
+    if raw_score == 0 and total_score == 0:
+        for part in breakdown_data:
+            for question in part['questions']:
+                question_id = question.get('question_id')
+                question_type = question.get('question_type')
+                correct_sub = question.get('correct_sub_questions', 0)
+                total_sub = question.get('total_sub_questions', 0)
+                points_per_sub = question.get('points', 1)
+
+                # Для multiple response в режиме per_correct не умножаем на points вопроса
+                if question_type == 'multiple_response' and question.get('scoring_mode', 'total') == 'per_correct':
+                    question_score = correct_sub  # Уже посчитано правильно
+                    question_total = total_sub
+                elif question_type == 'multiple_choice_group':
+                    # Для multiple_choice_group баллы уже учтены в correct_sub_questions и total_sub_questions
+                    # (каждый item имеет свои points), поэтому не умножаем на points вопроса
+                    question_score = correct_sub
+                    question_total = total_sub
+                else:
+                    question_score = correct_sub * points_per_sub
+                    question_total = total_sub * points_per_sub
+
+                raw_score += question_score
+                total_score += question_total
+
+    # 3. Конвертируем в band
+    band_score = listening_band_score(raw_score, 40) # В IELTS Listening всегда 40 вопросов
+
+    # 4. Возвращаем все данные
+    result = {
+        'detailed_breakdown': breakdown_data,
+        'raw_score': raw_score,
+        'total_score': total_score,
+        'band_score': band_score,
+    }
+
+    return result
+
+
+# --- Revision tracking ---
+# Any change below the test row bumps test.updated_at, so every worker sees a
+# new revision and recompiles on its next submission.
+
+_deferred = threading.local()
+
+
+@contextmanager
+def single_revision_bump(test):
+    """
+    Bulk edits of a test's tree: the per-row receivers below stay quiet inside
+    the block and the revision is bumped once when it completes.
+    """
+    _deferred.depth = getattr(_deferred, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _deferred.depth -= 1
+    test.updated_at = timezone.now()
+    type(test).objects.filter(pk=test.pk).update(updated_at=test.updated_at)
+
+
+def _bump_revision(test_qs, **kwargs):
+    if kwargs.get('raw') or getattr(_deferred, 'depth', 0):
+        return
+    origin = kwargs.get('origin')
+    origin_model = getattr(origin, 'model', type(origin))
+    if origin_model in (ListeningTest, ReadingTest):
+        # Cascade from deleting the test itself
+        return
+    test_qs.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=ListeningPart)
+@receiver(post_delete, sender=ListeningPart)
+def _listening_part_changed(sender, instance, **kwargs):
+    _bump_revision(ListeningTest.objects.filter(pk=instance.test_id), **kwargs)
+
+
+@receiver(post_save, sender=ListeningQuestion)
+@receiver(post_delete, sender=ListeningQuestion)
+def _listening_question_changed(sender, instance, **kwargs):
+    _bump_revision(ListeningTest.objects.filter(parts=instance.part_id), **kwargs)
+
+
+@receiver(post_save, sender=ListeningAnswerOption)
+@receiver(post_delete, sender=ListeningAnswerOption)
+def _listening_option_changed(sender, instance, **kwargs):
+    _bump_revision(ListeningTest.objects.filter(parts__questions=instance.question_id), **kwargs)
+
+
+@receiver(post_save, sender=ReadingPart)
+@receiver(post_delete, sender=ReadingPart)
+def _reading_part_changed(sender, instance, **kwargs):
+    _bump_revision(ReadingTest.objects.filter(pk=instance.test_id), **kwargs)
+
+
+@receiver(post_save, sender=ReadingQuestion)
+@receiver(post_delete, sender=ReadingQuestion)
+def _reading_question_changed(sender, instance, **kwargs):
+    _bump_revision(ReadingTest.objects.filter(parts=instance.part_id), **kwargs)
+
+
+@receiver(post_save, sender=ReadingAnswerOption)
+@receiver(post_delete, sender=ReadingAnswerOption)
+def _reading_option_changed(sender, instance, **kwargs):
+    _bump_revision(ReadingTest.objects.filter(parts__questions=instance.question_id), **kwargs)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Registers the rollup, teacher assignment, search text and published test signal receivers
+        from . import published_tests  # noqa: F401
+        from . import rollups  # noqa: F401
+        from . import teacher_assignment  # noqa: F401
+        from . import user_search  # noqa: F401
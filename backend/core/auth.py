@@ -1,8 +1,40 @@
+import copy
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from rest_framework.authentication import BaseAuthentication
 from core.firebase_config import verify_firebase_token
 from core.models import User
+from core.cache_utils import TTLCache
 from rest_framework.exceptions import AuthenticationFailed
 
+# Short-lived uid -> User cache so repeat requests skip the lookup query.
+_users_by_uid = TTLCache(
+    maxsize=getattr(settings, 'FIREBASE_USER_CACHE_MAX_ENTRIES', 5000),
+    default_ttl=getattr(settings, 'FIREBASE_USER_CACHE_TTL', 60),
+)
+
+
+def get_user_by_uid(uid):
+    """Returns a fresh copy of the cached User; raises User.DoesNotExist."""
+    user = _users_by_uid.get(uid)
+    if user is None:
+        user = User.objects.get(uid=uid)
+        _users_by_uid.set(uid, user)
+    return copy.copy(user)
+
+
+def clear_user_cache():
+    _users_by_uid.clear()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _evict_cached_user(sender, instance, **kwargs):
+    _users_by_uid.delete(instance.uid)
+
+
 class FirebaseAuthentication(BaseAuthentication):
     def authenticate(self, request):
         auth_header = request.META.get('HTTP_AUTHORIZATION')
@@ -16,7 +48,7 @@ class FirebaseAuthentication(BaseAuthentication):
 
         uid = decoded_token['uid']
         try:
-            user = User.objects.get(uid=uid)
+            user = get_user_by_uid(uid)
             return (user, None)
         except User.DoesNotExist:
             raise AuthenticationFailed("User not registered. Please contact administrator.")
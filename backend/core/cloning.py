@@ -0,0 +1,59 @@
+"""
+Deep copies of Listening/Reading test trees.
+
+``clone_test`` reads the source parts, questions and options in one query per
+table and inserts the copies with one ``bulk_create`` per table, pointing each
+copied row at its new parent through an old-id -> copy map kept in memory. A
+full test clones in a handful of queries whatever its size.
+
+Audio paths and question images are shared with the source by reference (the
+stored file names are copied, the files themselves are not), as the clone
+actions have always done. The copy starts inactive and is never a diagnostic
+template.
+"""
+from django.db import transaction
+from django.db.models import FileField
+
+from .editor_save import LISTENING_STRUCTURE, READING_STRUCTURE
+
+CLONE_STRUCTURES = {
+    'listening': LISTENING_STRUCTURE,
+    'reading': READING_STRUCTURE,
+}
+
+
+def _copy(obj, **overrides):
+    """Unsaved copy of ``obj``: every concrete field except the pk and auto timestamps."""
+    model = type(obj)
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.primary_key or getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            continue
+        value = getattr(obj, field.attname)
+        if isinstance(field, FileField):
+            # The name only: the copy points at the same stored file
+            value = value.name if value else None
+        values[field.attname] = value
+    for name, value in overrides.items():
+        values.pop(model._meta.get_field(name).attname, None)
+        values[name] = value
+    return model(**values)
+
+
+@transaction.atomic
+def clone_test(source, kind, title=None, batch_size=500):
+    """Copies ``source`` with its parts, questions and options; returns the new test."""
+    structure = CLONE_STRUCTURES[kind]
+    test = _copy(source, title=title or f"{source.title} (Copy)", is_active=False, is_diagnostic_template=False)
+    test.save()
+
+    levels = (structure.parts, structure.questions, structure.options)
+    filters = ({'test': source}, {'part__test': source}, {'question__part__test': source})
+    parents = {source.pk: test}
+    for level, lookup in zip(levels, filters):
+        parent_attname = level.model._meta.get_field(level.parent).attname
+        rows = list(level.model.objects.filter(**lookup).order_by('id'))
+        copies = [_copy(row, **{level.parent: parents[getattr(row, parent_attname)]}) for row in rows]
+        level.model.objects.bulk_create(copies, batch_size=batch_size)
+        parents = {row.pk: copy for row, copy in zip(rows, copies)}
+    return test
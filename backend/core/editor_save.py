@@ -0,0 +1,224 @@
+"""
+Diff-based saves of a test's parts -> questions -> options tree.
+
+The Listening/Reading editors send the whole tree on every save. Instead of
+saving it row by row, ``save_test_structure`` loads the current tree in three
+queries, matches the submitted rows against it and applies the differences per
+table: one ``bulk_create`` for new rows, one ``bulk_update`` of the fields that
+actually changed, one delete for rows that were left out (their children go
+with them). Unchanged rows are not written at all, and the test revision is
+bumped once for the whole save (see ``single_revision_bump``).
+
+Rows are matched within their parent: parts by part_number, questions by id,
+options by label (Listening) or id (Reading). Ids the client made up for rows
+it has not saved yet ('q-1700000000') simply do not match, so those rows are
+created.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.utils import timezone
+
+from .answer_keys import single_revision_bump
+from .models import (
+    ListeningAnswerOption, ListeningPart, ListeningQuestion, ReadingAnswerOption, ReadingPart, ReadingQuestion,
+)
+
+# Marks a question whose image is left as it is
+KEEP_IMAGE = object()
+
+
+@dataclass
+class Row:
+    """One submitted part/question/option: its match key, field values and children."""
+    key: object
+    values: dict
+    children: list = field(default_factory=list)
+    image: object = KEEP_IMAGE
+
+
+@dataclass(frozen=True)
+class Level:
+    model: type
+    parent: str
+    match: str
+
+
+@dataclass(frozen=True)
+class TestStructure:
+    parts: Level
+    questions: Level
+    options: Level
+    # Remove the stored file when a question image is replaced or cleared
+    delete_replaced_images: bool = False
+
+
+LISTENING_STRUCTURE = TestStructure(
+    parts=Level(ListeningPart, 'test', 'part_number'),
+    questions=Level(ListeningQuestion, 'part', 'id'),
+    options=Level(ListeningAnswerOption, 'question', 'label'),
+    delete_replaced_images=True,
+)
+READING_STRUCTURE = TestStructure(
+    parts=Level(ReadingPart, 'test', 'part_number'),
+    questions=Level(ReadingQuestion, 'part', 'id'),
+    options=Level(ReadingAnswerOption, 'question', 'id'),
+)
+
+
+def _writable_fields(level):
+    return {
+        f.name: f for f in level.model._meta.concrete_fields
+        if not f.primary_key and f.editable and f.name not in (level.parent, 'image_file')
+        and not getattr(f, 'auto_now', False) and not getattr(f, 'auto_now_add', False)
+    }
+
+
+class TableDiff:
+    """Pending inserts, updates and deletes of one table."""
+
+    def __init__(self, level):
+        self.level = level
+        self.fields = _writable_fields(level)
+        self.auto_now = [f.name for f in level.model._meta.concrete_fields if getattr(f, 'auto_now', False)]
+        self.created = []
+        self.updated = {}
+        self.changed_fields = set()
+        self.kept = set()
+
+    def clean(self, values, key):
+        cleaned = {}
+        for name, value in values.items():
+            model_field = self.fields.get(name)
+            if model_field is None:
+                continue
+            cleaned[name] = model_field.to_python(value)
+        if self.level.match in self.fields:
+            cleaned[self.level.match] = self.fields[self.level.match].to_python(key)
+        return cleaned
+
+    def sync(self, existing, row, parent):
+        values = self.clean(row.values, row.key)
+        if existing is None:
+            obj = self.level.model(**{self.level.parent: parent}, **values)
+            self.created.append(obj)
+            return obj
+        if existing.pk is None:
+            # Repeated key of a row created earlier in this save
+            for name, value in values.items():
+                setattr(existing, name, value)
+            return existing
+        self.kept.add(existing.pk)
+        for name, value in values.items():
+            if getattr(existing, name) != value:
+                setattr(existing, name, value)
+                self.changed_fields.add(name)
+                self.updated[existing.pk] = existing
+        return existing
+
+    def apply(self, batch_size=500):
+        model = self.level.model
+        if self.created:
+            model.objects.bulk_create(self.created, batch_size=batch_size)
+        if self.updated:
+            now = timezone.now()
+            for obj in self.updated.values():
+                for name in self.auto_now:
+                    setattr(obj, name, now)
+            model.objects.bulk_update(
+                list(self.updated.values()), sorted(self.changed_fields) + self.auto_now, batch_size=batch_size)
+
+
+@transaction.atomic
+def save_test_structure(test, structure, parts):
+    """
+    Makes the stored tree of ``test`` match ``parts`` (a list of Row, with
+    question Rows as part children and option Rows as question children).
+    Raises django ValidationError for values a model field cannot hold.
+    """
+    levels = (structure.parts, structure.questions, structure.options)
+    diffs = [TableDiff(level) for level in levels]
+    part_diff, question_diff, option_diff = diffs
+
+    stored_parts = list(structure.parts.model.objects.filter(test=test).order_by('id'))
+    questions_by_part = defaultdict(list)
+    for question in structure.questions.model.objects.filter(part__test=test).order_by('id'):
+        questions_by_part[question.part_id].append(question)
+    options_by_question = defaultdict(list)
+    for option in structure.options.model.objects.filter(question__part__test=test).order_by('id'):
+        options_by_question[option.question_id].append(option)
+
+    images = []
+    known_parts = _by_key(structure.parts, stored_parts)
+    for part_row in parts:
+        part = _sync(part_diff, known_parts, part_row, test)
+        known_questions = _by_key(structure.questions, questions_by_part.get(part.pk, ()))
+        for question_row in part_row.children:
+            question = _sync(question_diff, known_questions, question_row, part)
+            if question_row.image is not KEEP_IMAGE:
+                images.append((question, question_row.image))
+            known_options = _by_key(structure.options, options_by_question.get(question.pk, ()))
+            for option_row in question_row.children:
+                _sync(option_diff, known_options, option_row, question)
+
+    with single_revision_bump(test):
+        # Children of dropped rows go with them through the cascade
+        dropped = [
+            (structure.options, _dropped(option_diff, question_diff.kept, options_by_question)),
+            (structure.questions, _dropped(question_diff, part_diff.kept, questions_by_part)),
+            (structure.parts, [part.pk for part in stored_parts if part.pk not in part_diff.kept]),
+        ]
+        for level, ids in dropped:
+            if ids:
+                level.model.objects.filter(pk__in=ids).delete()
+        for diff in diffs:
+            diff.apply()
+        for question, image in images:
+            _set_image(question, image, structure.delete_replaced_images)
+
+
+def _by_key(level, rows):
+    """{match key: row}, first row winning for duplicate keys (the rest are dropped on save)."""
+    known = {}
+    for row in rows:
+        known.setdefault(getattr(row, level.match), row)
+    return known
+
+
+def _normalize_key(level, key):
+    if level.match == 'id':
+        try:
+            return int(key)
+        except (TypeError, ValueError):
+            # Client-side placeholder ids ('q-1700000000') are new rows
+            return None
+    return key
+
+
+def _sync(diff, known, row, parent):
+    """Matches ``row`` against the stored rows of its parent and records the change."""
+    key = _normalize_key(diff.level, row.key)
+    existing = known.get(key) if key is not None else None
+    obj = diff.sync(existing, row, parent)
+    if key is not None and diff.level.match != 'id':
+        # A repeated label/part number updates the row it already matched
+        known[key] = obj
+    return obj
+
+
+def _dropped(diff, kept_parents, children_by_parent):
+    return [
+        child.pk for parent_id in kept_parents for child in children_by_parent.get(parent_id, ())
+        if child.pk not in diff.kept
+    ]
+
+
+def _set_image(question, image, delete_replaced):
+    if delete_replaced and question.image_file:
+        try:
+            question.image_file.delete(save=False)
+        except Exception:
+            pass
+    question.image_file = image or None
+    question.save(update_fields=['image_file', 'updated_at'])
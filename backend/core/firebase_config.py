@@ -1,6 +1,22 @@
 import firebase_admin
 from firebase_admin import credentials, auth
+from django.conf import settings
+import hashlib
+import json
+import logging
 import os
+import re
+import threading
+import time
+
+import jwt
+import requests
+from cryptography.hazmat.primitives import serialization
+from cryptography.x509 import load_pem_x509_certificate
+
+from core.cache_utils import TTLCache
+
+logger = logging.getLogger(__name__)
 
 cred_path = os.path.join(os.path.dirname(__file__), 'firebase_credentials.json')
 
@@ -11,13 +27,180 @@ if not firebase_admin._apps:
     except Exception as e:
         raise
 
-def verify_firebase_token(token):
+# Verified ID tokens keyed by sha256(token); each entry lives until the token's own `exp`.
+_verified_tokens = TTLCache(maxsize=getattr(settings, 'FIREBASE_TOKEN_CACHE_MAX_ENTRIES', 10000))
+
+GOOGLE_ID_TOKEN_CERTS_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+CLOCK_SKEW_SECONDS = 10
+
+
+def _load_public_key(pem):
+    pem_bytes = pem.encode('utf-8') if isinstance(pem, str) else pem
+    if b'BEGIN CERTIFICATE' in pem_bytes:
+        return load_pem_x509_certificate(pem_bytes).public_key()
+    return serialization.load_pem_public_key(pem_bytes)
+
+
+class FirebasePublicKeySet:
+    """
+    Google's ID-token signing keys held in memory.
+    Loaded from a local file at startup and refreshed by a background thread
+    according to the Cache-Control max-age, so verification never fetches
+    certificates inside the request path.
+    """
+
+    def __init__(self, url=GOOGLE_ID_TOKEN_CERTS_URL, cache_file=None, default_max_age=3600, retry_seconds=60):
+        self.url = url
+        self.cache_file = cache_file
+        self.default_max_age = default_max_age
+        self.retry_seconds = retry_seconds
+        self.expires_at = 0
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def get(self, kid):
+        with self._lock:
+            return self._keys.get(kid)
+
+    def set_keys(self, pem_by_kid, expires_at=None):
+        """Installs a {kid: PEM certificate or public key} mapping."""
+        keys = {kid: _load_public_key(pem) for kid, pem in pem_by_kid.items()}
+        with self._lock:
+            self._keys = keys
+            self.expires_at = expires_at or (time.time() + self.default_max_age)
+
+    def load_file(self, path=None):
+        path = path or self.cache_file
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # Our cache format wraps the keys; Google's raw format is a flat {kid: pem}.
+            if isinstance(data, dict) and 'keys' in data:
+                self.set_keys(data['keys'], data.get('expires_at'))
+            else:
+                self.set_keys(data)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to load Firebase public keys from {path}: {e}")
+            return False
+
+    def fetch(self):
+        response = requests.get(self.url, timeout=10)
+        response.raise_for_status()
+        pem_by_kid = response.json()
+        max_age = self.default_max_age
+        match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+        if match:
+            max_age = int(match.group(1))
+        expires_at = time.time() + max_age
+        self.set_keys(pem_by_kid, expires_at)
+        if self.cache_file:
+            try:
+                tmp_path = f"{self.cache_file}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'expires_at': expires_at, 'keys': pem_by_kid}, f)
+                os.replace(tmp_path, self.cache_file)
+            except OSError as e:
+                logger.warning(f"Could not write Firebase public key cache {self.cache_file}: {e}")
+
+    def request_refresh(self):
+        self._wakeup.set()
+
+    def start_background_refresh(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._refresh_loop, name='firebase-key-refresh', daemon=True)
+        self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            # Refresh a little before the keys expire so there is never a gap.
+            delay = max(0, self.expires_at - time.time() - 60)
+            self._wakeup.wait(timeout=delay)
+            self._wakeup.clear()
+            try:
+                self.fetch()
+            except Exception as e:
+                logger.error(f"Firebase public key refresh failed: {e}")
+                self._wakeup.wait(timeout=self.retry_seconds)
+                self._wakeup.clear()
+
+
+def _get_project_id():
+    project_id = getattr(settings, 'FIREBASE_PROJECT_ID', None)
+    if project_id:
+        return project_id
     try:
-        decoded_token = auth.verify_id_token(token, check_revoked=False, clock_skew_seconds=10)
-        return decoded_token
-    except Exception as e:
+        return firebase_admin.get_app().project_id
+    except Exception:
         return None
 
 
+def verify_token_locally(token, key_set, project_id):
+    """Verifies a Firebase ID token against an in-memory key set; raises on failure."""
+    header = jwt.get_unverified_header(token)
+    public_key = key_set.get(header.get('kid'))
+    if public_key is None:
+        key_set.request_refresh()
+        raise jwt.InvalidTokenError('Unknown signing key')
+    decoded = jwt.decode(
+        token,
+        public_key,
+        algorithms=['RS256'],
+        audience=project_id,
+        issuer=f'https://securetoken.google.com/{project_id}',
+        leeway=CLOCK_SKEW_SECONDS,
+        options={'require': ['exp', 'iat', 'sub']},
+    )
+    sub = decoded.get('sub')
+    if not isinstance(sub, str) or not sub or len(sub) > 128:
+        raise jwt.InvalidTokenError('Invalid subject')
+    if decoded.get('auth_time', 0) > time.time() + CLOCK_SKEW_SECONDS:
+        raise jwt.InvalidTokenError('auth_time is in the future')
+    decoded['uid'] = sub
+    return decoded
+
+
+public_key_set = None
+if getattr(settings, 'FIREBASE_TOKEN_VERIFICATION', 'firebase_admin') == 'local':
+    public_key_set = FirebasePublicKeySet(
+        url=getattr(settings, 'FIREBASE_PUBLIC_KEYS_URL', GOOGLE_ID_TOKEN_CERTS_URL),
+        cache_file=getattr(settings, 'FIREBASE_PUBLIC_KEYS_FILE', None),
+    )
+    if not public_key_set.load_file() or public_key_set.expires_at <= time.time():
+        try:
+            public_key_set.fetch()
+        except Exception as e:
+            logger.error(f"Initial Firebase public key fetch failed: {e}")
+    public_key_set.start_background_refresh()
+
+
+def _token_cache_key(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def verify_firebase_token(token):
+    if not token:
+        return None
+    cache_key = _token_cache_key(token)
+    cached = _verified_tokens.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+    try:
+        if public_key_set is not None:
+            decoded_token = verify_token_locally(token, public_key_set, _get_project_id())
+        else:
+            decoded_token = auth.verify_id_token(token, check_revoked=False, clock_skew_seconds=CLOCK_SKEW_SECONDS)
+    except Exception as e:
+        return None
+    if decoded_token and decoded_token.get('exp'):
+        _verified_tokens.set(cache_key, dict(decoded_token), expires_at=decoded_token['exp'])
+    return decoded_token
 
 
+def clear_verified_token_cache():
+    _verified_tokens.clear()
@@ -0,0 +1,27 @@
+"""
+Links students to their teacher account (User.assigned_teacher) by matching
+the free-text User.teacher field against teacher first names / student_ids.
+
+    python manage.py backfill_assigned_teachers             # unassigned students only
+    python manage.py backfill_assigned_teachers --overwrite --dry-run
+"""
+from django.core.management.base import BaseCommand
+
+from core.teacher_assignment import backfill_assigned_teachers
+
+
+class Command(BaseCommand):
+    help = 'Set User.assigned_teacher for students from their teacher name.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--overwrite', action='store_true',
+                            help='Re-match students that already have an assigned teacher')
+        parser.add_argument('--dry-run', action='store_true', help='Report the counts without saving')
+
+    def handle(self, *args, **options):
+        stats = backfill_assigned_teachers(overwrite=options['overwrite'], dry_run=options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {stats['assigned']} students ({stats['unchanged']} unchanged, "
+            f"{stats['unmatched']} with no matching teacher, {stats['ambiguous']} with an ambiguous name)"
+            + (' [dry run]' if options['dry_run'] else '')
+        ))
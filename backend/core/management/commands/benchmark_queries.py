@@ -0,0 +1,170 @@
+"""
+Seeds a realistic volume of students and sessions inside a transaction, then
+times the main dashboard and curator queries and prints their plans with and
+without the session/essay hot path indexes (migration 0047). Everything is
+rolled back at the end, so it can be pointed at a staging copy of the DB.
+
+    python manage.py benchmark_queries
+    python manage.py benchmark_queries --students 3000 --sessions 20 --plans
+"""
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from core.models import (
+    Essay, ListeningTest, ListeningTestSession, ReadingTest, ReadingTestSession, User, WritingTestSession,
+)
+from core.views import annotate_last_activity
+
+HOT_PATH_INDEXES = {
+    WritingTestSession: ['core_wsession_user_idx'],
+    Essay: ['core_essay_user_submitted_idx'],
+    ListeningTestSession: ['core_lsession_user_done_idx', 'core_lsession_done_at_idx'],
+    ReadingTestSession: ['core_rsession_user_done_idx', 'core_rsession_done_at_idx'],
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the dashboard/curator queries with and without the session hot path indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1500, help='Students to seed')
+        parser.add_argument('--sessions', type=int, default=12,
+                            help='Listening and Reading sessions per student (half as many Writing sessions)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query; the median is reported')
+        parser.add_argument('--plans', action='store_true', help='Print the query plans')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        with transaction.atomic():
+            started = time.monotonic()
+            students = self._seed(options['students'], options['sessions'])
+            self._analyze()
+            self.stdout.write(f'Seeded {len(students)} students in {time.monotonic() - started:.1f}s')
+
+            queries = self._queries(students[len(students) // 2])
+            after = self._run(queries, options['repeat'])
+            dropped = self._drop_indexes()
+            if not dropped:
+                self.stdout.write(self.style.WARNING('Hot path indexes not found; apply migration 0047 first'))
+            before = self._run(queries, options['repeat'])
+
+            self.stdout.write(f'\n{"query":<40} {"before ms":>10} {"after ms":>10}')
+            for name, _ in queries:
+                self.stdout.write(f'{name:<40} {before[name][0]:>10.2f} {after[name][0]:>10.2f}')
+            if options['plans']:
+                for name, _ in queries:
+                    self.stdout.write(f'\n== {name}\n-- before\n{before[name][1]}\n-- after\n{after[name][1]}')
+            transaction.set_rollback(True)
+
+    def _seed(self, student_count, per_student):
+        rng = self.rng
+        now = timezone.now()
+
+        def when():
+            return now - timedelta(days=rng.uniform(0, 365))
+
+        listening = ListeningTest.objects.create(title='Benchmark Listening')
+        reading = ReadingTest.objects.create(title='Benchmark Reading')
+        students = User.objects.bulk_create([
+            User(uid=f'benchmark_{i}', role='student', student_id=f'BM{i:05d}', first_name=f'Student{i}',
+                 last_name='Benchmark', group=f'G{i % 40}', teacher=f'Teacher{i % 25}')
+            for i in range(student_count)
+        ], batch_size=1000)
+
+        listening_sessions, reading_sessions, writing_sessions = [], [], []
+        for student in students:
+            for _ in range(per_student):
+                submitted = rng.random() < 0.85
+                listening_sessions.append(ListeningTestSession(
+                    user=student, test=listening, submitted=submitted, is_diagnostic=rng.random() < 0.1,
+                    completed_at=when() if submitted else None,
+                ))
+                completed = rng.random() < 0.85
+                reading_sessions.append(ReadingTestSession(
+                    user=student, test=reading, completed=completed, is_diagnostic=rng.random() < 0.1,
+                    end_time=when() if completed else None,
+                ))
+            for _ in range(per_student // 2):
+                writing_sessions.append(WritingTestSession(user=student, completed=True, is_diagnostic=rng.random() < 0.1))
+        ListeningTestSession.objects.bulk_create(listening_sessions, batch_size=2000)
+        ReadingTestSession.objects.bulk_create(reading_sessions, batch_size=2000)
+        WritingTestSession.objects.bulk_create(writing_sessions, batch_size=2000)
+
+        essays = [
+            Essay(user_id=session.user_id, test_session=session, task_type=task_type,
+                  question_text='Benchmark', submitted_text='Benchmark essay')
+            for session in writing_sessions for task_type in ('task1', 'task2')
+        ]
+        Essay.objects.bulk_create(essays, batch_size=2000)
+        # auto_now_add fields ignore the values passed to bulk_create; spread them over the year
+        for session in writing_sessions:
+            session.started_at = when()
+        WritingTestSession.objects.bulk_update(writing_sessions, ['started_at'], batch_size=2000)
+        for essay in essays:
+            essay.submitted_at = essay.test_session.started_at + timedelta(minutes=50)
+        Essay.objects.bulk_update(essays, ['submitted_at'], batch_size=2000)
+        return students
+
+    def _analyze(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                for model in list(HOT_PATH_INDEXES) + [User]:
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+            else:
+                cursor.execute('ANALYZE')
+
+    def _queries(self, student):
+        since = timezone.now() - timedelta(days=30)
+        missing = User.objects.filter(role='student', is_active=True).annotate(
+            has_writing=Exists(Essay.objects.filter(
+                user=OuterRef('pk'), test_session__is_diagnostic=False, submitted_at__gte=since)),
+            has_listening=Exists(ListeningTestSession.objects.filter(
+                user=OuterRef('pk'), submitted=True, is_diagnostic=False, completed_at__gte=since)),
+            has_reading=Exists(ReadingTestSession.objects.filter(
+                user=OuterRef('pk'), completed=True, is_diagnostic=False, end_time__gte=since)),
+        ).filter(Q(has_writing=False) | Q(has_listening=False) | Q(has_reading=False))
+        return [
+            ('student listening history', ListeningTestSession.objects.filter(
+                user=student, submitted=True, is_diagnostic=False).order_by('-completed_at')),
+            ('student reading history', ReadingTestSession.objects.filter(
+                user=student, completed=True, is_diagnostic=False).order_by('-end_time')),
+            ('student writing sessions', WritingTestSession.objects.filter(
+                user=student, is_diagnostic=False).order_by('-started_at')),
+            ('student essays', Essay.objects.filter(user=student).order_by('-submitted_at')),
+            ('curator listening, last 30 days', ListeningTestSession.objects.filter(
+                submitted=True, is_diagnostic=False, completed_at__gte=since).select_related('user')),
+            ('curator reading, last 30 days', ReadingTestSession.objects.filter(
+                completed=True, is_diagnostic=False, end_time__gte=since).select_related('user')),
+            ('curator missing tests page', annotate_last_activity(missing).order_by('id')[:10]),
+        ]
+
+    def _run(self, queries, repeat):
+        results = {}
+        for name, queryset in queries:
+            timings = []
+            for _ in range(max(1, repeat)):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (statistics.median(timings), queryset.explain())
+        return results
+
+    def _drop_indexes(self):
+        """Drops the hot path indexes inside the benchmark transaction (restored by the rollback)."""
+        dropped = []
+        with connection.cursor() as cursor:
+            for model, names in HOT_PATH_INDEXES.items():
+                existing = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                for name in names:
+                    if name in existing:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                        dropped.append(name)
+        return dropped
@@ -0,0 +1,39 @@
+"""
+Writes buffered session autosave state (core.sync_buffer) to the database.
+
+    python manage.py flush_session_sync               # one pass
+    python manage.py flush_session_sync --interval 5  # keep flushing every 5s
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.sync_buffer import flush_pending
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Flush buffered Listening/Reading/Writing session syncs to the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Seconds between passes; 0 runs a single pass')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        batch_size = max(1, options['batch_size'])
+        while True:
+            if interval <= 0:
+                written = flush_pending(batch_size=batch_size)
+                self.stdout.write(f'Flushed {written} session(s)')
+                return
+            try:
+                written = flush_pending(batch_size=batch_size)
+                self.stdout.write(f'Flushed {written} session(s)')
+            except Exception:
+                # Keep draining: the entries stay in the journal for the next pass
+                logger.exception('Session sync flush failed')
+            time.sleep(interval)
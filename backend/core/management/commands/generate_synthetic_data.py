@@ -0,0 +1,461 @@
+"""
+Generates a synthetic population for load tests: teachers with their groups of
+students, Listening/Reading tests with a realistic mix of question types,
+Writing tests, and per student a history of submitted sessions with answers,
+results, essays, teacher feedback and speaking sessions.
+
+Answers are drawn from a per-student ability, so raw scores, band scores and
+rollups look like real data and the stored results agree with what the scorer
+would compute. Everything is written with bulk_create in batches and the same
+--seed (and --until) always produces the same rows.
+
+    python manage.py generate_synthetic_data --students 2000 --sessions 10
+    python manage.py generate_synthetic_data --clear --students 10000 --tests 6 --until 2026-06-01
+
+Synthetic users have uids starting with '<prefix>_' and tests are titled
+'[<prefix>] ...'; --clear deletes them (and everything hanging off them) first.
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, time as day_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.answer_keys import listening_band_score, reading_band_score
+from core.models import (
+    Essay, ListeningAnswerOption, ListeningPart, ListeningQuestion, ListeningTest, ListeningTestResult,
+    ListeningTestSession, ReadingAnswerOption, ReadingPart, ReadingQuestion, ReadingTest, ReadingTestResult,
+    ReadingTestSession, SpeakingSession, TeacherFeedback, User, WritingTask, WritingTest, WritingTestSession,
+)
+from core.rollups import rebuild_rollups
+from core.scoring_jobs import round_band
+from core.user_search import build_search_text
+
+WORDS = [
+    'library', 'harbour', 'museum', 'station', 'bakery', 'garden', 'bridge', 'market', 'cinema', 'stadium',
+    'ticket', 'parking', 'bicycle', 'kitchen', 'laptop', 'passport', 'Monday', 'Friday', 'August', 'October',
+    'seventeen', 'forty', 'blue', 'wooden', 'cotton', 'river', 'island', 'valley', 'forest', 'desert',
+]
+FIRST_NAMES = ['Aida', 'Timur', 'Leyla', 'Rustam', 'Nigar', 'Elvin', 'Sabina', 'Murad', 'Aysel', 'Kamran',
+               'Gunel', 'Orkhan', 'Lala', 'Farid', 'Narmin', 'Javid']
+LAST_NAMES = ['Aliyev', 'Huseynova', 'Mammadov', 'Ismayilova', 'Guliyev', 'Hasanova', 'Karimov', 'Abbasova']
+TFNG = ['True', 'False', 'Not Given']
+OPTION_LABELS = 'ABCDE'
+
+# Fields filled by auto_now_add that the generator spreads over --days instead
+BACKDATED_FIELDS = [
+    (WritingTestSession, 'started_at'), (Essay, 'submitted_at'), (TeacherFeedback, 'created_at'),
+    (ListeningTestSession, 'started_at'), (ListeningTestResult, 'calculated_at'),
+    (ReadingTestSession, 'start_time'), (ReadingTestResult, 'calculated_at'),
+    (SpeakingSession, 'conducted_at'),
+]
+
+
+@contextmanager
+def backdated_timestamps():
+    """
+    Lets bulk_create keep the values set on BACKDATED_FIELDS (auto_now_add
+    would overwrite them) instead of a second bulk_update pass over every row.
+    """
+    fields = [model._meta.get_field(name) for model, name in BACKDATED_FIELDS]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def fill_answer(answers, slot, value):
+    """Writes one answer the way the test players save it (see core.answer_keys)."""
+    kind, key, sub = slot[:3]
+    if kind == 'value':
+        answers[key] = value
+    elif kind == 'field':
+        answers.setdefault(key, {})[sub] = value
+    elif kind == 'flags':
+        for label in value:
+            answers[f'{key}__{label}'] = True
+    else:
+        answers[key] = list(value)
+
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic synthetic population of students, tests and sessions for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=500)
+        parser.add_argument('--teachers', type=int, default=10)
+        parser.add_argument('--groups', type=int, default=25, help='Groups, spread round-robin over the teachers')
+        parser.add_argument('--tests', type=int, default=4, help='Listening, Reading and Writing tests each')
+        parser.add_argument('--sessions', type=int, default=6,
+                            help='Listening, Reading and Writing sessions per student each')
+        parser.add_argument('--speaking', type=int, default=2, help='Speaking sessions per student')
+        parser.add_argument('--feedback', type=float, default=0.5,
+                            help='Share of essays with teacher feedback (most of it published)')
+        parser.add_argument('--days', type=int, default=180, help='Spread the sessions over this many days')
+        parser.add_argument('--until', help='Latest session date (YYYY-MM-DD, default today); fix it for '
+                                            'byte-identical runs')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--prefix', default='synthetic', help='Marks the generated users and tests')
+        parser.add_argument('--clear', action='store_true', help='Delete earlier data with the same prefix first')
+        parser.add_argument('--skip-rollups', action='store_true', help='Do not rebuild the performance rollups')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        self.days = max(1, options['days'])
+        if options['until']:
+            try:
+                until = datetime.strptime(options['until'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--until must be a YYYY-MM-DD date')
+            self.until = timezone.make_aware(datetime.combine(until.date(), day_time(18, 0)))
+        else:
+            self.until = timezone.now()
+
+        started = time.monotonic()
+        counts = {}
+        with transaction.atomic():
+            if options['clear']:
+                self._clear()
+            elif User.objects.filter(uid__startswith=f'{self.prefix}_').exists():
+                raise CommandError(f"Synthetic data with prefix '{self.prefix}' exists; pass --clear or another --prefix")
+
+            teachers, students = self._users(options['teachers'], options['groups'], options['students'])
+            tests = max(1, options['tests'])
+            listening = [self._listening_test(i) for i in range(tests)]
+            reading = [self._reading_test(i) for i in range(tests)]
+            writing = [self._writing_test(i) for i in range(tests)]
+            counts['teachers'], counts['students'] = len(teachers), len(students)
+            counts['tests'] = 3 * tests
+
+            with backdated_timestamps():
+                counts['listening sessions'] = self._listening_sessions(students, listening, options['sessions'])
+                counts['reading sessions'] = self._reading_sessions(students, reading, options['sessions'])
+                counts['writing sessions'], counts['essays'], counts['teacher feedback'] = self._writing_sessions(
+                    students, writing, options['sessions'], options['feedback'])
+                counts['speaking sessions'] = self._speaking_sessions(students, options['speaking'])
+
+            if not options['skip_rollups']:
+                counts['rollup rows'] = rebuild_rollups(student_ids=[student.pk for student in students])
+
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Generated {summary} in {time.monotonic() - started:.1f}s'))
+
+    def _clear(self):
+        User.objects.filter(uid__startswith=f'{self.prefix}_').delete()
+        title = f'[{self.prefix}] '
+        for model in (ListeningTest, ReadingTest, WritingTest):
+            model.objects.filter(title__startswith=title).delete()
+
+    def _when(self):
+        return self.until - timedelta(seconds=self.rng.randrange(self.days * 86400))
+
+    def _bulk(self, model, objects):
+        return model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    # Users
+
+    def _users(self, teacher_count, group_count, student_count):
+        rng, prefix = self.rng, self.prefix
+        teachers = [
+            User(uid=f'{prefix}_teacher_{t}', role='teacher', first_name=f'Teacher{t:02d}',
+                 last_name=prefix.capitalize(), email=f'{prefix}.teacher{t}@example.com')
+            for t in range(max(1, teacher_count))
+        ]
+        for teacher in teachers:
+            teacher.search_text = build_search_text(teacher)
+        self._bulk(User, teachers)
+
+        groups = [(f'{prefix}-G{g:02d}', teachers[g % len(teachers)]) for g in range(max(1, group_count))]
+        students = []
+        for i in range(student_count):
+            group, teacher = groups[i % len(groups)]
+            student = User(
+                uid=f'{prefix}_student_{i}', role='student', student_id=f'{prefix.upper()[:3]}{i:06d}',
+                first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                email=f'{prefix}.student{i}@example.com', group=group,
+                teacher=teacher.first_name, assigned_teacher=teacher,
+            )
+            # The pre_save receivers that keep these in sync do not run for bulk_create
+            student.search_text = build_search_text(student)
+            students.append(student)
+        self._bulk(User, students)
+        # Ability in [0, 1]: the chance of answering an average question right
+        self.ability = {student.pk: rng.betavariate(4, 3) for student in students}
+        return teachers, students
+
+    # Tests. Each builder returns the test with its answer "slots": one entry per
+    # scored point, (kind, key, sub, correct value, wrong value), see fill_answer.
+
+    def _word_pair(self):
+        correct, wrong = self.rng.sample(WORDS, 2)
+        return correct, wrong
+
+    def _listening_test(self, index):
+        rng = self.rng
+        test = ListeningTest.objects.create(title=f'[{self.prefix}] Listening {index + 1}', is_active=True)
+        parts = self._bulk(ListeningPart, [
+            ListeningPart(test=test, part_number=n, audio_duration=600, instructions=f'Part {n}')
+            for n in range(1, 5)
+        ])
+
+        questions, templates, options = [], [], []
+        for part in parts:
+            base = (part.part_number - 1) * 10
+            gaps = [(base + k, *self._word_pair()) for k in range(1, 5)]
+            questions.append(ListeningQuestion(
+                part=part, order=1, question_type='gap_fill', header='Complete the notes.',
+                question_text='\n'.join(f'Note {k}: [[{number}]]' for k, (number, _, _) in enumerate(gaps, 1)),
+                correct_answers=[answer for _, answer, _ in gaps],
+            ))
+            templates.append([('value', f'__gap{number}', None, answer, wrong) for number, answer, wrong in gaps])
+            options.append([])
+
+            cells = [(base + k, *self._word_pair()) for k in range(5, 8)]
+            questions.append(ListeningQuestion(
+                part=part, order=2, question_type='table', header='Complete the table.',
+                extra_data={
+                    'table': {'cells': [[{'text': 'Item'}, {'text': 'Detail'}]] + [
+                        [{'text': f'Row {r}'}, {'text': f'[[{number}]]'}] for r, (number, _, _) in enumerate(cells, 1)
+                    ]},
+                    'gaps': [{'number': number, 'answer': answer} for number, answer, _ in cells],
+                },
+            ))
+            templates.append([
+                ('value', f'__r{r}c1__gap{number}', None, answer, wrong)
+                for r, (number, answer, wrong) in enumerate(cells, 1)
+            ])
+            options.append([])
+
+            for order in (3, 4):
+                correct, wrong = rng.sample('ABC', 2)
+                questions.append(ListeningQuestion(
+                    part=part, order=order, question_type='multiple_choice',
+                    question_text=f'Question {base + order + 5}', correct_answers=[correct],
+                ))
+                templates.append([('value', '', None, correct, wrong)])
+                options.append([(label, rng.choice(WORDS)) for label in 'ABC'])
+
+            labels = rng.sample(OPTION_LABELS, 4)
+            correct, wrong = sorted(labels[:2]), sorted(labels[1:3])
+            questions.append(ListeningQuestion(
+                part=part, order=5, question_type='multiple_response', scoring_mode='total',
+                question_text=f'Choose TWO letters ({base + 10})', correct_answers=correct,
+            ))
+            templates.append([('flags', '', None, correct, wrong)])
+            options.append([(label, rng.choice(WORDS)) for label in OPTION_LABELS])
+
+        self._bulk(ListeningQuestion, questions)
+        self._bulk(ListeningAnswerOption, [
+            ListeningAnswerOption(question=question, label=label, text=text)
+            for question, rows in zip(questions, options) for label, text in rows
+        ])
+        slots = [
+            (kind, f'{question.pk}{suffix}', sub, correct, wrong)
+            for question, rows in zip(questions, templates) for kind, suffix, sub, correct, wrong in rows
+        ]
+        return test, slots
+
+    def _reading_test(self, index):
+        rng = self.rng
+        test = ReadingTest.objects.create(title=f'[{self.prefix}] Reading {index + 1}', is_active=True)
+        parts = self._bulk(ReadingPart, [
+            ReadingPart(test=test, part_number=n, order=n, title=f'Passage {n}',
+                        passage_text=' '.join(rng.choices(WORDS, k=400)))
+            for n in range(1, 4)
+        ])
+
+        questions, templates, options = [], [], []
+        for part in parts:
+            base = (part.part_number - 1) * 14
+            verdicts = [rng.choice(TFNG) for _ in range(5)]
+            questions.append(ReadingQuestion(
+                part=part, order=1, question_type='true_false_not_given', header='True, False or Not Given?',
+                extra_data={'statements': [f'Statement {base + k + 1}' for k in range(5)], 'answers': verdicts},
+            ))
+            templates.append([
+                ('field', f'stmt{k}', verdict, rng.choice([v for v in TFNG if v != verdict]))
+                for k, verdict in enumerate(verdicts)
+            ])
+            options.append([])
+
+            gaps = [(base + k, *self._word_pair()) for k in range(6, 11)]
+            questions.append(ReadingQuestion(
+                part=part, order=2, question_type='gap_fill', header='Complete the summary.',
+                question_text=' '.join(f'... [[{number}]] ...' for number, _, _ in gaps),
+                correct_answers=[{'number': number, 'answer': answer} for number, answer, _ in gaps],
+            ))
+            templates.append([('field', f'gap{number}', answer, wrong) for number, answer, wrong in gaps])
+            options.append([])
+
+            for order in (3, 4, 5):
+                correct, wrong = rng.sample('ABCD', 2)
+                questions.append(ReadingQuestion(
+                    part=part, order=order, question_type='multiple_choice',
+                    question_text=f'Question {base + order + 8}',
+                ))
+                templates.append([('field', 'text', correct, wrong)])
+                options.append([(label, rng.choice(WORDS), label == correct) for label in 'ABCD'])
+
+            texts = rng.sample(WORDS, 5)
+            questions.append(ReadingQuestion(
+                part=part, order=6, question_type='multiple_response', reading_scoring_type='all_or_nothing',
+                question_text=f'Choose TWO answers ({base + 14})',
+            ))
+            templates.append([('list', None, texts[:2], texts[1:3])])
+            options.append([(label, text, k < 2) for k, (label, text) in enumerate(zip(OPTION_LABELS, texts))])
+
+        self._bulk(ReadingQuestion, questions)
+        self._bulk(ReadingAnswerOption, [
+            ReadingAnswerOption(question=question, label=label, text=text, is_correct=is_correct)
+            for question, rows in zip(questions, options) for label, text, is_correct in rows
+        ])
+        slots = [
+            (kind, str(question.pk), sub, correct, wrong)
+            for question, rows in zip(questions, templates) for kind, sub, correct, wrong in rows
+        ]
+        test.total_points = len(slots)
+        test.save(update_fields=['total_points'])
+        return test, slots
+
+    def _writing_test(self, index):
+        test = WritingTest.objects.create(title=f'[{self.prefix}] Writing {index + 1}', is_active=True)
+        WritingTask.objects.bulk_create([
+            WritingTask(test=test, task_type='task1', task_text='Summarise the information in the chart.'),
+            WritingTask(test=test, task_type='task2', task_text='Discuss both views and give your opinion.'),
+        ])
+        return test
+
+    # Sessions
+
+    def _answer(self, student, slots):
+        """Answers every slot with the student's ability (give or take per sitting); returns (answers, raw)."""
+        rng = self.rng
+        chance = min(0.98, max(0.02, self.ability[student.pk] + rng.uniform(-0.1, 0.1)))
+        answers, raw = {}, 0
+        for slot in slots:
+            right = rng.random() < chance
+            raw += right
+            fill_answer(answers, slot, slot[3] if right else slot[4])
+        return answers, raw
+
+    def _band(self, student, spread=1.0):
+        """A writing/speaking criterion score around the student's ability."""
+        value = 4.0 + 4.5 * self.ability[student.pk] + self.rng.uniform(-spread, spread)
+        return min(9.0, max(1.0, round(value * 2) / 2))
+
+    def _listening_sessions(self, students, tests, per_student):
+        rng = self.rng
+        sessions, results = [], []
+        for student in students:
+            for _ in range(per_student):
+                test, slots = rng.choice(tests)
+                answers, raw = self._answer(student, slots)
+                started_at = self._when()
+                taken = rng.randint(25 * 60, 40 * 60)
+                completed_at = started_at + timedelta(seconds=taken)
+                session = ListeningTestSession(
+                    user=student, test=test, started_at=started_at, completed_at=completed_at,
+                    submitted=True, answers=answers, time_left=max(0, 2400 - taken), time_taken=taken,
+                    score=raw, correct_answers_count=raw, total_questions_count=len(slots),
+                )
+                sessions.append(session)
+                results.append(ListeningTestResult(
+                    session=session, raw_score=raw, band_score=listening_band_score(raw, len(slots)),
+                    calculated_at=completed_at,
+                ))
+        self._bulk(ListeningTestSession, sessions)
+        self._bulk(ListeningTestResult, results)
+        return len(sessions)
+
+    def _reading_sessions(self, students, tests, per_student):
+        rng = self.rng
+        sessions, results = [], []
+        for student in students:
+            for _ in range(per_student):
+                test, slots = rng.choice(tests)
+                answers, raw = self._answer(student, slots)
+                start_time = self._when()
+                taken = timedelta(seconds=rng.randint(40 * 60, 60 * 60))
+                session = ReadingTestSession(
+                    user=student, test=test, start_time=start_time, end_time=start_time + taken,
+                    completed=True, answers=answers, time_left_seconds=3600 - int(taken.total_seconds()),
+                )
+                sessions.append(session)
+                results.append(ReadingTestResult(
+                    session=session, raw_score=raw, total_score=len(slots),
+                    band_score=reading_band_score(raw, len(slots)), calculated_at=start_time + taken,
+                    time_taken=taken,
+                ))
+        self._bulk(ReadingTestSession, sessions)
+        self._bulk(ReadingTestResult, results)
+        return len(sessions)
+
+    def _writing_sessions(self, students, tests, per_student, feedback_share):
+        rng = self.rng
+        # A small pool of texts: generating every essay word by word costs more than inserting it
+        texts = {task_type: [' '.join(rng.choices(WORDS, k=words)) for _ in range(20)]
+                 for task_type, words in (('task1', 150), ('task2', 250))}
+        sessions, essays, feedback = [], [], []
+        for student in students:
+            for _ in range(per_student):
+                test = rng.choice(tests)
+                started_at = self._when()
+                session = WritingTestSession(user=student, test=test, started_at=started_at, completed=True,
+                                             time_left_seconds=rng.randint(0, 600))
+                bands = []
+                for task_type in ('task1', 'task2'):
+                    scores = [self._band(student) for _ in range(4)]
+                    overall = round_band(sum(scores) / 4)
+                    bands.append(overall)
+                    essay = Essay(
+                        user=student, test_session=session, task_type=task_type,
+                        question_text=f'{test.title} {task_type}',
+                        submitted_text=rng.choice(texts[task_type]),
+                        score_task=scores[0], score_coherence=scores[1], score_lexical=scores[2],
+                        score_grammar=scores[3], overall_band=overall, feedback='Synthetic feedback.',
+                        submitted_at=started_at + timedelta(minutes=20 if task_type == 'task1' else 60),
+                    )
+                    essays.append(essay)
+                    if rng.random() < feedback_share:
+                        teacher_scores = [self._band(student, spread=0.5) for _ in range(4)]
+                        published = rng.random() < 0.8
+                        created_at = essay.submitted_at + timedelta(days=rng.randint(1, 5))
+                        feedback.append(TeacherFeedback(
+                            essay=essay, teacher_id=student.assigned_teacher_id, overall_feedback='Synthetic review.',
+                            teacher_task_score=teacher_scores[0], teacher_coherence_score=teacher_scores[1],
+                            teacher_lexical_score=teacher_scores[2], teacher_grammar_score=teacher_scores[3],
+                            teacher_overall_score=round_band(sum(teacher_scores) / 4),
+                            published=published, created_at=created_at,
+                            published_at=created_at + timedelta(hours=2) if published else None,
+                        ))
+                session.band_score = round_band(sum(bands) / 2)
+                sessions.append(session)
+        self._bulk(WritingTestSession, sessions)
+        self._bulk(Essay, essays)
+        self._bulk(TeacherFeedback, feedback)
+        return len(sessions), len(essays), len(feedback)
+
+    def _speaking_sessions(self, students, per_student):
+        rng = self.rng
+        sessions = []
+        for student in students:
+            for _ in range(per_student):
+                scores = [self._band(student) for _ in range(4)]
+                sessions.append(SpeakingSession(
+                    student=student, teacher_id=student.assigned_teacher_id,
+                    fluency_coherence_score=scores[0], lexical_resource_score=scores[1],
+                    grammatical_range_score=scores[2], pronunciation_score=scores[3],
+                    overall_band_score=round_band(sum(scores) / 4), duration_seconds=rng.randint(11 * 60, 14 * 60),
+                    completed=True, conducted_at=self._when(),
+                ))
+        self._bulk(SpeakingSession, sessions)
+        return len(sessions)
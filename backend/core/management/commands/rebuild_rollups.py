@@ -0,0 +1,44 @@
+"""
+Recomputes StudentPerformanceRollup rows from the session/result tables.
+
+    python manage.py rebuild_rollups
+    python manage.py rebuild_rollups --module writing --student 42
+    python manage.py rebuild_rollups --missing
+
+--missing only rebuilds students with activity in a week that has no rollup
+row; entrypoint.sh runs it after migrate, so dashboards are populated once a
+migration has created or cleared the table.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.rollups import ROLLUP_MODULES, rebuild_rollups, students_missing_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per student x module x week performance rollups used by curator dashboards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', action='append', choices=ROLLUP_MODULES,
+                            help='Module to rebuild (repeatable); default: all')
+        parser.add_argument('--student', action='append', type=int,
+                            help='Student (User) id to rebuild (repeatable); default: all')
+        parser.add_argument('--missing', action='store_true',
+                            help='Only students with activity in a week without rollup rows')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['missing']:
+            written = 0
+            for module in options['module'] or ROLLUP_MODULES:
+                student_ids = students_missing_rollups(module)
+                if options['student']:
+                    student_ids = [pk for pk in student_ids if pk in options['student']]
+                if student_ids:
+                    written += rebuild_rollups(modules=[module], student_ids=student_ids)
+        else:
+            written = rebuild_rollups(modules=options['module'], student_ids=options['student'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} rollup rows in {time.monotonic() - started:.1f}s'
+        ))
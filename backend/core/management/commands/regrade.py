@@ -0,0 +1,225 @@
+"""
+Re-scores every completed session of one Reading/Listening test against its
+current answer key and writes the results back in bulk.
+
+    python manage.py regrade --module reading --test 12
+    python manage.py regrade --module listening --test 7 --workers 8 --dry-run
+
+Each worker process receives the compiled key once, then loads, scores and
+bulk-updates whole chunks of sessions on its own DB connection; the parent
+only streams session ids and aggregates the report.
+"""
+import multiprocessing
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+from core.answer_keys import get_answer_key, build_reading_results, build_listening_results
+from core.rollups import rebuild_rollups
+from core.models import (
+    ReadingTest, ReadingTestSession, ReadingTestResult,
+    ListeningTest, ListeningTestSession, ListeningTestResult,
+)
+
+MODULES = {
+    'reading': (ReadingTest, ReadingTestSession, ReadingTestResult, 'completed'),
+    'listening': (ListeningTest, ListeningTestSession, ListeningTestResult, 'submitted'),
+}
+
+# Set once per worker process by _init_worker.
+_worker_args = None
+
+
+def score_answers(answer_key, module, answers):
+    """Scores one answers dict the same way the submit views do."""
+    try:
+        breakdown_result = answer_key.score(answers or {})
+    except Exception:
+        breakdown_result = {'raw_score': 0, 'total_score': 0, 'breakdown': []}
+    if module == 'reading':
+        return build_reading_results(breakdown_result)
+    return build_listening_results(breakdown_result)
+
+
+def regrade_chunk(answer_key, module, session_ids, dry_run=False):
+    """
+    Scores and saves one chunk of sessions.
+    Returns (stats, band_deltas) counters for the caller to aggregate.
+    """
+    _, session_model, result_model, _ = MODULES[module]
+    stats = Counter()
+    band_deltas = Counter()
+
+    existing = {
+        r.session_id: r
+        for r in result_model.objects.filter(session_id__in=session_ids).only('id', 'session_id', 'band_score')
+    }
+    to_update, to_create, session_rows = [], [], []
+    for session_id, answers in session_model.objects.filter(pk__in=session_ids).values_list('pk', 'answers'):
+        try:
+            result = score_answers(answer_key, module, answers)
+        except Exception:
+            stats['failed'] += 1
+            continue
+        stats['scored'] += 1
+
+        band_score = result['band_score'] if result['band_score'] is not None else 0
+        fields = {'raw_score': result['raw_score'], 'band_score': band_score}
+        if module == 'reading':
+            fields['total_score'] = result['total_score']
+            fields['breakdown'] = result['breakdown']
+        else:
+            fields['breakdown'] = result['detailed_breakdown']
+            session_rows.append(session_model(
+                pk=session_id,
+                correct_answers_count=result['raw_score'],
+                total_questions_count=result['total_score'],
+                score=result['raw_score'],
+            ))
+
+        row = existing.get(session_id)
+        if row is None:
+            to_create.append(result_model(session_id=session_id, **fields))
+            continue
+        delta = round(band_score - (row.band_score or 0), 1)
+        if delta:
+            band_deltas[delta] += 1
+        for attr, value in fields.items():
+            setattr(row, attr, value)
+        to_update.append(row)
+
+    stats['updated'] += len(to_update)
+    stats['created'] += len(to_create)
+    if dry_run:
+        return stats, band_deltas
+
+    update_fields = ['raw_score', 'band_score', 'breakdown']
+    if module == 'reading':
+        update_fields.append('total_score')
+    with transaction.atomic():
+        if to_update:
+            result_model.objects.bulk_update(to_update, update_fields)
+        if to_create:
+            result_model.objects.bulk_create(to_create)
+        if session_rows:
+            session_model.objects.bulk_update(session_rows, ['correct_answers_count', 'total_questions_count', 'score'])
+    return stats, band_deltas
+
+
+def _init_worker(answer_key, module, dry_run):
+    global _worker_args
+    _worker_args = (answer_key, module, dry_run)
+
+
+def _regrade_chunk_in_worker(session_ids):
+    answer_key, module, dry_run = _worker_args
+    return regrade_chunk(answer_key, module, session_ids, dry_run)
+
+
+class Command(BaseCommand):
+    help = 'Re-score completed Reading/Listening sessions of a test against its current answer key.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', required=True, choices=sorted(MODULES))
+        parser.add_argument('--test', required=True, type=int, help='Test id')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes; 1 (and SQLite) runs in the current process')
+        parser.add_argument('--dry-run', action='store_true', help='Report band changes without writing')
+
+    def handle(self, *args, **options):
+        module = options['module']
+        chunk_size = max(1, options['chunk_size'])
+        workers = max(1, options['workers'])
+        dry_run = options['dry_run']
+        test_model, session_model, _, done_field = MODULES[module]
+
+        try:
+            test = test_model.objects.get(pk=options['test'])
+        except test_model.DoesNotExist:
+            raise CommandError(f'{module} test {options["test"]} does not exist')
+
+        answer_key = get_answer_key(test, module)
+        sessions = session_model.objects.filter(test=test, **{done_field: True})
+        total_sessions = sessions.count()
+        self.stdout.write(f'Regrading {total_sessions} {module} sessions of test {test.pk} "{test.title}"'
+                          f'{" (dry run)" if dry_run else ""}')
+
+        self.stats = Counter()
+        self.band_deltas = Counter()
+        self.started = time.monotonic()
+        self.total_sessions = total_sessions
+
+        # SQLite cannot take concurrent writers, and fork is needed to share the key cheaply.
+        in_process = (
+            workers == 1
+            or connection.vendor == 'sqlite'
+            or 'fork' not in multiprocessing.get_all_start_methods()
+        )
+        if in_process:
+            for session_ids in self._id_chunks(sessions, chunk_size):
+                self._collect(regrade_chunk(answer_key, module, session_ids, dry_run))
+        else:
+            # A fork pool forks every worker on the first submit. Fetch the first chunk
+            # before closing the connections, so the children open their own and never
+            # share the parent's socket; the parent reconnects for the later chunks.
+            id_chunks = self._id_chunks(sessions, chunk_size)
+            first_chunk = next(id_chunks, None)
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=_init_worker,
+                initargs=(answer_key, module, dry_run),
+            ) as pool:
+                pending = deque()
+                for session_ids in chain([first_chunk] if first_chunk else [], id_chunks):
+                    pending.append(pool.submit(_regrade_chunk_in_worker, session_ids))
+                    if len(pending) >= workers * 2:
+                        self._collect(pending.popleft().result())
+                while pending:
+                    self._collect(pending.popleft().result())
+
+        if not dry_run:
+            # bulk_update skips the result signals that keep dashboard rollups current
+            rebuild_rollups(modules=[module], student_ids=list(sessions.values_list('user_id', flat=True).distinct()))
+
+        self._report_summary(time.monotonic() - self.started)
+
+    def _id_chunks(self, sessions, chunk_size):
+        """Keyset pagination over session ids so memory stays bounded."""
+        last_pk = 0
+        while True:
+            session_ids = list(
+                sessions.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not session_ids:
+                return
+            last_pk = session_ids[-1]
+            yield session_ids
+
+    def _collect(self, chunk_result):
+        stats, band_deltas = chunk_result
+        self.stats.update(stats)
+        self.band_deltas.update(band_deltas)
+        done = self.stats['scored'] + self.stats['failed']
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        self.stdout.write(f'  {done}/{self.total_sessions} sessions, {done / elapsed:.0f}/s')
+
+    def _report_summary(self, elapsed):
+        done = self.stats['scored'] + self.stats['failed']
+        rate = done / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Scored {self.stats["scored"]} sessions in {elapsed:.1f}s ({rate:.0f}/s): '
+            f'{self.stats["updated"]} results updated, {self.stats["created"]} created, '
+            f'{self.stats["failed"]} failed'
+        ))
+        changed = sum(self.band_deltas.values())
+        self.stdout.write(f'Band score changed for {changed} session(s)')
+        for delta in sorted(self.band_deltas):
+            self.stdout.write(f'  {delta:+.1f}: {self.band_deltas[delta]}')
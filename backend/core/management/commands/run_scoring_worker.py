@@ -0,0 +1,52 @@
+"""
+Processes queued AI essay scoring jobs (core.scoring_jobs).
+
+    python manage.py run_scoring_worker           # run until stopped
+    python manage.py run_scoring_worker --once    # drain due jobs and exit
+
+Several workers can run side by side; each claims its own jobs.
+"""
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.scoring_jobs import claim_jobs, release_jobs, run_job, worker_id
+
+
+class Command(BaseCommand):
+    help = 'Score queued writing essays with AI.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when no job is due')
+        parser.add_argument('--batch-size', type=int, default=5, help='Jobs claimed per poll')
+        parser.add_argument('--poll-interval', type=float, default=2, help='Seconds to wait when idle')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        owner = worker_id()
+        self.stopping = False
+        # Finish the current job on SIGTERM/SIGINT and hand the rest of the batch back
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write(f'Scoring worker {owner} started')
+        while not self.stopping:
+            close_old_connections()
+            jobs = claim_jobs(owner, limit=batch_size)
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+            for index, job in enumerate(jobs):
+                if self.stopping:
+                    release_jobs(jobs[index:], owner)
+                    break
+                ok = run_job(job, owner)
+                self.stdout.write(f'  job {job.pk} essay {job.essay_id}: {"scored" if ok else "not scored"}')
+        self.stdout.write(f'Scoring worker {owner} stopped')
+
+    def _stop(self, signum, frame):
+        self.stopping = True
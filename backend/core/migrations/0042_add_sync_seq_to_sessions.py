@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0041_add_ai_feedback_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listeningtestsession',
+            name='sync_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='readingtestsession',
+            name='sync_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0042_add_sync_seq_to_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentPerformanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('module', models.CharField(choices=[('listening', 'Listening'), ('reading', 'Reading'), ('writing', 'Writing'), ('speaking', 'Speaking')], max_length=16)),
+                ('week_start', models.DateField()),
+                ('is_diagnostic', models.BooleanField(default=False)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('band_sum', models.FloatField(default=0)),
+                ('band_count', models.PositiveIntegerField(default=0)),
+                ('teacher_band_sum', models.FloatField(default=0)),
+                ('teacher_band_count', models.PositiveIntegerField(default=0)),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='performance_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('student', 'module', 'week_start', 'is_diagnostic')},
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+TEACHER_ROLES = ('teacher', 'speaking_mentor')
+
+
+def backfill_assigned_teachers(apps, schema_editor):
+    # Frozen copy of core.teacher_assignment.backfill_assigned_teachers as of this migration
+    User = apps.get_model('core', 'User')
+    index = {}
+    for teacher_id, first_name, student_id in (
+        User.objects.filter(role__in=TEACHER_ROLES).values_list('id', 'first_name', 'student_id')
+    ):
+        label = (first_name or student_id or '').strip().lower()
+        if label:
+            index.setdefault(label, []).append(teacher_id)
+
+    students = (
+        User.objects.filter(role='student', assigned_teacher__isnull=True)
+        .exclude(teacher__isnull=True).exclude(teacher='')
+    )
+    pending = []
+    for student in students.only('id', 'teacher', 'assigned_teacher').iterator(chunk_size=500):
+        teacher_ids = index.get(student.teacher.strip().lower(), [])
+        # Unmatched and ambiguous names stay unlinked (matched by name)
+        if len(teacher_ids) == 1:
+            student.assigned_teacher_id = teacher_ids[0]
+            pending.append(student)
+        if len(pending) >= 500:
+            User.objects.bulk_update(pending, ['assigned_teacher'])
+            pending = []
+    if pending:
+        User.objects.bulk_update(pending, ['assigned_teacher'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0045_aiscorecacheentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['assigned_teacher', 'role'], name='core_user_teacher_role_idx'),
+        ),
+        migrations.RunPython(backfill_assigned_teachers, migrations.RunPython.noop),
+    ]
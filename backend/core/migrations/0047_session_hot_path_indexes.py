@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0046_user_assigned_teacher_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='writingtestsession',
+            index=models.Index(fields=['user', 'is_diagnostic', 'started_at'], name='core_wsession_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='essay',
+            index=models.Index(fields=['user', 'submitted_at'], name='core_essay_user_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listeningtestsession',
+            index=models.Index(fields=['user', 'is_diagnostic', 'completed_at'], name='core_lsession_user_done_idx',
+                               condition=models.Q(submitted=True)),
+        ),
+        migrations.AddIndex(
+            model_name='listeningtestsession',
+            index=models.Index(fields=['completed_at'], name='core_lsession_done_at_idx',
+                               condition=models.Q(submitted=True, is_diagnostic=False)),
+        ),
+        migrations.AddIndex(
+            model_name='readingtestsession',
+            index=models.Index(fields=['user', 'is_diagnostic', 'end_time'], name='core_rsession_user_done_idx',
+                               condition=models.Q(completed=True)),
+        ),
+        migrations.AddIndex(
+            model_name='readingtestsession',
+            index=models.Index(fields=['end_time'], name='core_rsession_done_at_idx',
+                               condition=models.Q(completed=True, is_diagnostic=False)),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations, models
+
+
+SEARCH_FIELDS = ('first_name', 'last_name', 'student_id', 'email')
+
+
+def build_search_text(user):
+    # Frozen copy of core.user_search.build_search_text as of this migration
+    return ' '.join(' '.join(getattr(user, field) or '' for field in SEARCH_FIELDS).split()).lower()
+
+
+def fill_search_text(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    batch = []
+    for user in User.objects.only('id', *SEARCH_FIELDS).iterator(chunk_size=1000):
+        user.search_text = build_search_text(user)
+        batch.append(user)
+        if len(batch) >= 1000:
+            User.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ['search_text'])
+
+
+def create_trigram_index(apps, schema_editor):
+    # pg_trgm GIN index for LIKE '%term%'; other backends (SQLite in tests) search without it
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS core_user_search_trgm_idx ON core_user USING gin (search_text gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS core_user_search_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0047_session_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
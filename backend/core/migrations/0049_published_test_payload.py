@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0048_user_search_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublishedTestPayload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test_type', models.CharField(choices=[('listening', 'Listening'), ('reading', 'Reading')], max_length=16)),
+                ('test_id', models.BigIntegerField()),
+                ('revision', models.DateTimeField(blank=True, null=True)),
+                ('payload', models.BinaryField()),
+                ('etag', models.CharField(max_length=64)),
+                ('raw_size', models.PositiveIntegerField(default=0)),
+                ('published_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('test_type', 'test_id'), name='core_published_test_uniq'),
+                ],
+            },
+        ),
+    ]
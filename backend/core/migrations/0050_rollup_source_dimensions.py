@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+
+def clear_rollups(apps, schema_editor):
+    # Old rows have no source dimensions; `manage.py rebuild_rollups --missing` (entrypoint.sh) recomputes them
+    apps.get_model('core', 'StudentPerformanceRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0049_published_test_payload'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='studentperformancerollup',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='studentperformancerollup',
+            name='source_test_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='studentperformancerollup',
+            name='source_prompt_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='studentperformancerollup',
+            name='in_test_session',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='studentperformancerollup',
+            name='feedback_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='studentperformancerollup',
+            index=models.Index(fields=['student', 'module', 'week_start'], name='core_rollup_student_week_idx'),
+        ),
+        migrations.RunPython(clear_rollups, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from django.conf import settings
+from django.utils import timezone
 from django.db.models import JSONField
 
 class UserManager(BaseUserManager):
@@ -39,6 +40,8 @@ class User(AbstractBaseUser):
     assigned_teacher = models.ForeignKey(
         'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='students_assigned'
     )
+    # Lowercased first/last name, student_id and email for search (core.user_search)
+    search_text = models.TextField(blank=True, default='', editable=False)
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
@@ -47,6 +50,12 @@ class User(AbstractBaseUser):
 
     USERNAME_FIELD = 'uid'
 
+    class Meta:
+        indexes = [
+            # Teacher queues: students of one teacher (core.teacher_assignment)
+            models.Index(fields=['assigned_teacher', 'role'], name='core_user_teacher_role_idx'),
+        ]
+
     def has_perm(self, perm, obj=None):
         return self.is_superuser
 
@@ -81,6 +90,11 @@ class WritingTestSession(models.Model):
     def __str__(self):
         return f"TestSession #{self.id} for {self.user.uid}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_diagnostic', 'started_at'], name='core_wsession_user_idx'),
+        ]
+
 class WritingTask(models.Model):
     test = models.ForeignKey(WritingTest, related_name='tasks', on_delete=models.CASCADE)
     task_type = models.CharField(max_length=10, choices=[('task1', 'Task 1'), ('task2', 'Task 2')])
@@ -125,6 +139,11 @@ class Essay(models.Model):
     task = models.ForeignKey(WritingTask, null=True, blank=True, on_delete=models.SET_NULL)
     prompt = models.ForeignKey(WritingPrompt, null=True, blank=True, on_delete=models.SET_NULL)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'submitted_at'], name='core_essay_user_submitted_idx'),
+        ]
+
 
 
 
@@ -256,6 +275,18 @@ class ListeningTestSession(models.Model):
     # Diagnostic marker for this session
     is_diagnostic = models.BooleanField(default=False)
     last_updated = models.DateTimeField(auto_now=True)
+    # Sequence number of the last applied delta sync (see core.session_sync)
+    sync_seq = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Per-student history and dashboards: submitted sessions only
+            models.Index(fields=['user', 'is_diagnostic', 'completed_at'], name='core_lsession_user_done_idx',
+                         condition=models.Q(submitted=True)),
+            # Curator date windows over all students
+            models.Index(fields=['completed_at'], name='core_lsession_done_at_idx',
+                         condition=models.Q(submitted=True, is_diagnostic=False)),
+        ]
 
 class ListeningStudentAnswer(models.Model):
     session = models.ForeignKey(ListeningTestSession, related_name='student_answers', on_delete=models.CASCADE)
@@ -358,6 +389,16 @@ class ReadingTestSession(models.Model):
     # Diagnostic marker for this session
     is_diagnostic = models.BooleanField(default=False)
     last_updated = models.DateTimeField(auto_now=True)
+    # Sequence number of the last applied delta sync (see core.session_sync)
+    sync_seq = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_diagnostic', 'end_time'], name='core_rsession_user_done_idx',
+                         condition=models.Q(completed=True)),
+            models.Index(fields=['end_time'], name='core_rsession_done_at_idx',
+                         condition=models.Q(completed=True, is_diagnostic=False)),
+        ]
 
     def __str__(self):
         return f"Reading Session for {self.user.email} on {self.test.title}"
@@ -494,3 +535,109 @@ class PlacementTestSubmission(models.Model):
     
     def __str__(self):
         return f"{self.full_name} - {self.score}/20 ({self.submitted_at.strftime('%Y-%m-%d')})"
+
+
+# --- DASHBOARD ROLLUPS ---
+class StudentPerformanceRollup(models.Model):
+    """Per student x module x week totals for curator dashboards (maintained by core.rollups)."""
+    MODULE_CHOICES = [
+        ('listening', 'Listening'),
+        ('reading', 'Reading'),
+        ('writing', 'Writing'),
+        ('speaking', 'Speaking'),
+    ]
+
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='performance_rollups')
+    module = models.CharField(max_length=16, choices=MODULE_CHOICES)
+    week_start = models.DateField()  # Monday of the week
+    is_diagnostic = models.BooleanField(default=False)
+    attempts = models.PositiveIntegerField(default=0)
+    # Listening/Reading result band, Writing AI overall band, Speaking overall band
+    band_sum = models.FloatField(default=0)
+    band_count = models.PositiveIntegerField(default=0)
+    # Writing only: teacher_overall_score from TeacherFeedback
+    teacher_band_sum = models.FloatField(default=0)
+    teacher_band_count = models.PositiveIntegerField(default=0)
+    last_activity = models.DateTimeField(null=True, blank=True)
+    # Source dimensions, so readers can scope rows like the live queries do (active tests only,
+    # essays of test sessions or of prompts): the Listening/Reading test or the essay's writing
+    # test, and the essay's prompt
+    source_test_id = models.IntegerField(null=True, blank=True)
+    source_prompt_id = models.IntegerField(null=True, blank=True)
+    in_test_session = models.BooleanField(default=False)
+    # Writing only: essays with a TeacherFeedback, scored or not
+    feedback_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'module', 'week_start'], name='core_rollup_student_week_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} {self.module} {self.week_start}"
+
+
+# --- ESSAY SCORING QUEUE ---
+class EssayScoringJob(models.Model):
+    """One AI scoring run for an essay, processed by the run_scoring_worker command (see core.scoring_jobs)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    essay = models.ForeignKey(Essay, on_delete=models.CASCADE, related_name='scoring_jobs')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)  # not picked up before (retry backoff)
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    locked_until = models.DateTimeField(null=True, blank=True)  # visibility timeout of a running job
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'], name='core_scoring_job_due_idx')]
+
+    def __str__(self):
+        return f"ScoringJob #{self.id} essay {self.essay_id} ({self.status})"
+
+
+class AIScoreCacheEntry(models.Model):
+    """ai_score_essay result stored under the content hash of its inputs (see core.utils.ai_score_cache_key)."""
+    key = models.CharField(max_length=64, unique=True)
+    prompt_version = models.CharField(max_length=32)
+    task_type = models.CharField(max_length=10)
+    result = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.prompt_version} {self.key[:12]}"
+
+
+class PublishedTestPayload(models.Model):
+    """
+    Student-facing structure of a Listening/Reading test without answer keys,
+    rendered at publish time and stored gzip-compressed (see core.published_tests).
+    """
+    TEST_TYPE_CHOICES = [('listening', 'Listening'), ('reading', 'Reading')]
+    test_type = models.CharField(max_length=16, choices=TEST_TYPE_CHOICES)
+    test_id = models.BigIntegerField()
+    revision = models.DateTimeField(null=True, blank=True)  # test.updated_at the payload was rendered from
+    payload = models.BinaryField()  # gzip-compressed JSON
+    etag = models.CharField(max_length=64)
+    raw_size = models.PositiveIntegerField(default=0)
+    published_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['test_type', 'test_id'], name='core_published_test_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.test_type} test #{self.test_id} ({self.revision})"
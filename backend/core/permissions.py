@@ -6,7 +6,7 @@ class IsStudent(BasePermission):
 
 class IsAdmin(BasePermission):
     def has_permission(self, request, view):
-        return request.user.role == 'admin'
+        return getattr(request.user, 'role', None) == 'admin'
 
 class IsTeacher(BasePermission):
     def has_permission(self, request, view):
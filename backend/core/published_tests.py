@@ -0,0 +1,228 @@
+"""
+Answer-key-free test payloads for students, rendered once at publish time.
+
+``ListeningTestViewSet.activate`` / ``ReadingTestViewSet.activate`` (and saves
+of an active test through the admin builders) render the student structure
+from an explicit allow-list of fields, never through the admin serializers,
+so ``correct_answers``, ``is_correct``, option points and the answers kept in
+``extra_data`` cannot reach students through a serializer change. The JSON is
+stored gzip-compressed in PublishedTestPayload and
+``/api/{listening,reading}-tests/<id>/student/`` returns those bytes as they
+are: one row read, no serializer work. Only active tests and diagnostic
+templates are served; the full structure at ``/api/{listening,reading}-tests/<id>/``
+(with the keys) is for admins only.
+
+The row remembers the ``test.updated_at`` it was rendered from. Every nested
+part/question/option edit bumps that revision (see core.answer_keys), and a
+stale or missing payload is re-published on the next student request.
+"""
+import gzip
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Prefetch, Q, Subquery
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from django.utils.http import parse_etags
+
+from .models import (
+    ListeningPart, ListeningQuestion, ListeningTest, PublishedTestPayload, ReadingPart, ReadingQuestion, ReadingTest,
+)
+
+# Keys that hold answers inside the free-form extra_data (gap/table/form answers,
+# statement answers, group item keys, option flags)
+ANSWER_KEY_FIELDS = frozenset({
+    'answer', 'answers', 'correct_answer', 'correct_answers', 'correctAnswer', 'correctAnswers',
+    'is_correct', 'isCorrect',
+})
+
+
+def strip_answer_keys(value):
+    """Copy of an extra_data value with every answer key removed at any depth."""
+    if isinstance(value, dict):
+        return {key: strip_answer_keys(item) for key, item in value.items() if key not in ANSWER_KEY_FIELDS}
+    if isinstance(value, list):
+        return [strip_answer_keys(item) for item in value]
+    return value
+
+
+def _file_url(field, fallback):
+    if field:
+        try:
+            return field.url or fallback or None
+        except ValueError:
+            pass
+    return fallback or None
+
+
+def _audio_url(audio):
+    if not audio:
+        return None
+    if audio.startswith(settings.MEDIA_URL):
+        return audio
+    return default_storage.url(audio)
+
+
+def listening_student_payload(test):
+    parts = ListeningPart.objects.filter(test=test).order_by('part_number', 'id').prefetch_related(
+        Prefetch('questions', queryset=ListeningQuestion.objects.order_by('order', 'id').prefetch_related('options'))
+    )
+    return {
+        'id': test.pk,
+        'title': test.title,
+        'description': test.description,
+        'is_diagnostic_template': test.is_diagnostic_template,
+        'parts': [{
+            'id': part.pk,
+            'part_number': part.part_number,
+            'audio': _audio_url(part.audio),
+            'audio_duration': part.audio_duration,
+            'instructions': part.instructions,
+            'questions': [{
+                'id': question.pk,
+                'order': question.order,
+                'question_type': question.question_type,
+                'question_text': question.question_text,
+                'extra_data': strip_answer_keys(question.extra_data or {}),
+                'header': question.header,
+                'instruction': question.instruction,
+                'task_prompt': question.task_prompt,
+                'image': _file_url(question.image_file, question.image),
+                'points': question.points,
+                'scoring_mode': question.scoring_mode,
+                'options': [
+                    {'id': option.pk, 'label': option.label, 'text': option.text}
+                    for option in sorted(question.options.all(), key=lambda option: option.pk)
+                ],
+            } for question in part.questions.all()],
+        } for part in parts],
+    }
+
+
+def reading_student_payload(test):
+    parts = ReadingPart.objects.filter(test=test).order_by('order', 'part_number', 'id').prefetch_related(
+        Prefetch('questions', queryset=ReadingQuestion.objects.order_by('order', 'id').prefetch_related('answer_options'))
+    )
+    return {
+        'id': test.pk,
+        'title': test.title,
+        'description': test.description,
+        'time_limit': test.time_limit,
+        'total_points': test.total_points,
+        'is_diagnostic_template': test.is_diagnostic_template,
+        'parts': [{
+            'id': part.pk,
+            'part_number': part.part_number,
+            'title': part.title,
+            'instructions': part.instructions,
+            'passage_text': part.passage_text,
+            'passage_heading': part.passage_heading,
+            'passage_image_url': part.passage_image_url or None,
+            'order': part.order,
+            'questions': [{
+                'id': question.pk,
+                'order': question.order,
+                'question_type': question.question_type,
+                'header': question.header,
+                'instruction': question.instruction,
+                'task_prompt': question.task_prompt,
+                'image_url': _file_url(question.image_file, question.image_url),
+                'question_text': question.question_text,
+                'points': question.points,
+                'extra_data': strip_answer_keys(question.extra_data or {}),
+                'answer_options': [
+                    {'id': option.pk, 'label': option.label, 'text': option.text}
+                    for option in sorted(question.answer_options.all(), key=lambda option: option.pk)
+                ],
+                'reading_scoring_type': question.reading_scoring_type,
+            } for question in part.questions.all()],
+        } for part in parts],
+    }
+
+
+TEST_KINDS = {
+    'listening': (ListeningTest, listening_student_payload),
+    'reading': (ReadingTest, reading_student_payload),
+}
+
+
+def publish_test(kind, test):
+    """Renders and stores the student payload of ``test`` for its current revision."""
+    build = TEST_KINDS[kind][1]
+    raw = json.dumps(build(test), cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+    published, _ = PublishedTestPayload.objects.update_or_create(
+        test_type=kind, test_id=test.pk,
+        defaults={
+            'revision': test.updated_at,
+            # mtime=0: re-publishing an unchanged test stores identical bytes
+            'payload': gzip.compress(raw, mtime=0),
+            'etag': f'"{kind}-{test.pk}-{hashlib.sha1(raw).hexdigest()[:20]}"',
+            'raw_size': len(raw),
+        },
+    )
+    return published
+
+
+def student_visible_tests(model):
+    """Tests students may open: active ones, and diagnostic templates (started from the diagnostic flow)."""
+    return model.objects.filter(Q(is_active=True) | Q(is_diagnostic_template=True))
+
+
+def get_published_payload(kind, test_id):
+    """
+    The current PublishedTestPayload of a test, read together with the test's
+    revision in one query; published first when missing or stale. Tests that
+    are not visible to students (see student_visible_tests) are a 404.
+    """
+    model = TEST_KINDS[kind][0]
+    try:
+        test_id = int(test_id)
+    except (TypeError, ValueError):
+        raise Http404
+    visible = student_visible_tests(model)
+    published = (
+        PublishedTestPayload.objects.filter(test_type=kind, test_id=test_id)
+        .annotate(current_revision=Subquery(visible.filter(pk=OuterRef('test_id')).values('updated_at')[:1]))
+        .first()
+    )
+    if published is not None and published.current_revision is not None \
+            and published.revision == published.current_revision:
+        return published
+    test = visible.filter(pk=test_id).first()
+    if test is None:
+        raise Http404
+    return publish_test(kind, test)
+
+
+def published_response(request, kind, test_id):
+    """
+    The stored payload byte-for-byte (gzip Content-Encoding when the client
+    accepts it), or 304 when If-None-Match holds its ETag.
+    """
+    published = get_published_payload(kind, test_id)
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if published.etag in if_none_match or '*' in if_none_match:
+        response = HttpResponse(status=304)
+    elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(bytes(published.payload), content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(gzip.decompress(bytes(published.payload)), content_type='application/json')
+    response['ETag'] = published.etag
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@receiver(post_delete, sender=ListeningTest)
+def _unpublish_listening_test(sender, instance, **kwargs):
+    PublishedTestPayload.objects.filter(test_type='listening', test_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=ReadingTest)
+def _unpublish_reading_test(sender, instance, **kwargs):
+    PublishedTestPayload.objects.filter(test_type='reading', test_id=instance.pk).delete()
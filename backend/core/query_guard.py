@@ -0,0 +1,122 @@
+"""
+N+1 query detection for tests and development.
+
+``QueryGuard`` hooks ``connection.execute_wrapper`` and fingerprints every
+SQL statement it sees: parameters are already placeholders, and literals and
+``IN (...)`` lists are collapsed, so the per-row queries of a loop over a
+queryset all share one fingerprint. When a fingerprint runs more than
+``threshold`` times the guard raises NPlusOneError (``mode='raise'``) or logs a
+warning (``mode='warn'``).
+
+- Tests: ``with QueryGuard(threshold=3): client.get(...)``, or
+  ``QueryBudgetMixin.assertQueryBudget`` which also caps the total count.
+- Development: QueryGuardMiddleware wraps every request when
+  ``QUERY_GUARD_MODE`` is 'warn' or 'raise' (default: 'warn' with DEBUG on,
+  'off' otherwise).
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE_RE = re.compile(r'\s+')
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    """The shape of a statement: literals become ?, IN lists become IN (...)."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryGuard:
+    """
+    Context manager recording the statements run inside it. ``repeated()``
+    lists the fingerprints seen more than ``threshold`` times; on exit they are
+    reported according to ``mode`` ('raise', 'warn' or 'off').
+    """
+
+    def __init__(self, threshold=None, mode='raise', label='', using=connection):
+        self.threshold = threshold if threshold is not None else settings.QUERY_GUARD_THRESHOLD
+        self.mode = mode
+        self.label = label
+        self.connection = using
+        self.statements = Counter()
+        self.examples = {}
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = fingerprint(sql)
+        self.statements[shape] += 1
+        self.examples.setdefault(shape, sql)
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return sum(self.statements.values())
+
+    def repeated(self):
+        return [(shape, count) for shape, count in self.statements.most_common() if count > self.threshold]
+
+    def report(self):
+        lines = [f"{count}x {self.examples[shape][:300]}" for shape, count in self.repeated()]
+        where = f" in {self.label}" if self.label else ''
+        return f"Repeated queries{where} (threshold {self.threshold}):\n" + '\n'.join(lines)
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._wrapper.__exit__(exc_type, exc, tb)
+        if exc_type is not None or self.mode == 'off' or not self.repeated():
+            return False
+        if self.mode == 'raise':
+            raise NPlusOneError(self.report())
+        logger.warning(self.report())
+        return False
+
+
+class QueryBudgetMixin:
+    """TestCase helpers pinning query counts and repeated statement shapes."""
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, repeat_threshold=None, label=''):
+        guard = QueryGuard(threshold=repeat_threshold, mode='off', label=label)
+        with guard:
+            yield guard
+        problems = []
+        if guard.count > max_queries:
+            problems.append(f"{label or 'Block'} ran {guard.count} queries, budget is {max_queries}")
+        if guard.repeated():
+            problems.append(guard.report())
+        if problems:
+            self.fail('\n'.join(problems))
+
+
+class QueryGuardMiddleware:
+    """Runs every request inside a QueryGuard when QUERY_GUARD_MODE is 'warn' or 'raise'."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.QUERY_GUARD_MODE
+        if mode not in ('warn', 'raise'):
+            return self.get_response(request)
+        with QueryGuard(mode=mode, label=f"{request.method} {request.path}"):
+            return self.get_response(request)
@@ -0,0 +1,255 @@
+"""
+Per-view latency and query-count instrumentation.
+
+RequestMetricsMiddleware times every sampled request and counts the SQL
+queries it runs (through ``connection.execute_wrapper``, so it works with
+DEBUG off), then records wall time, query count, SQL time and response size
+under the resolved URL name and method. Aggregates live in an in-process
+registry of fixed-bucket histograms:
+
+- ``/api/admin/request-metrics/`` (admins) returns them as JSON, slowest
+  routes first; DELETE resets them.
+- ``/api/metrics/`` returns the Prometheus text format. It is only served
+  when ``REQUEST_METRICS_TOKEN`` is set and must be scraped with
+  ``Authorization: Bearer <token>``.
+
+Every gunicorn worker keeps its own registry, so both endpoints describe the
+worker that answered; the ``worker`` label tells them apart in Prometheus.
+Requests slower than ``REQUEST_METRICS_SLOW_MS`` are logged as warnings.
+"""
+import hmac
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets (the last bucket is +Inf)
+DURATION_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+UNRESOLVED_ROUTE = '<unresolved>'
+
+
+class Histogram:
+    """Fixed-bucket histogram with sum, count and max."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        """[(upper bound, observations <= bound)], ending with ('+Inf', count)."""
+        total = 0
+        rows = []
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            rows.append((bound, total))
+        return rows
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the max for the +Inf bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return self.max if bound == '+Inf' else min(bound, self.max)
+        return self.max
+
+
+class RouteStats:
+    def __init__(self):
+        self.duration_ms = Histogram(DURATION_BUCKETS_MS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.sql_ms = 0.0
+        self.response_bytes = 0
+        self.slow = 0
+        self.errors = 0
+
+
+class MetricsRegistry:
+    """Thread-safe {(route, method): RouteStats} for one process."""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def record(self, route, method, status_code, duration_ms, queries, sql_ms, response_bytes, slow=False):
+        with self._lock:
+            stats = self._routes.get((route, method))
+            if stats is None:
+                stats = self._routes[(route, method)] = RouteStats()
+            stats.duration_ms.observe(duration_ms)
+            stats.queries.observe(queries)
+            stats.sql_ms += sql_ms
+            stats.response_bytes += response_bytes
+            stats.slow += int(slow)
+            stats.errors += int(status_code >= 500)
+
+    def items(self):
+        with self._lock:
+            return sorted(self._routes.items())
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self.started_at = time.time()
+
+
+registry = MetricsRegistry()
+
+
+class QueryCounter:
+    """``connection.execute_wrapper`` hook that counts queries and sums their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNRESOLVED_ROUTE
+    return match.view_name or match.route or UNRESOLVED_ROUTE
+
+
+def response_size(response):
+    if getattr(response, 'streaming', False):
+        return 0
+    return len(response.content)
+
+
+class RequestMetricsMiddleware:
+    """Records per-route latency, query count, SQL time and response size (see module docstring)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_METRICS_ENABLED or random.random() >= settings.REQUEST_METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        route = route_name(request)
+        slow = duration_ms >= settings.REQUEST_METRICS_SLOW_MS
+        registry.record(route, request.method, response.status_code, duration_ms,
+                        counter.count, counter.seconds * 1000, response_size(response), slow=slow)
+        if slow:
+            logger.warning(
+                f"Slow request {request.method} {request.path} ({route}): {duration_ms:.0f}ms, "
+                f"{counter.count} queries, {counter.seconds * 1000:.0f}ms SQL, status {response.status_code}"
+            )
+        return response
+
+
+def metrics_snapshot():
+    """JSON-friendly aggregates per route, slowest total time first."""
+    rows = []
+    for (route, method), stats in registry.items():
+        duration, queries = stats.duration_ms, stats.queries
+        rows.append({
+            'route': route,
+            'method': method,
+            'requests': duration.count,
+            'total_ms': round(duration.sum, 1),
+            'mean_ms': round(duration.sum / duration.count, 1),
+            'p50_ms': duration.quantile(0.5),
+            'p95_ms': duration.quantile(0.95),
+            'max_ms': round(duration.max, 1),
+            'mean_queries': round(queries.sum / queries.count, 1),
+            'max_queries': queries.max,
+            'mean_sql_ms': round(stats.sql_ms / duration.count, 1),
+            'mean_response_bytes': round(stats.response_bytes / duration.count),
+            'slow_requests': stats.slow,
+            'server_errors': stats.errors,
+        })
+    rows.sort(key=lambda row: row['total_ms'], reverse=True)
+    return {
+        'worker': os.getpid(),
+        'since': registry.started_at,
+        'sample_rate': settings.REQUEST_METRICS_SAMPLE_RATE,
+        'slow_ms': settings.REQUEST_METRICS_SLOW_MS,
+        'routes': rows,
+    }
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text():
+    worker = os.getpid()
+    lines = []
+
+    def histogram(name, help_text, values, scale=1):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, hist in values:
+            for bound, total in hist.cumulative():
+                le = bound if bound == '+Inf' else bound / scale
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {total}')
+            lines.append(f'{name}_sum{{{labels}}} {hist.sum / scale}')
+            lines.append(f'{name}_count{{{labels}}} {hist.count}')
+
+    def counter(name, help_text, values):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for labels, value in values:
+            lines.append(f'{name}{{{labels}}} {value}')
+
+    items = [
+        (f'route="{_escape_label(route)}",method="{method}",worker="{worker}"', stats)
+        for (route, method), stats in registry.items()
+    ]
+    histogram('ielts_request_duration_seconds', 'Wall time of sampled requests.',
+              [(labels, stats.duration_ms) for labels, stats in items], scale=1000)
+    histogram('ielts_request_db_queries', 'SQL queries per sampled request.',
+              [(labels, stats.queries) for labels, stats in items])
+    counter('ielts_request_db_seconds_total', 'SQL time of sampled requests.',
+            [(labels, stats.sql_ms / 1000) for labels, stats in items])
+    counter('ielts_response_bytes_total', 'Response body bytes of sampled requests.',
+            [(labels, stats.response_bytes) for labels, stats in items])
+    counter('ielts_slow_requests_total', 'Sampled requests over REQUEST_METRICS_SLOW_MS.',
+            [(labels, stats.slow) for labels, stats in items])
+    return '\n'.join(lines) + '\n'
+
+
+def prometheus_metrics_view(request):
+    """Prometheus scrape endpoint; 404 unless REQUEST_METRICS_TOKEN is configured and presented."""
+    token = settings.REQUEST_METRICS_TOKEN
+    presented = request.META.get('HTTP_AUTHORIZATION', '')
+    if not token or not hmac.compare_digest(presented.encode(), f'Bearer {token}'.encode()):
+        raise Http404
+    return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,357 @@
+"""
+Per student x module x week performance rollups (StudentPerformanceRollup).
+
+Rows are recomputed for one student, module and week whenever one of the
+sources changes (Listening/Reading result saved, essay saved, teacher
+feedback saved, speaking session saved), so the curator dashboards can read a
+handful of pre-aggregated rows instead of scanning every session.
+``rebuild_rollups`` recomputes everything; see the ``rebuild_rollups``
+management command (``--missing`` runs on every deploy and fills in weeks
+without rows). Every recompute locks the students' User rows first, so
+concurrent refreshes of one student run one after the other.
+
+Rows use the same definitions as the live (filtered) queries next to them:
+attempts are submitted Listening / completed Reading sessions, every essay and
+completed speaking sessions; last activity is completed_at / end_time /
+submitted_at; the speaking band averages every session with a band. Each row
+also carries its source test (and prompt, for essays), so ``rollup_totals``
+can apply the active-test and essay scoping of each dashboard at read time,
+with no rebuild when a test is activated or deactivated.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Count, DateField, Exists, ExpressionWrapper, F, IntegerField, Max, OuterRef, Q, Sum, Value,
+)
+from django.db.models.functions import Coalesce, TruncWeek
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    ListeningTest, ListeningTestSession, ListeningTestResult,
+    ReadingTest, ReadingTestSession, ReadingTestResult,
+    Essay, TeacherFeedback, SpeakingSession, StudentPerformanceRollup, WritingPrompt, WritingTest, User,
+)
+
+ROLLUP_MODULES = ['listening', 'reading', 'writing', 'speaking']
+
+# Students per transaction of a full rebuild
+REBUILD_BATCH_SIZE = 500
+
+# Which essays a writing rollup read covers (see rollup_totals)
+ESSAYS_ALL, ESSAYS_OF_PROMPTS, ESSAYS_OF_SESSIONS = 'all', 'prompts', 'sessions'
+
+
+def _no_value(output_field):
+    return Value(None, output_field=output_field)
+
+
+def _source_rows(module):
+    """Aggregated source rows for one module, grouped by student, week, diagnostic flag and source."""
+    attempt_filter = None
+    if module == 'listening':
+        qs = ListeningTestSession.objects.filter(submitted=True).annotate(
+            rollup_student=F('user_id'),
+            # Bucket only: sessions without completed_at still count, as in the live queries
+            rollup_when=Coalesce('completed_at', 'started_at'),
+            rollup_diagnostic=F('is_diagnostic'),
+            rollup_test=F('test_id'),
+            rollup_prompt=_no_value(IntegerField()),
+            rollup_in_session=Value(False, output_field=BooleanField()),
+        )
+        band, teacher_band, activity = 'listeningtestresult__band_score', None, 'completed_at'
+    elif module == 'reading':
+        qs = ReadingTestSession.objects.filter(completed=True).annotate(
+            rollup_student=F('user_id'),
+            rollup_when=Coalesce('end_time', 'start_time'),
+            rollup_diagnostic=F('is_diagnostic'),
+            rollup_test=F('test_id'),
+            rollup_prompt=_no_value(IntegerField()),
+            rollup_in_session=Value(False, output_field=BooleanField()),
+        )
+        band, teacher_band, activity = 'result__band_score', None, 'end_time'
+    elif module == 'writing':
+        qs = Essay.objects.annotate(
+            rollup_student=F('user_id'),
+            rollup_when=F('submitted_at'),
+            rollup_diagnostic=Coalesce('test_session__is_diagnostic', Value(False), output_field=BooleanField()),
+            rollup_test=F('test_session__test_id'),
+            rollup_prompt=F('prompt_id'),
+            rollup_in_session=ExpressionWrapper(Q(test_session__isnull=False), output_field=BooleanField()),
+        )
+        band, teacher_band, activity = 'overall_band', 'teacher_feedback__teacher_overall_score', 'submitted_at'
+    elif module == 'speaking':
+        qs = SpeakingSession.objects.annotate(
+            rollup_student=F('student_id'),
+            rollup_when=F('conducted_at'),
+            rollup_diagnostic=Value(False, output_field=BooleanField()),
+            rollup_test=_no_value(IntegerField()),
+            rollup_prompt=_no_value(IntegerField()),
+            rollup_in_session=Value(False, output_field=BooleanField()),
+        )
+        # Every session counts towards the band, completed ones are the attempts
+        attempt_filter = Q(completed=True)
+        band, teacher_band, activity = 'overall_band_score', None, 'conducted_at'
+    else:
+        raise ValueError(f'Unknown rollup module: {module}')
+
+    aggregates = {
+        'attempts': Count('pk', filter=attempt_filter),
+        'band_sum': Sum(band),
+        'band_count': Count(band),
+        'last_activity': Max(activity, filter=attempt_filter),
+    }
+    if teacher_band:
+        aggregates['teacher_band_sum'] = Sum(teacher_band)
+        aggregates['teacher_band_count'] = Count(teacher_band)
+        aggregates['feedback_count'] = Count('teacher_feedback')
+
+    return (
+        qs.annotate(rollup_week=TruncWeek('rollup_when', output_field=DateField()))
+        .values('rollup_student', 'rollup_week', 'rollup_diagnostic', 'rollup_test', 'rollup_prompt',
+                'rollup_in_session')
+        .annotate(**aggregates)
+        .order_by()
+    )
+
+
+def week_start(moment):
+    """Monday (local time) of the week ``moment`` falls in, as TruncWeek buckets it."""
+    day = timezone.localtime(moment).date()
+    return day - timedelta(days=day.weekday())
+
+
+def _week_bounds(week):
+    start = timezone.make_aware(datetime.combine(week, time.min))
+    return start, timezone.make_aware(datetime.combine(week + timedelta(days=7), time.min))
+
+
+def rebuild_rollups(modules=None, student_ids=None, week=None):
+    """
+    Recomputes rollup rows for the given modules (default: all), students
+    (default: all) and week (a Monday; default: every week). Returns the number
+    of rows written.
+    """
+    modules = modules or ROLLUP_MODULES
+    if student_ids is not None:
+        return _rebuild_students(modules, student_ids, week)
+    # Every student, one batch (and transaction) at a time, so the student locks stay short
+    written = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            User.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:REBUILD_BATCH_SIZE]
+        )
+        if not batch:
+            return written
+        last_pk = batch[-1]
+        written += _rebuild_students(modules, batch, week)
+
+
+def _rebuild_students(modules, student_ids, week):
+    written = 0
+    with transaction.atomic():
+        # Rows are replaced by delete + insert: two refreshes of one student (Task 1 and Task 2
+        # scored by different workers, feedback saved next to an essay) must not interleave, or
+        # both insert and the totals double. Locking in pk order keeps concurrent batches deadlock-free.
+        list(User.objects.select_for_update().filter(pk__in=student_ids).order_by('pk').values_list('pk', flat=True))
+        for module in modules:
+            rows = _source_rows(module).filter(rollup_student__in=student_ids)
+            existing = StudentPerformanceRollup.objects.filter(module=module, student_id__in=student_ids)
+            if week is not None:
+                start, end = _week_bounds(week)
+                rows = rows.filter(rollup_when__gte=start, rollup_when__lt=end)
+                existing = existing.filter(week_start=week)
+            existing.delete()
+
+            batch = []
+            for row in rows.iterator(chunk_size=2000):
+                if row['rollup_week'] is None:
+                    continue
+                batch.append(StudentPerformanceRollup(
+                    student_id=row['rollup_student'],
+                    module=module,
+                    week_start=row['rollup_week'],
+                    is_diagnostic=bool(row['rollup_diagnostic']),
+                    source_test_id=row['rollup_test'],
+                    source_prompt_id=row['rollup_prompt'],
+                    in_test_session=bool(row['rollup_in_session']),
+                    attempts=row['attempts'],
+                    band_sum=row['band_sum'] or 0,
+                    band_count=row['band_count'],
+                    teacher_band_sum=row.get('teacher_band_sum') or 0,
+                    teacher_band_count=row.get('teacher_band_count') or 0,
+                    feedback_count=row.get('feedback_count') or 0,
+                    last_activity=row['last_activity'],
+                ))
+                if len(batch) >= 2000:
+                    StudentPerformanceRollup.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                StudentPerformanceRollup.objects.bulk_create(batch)
+                written += len(batch)
+    return written
+
+
+def students_missing_rollups(module):
+    """
+    Ids of students with activity in ``module`` during a week that has no
+    rollup row, as after a migration created or cleared the table.
+    """
+    model, student_field, filters, when = {
+        'listening': (ListeningTestSession, 'user_id', {'submitted': True}, Coalesce('completed_at', 'started_at')),
+        'reading': (ReadingTestSession, 'user_id', {'completed': True}, Coalesce('end_time', 'start_time')),
+        'writing': (Essay, 'user_id', {}, F('submitted_at')),
+        'speaking': (SpeakingSession, 'student_id', {}, F('conducted_at')),
+    }[module]
+    has_row = StudentPerformanceRollup.objects.filter(
+        module=module, student_id=OuterRef(student_field), week_start=OuterRef('rollup_week'))
+    return list(
+        model.objects.filter(**filters)
+        .annotate(rollup_week=TruncWeek(when, output_field=DateField()))
+        .filter(rollup_week__isnull=False)
+        .exclude(Exists(has_row))
+        .values_list(student_field, flat=True).distinct().order_by()
+    )
+
+
+def refresh_student_rollup(student_id, module, when=None):
+    """
+    Incremental update: recomputes one student's rows for one module, limited
+    to the week of ``when`` when it is known.
+    """
+    if student_id is None:
+        return
+    rebuild_rollups(modules=[module], student_ids=[student_id], week=week_start(when) if when else None)
+
+
+def _refresh_on_commit(student_id, module, when=None):
+    # After commit, so a cascade delete of the student cannot re-create rows mid-delete
+    if student_id is not None:
+        transaction.on_commit(lambda: refresh_student_rollup(student_id, module, when))
+
+
+def rollup_scope(active_only=False, essays=ESSAYS_ALL):
+    """
+    Q over rollup rows matching a dashboard's live definitions: ``active_only``
+    keeps Listening/Reading rows of active tests (and essays of active prompts
+    or writing tests); ``essays`` picks every essay, essays with a prompt, or
+    essays written in a writing test session.
+    """
+    listening, reading, writing = Q(module='listening'), Q(module='reading'), Q(module='writing')
+    if essays == ESSAYS_OF_PROMPTS:
+        writing &= Q(source_prompt_id__isnull=False)
+    elif essays == ESSAYS_OF_SESSIONS:
+        writing &= Q(in_test_session=True)
+    if active_only:
+        listening &= Q(source_test_id__in=ListeningTest.objects.filter(is_active=True).values('id'))
+        reading &= Q(source_test_id__in=ReadingTest.objects.filter(is_active=True).values('id'))
+        if essays == ESSAYS_OF_PROMPTS:
+            writing &= Q(source_prompt_id__in=WritingPrompt.objects.filter(is_active=True).values('id'))
+        elif essays == ESSAYS_OF_SESSIONS:
+            writing &= Q(source_test_id__in=WritingTest.objects.filter(is_active=True).values('id'))
+    return listening | reading | writing | Q(module='speaking')
+
+
+def rollup_totals(students, include_diagnostic=True, active_only=False, essays=ESSAYS_ALL):
+    """
+    Sums rollup rows over all weeks for a student queryset, scoped by
+    rollup_scope(active_only, essays).
+    Returns {student_id: {module: {'attempts', 'band_sum', 'band_count',
+    'teacher_band_sum', 'teacher_band_count', 'feedback_count', 'last_activity'}}}.
+    """
+    qs = StudentPerformanceRollup.objects.filter(rollup_scope(active_only, essays), student__in=students)
+    if not include_diagnostic:
+        qs = qs.filter(is_diagnostic=False)
+    rows = qs.values('student_id', 'module').annotate(
+        attempts_total=Sum('attempts'),
+        band_sum_total=Sum('band_sum'),
+        band_count_total=Sum('band_count'),
+        teacher_band_sum_total=Sum('teacher_band_sum'),
+        teacher_band_count_total=Sum('teacher_band_count'),
+        feedback_count_total=Sum('feedback_count'),
+        last_activity_max=Max('last_activity'),
+    ).order_by()
+
+    totals = {}
+    for row in rows:
+        totals.setdefault(row['student_id'], {})[row['module']] = {
+            'attempts': row['attempts_total'] or 0,
+            'band_sum': row['band_sum_total'] or 0,
+            'band_count': row['band_count_total'] or 0,
+            'teacher_band_sum': row['teacher_band_sum_total'] or 0,
+            'teacher_band_count': row['teacher_band_count_total'] or 0,
+            'feedback_count': row['feedback_count_total'] or 0,
+            'last_activity': row['last_activity_max'],
+        }
+    return totals
+
+
+def rollup_mean(totals, prefix='band'):
+    """Average band of a rollup_totals() entry, or None if nothing was scored."""
+    if not totals or not totals[f'{prefix}_count']:
+        return None
+    return totals[f'{prefix}_sum'] / totals[f'{prefix}_count']
+
+
+# --- Incremental updates ---
+
+@receiver(post_save, sender=ListeningTestResult)
+@receiver(post_delete, sender=ListeningTestResult)
+def _listening_result_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    session = ListeningTestSession.objects.filter(pk=instance.session_id).values(
+        'user_id', 'completed_at', 'started_at').first()
+    if session:
+        _refresh_on_commit(session['user_id'], 'listening', session['completed_at'] or session['started_at'])
+
+
+@receiver(post_delete, sender=ListeningTestSession)
+def _listening_session_deleted(sender, instance, **kwargs):
+    _refresh_on_commit(instance.user_id, 'listening', instance.completed_at or instance.started_at)
+
+
+@receiver(post_save, sender=ReadingTestResult)
+@receiver(post_delete, sender=ReadingTestResult)
+def _reading_result_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    session = ReadingTestSession.objects.filter(pk=instance.session_id).values(
+        'user_id', 'end_time', 'start_time').first()
+    if session:
+        _refresh_on_commit(session['user_id'], 'reading', session['end_time'] or session['start_time'])
+
+
+@receiver(post_delete, sender=ReadingTestSession)
+def _reading_session_deleted(sender, instance, **kwargs):
+    _refresh_on_commit(instance.user_id, 'reading', instance.end_time or instance.start_time)
+
+
+@receiver(post_save, sender=Essay)
+@receiver(post_delete, sender=Essay)
+def _essay_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _refresh_on_commit(instance.user_id, 'writing', instance.submitted_at)
+
+
+@receiver(post_save, sender=TeacherFeedback)
+@receiver(post_delete, sender=TeacherFeedback)
+def _teacher_feedback_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    essay = Essay.objects.filter(pk=instance.essay_id).values('user_id', 'submitted_at').first()
+    if essay:
+        _refresh_on_commit(essay['user_id'], 'writing', essay['submitted_at'])
+
+
+@receiver(post_save, sender=SpeakingSession)
+@receiver(post_delete, sender=SpeakingSession)
+def _speaking_session_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _refresh_on_commit(instance.student_id, 'speaking', instance.conducted_at)
@@ -0,0 +1,314 @@
+"""
+DB-backed queue for AI essay scoring (ESSAY_SCORING_ASYNC = True).
+
+FinishWritingSessionView enqueues one EssayScoringJob per unscored essay and
+returns right away; ``manage.py run_scoring_worker`` claims due jobs, calls the
+AI scorer and writes the scores back. A claimed job stays invisible to other
+workers until its visibility timeout expires, so the jobs of a crashed worker
+are picked up again. Failed attempts are retried with exponential backoff up
+to ``max_attempts``. Clients poll /api/writing-sessions/<id>/scoring-status/.
+"""
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import AIScoreCacheEntry, Essay, EssayScoringJob
+from .utils import AI_SCORING_PROMPT_VERSION, ai_score_cache_key, ai_score_essay
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+IMAGE_BASE_URL = "https://ielts.mastereducation.kz"
+
+
+class ScoringError(Exception):
+    pass
+
+
+def is_enabled():
+    return getattr(settings, 'ESSAY_SCORING_ASYNC', False)
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def round_band(raw):
+    # IELTS округление: < 0.25 → вниз, ≥ 0.25 и < 0.75 → 0.5, ≥ 0.75 → вверх
+    decimal_part = raw - int(raw)
+    if decimal_part < 0.25:
+        return int(raw)
+    elif decimal_part < 0.75:
+        return int(raw) + 0.5
+    return int(raw) + 1.0
+
+
+def needs_scoring(essay):
+    return essay.overall_band is None or essay.feedback is None
+
+
+def essay_image_url(essay):
+    """Absolute URL of the Task 1 image for the Vision prompt, or None."""
+    task = essay.task
+    if not task or not getattr(task, 'image', None):
+        return None
+    try:
+        if task.image.url.startswith('http'):
+            return task.image.url
+        return f"{IMAGE_BASE_URL}/{task.image.url.lstrip('/')}"
+    except Exception:
+        return None
+
+
+def request_ai_scores(essay, image_url=None, timeout=None):
+    """The OpenAI round trip for one essay; touches no DB, so it can run in a thread."""
+    return ai_score_essay(essay.question_text, essay.submitted_text, essay.task_type, image_url, timeout=timeout)
+
+
+def apply_ai_scores(essay, ai_result):
+    """Copies an ai_score_essay result onto the essay and saves it."""
+    # AI функция всегда возвращает task_response (даже для Task 1)
+    essay.score_task = ai_result.get('task_response')
+    essay.score_coherence = ai_result.get('coherence')
+    essay.score_lexical = ai_result.get('lexical')
+    essay.score_grammar = ai_result.get('grammar')
+    # НЕ сохраняем overall_band от AI - рассчитываем сами
+    essay.feedback = ai_result.get('feedback')
+
+    individual_scores = [essay.score_task, essay.score_coherence, essay.score_lexical, essay.score_grammar]
+    if all(score is not None for score in individual_scores):
+        essay.overall_band = round_band(sum(individual_scores) / len(individual_scores))
+    essay.save()
+    return essay
+
+
+def score_cache_key(essay, image_url=None):
+    return ai_score_cache_key(essay.question_text, essay.submitted_text, essay.task_type, image_url)
+
+
+def cached_ai_scores(key):
+    """Stored AI result for a cache key, or None. Identical inputs are never sent to OpenAI twice."""
+    entry = AIScoreCacheEntry.objects.filter(key=key).only('id', 'result').first()
+    if entry is None:
+        return None
+    AIScoreCacheEntry.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_hit_at=timezone.now())
+    return entry.result
+
+
+def store_ai_scores(key, task_type, ai_result):
+    """Caches a complete AI result; failed or partial results are not stored so they get retried."""
+    if any(ai_result.get(field) is None for field in ('task_response', 'coherence', 'lexical', 'grammar')):
+        return
+    AIScoreCacheEntry.objects.get_or_create(key=key, defaults={
+        'prompt_version': AI_SCORING_PROMPT_VERSION,
+        'task_type': task_type,
+        'result': ai_result,
+    })
+
+
+def score_essay(essay):
+    """Scores one essay (from the AI score cache when possible) and saves the result."""
+    image_url = essay_image_url(essay)
+    key = score_cache_key(essay, image_url)
+    ai_result = cached_ai_scores(key)
+    if ai_result is None:
+        ai_result = request_ai_scores(essay, image_url)
+        store_ai_scores(key, essay.task_type, ai_result)
+    return apply_ai_scores(essay, ai_result)
+
+
+def score_essays_concurrently(essays, deadline=None):
+    """
+    Scores several essays (Task 1 and Task 2 of a session) in parallel threads
+    that share one deadline, saving each result as soon as it arrives. Cached
+    results are applied first without a request. Cache and DB access stay on
+    the calling thread.
+    Returns {essay_id: error} for essays that raised or missed the deadline.
+    """
+    deadline = deadline or settings.ESSAY_SCORING_DEADLINE
+    expires_at = time.monotonic() + deadline
+    errors = {}
+    misses = []
+    for essay in essays:
+        image_url = essay_image_url(essay)
+        key = score_cache_key(essay, image_url)
+        ai_result = cached_ai_scores(key)
+        if ai_result is not None:
+            apply_ai_scores(essay, ai_result)
+        else:
+            misses.append((essay, image_url, key))
+    if not misses:
+        return errors
+
+    pending = {}
+    pool = ThreadPoolExecutor(max_workers=len(misses))
+    try:
+        for essay, image_url, key in misses:
+            remaining = max(expires_at - time.monotonic(), 0.001)
+            pending[pool.submit(request_ai_scores, essay, image_url, remaining)] = (essay, key)
+        for future in as_completed(list(pending), timeout=max(expires_at - time.monotonic(), 0)):
+            essay, key = pending.pop(future)
+            try:
+                ai_result = future.result()
+                store_ai_scores(key, essay.task_type, ai_result)
+                apply_ai_scores(essay, ai_result)
+            except Exception as e:
+                errors[essay.pk] = str(e)
+    except FuturesTimeout:
+        for essay, _ in pending.values():
+            errors[essay.pk] = f'timed out after {deadline}s'
+    finally:
+        # Do not wait for calls that missed the deadline
+        pool.shutdown(wait=False, cancel_futures=True)
+    return errors
+
+
+def writing_overall_band(essays):
+    """Session band: mean of the Task 1 and Task 2 bands, or None until both are scored."""
+    band1 = band2 = None
+    for essay in essays:
+        if essay.task_type == 'task1':
+            band1 = essay.overall_band
+        elif essay.task_type == 'task2':
+            band2 = essay.overall_band
+    if band1 is None or band2 is None:
+        return None
+    return round_band((band1 + band2) / 2)
+
+
+def enqueue_essay_scoring(essays):
+    """Queues every essay that still needs scoring and has no queued/running job. Returns the new jobs."""
+    essays = [essay for essay in essays if needs_scoring(essay)]
+    if not essays:
+        return []
+    active = set(
+        EssayScoringJob.objects.filter(essay__in=essays, status__in=ACTIVE_STATUSES)
+        .values_list('essay_id', flat=True)
+    )
+    jobs = [
+        EssayScoringJob(essay=essay, max_attempts=settings.ESSAY_SCORING_MAX_ATTEMPTS)
+        for essay in essays if essay.pk not in active
+    ]
+    return EssayScoringJob.objects.bulk_create(jobs)
+
+
+def retry_delay(attempts):
+    """Exponential backoff after the given number of failed attempts."""
+    delay = settings.ESSAY_SCORING_RETRY_BASE * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, settings.ESSAY_SCORING_RETRY_MAX))
+
+
+def claim_jobs(owner, limit=5, visibility_timeout=None):
+    """
+    Locks up to ``limit`` due jobs for ``owner``: queued jobs whose backoff has
+    passed and running jobs whose visibility timeout expired.
+    """
+    visibility_timeout = visibility_timeout or settings.ESSAY_SCORING_VISIBILITY_TIMEOUT
+    now = timezone.now()
+    expired = Q(status='running', locked_until__lt=now)
+    # A job that timed out on its last attempt is not handed out again
+    EssayScoringJob.objects.filter(expired, attempts__gte=F('max_attempts')).update(
+        status='failed', finished_at=now, locked_until=None,
+        last_error='Visibility timeout expired on the last attempt',
+    )
+    with transaction.atomic():
+        jobs = list(
+            EssayScoringJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='queued', run_after__lte=now) | expired)
+            .order_by('run_after', 'id')[:limit]
+        )
+        for job in jobs:
+            job.status = 'running'
+            job.attempts += 1
+            job.locked_by = owner
+            job.locked_until = now + timedelta(seconds=visibility_timeout)
+        if jobs:
+            EssayScoringJob.objects.bulk_update(jobs, ['status', 'attempts', 'locked_by', 'locked_until'])
+    return jobs
+
+
+def release_jobs(jobs, owner):
+    """Hands claimed but unstarted jobs back to the queue without using up an attempt."""
+    EssayScoringJob.objects.filter(pk__in=[job.pk for job in jobs], status='running', locked_by=owner).update(
+        status='queued', attempts=F('attempts') - 1, locked_by='', locked_until=None,
+    )
+
+
+def run_job(job, owner):
+    """
+    Scores the job's essay. Returns True on success. The final status is only
+    written while ``owner`` still holds the job, so a worker whose job was
+    reclaimed after a timeout cannot overwrite the new owner's outcome.
+    """
+    owned = EssayScoringJob.objects.filter(pk=job.pk, status='running', locked_by=owner)
+    try:
+        essay = Essay.objects.select_related('task').get(pk=job.essay_id)
+        if needs_scoring(essay):
+            score_essay(essay)
+            if essay.overall_band is None:
+                raise ScoringError(essay.feedback or 'AI returned no scores')
+    except Exception as e:
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            logger.error(f"Essay scoring job {job.pk} failed after {job.attempts} attempts: {e}")
+            owned.update(status='failed', last_error=str(e), finished_at=now, locked_until=None)
+        else:
+            logger.warning(f"Essay scoring job {job.pk} attempt {job.attempts} failed, retrying: {e}")
+            owned.update(status='queued', last_error=str(e), run_after=now + retry_delay(job.attempts),
+                         locked_by='', locked_until=None)
+        return False
+    owned.update(status='done', last_error='', finished_at=timezone.now(), locked_until=None)
+    return True
+
+
+def session_scoring_status(session):
+    """
+    Scoring progress of a writing session for the status endpoint: 'pending'
+    while any essay has a queued/running job, 'failed' if an essay's last job
+    failed, 'not_scored' if an essay was never queued, 'done' otherwise.
+    """
+    essays = list(Essay.objects.filter(test_session=session).order_by('task_type'))
+    latest_jobs = {}
+    for job in EssayScoringJob.objects.filter(essay__in=essays).order_by('essay_id', '-id'):
+        latest_jobs.setdefault(job.essay_id, job)
+
+    essay_states = []
+    for essay in essays:
+        job = latest_jobs.get(essay.pk)
+        if not needs_scoring(essay):
+            state = 'done'
+        elif job is None:
+            state = 'not_queued'
+        else:
+            state = 'pending' if job.status in ACTIVE_STATUSES else job.status
+        essay_states.append({
+            'id': essay.pk,
+            'task_type': essay.task_type,
+            'status': state,
+            'attempts': job.attempts if job else 0,
+            'last_error': job.last_error if job and state != 'done' else '',
+        })
+
+    states = {item['status'] for item in essay_states}
+    if 'pending' in states:
+        status = 'pending'
+    elif 'failed' in states:
+        status = 'failed'
+    elif 'not_queued' in states:
+        status = 'not_scored'
+    else:
+        status = 'done'
+    return {
+        'session_id': session.pk,
+        'status': status,
+        'overall_band': writing_overall_band(essays),
+        'essays': essay_states,
+    }
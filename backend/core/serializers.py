@@ -6,12 +6,21 @@ from .models import (
     ReadingTest, ReadingPart, ReadingQuestion, ReadingAnswerOption,
     ReadingTestSession, ReadingTestResult, TeacherFeedback, TeacherSatisfactionSurvey, SpeakingSession
 )
+from .answer_keys import (
+    get_answer_key, build_listening_results, normalize_answer, check_alternative_answers,
+    format_alternative_answers_display, normalize_correct_answers_for_gaps,
+)
 import re
 import json
 import base64
 import uuid
 import binascii
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.base import ContentFile
+from django.db import transaction
+from .editor_save import KEEP_IMAGE, LISTENING_STRUCTURE, READING_STRUCTURE, Row, save_test_structure
+from .structure_cache import LISTENING_KINDS, READING_KINDS, invalidate_test_structure
+from .teacher_assignment import is_students_teacher
 
 
 def decode_base64_file(data):
@@ -43,6 +52,37 @@ def decode_base64_file(data):
         return None
     return ContentFile(decoded, name=f"{uuid.uuid4().hex}.{file_ext}")
 
+
+def pop_question_image(question_data):
+    """
+    The new image_file of an editor question: a file, None to clear it, or
+    KEEP_IMAGE when the question data carries no image change.
+    """
+    image_file = question_data.pop('image_file', KEEP_IMAGE)
+    image_base64 = question_data.pop('image_base64', None)
+    if image_base64 not in [None, '', 'null']:
+        return decode_base64_file(image_base64) or image_file
+    if image_base64 in ['', 'null']:
+        return None
+    return image_file
+
+
+def save_editor_structure(test, structure, parts):
+    try:
+        save_test_structure(test, structure, parts)
+    except DjangoValidationError as error:
+        raise serializers.ValidationError({'parts': error.messages})
+
+
+class EditorRowIdField(serializers.Field):
+    """Row id sent by the test editor: a stored id, or a placeholder ('q-1700000000') for a new row."""
+
+    def to_internal_value(self, data):
+        return data
+
+    def to_representation(self, value):
+        return value
+
 class WritingTestSerializer(serializers.ModelSerializer):
     tasks = serializers.SerializerMethodField()
     
@@ -191,51 +231,21 @@ class ListeningTestSessionSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ListeningTestSession
-        fields = ['id', 'test', 'test_title', 'user', 'student_id', 'started_at', 'status', 'answers', 'flagged', 'time_left', 'submitted', 'is_diagnostic']
-        read_only_fields = ['id', 'user', 'started_at', 'status', 'submitted']
+        fields = ['id', 'test', 'test_title', 'user', 'student_id', 'started_at', 'status', 'answers', 'flagged', 'time_left', 'submitted', 'is_diagnostic', 'sync_seq']
+        read_only_fields = ['id', 'user', 'started_at', 'status', 'submitted', 'sync_seq']
 
 
 class ListeningTestListSerializer(serializers.ModelSerializer):
-    has_attempted = serializers.SerializerMethodField()
-    is_active = serializers.BooleanField()
-    parts_count = serializers.SerializerMethodField()
-    time_limit = serializers.SerializerMethodField()
+    # Rows of ListeningTestViewSet.list: no nested parts, the counts are annotated on the queryset
+    parts_count = serializers.IntegerField(read_only=True)
+    questions_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = ListeningTest
-        fields = ['id', 'title', 'description', 'has_attempted', 'is_active', 'parts_count', 'time_limit']
-
-    def get_parts_count(self, obj):
-        return obj.parts.count()
-
-    def get_time_limit(self, obj):
-        # Assuming time_limit is stored on the test model. If not, this needs adjustment.
-        # Let's say we calculate it based on parts or have a default.
-        # For now, let's look for a `time_limit` attribute, or default to 40.
-        return getattr(obj, 'time_limit', 40)
-
-    def get_has_attempted(self, obj):
-        request = self.context.get('request')
-        if request:
-            
-            auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-            if auth_header.startswith('Bearer '):
-                from .firebase_config import verify_firebase_token
-                
-                id_token = auth_header.split(' ')[1]
-                decoded = verify_firebase_token(id_token)
-                if decoded:
-                    uid = decoded['uid']
-                    try:
-                        user = User.objects.get(uid=uid)
-                        return ListeningTestSession.objects.filter(
-                            test=obj,
-                            user=user,
-                            completed=True
-                        ).exists()
-                    except User.DoesNotExist:
-                        pass
-        return False
+        fields = [
+            'id', 'title', 'description', 'is_active', 'is_diagnostic_template', 'explanation_url',
+            'parts_count', 'questions_count', 'created_at', 'updated_at'
+        ]
 
 
 class ListeningTestDetailSerializer(serializers.ModelSerializer):
@@ -281,557 +291,12 @@ def create_detailed_breakdown(session, test_type='reading'):
     """
     Создает детальный breakdown для всех подвопросов в сессии.
     Может работать как с Reading, так и с Listening тестами.
-    Эта версия полностью переработана для надежной обработки разных форматов ответов.
+    Ключ ответов компилируется один раз на ревизию теста (см. core.answer_keys),
+    поэтому подсчет не обращается к ORM за структурой теста.
     """
     try:
-        detailed_breakdown = []
-        
-        # Определяем модели на основе типа теста
-        PartModel = ReadingPart if test_type == 'reading' else ListeningPart
-        
-        for part in session.test.parts.all().order_by('part_number'):
-            part_data = {
-                'part_number': part.part_number,
-                'instructions': getattr(part, 'instructions', ''),
-                'passage_text': getattr(part, 'passage_text', ''),
-                'questions': []
-            }
-
-            questions_query = part.questions.all().order_by('order') if test_type == 'reading' else part.questions.all().order_by('order')
-
-            for question in questions_query:
-                try:
-                    question_data = {
-                        'question_id': question.id,
-                        'question_text': question.question_text or '',
-                        'question_type': question.question_type,
-                        'header': getattr(question, 'header', ''),
-                        'instruction': getattr(question, 'instruction', ''),
-                        'image_url': getattr(question, 'image_url', getattr(question, 'image', None)),
-                        'sub_questions': [],
-                        'correct_sub_questions': 0,
-                        'total_sub_questions': 0,
-                        'points': getattr(question, 'points', 1),
-                        'scoring_mode': getattr(question, 'reading_scoring_type', 'total') if test_type == 'reading' else getattr(question, 'scoring_mode', 'total')
-                    }
-                    
-                    sub_questions_data = []
-                    correct_sub_questions = 0
-                    total_sub_questions = 0
-                    all_user_answers = session.answers or {}
-
-                    # --- Multiple Response (оценивается как единое целое) ---
-                    if question.question_type in ['multiple_response', 'checkbox', 'multi_select', 'multipleresponse']:
-                        # Проверяем, это Reading или Listening вопрос
-                        if hasattr(question, 'answer_options'):  # Reading
-                            # Используем новые функции для Reading multiple_response
-                            breakdown = get_reading_multiple_response_breakdown(question, all_user_answers)
-                            correct_sub_questions = breakdown['total_score']
-                            total_sub_questions = breakdown['max_score']
-                            
-                            # Определяем общий статус для multiple_response вопроса
-                            selected_options = set(breakdown['selected_options'])
-                            correct_options = set(breakdown['correct_options'])
-                            
-                            if question.reading_scoring_type == 'all_or_nothing':
-                                # Для all_or_nothing: выбранные опции должны точно совпадать с правильными
-                                is_question_correct = (selected_options == correct_options)
-                            else:  # per_correct_option
-                                # Для per_correct_option: все правильные выбраны И никаких неправильных
-                                is_question_correct = (correct_options.issubset(selected_options) and 
-                                                     selected_options.issubset(correct_options))
-                            
-                            # Формируем опции для отображения
-                            options_data = []
-                            for option in question.answer_options.all():
-                                option_detail = next((d for d in breakdown['option_details'] if d['label'] == option.label), None)
-                                was_selected = option_detail['student_selected'] if option_detail else False
-                                should_be_selected = option.is_correct
-                                
-                                options_data.append({
-                                    'label': option.label,
-                                    'text': option.text,
-                                    'student_selected': was_selected,
-                                    'is_correct_option': should_be_selected,
-                                    'points': option.reading_points
-                                })
-                            
-                            # Добавляем один элемент для всего multiple_response вопроса
-                            sub_questions_data.append({
-                                'type': 'multiple_response',
-                                'is_correct': is_question_correct,
-                                'scoring_mode': question.reading_scoring_type,
-                                'selected_count': len(selected_options),
-                                'correct_count': len(correct_options),
-                                'options': options_data,
-                                'user_answer': f"Selected {len(selected_options)} option(s)",
-                                'correct_answer': f"Should select {len(correct_options)} option(s)"
-                            })
-                        else:  # Listening - старая логика
-                            # Проверяем, что это действительно Listening вопрос
-                            if hasattr(question, 'options'):
-                                options = list(question.options.all())
-                            else:
-                                # Если это Reading вопрос без answer_options, это НЕ multiple_response вопрос!
-                                # Пропускаем только если это действительно multiple_response вопрос
-                                if question.question_type in ['multiple_response', 'checkbox', 'multi_select', 'multipleresponse']:
-                                    continue
-                                # Для других типов вопросов (true_false_not_given, multiple_choice) 
-                                # не обрабатываем здесь, они обработаются в своих секциях
-                                pass
-                            correct_labels = set(q.strip() for q in (question.correct_answers or []))
-                            
-                            # Получаем режим подсчета баллов
-                            scoring_mode = getattr(question, 'scoring_mode', 'total')
-                            
-                            user_selected_labels = set()
-
-                            # Поддерживаем два формата ответов:
-                            # 1. Listening формат: {question.id}__{option.label} = true/false
-                            # 2. Reading формат: {question.id} = ['text1', 'text2']
-                            
-                            # Сначала проверяем Reading формат (массив выбранных текстов)
-                            reading_format_answer = all_user_answers.get(str(question.id))
-                            if isinstance(reading_format_answer, list):
-                                # Reading формат: список выбранных текстов опций
-                                for option in options:
-                                    if option.text in reading_format_answer:
-                                        user_selected_labels.add(option.label)
-                            else:
-                                # Listening формат: ищем ответы пользователя по ключам {question.id}__{option.label}
-                                for option in options:
-                                    key = f"{question.id}__{option.label}"
-                                    option_value = all_user_answers.get(key)
-                                    # Проверяем если опция выбрана (значение True, 'true', или равно label)
-                                    if option_value is True or str(option_value).lower() == 'true' or option_value == option.label:
-                                        user_selected_labels.add(option.label)
-                            
-                            # Подсчитываем баллы в зависимости от режима
-                            if scoring_mode == 'total':
-                                # Старая логика: 1 балл за весь вопрос
-                                total_sub_questions = 1
-                                is_question_correct = (user_selected_labels == correct_labels)
-                                if is_question_correct:
-                                    correct_sub_questions = 1
-                            else:
-                                # Новая логика: баллы за каждый правильный ответ
-                                total_sub_questions = len(correct_labels)
-                                correct_sub_questions = 0
-                                for label in user_selected_labels:
-                                    if label in correct_labels:
-                                        # Получаем баллы за эту опцию
-                                        option_points = getattr(next((opt for opt in options if opt.label == label), None), 'points', 1)
-                                        correct_sub_questions += option_points
-
-                            # Формируем sub_questions для отображения фронтенду
-                            for option in options:
-                                was_selected = option.label in user_selected_labels
-                                should_be_selected = option.label in correct_labels
-                                
-                                # Правильность: (выбрано И должно быть выбрано) ИЛИ (не выбрано И не должно быть выбрано)
-                                is_choice_correct = (was_selected and should_be_selected) or (not was_selected and not should_be_selected)
-
-                                sub_questions_data.append({
-                                    'sub_id': option.label,
-                                    'label': option.text,
-                                    'user_answer': 'Selected' if was_selected else '(not selected)',
-                                    'correct_answer': 'Should be selected' if should_be_selected else 'Should not be selected',
-                                    'is_correct': is_choice_correct,
-                                    'points': getattr(option, 'points', 1)
-                                })
-                    
-                    # --- Multiple Choice Group (несколько подпунктов) ---
-                    elif question.question_type in ['multiple_choice_group']:
-                        extra_data = getattr(question, 'extra_data', {}) or {}
-                        group_items = extra_data.get('group_items') or []
-                        total_sub_questions = 0
-                        correct_sub_questions = 0
-
-                        # Поддерживаем два формата ответов: словарь в answers[str(question.id)] и плоские ключи questionId__itemId
-                        raw_group_answers = all_user_answers.get(str(question.id), {})
-                        group_answers = {}
-                        if isinstance(raw_group_answers, dict):
-                            group_answers.update({str(k): v for k, v in raw_group_answers.items()})
-
-                        for idx, item in enumerate(group_items):
-                            item_id = str(item.get('id') or f'item_{idx}')
-                            if item_id not in group_answers:
-                                flat_key = f"{question.id}__{item_id}"
-                                if flat_key in all_user_answers:
-                                    group_answers[item_id] = all_user_answers.get(flat_key)
-
-                        for idx, item in enumerate(group_items):
-                            item_id = str(item.get('id') or f'item_{idx}')
-                            prompt = item.get('prompt') or ''
-                            options = item.get('options') or []
-                            correct_label = str(item.get('correct_answer') or '').strip()
-                            item_points = item.get('points', 1)
-                            try:
-                                item_points = float(item_points)
-                            except (TypeError, ValueError):
-                                item_points = 1
-
-                            total_sub_questions += item_points
-
-                            user_label = group_answers.get(item_id)
-                            is_correct = check_alternative_answers(user_label, correct_label)
-                            if is_correct:
-                                correct_sub_questions += item_points
-
-                            sub_questions_data.append({
-                                'sub_id': item_id,
-                                'label': prompt,
-                                'user_answer': user_label or '(empty)',
-                                'correct_answer': correct_label,
-                                'is_correct': is_correct,
-                                'points': item_points,
-                                'options': options
-                            })
-
-                    # --- Multiple Choice (один ответ) / True-False ---
-                    elif question.question_type in ['multiple_choice', 'single_choice', 'radio', 'true_false_not_given', 'true_false', 'yes_no_not_given']:
-                        total_sub_questions = 1
-                        
-                        # Для Reading вопросов, получаем правильный ответ из extra_data или answer_options
-                        if test_type == 'reading':
-                            if question.question_type == 'multiple_choice':
-                                # Для multiple_choice ищем правильную опцию в answer_options
-                                correct_option = question.answer_options.filter(is_correct=True).first()
-                                if correct_option:
-                                    correct_answer_label = correct_option.label
-                                else:
-                                    correct_answer_label = ''
-                            elif question.question_type == 'true_false_not_given':
-                                # Для true_false_not_given обрабатываем каждое утверждение отдельно
-                                extra_data = getattr(question, 'extra_data', {})
-                                statements = extra_data.get('statements', [])
-                                answers = extra_data.get('answers', [])
-                                
-                                # Каждое утверждение - это отдельный подвопрос
-                                total_sub_questions = len(statements)
-                                
-                                # Обрабатываем каждое утверждение
-                                for idx, statement in enumerate(statements):
-                                    correct_answer = answers[idx] if idx < len(answers) else 'True'
-                                    
-                                    # Ищем ответ пользователя в правильном формате: {question.id: {stmt0: "True", stmt1: "False"}}
-                                    question_answers = all_user_answers.get(str(question.id), {})
-                                    user_answer = question_answers.get(f"stmt{idx}")
-                                    
-                                    is_correct = check_alternative_answers(user_answer, correct_answer)
-                                    if is_correct:
-                                        correct_sub_questions += 1
-                                    
-                                    sub_questions_data.append({
-                                        'sub_id': f"statement_{idx}",
-                                        'label': statement,
-                                        'user_answer': user_answer or '(empty)',
-                                        'correct_answer': correct_answer,
-                                        'is_correct': is_correct
-                                    })
-                                
-                                # Пропускаем обычную обработку для true_false_not_given
-                                # НЕ используем continue - нужно добавить вопрос в breakdown
-                            else:
-                                # Fallback для других типов
-                                correct_answer_label = str(question.correct_answers[0]).strip() if (isinstance(question.correct_answers, list) and question.correct_answers) else str(question.correct_answers).strip()
-                        else:
-                            # Для Listening вопросов используем старую логику
-                            correct_answer_label = str(question.correct_answers[0]).strip() if (isinstance(question.correct_answers, list) and question.correct_answers) else str(question.correct_answers).strip()
-
-                        # Для true_false_not_given вопросов уже все обработано выше
-                        if question.question_type != 'true_false_not_given' or test_type != 'reading':
-                            # Для Reading multiple_choice ответы сохраняются как {question.id: {text: "A"}}
-                            if test_type == 'reading' and question.question_type == 'multiple_choice':
-                                question_answer = all_user_answers.get(str(question.id), {})
-                                user_answer_label = question_answer.get('text') if isinstance(question_answer, dict) else None
-                            else:
-                                user_answer_label = all_user_answers.get(str(question.id))
-                            
-                            if user_answer_label is None:
-                                # Проверяем, что это Listening вопрос
-                                if hasattr(question, 'options'):
-                                    options = list(question.options.all())
-                                    for option in options:
-                                        key = f"{question.id}__{option.label}"
-                                        option_value = all_user_answers.get(key)
-                                        # Проверяем если опция выбрана (значение True или равно label)
-                                        if option_value is True or option_value == option.label:
-                                            user_answer_label = option.label
-                                            break
-                            
-                            is_correct = check_alternative_answers(user_answer_label, correct_answer_label)
-                            if is_correct:
-                                correct_sub_questions = 1
-
-                            sub_questions_data.append({
-                                'sub_id': question.id,
-                                'label': question.header or question.question_text,
-                                'user_answer': user_answer_label or '(empty)',
-                                'correct_answer': correct_answer_label,
-                                'is_correct': is_correct
-                            })
-
-                    # --- Gap Fill и его варианты ---
-                    elif question.question_type in ['gap_fill', 'gapfill', 'sentence_completion', 'summary_completion', 'note_completion', 'flow_chart', 'short_answer', 'shortanswer']:
-                        # Нормализуем правильные ответы
-                        correct_answers_list = normalize_correct_answers_for_gaps(question.correct_answers, question.question_type)
-                        
-                        if not correct_answers_list and question.question_type in ['short_answer', 'shortanswer']:
-                             correct_answers_list = [{'number': 1, 'answer': str(question.correct_answers[0]) if question.correct_answers else ''}]
-                        
-                        # 🎯 СПЕЦИАЛЬНАЯ ЛОГИКА ДЛЯ LISTENING: извлекаем номера gap'ов из question_text
-                        if test_type == 'listening' and question.question_text:
-                            import re
-                            gap_matches = re.findall(r'\[\[(\d+)\]\]', question.question_text)
-                            if gap_matches and isinstance(question.correct_answers, list):
-                                # Пересоздаем correct_answers_list с правильными номерами из текста
-                                corrected_list = []
-                                for idx, answer_text in enumerate(question.correct_answers):
-                                    if idx < len(gap_matches):
-                                        gap_number = int(gap_matches[idx])
-                                        corrected_list.append({
-                                            'number': gap_number,
-                                            'answer': answer_text
-                                        })
-                                correct_answers_list = corrected_list
-                        
-                        # Убираем пустые ответы (элементы с answer: "" или пустые)
-                        # И убираем элементы с number: '1' если они пустые (это артефакты создания)
-                        correct_answers_list = [
-                            item for item in correct_answers_list 
-                            if item.get('answer', '').strip() and item.get('number', '') != '1'
-                        ]
-                        total_sub_questions = len(correct_answers_list)
-
-                        # 🎯 УНИВЕРСАЛЬНАЯ ЛОГИКА СОПОСТАВЛЕНИЯ GAP-FILL ОТВЕТОВ
-                        for idx, correct_answer_item in enumerate(correct_answers_list):
-                            correct_val = correct_answer_item['answer']
-                            user_val = None
-                            
-                            # Используем номер из текущего элемента (уже отфильтрованного)
-                            original_gap_number = str(correct_answer_item.get('number', idx + 1))
-                            
-                            # Метод 1: Reading формат {question.id: {gap8: value, gap9: value}}
-                            reading_format_answers = all_user_answers.get(str(question.id))
-                            if isinstance(reading_format_answers, dict):
-                                user_val = reading_format_answers.get(f"gap{original_gap_number}")
-                            
-                            # Метод 2: Listening формат {question.id__gap31: value}
-                            if user_val is None:
-                                listening_key = f"{question.id}__gap{original_gap_number}"
-                                user_val = all_user_answers.get(listening_key)
-                            
-                            # Метод 3: Fallback для single answer questions
-                            if user_val is None and total_sub_questions == 1:
-                                user_val = all_user_answers.get(str(question.id))
-
-                            is_sub_correct = check_alternative_answers(user_val, correct_val)
-                            if is_sub_correct:
-                                correct_sub_questions += 1
-                            
-                            sub_questions_data.append({
-                                'sub_id': f"gap{original_gap_number}",
-                                'label': f"Answer {original_gap_number}",
-                                'user_answer': user_val or '(empty)',
-                                'correct_answer': format_alternative_answers_display(correct_val),
-                                'is_correct': is_sub_correct,
-                            })
-
-                    # --- Table & Form (каждая ячейка - отдельный балл) ---
-                    elif question.question_type in ['table', 'table_completion', 'tablecompletion', 'form', 'form_completion']:
-                        # Эта логика предполагает, что correct_answers хранит ответы в виде словаря
-                        # e.g., {"r0c1": "answer1", "r2c3": "answer2"}
-                        correct_answers_map = {}
-                        if isinstance(question.correct_answers, list) and question.correct_answers and isinstance(question.correct_answers[0], dict):
-                             correct_answers_map = {item['id']: item['answer'] for item in question.correct_answers}
-                        
-                        # Для table questions нужно перестроить correct_answers_map из extra_data,
-                        # чтобы ключи были в формате r{row}c{col}__gap{number}, а не просто gap{number}
-                        # Это важно для правильного поиска ответов пользователя
-                        if question.extra_data and (question.question_type in ['table', 'table_completion', 'tablecompletion']):
-                            import re
-                            gap_regex = re.compile(r'\[\[(\d+)\]\]')
-                            
-                            if 'cells' in question.extra_data.get('table', {}):
-                                correct_answers_map = {}
-                                for r, row in enumerate(question.extra_data['table']['cells']):
-                                    for c, cell in enumerate(row):
-                                        cell_text = cell.get('text', '') if isinstance(cell, dict) else ''
-                                        if cell_text:
-                                            matches = list(gap_regex.finditer(cell_text))
-                                            for match in matches:
-                                                gap_number = match.group(1)
-                                                gap_key = f"r{r}c{c}__gap{gap_number}"
-                                                correct_gap = None
-                                                if question.extra_data and 'gaps' in question.extra_data:
-                                                    correct_gap = next((g for g in question.extra_data['gaps'] if str(g.get('number', '')) == gap_number), None)
-                                                elif isinstance(question.correct_answers, list) and question.correct_answers:
-                                                    correct_gap = next((g for g in question.correct_answers if str(g.get('number', '')) == gap_number), None)
-                                                if correct_gap:
-                                                    correct_answers_map[gap_key] = correct_gap.get('answer', '')
-                        
-                        # Если карта пуста, пытаемся построить из extra_data (для других типов вопросов)
-                        if not correct_answers_map and question.extra_data:
-                            import re
-                            gap_regex = re.compile(r'\[\[(\d+)\]\]')
-                            
-                            if 'cells' in question.extra_data.get('table', {}): # Table (Listening)
-                                for r, row in enumerate(question.extra_data['table']['cells']):
-                                    for c, cell in enumerate(row):
-                                        cell_text = cell.get('text', '') if isinstance(cell, dict) else ''
-                                        if cell_text:
-                                            matches = list(gap_regex.finditer(cell_text))
-                                            for match in matches:
-                                                gap_number = match.group(1)
-                                                gap_key = f"r{r}c{c}__gap{gap_number}"
-                                                correct_gap = None
-                                                if question.gaps and isinstance(question.gaps, list):
-                                                    correct_gap = next((g for g in question.gaps if str(g.get('number', '')) == gap_number), None)
-                                                elif question.extra_data and 'gaps' in question.extra_data:
-                                                    correct_gap = next((g for g in question.extra_data['gaps'] if str(g.get('number', '')) == gap_number), None)
-                                                correct_answers_map[gap_key] = correct_gap.get('answer', '') if correct_gap else ''
-                                        elif cell.get('isAnswer'):
-                                            correct_answers_map[f"r{r}c{c}"] = cell.get('answer', '')
-                            elif 'rows' in question.extra_data: # Table (Reading)
-                                for r, row in enumerate(question.extra_data['rows']):
-                                    for c, cell in enumerate(row):
-                                        cell_text = ''
-                                        if isinstance(cell, dict):
-                                            cell_text = cell.get('text', cell.get('content', ''))
-                                        elif isinstance(cell, str):
-                                            cell_text = cell
-                                        
-                                        if cell_text:
-                                            matches = list(gap_regex.finditer(cell_text))
-                                            for match in matches:
-                                                gap_number = match.group(1)
-                                                gap_key = f"r{r}c{c}__gap{gap_number}"
-                                                correct_val = ''
-                                                if question.extra_data and 'answers' in question.extra_data:
-                                                    correct_val = question.extra_data['answers'].get(gap_number, '')
-                                                    if not isinstance(correct_val, str):
-                                                        correct_val = ''
-                                                if not correct_val and question.gaps and isinstance(question.gaps, list):
-                                                    correct_gap = next((g for g in question.gaps if str(g.get('number', '')) == gap_number), None)
-                                                    if correct_gap:
-                                                        correct_val = correct_gap.get('answer', '')
-                                                elif not correct_val and question.extra_data and 'gaps' in question.extra_data:
-                                                    correct_gap = next((g for g in question.extra_data['gaps'] if str(g.get('number', '')) == gap_number), None)
-                                                    if correct_gap:
-                                                        correct_val = correct_gap.get('answer', '')
-                                                correct_answers_map[gap_key] = correct_val
-                                        elif isinstance(cell, dict) and cell.get('type') == 'gap':
-                                            gap_key = f"r{r}c{c}"
-                                            correct_answers_map[gap_key] = cell.get('answer', '')
-                            elif 'fields' in question.extra_data: # Form
-                                 for i, field in enumerate(question.extra_data['fields']):
-                                     if field.get('isAnswer'):
-                                         correct_answers_map[f"field{i}"] = field.get('answer', '')
-                        
-                        total_sub_questions = len(correct_answers_map)
-                        
-                        for sub_id, correct_val in correct_answers_map.items():
-                            user_val = None
-                            
-                            if sub_id.startswith('r') and '__gap' in sub_id:
-                                question_id_str = str(question.id)
-                                
-                                possible_keys = [
-                                    f"{question_id_str}__{sub_id}",
-                                    f"{question.id}__{sub_id}",
-                                ]
-                                
-                                for key in possible_keys:
-                                    if key in all_user_answers:
-                                        user_val = all_user_answers.get(key)
-                                        if user_val:
-                                            break
-                                
-                                if not user_val:
-                                    for key in all_user_answers.keys():
-                                        if isinstance(key, str) and key.endswith(f"__{sub_id}"):
-                                            user_val = all_user_answers.get(key)
-                                            if user_val:
-                                                break
-                            else:
-                                key_str = f"{question.id}__{sub_id}"
-                                key_str_alt = f"{str(question.id)}__{sub_id}"
-                                user_val = all_user_answers.get(key_str) or all_user_answers.get(key_str_alt)
-                            
-                            is_sub_correct = check_alternative_answers(user_val, correct_val)
-                            if is_sub_correct:
-                                correct_sub_questions += 1
-                                
-                            label = sub_id
-                            if '__gap' in sub_id:
-                                gap_num = sub_id.split('__gap')[-1]
-                                label = f"Gap {gap_num}"
-                            elif sub_id.startswith('gap'):
-                                gap_num = sub_id.replace('gap', '')
-                                label = f"Gap {gap_num}"
-                            
-                            sub_questions_data.append({
-                                'sub_id': sub_id,
-                                'label': label,
-                                'user_answer': user_val or '(empty)',
-                                'correct_answer': format_alternative_answers_display(correct_val),
-                                'is_correct': is_sub_correct,
-                            })
-
-                    # --- Неизвестный тип вопроса (Fallback) ---
-                    else:
-                        sub_questions_data.append({
-                            'sub_id': 'unknown', 'label': 'Unknown question type', 'user_answer': '',
-                            'correct_answer': '', 'is_correct': False,
-                            'error': f'Unsupported question type: {question.question_type}'
-                        })
-
-                    question_data['sub_questions'] = sub_questions_data
-                    question_data['correct_sub_questions'] = correct_sub_questions
-                    question_data['total_sub_questions'] = total_sub_questions
-                    
-                    part_data['questions'].append(question_data)
-
-                except Exception as e:
-                    print(f"❌ Error processing question {question.id}: {e}")
-                    # Добавляем вопрос с ошибкой в breakdown
-                    question_data = {
-                        'question_id': question.id,
-                        'question_text': question.question_text or '',
-                        'question_type': question.question_type,
-                        'header': getattr(question, 'header', ''),
-                        'instruction': getattr(question, 'instruction', ''),
-                        'sub_questions': [{
-                            'sub_id': 'error',
-                            'label': 'Error processing question',
-                            'user_answer': 'Error',
-                            'correct_answer': 'Error',
-                            'is_correct': False,
-                            'error': str(e)
-                        }],
-                        'correct_sub_questions': 0,
-                        'total_sub_questions': 1,
-                        'points': 0
-                    }
-                    part_data['questions'].append(question_data)
-            
-            detailed_breakdown.append(part_data)
-        
-        # Подсчитываем общие баллы
-        total_raw_score = 0
-        total_possible_score = 0
-        
-        for part in detailed_breakdown:
-            for question in part['questions']:
-                total_raw_score += question['correct_sub_questions']
-                total_possible_score += question['total_sub_questions']
-        
-        return {
-            'raw_score': total_raw_score,
-            'total_score': total_possible_score,
-            'breakdown': detailed_breakdown
-        }
+        answer_key = get_answer_key(session.test, test_type)
+        return answer_key.score(session.answers or {})
     except Exception as e:
         return {
             'raw_score': 0,
@@ -844,126 +309,8 @@ def create_listening_detailed_breakdown(session):
     Обертка для create_detailed_breakdown специально для Listening тестов.
     Возвращает полный объект с результатами.
     """
-
-    # Конвертация в IELTS Band
-    def convert_to_band(score, total):
-        # Эта шкала примерная и должна быть уточнена
-        if score >= 39: return 9.0
-        if score >= 37: return 8.5
-        if score >= 35: return 8.0
-        if score >= 32: return 7.5
-        if score >= 30: return 7.0
-        if score >= 27: return 6.5
-        if score >= 23: return 6.0
-        if score >= 19: return 5.5
-        if score >= 15: return 5.0
-        if score >= 12: return 4.5
-        if score >= 10: return 4.0
-        if score >= 8: return 3.5
-        if score >= 6: return 3.0
-        return 2.5
-
-    # 1. Считаем детальный breakdown
     breakdown_result = create_detailed_breakdown(session, test_type='listening')
-    breakdown_data = breakdown_result.get('breakdown', [])
-    raw_score = breakdown_result.get('raw_score', 0)
-    total_score = breakdown_result.get('total_score', 0)
-
-    # 2. Считаем баллы на основе breakdown (если не посчитано)
-    if raw_score == 0 and total_score == 0:
-        for part in breakdown_data:
-            for question in part['questions']:
-                question_id = question.get('question_id')
-                question_type = question.get('question_type')
-                correct_sub = question.get('correct_sub_questions', 0)
-                total_sub = question.get('total_sub_questions', 0)
-                points_per_sub = question.get('points', 1)
-            
-                # Для multiple response в режиме per_correct не умножаем на points вопроса
-                if question_type == 'multiple_response' and question.get('scoring_mode', 'total') == 'per_correct':
-                    question_score = correct_sub  # Уже посчитано правильно
-                    question_total = total_sub
-                elif question_type == 'multiple_choice_group':
-                    # Для multiple_choice_group баллы уже учтены в correct_sub_questions и total_sub_questions
-                    # (каждый item имеет свои points), поэтому не умножаем на points вопроса
-                    question_score = correct_sub
-                    question_total = total_sub
-                else:
-                    question_score = correct_sub * points_per_sub
-                    question_total = total_sub * points_per_sub
-                
-                raw_score += question_score
-                total_score += question_total
-            
-    # 3. Конвертируем в band
-    band_score = convert_to_band(raw_score, 40) # В IELTS Listening всегда 40 вопросов
-    
-    # 4. Возвращаем все данные
-    result = {
-        'detailed_breakdown': breakdown_data,
-        'raw_score': raw_score,
-        'total_score': total_score,
-        'band_score': band_score,
-    }
-    
-    return result
-
-def normalize_correct_answers_for_gaps(correct_answers, question_type):
-    """
-    Нормализует correct_answers для gap_fill типов вопросов.
-    Для reading СОХРАНЯЕТ оригинальные номера gap'ов.
-    Для listening нормализует к последовательности 1,2,3...
-    
-    Args:
-        correct_answers: может быть списком строк ['text1', 'text2'] или списком словарей [{'number': 1, 'answer': 'text1'}]
-        question_type: тип вопроса
-    
-    Returns:
-        list: список словарей с ключами 'number' и 'answer'
-    """
-    if question_type not in ['gap_fill', 'gapfill', 'sentence_completion', 'summary_completion', 'note_completion', 'flow_chart']:
-        return correct_answers
-    
-    if not isinstance(correct_answers, list):
-        return []
-    
-    normalized = []
-    for idx, item in enumerate(correct_answers):
-        if isinstance(item, str):
-            # Простая строка - делаем словарь с последовательным номером
-            normalized.append({
-                'number': idx + 1,
-                'answer': item
-            })
-        elif isinstance(item, dict):
-            # Словарь - СОХРАНЯЕМ оригинальный номер для reading
-            if 'answer' in item:
-                original_number = item.get('number', idx + 1)
-                # Конвертируем строковые номера в числа
-                if isinstance(original_number, str):
-                    try:
-                        original_number = int(original_number)
-                    except:
-                        original_number = idx + 1
-                normalized.append({
-                    'number': original_number,  # СОХРАНЯЕМ оригинальный номер!
-                    'answer': item['answer']
-                })
-            else:
-                # Неизвестный формат - пытаемся извлечь как строку
-                answer_text = str(item) if item else ''
-                normalized.append({
-                    'number': idx + 1,
-                    'answer': answer_text
-                })
-        else:
-            # Не строка и не словарь - конвертируем в строку
-            normalized.append({
-                'number': idx + 1,
-                'answer': str(item) if item is not None else ''
-            })
-    
-    return normalized
+    return build_listening_results(breakdown_result)
 
 def get_test_render_structure(serializer_instance, obj):
     """
@@ -976,11 +323,12 @@ def get_test_render_structure(serializer_instance, obj):
     answers = session.answers or {}
     test = session.test
     module = 'listening' if hasattr(test, 'listeningpart_set') or test.__class__.__name__ == 'ListeningTest' else 'reading'
+    # Структура берется из скомпилированного ключа ответов, без запросов к ORM
+    compiled_parts = get_answer_key(test, module).parts
     if module == 'reading':
-        parts_query = test.parts.all().order_by('order', 'part_number')
-    else:
-        parts_query = test.parts.all().order_by('part_number')
-    for part in parts_query:
+        compiled_parts = sorted(compiled_parts, key=lambda p: (p.part.order, p.part.part_number))
+    for compiled_part in compiled_parts:
+        part = compiled_part.part
         part_data = {
             'part_number': part.part_number,
             'title': getattr(part, 'title', ''),
@@ -988,11 +336,8 @@ def get_test_render_structure(serializer_instance, obj):
             'instructions': part.instructions if module == 'listening' else getattr(part, 'instructions', ''),
             'questions': []
         }
-        if module == 'reading':
-            questions = part.questions.all().order_by('order')
-        else:
-            questions = part.questions.all().order_by('order')
-        for q in questions:
+        for question_key in compiled_part.questions:
+            q = question_key.question
             q_data = {
                 'id': q.id,
                 'type': q.question_type,
@@ -1018,11 +363,8 @@ def get_test_render_structure(serializer_instance, obj):
                 correct_option = None
                 options = []
 
-                # Reading has answer_options, Listening has options  
-                if hasattr(q, 'answer_options'):
-                    options_qs = q.answer_options.all()
-                else:
-                    options_qs = q.options.all()
+                # Reading has answer_options, Listening has options
+                options_qs = question_key.options
 
                 for opt in options_qs:
                     # Reading has is_correct field, Listening determines from correct_answers
@@ -1069,10 +411,7 @@ def get_test_render_structure(serializer_instance, obj):
                 sub_questions = []
                 
                 # Reading has answer_options, Listening has options
-                if hasattr(q, 'answer_options'):
-                    options_qs = q.answer_options.all()
-                else:
-                    options_qs = q.options.all()
+                options_qs = question_key.options
                 all_correct = True
                 
                 for opt in options_qs:
@@ -1168,7 +507,6 @@ def get_test_render_structure(serializer_instance, obj):
                     is_listening_format = True
                 
                 if table_data:
-                    import re
                     gap_regex = re.compile(r'\[\[(\d+)\]\]')
                     
                     for r_idx, row in enumerate(table_data):
@@ -1492,57 +830,6 @@ class ListeningTestCloneSerializer(serializers.ModelSerializer):
         model = ListeningTestClone
         fields = ['id', 'source_test', 'cloned_test', 'cloned_at']
 
-def normalize_answer(ans):
-    if not isinstance(ans, str):
-        return ''
-    ans = re.sub(r'[^A-Za-z0-9 \n]', '', ans)
-    ans = re.sub(r'\s+', ' ', ans.replace('\n', ' '))
-    return ans.strip().upper()
-
-def check_alternative_answers(user_answer, correct_answer_text):
-    """
-    Проверяет ответ пользователя против правильного ответа с поддержкой альтернатив.
-    Если в correct_answer_text есть |, то проверяются все альтернативы.
-    
-    Args:
-        user_answer: ответ пользователя
-        correct_answer_text: правильный ответ, может содержать альтернативы через |
-        
-    Returns:
-        bool: True если ответ правильный
-    """
-    if not isinstance(correct_answer_text, str):
-        correct_answer_text = str(correct_answer_text) if correct_answer_text else ''
-    
-    if '|' in correct_answer_text:
-        alternatives = [alt.strip() for alt in correct_answer_text.split('|')]  # Убрали if alt.strip() чтобы поддерживать пустые ответы
-        user_normalized = normalize_answer(user_answer)
-        return any(user_normalized == normalize_answer(alt) for alt in alternatives)
-    else:
-        return normalize_answer(user_answer) == normalize_answer(correct_answer_text)
-
-def format_alternative_answers_display(correct_answer_text):
-    """
-    Форматирует альтернативные ответы для отображения в UI.
-    Если есть альтернативы через |, показывает их через " / ".
-    
-    Args:
-        correct_answer_text: правильный ответ, может содержать альтернативы через |
-        
-    Returns:
-        str: отформатированная строка для отображения
-    """
-    if not isinstance(correct_answer_text, str):
-        return str(correct_answer_text) if correct_answer_text else ''
-    
-    if '|' in correct_answer_text:
-        alternatives = [alt.strip() for alt in correct_answer_text.split('|')]
-        # Заменяем пустые альтернативы на "(empty)" для отображения
-        formatted_alternatives = [alt if alt else "(empty)" for alt in alternatives]
-        return ' / '.join(formatted_alternatives)
-    else:
-        return correct_answer_text
-
 # --- Универсальная схема ключей для answers ---
 # Везде, где ищутся user_answer/all_user_answers, теперь ищем по ключу f"{question_id}__{subId}" для саб-ответов.
 # Для table: subId = r{row}c{col}
@@ -1984,6 +1271,7 @@ class ListeningPartSerializer(serializers.ModelSerializer):
 
 # --- Вложенные сериализаторы для записи ListeningTest ---
 class ListeningQuestionWriteSerializer(serializers.ModelSerializer):
+    id = EditorRowIdField(required=False, allow_null=True)
     options = serializers.ListField(child=serializers.DictField(), required=False, allow_null=True, default=list)
     image_file = serializers.ImageField(write_only=True, required=False, allow_null=True)
     image_base64 = serializers.CharField(write_only=True, required=False, allow_blank=True)
@@ -2095,40 +1383,25 @@ class ListeningTestSerializer(serializers.ModelSerializer):
             filtered.append(q)
         return filtered
 
+    def _structure_rows(self, parts_data):
+        parts = []
+        for part_data in parts_data:
+            questions = []
+            for question_data in part_data.pop('questions', []):
+                options_data = question_data.pop('options', None) or []
+                image = pop_question_image(question_data)
+                if not question_data.get('image'):
+                    question_data['image'] = None
+                options = [Row(option.get('label') or chr(65 + idx), option) for idx, option in enumerate(options_data)]
+                questions.append(Row(question_data.pop('id', None), question_data, options, image))
+            parts.append(Row(part_data.get('part_number'), part_data, questions))
+        return parts
+
+    @transaction.atomic
     def create(self, validated_data):
         parts_data = validated_data.pop('parts', [])
         test = ListeningTest.objects.create(**validated_data)
-        for part_data in parts_data:
-            questions_data = part_data.pop('questions', [])
-            part = ListeningPart.objects.create(test=test, **part_data)
-            for question_data in questions_data:
-                options_data = question_data.pop('options', [])
-                image_file = question_data.pop('image_file', serializers.empty)
-                image_base64 = question_data.pop('image_base64', None)
-                new_image_file = serializers.empty
-                if image_base64 not in [None, '', 'null']:
-                    decoded = decode_base64_file(image_base64)
-                    if decoded:
-                        new_image_file = decoded
-                elif image_base64 in ['', 'null']:
-                    new_image_file = None
-                elif image_file is not serializers.empty:
-                    new_image_file = image_file
-                image = question_data.get('image', None)
-                if not image:
-                    question_data['image'] = None
-                question = ListeningQuestion.objects.create(part=part, **question_data)
-                if new_image_file is not serializers.empty:
-                    question.image_file = new_image_file
-                    question.save()
-                for idx, option_data in enumerate(options_data):
-                    label = option_data.get('label') or chr(65 + idx)
-                    text = option_data.get('text', '')
-                    points = option_data.get('points', 1)
-                    try:
-                        ListeningAnswerOption.objects.create(question=question, label=label, text=text, points=points)
-                    except Exception as e:
-                        continue
+        save_editor_structure(test, LISTENING_STRUCTURE, self._structure_rows(parts_data))
         return test
 
     def update(self, instance, validated_data):
@@ -2141,99 +1414,14 @@ class ListeningTestSerializer(serializers.ModelSerializer):
         instance.explanation_url = validated_data.get('explanation_url', instance.explanation_url)
         instance.save()
 
+        invalidate_test_structure(instance.pk, LISTENING_KINDS)
+
         # Если parts не переданы в запросе (обычный PATCH статуса) — не трогаем структуру теста
         if not parts_present:
             return instance
 
-        existing_parts = {p.id: p for p in instance.parts.all()}
-        sent_part_ids = set()
-        for part_data in parts_data:
-            part_id = part_data.get('id')
-            part_number = part_data.get('part_number')
-            questions_data = part_data.pop('questions', [])
-            part_data_copy = {k: v for k, v in part_data.items() if k not in ['questions', 'test', 'id']}
-            part = None
-            if part_id:
-                part = existing_parts.get(part_id)
-            if part:
-                sent_part_ids.add(part.id)
-                for attr, value in part_data_copy.items():
-                    setattr(part, attr, value)
-                part.save()
-            else:
-                part = ListeningPart.objects.create(test=instance, **part_data_copy)
-                sent_part_ids.add(part.id)
-            existing_questions = {q.id: q for q in part.questions.all()}
-            sent_question_ids = set()
-            for question_data in questions_data:
-                order = question_data.get('order')
-                options_data = question_data.pop('options', [])
-                image_file = question_data.pop('image_file', serializers.empty)
-                image_base64 = question_data.pop('image_base64', None)
-                should_update_image = False
-                new_image_file = serializers.empty
-                if image_base64 not in [None, '', 'null']:
-                    decoded = decode_base64_file(image_base64)
-                    if decoded:
-                        new_image_file = decoded
-                        should_update_image = True
-                elif image_base64 in ['', 'null']:
-                    new_image_file = None
-                    should_update_image = True
-                elif image_file is not serializers.empty:
-                    new_image_file = image_file
-                    should_update_image = True
-                image = question_data.get('image', None)
-                if not image:
-                    question_data['image'] = None
-                question_id = question_data.pop('id', None)
-                question = None
-                if question_id is not None:
-                    question = existing_questions.get(question_id)
-                if question:
-                    sent_question_ids.add(question.id)
-                    for attr, value in question_data.items():
-                        setattr(question, attr, value)
-                    if should_update_image:
-                        if question.image_file:
-                            try:
-                                question.image_file.delete(save=False)
-                            except Exception:
-                                pass
-                        question.image_file = new_image_file if new_image_file is not serializers.empty else None
-                    question.save()
-                else:
-                    question = ListeningQuestion.objects.create(part=part, **question_data)
-                    sent_question_ids.add(question.id)
-                    if should_update_image:
-                        question.image_file = new_image_file if new_image_file is not serializers.empty else None
-                        question.save()
-                existing_options = {o.label: o for o in question.options.all()}
-                sent_option_labels = set()
-                for idx, option_data in enumerate(options_data):
-                    label = option_data.get('label') or chr(65 + idx)
-                    sent_option_labels.add(label)
-                    option_data = dict(option_data)
-                    option_data.pop('label', None)
-                    option_data.pop('id', None)
-                    option_data.pop('isCorrect', None)
-                    try:
-                        option, created = question.options.get_or_create(label=label, defaults={**option_data, 'question': question})
-                        if not created:
-                            for attr, value in option_data.items():
-                                setattr(option, attr, value)
-                            option.save()
-                    except Exception as e:
-                        continue
-                for label, option in existing_options.items():
-                    if label not in sent_option_labels:
-                        option.delete()
-            for question_id, question in existing_questions.items():
-                if question_id not in sent_question_ids:
-                    question.delete()
-        for part_id, part in existing_parts.items():
-            if part_id not in sent_part_ids:
-                part.delete()
+        save_editor_structure(instance, LISTENING_STRUCTURE, self._structure_rows(parts_data))
+        invalidate_test_structure(instance.pk, LISTENING_KINDS)
         return instance
 
     def to_representation(self, instance):
@@ -2366,6 +1554,18 @@ class ReadingTestReadSerializer(serializers.ModelSerializer):
             )
         return representation
 
+class ReadingTestListSerializer(serializers.ModelSerializer):
+    # Rows of ReadingTestViewSet.list: no nested parts, the counts are annotated on the queryset
+    parts_count = serializers.IntegerField(read_only=True)
+    questions_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ReadingTest
+        fields = [
+            'id', 'title', 'description', 'time_limit', 'total_points', 'is_active', 'is_diagnostic_template',
+            'explanation_url', 'created_at', 'parts_count', 'questions_count'
+        ]
+
 # --- WRITE-ONLY (for POST/PUT/PATCH requests) ---
 
 class ReadingQuestionWriteSerializer(serializers.ModelSerializer):
@@ -2418,40 +1618,29 @@ class ReadingTestSerializer(serializers.ModelSerializer):
             'is_active', 'is_diagnostic_template', 'explanation_url', 'parts'
         ]
     
-    def create(self, validated_data):
-        parts_data = validated_data.pop('parts', [])
-        test = ReadingTest.objects.create(**validated_data)
+    def _structure_rows(self, parts_data):
+        parts = []
         for part_data in parts_data:
             if not isinstance(part_data, dict):
                 continue
-            questions_data = part_data.pop('questions', []) if 'questions' in part_data else []
-            part = ReadingPart.objects.create(test=test, **part_data)
-            for question_data in questions_data:
-                answer_options_data = question_data.pop('answer_options', []) if 'answer_options' in question_data else []
-                image_file = question_data.pop('image_file', serializers.empty)
-                image_base64 = question_data.pop('image_base64', None)
-                if image_base64 not in [None, '', 'null']:
-                    decoded_question = decode_base64_file(image_base64)
-                    if decoded_question:
-                        image_file = decoded_question
-                elif image_base64 in ['', 'null']:
-                    image_file = None
-                try:
-                    question = ReadingQuestion.objects.create(part=part, **question_data)
-                    if image_file is not serializers.empty:
-                        question.image_file = image_file or None
-                        question.save()
-                except Exception:
+            questions = []
+            for question_data in part_data.pop('questions', None) or []:
+                if not isinstance(question_data, dict):
                     continue
-                for option_data in answer_options_data:
-                    option_data.pop('image_file', None)
-                    option_data.pop('image_base64', None)
-                    try:
-                        ReadingAnswerOption.objects.create(question=question, **option_data)
-                    except Exception:
-                        continue
+                options_data = question_data.pop('answer_options', None) or []
+                image = pop_question_image(question_data)
+                options = [Row(option.get('id'), option) for option in options_data]
+                questions.append(Row(question_data.get('id'), question_data, options, image))
+            parts.append(Row(part_data.get('part_number'), part_data, questions))
+        return parts
+
+    @transaction.atomic
+    def create(self, validated_data):
+        parts_data = validated_data.pop('parts', [])
+        test = ReadingTest.objects.create(**validated_data)
+        save_editor_structure(test, READING_STRUCTURE, self._structure_rows(parts_data))
         return test
- 
+
     def update(self, instance, validated_data):
         parts_data = validated_data.pop('parts', None)
         instance.title = validated_data.get('title', instance.title)
@@ -2461,83 +1650,11 @@ class ReadingTestSerializer(serializers.ModelSerializer):
         instance.is_diagnostic_template = validated_data.get('is_diagnostic_template', instance.is_diagnostic_template)
         instance.explanation_url = validated_data.get('explanation_url', instance.explanation_url)
         instance.save()
- 
+
         if parts_data is not None:
-            existing_parts = {p.part_number: p for p in instance.parts.all()}
-            sent_part_numbers = set()
-            for part_data in parts_data:
-                if not isinstance(part_data, dict):
-                    continue
-                part_number = part_data.get('part_number')
-                sent_part_numbers.add(part_number)
-                questions_data = part_data.get('questions', []) if 'questions' in part_data else []
-                part_data_copy = {k: v for k, v in part_data.items() if k not in ['questions', 'test']}
-                part, created = instance.parts.get_or_create(part_number=part_number, defaults={**part_data_copy, 'test': instance})
-                if not created:
-                    for attr, value in part_data_copy.items():
-                        if attr != 'part_number':
-                            setattr(part, attr, value)
-                    part.save()
-                else:
-                    part.save()
-                existing_questions = {str(q.id): q for q in part.questions.all()}
-                sent_question_ids = set()
-                for question_data in questions_data:
-                    if not isinstance(question_data, dict):
-                        continue
-                    q_id = str(question_data.get('id')) if question_data.get('id') else None
-                    answer_options_data = question_data.pop('answer_options', []) if 'answer_options' in question_data else []
-                    image_file = question_data.pop('image_file', serializers.empty)
-                    image_base64 = question_data.pop('image_base64', None)
-                    if image_base64 not in [None, '', 'null']:
-                        decoded_question = decode_base64_file(image_base64)
-                        if decoded_question:
-                            image_file = decoded_question
-                    elif image_base64 in ['', 'null']:
-                        image_file = None
-                    if q_id and q_id in existing_questions:
-                        question = existing_questions[q_id]
-                        sent_question_ids.add(q_id)
-                        for attr, value in question_data.items():
-                            setattr(question, attr, value)
-                        if image_file is not serializers.empty:
-                            question.image_file = image_file or None
-                        question.save()
-                        existing_options = {str(opt.id): opt for opt in question.answer_options.all()}
-                        sent_option_ids = set()
-                        for option_data in answer_options_data:
-                            opt_id = str(option_data.get('id')) if option_data.get('id') else None
-                            option_data.pop('image_file', None)
-                            option_data.pop('image_base64', None)
-                            if opt_id and opt_id in existing_options:
-                                option = existing_options[opt_id]
-                                sent_option_ids.add(opt_id)
-                                for attr, value in option_data.items():
-                                    setattr(option, attr, value)
-                                option.save()
-                            else:
-                                new_option = ReadingAnswerOption.objects.create(question=question, **option_data)
-                                sent_option_ids.add(str(new_option.id))
-                        for opt_id, opt in existing_options.items():
-                            if opt_id not in sent_option_ids:
-                                opt.delete()
-                    else:
-                        question = ReadingQuestion.objects.create(part=part, **question_data)
-                        if image_file is not serializers.empty:
-                            question.image_file = image_file or None
-                            question.save()
-                        sent_question_ids.add(str(question.id))
-                        for option_data in answer_options_data:
-                            option_data.pop('image_file', None)
-                            option_data.pop('image_base64', None)
-                            ReadingAnswerOption.objects.create(question=question, **option_data)
-                for q_id, question in existing_questions.items():
-                    if q_id not in sent_question_ids:
-                        question.delete()
-            for part_number, part in existing_parts.items():
-                if part_number not in sent_part_numbers:
-                    part.delete()
- 
+            save_editor_structure(instance, READING_STRUCTURE, self._structure_rows(parts_data))
+
+        invalidate_test_structure(instance.pk, READING_KINDS)
         return instance
 
 class ReadingTestSessionSerializer(serializers.ModelSerializer):
@@ -2545,8 +1662,9 @@ class ReadingTestSessionSerializer(serializers.ModelSerializer):
         model = ReadingTestSession
         fields = [
             'id', 'user', 'test', 'start_time', 'end_time', 
-            'completed', 'answers', 'time_left_seconds', 'is_diagnostic'
+            'completed', 'answers', 'time_left_seconds', 'is_diagnostic', 'sync_seq'
         ]
+        read_only_fields = ['sync_seq']
 
 
 def count_correct_subanswers(user_answer, correct_answers, question_type, extra_data=None, all_user_answers=None, question_id=None, options=None, points=1):
@@ -2716,8 +1834,7 @@ class SpeakingSessionCreateSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError("Only teachers can create speaking sessions")
             
             if teacher.role == 'teacher':
-                teacher_name = teacher.first_name or teacher.student_id
-                if value.teacher != teacher_name:
+                if not is_students_teacher(value, teacher):
                     raise serializers.ValidationError("Student does not belong to this teacher")
         
         return value
@@ -0,0 +1,164 @@
+"""
+Delta autosave for Listening/Reading sessions.
+
+The client sends only the answers it changed since the last sync together with
+a monotonically increasing ``seq``:
+
+    PATCH /api/listening-sessions/<id>/sync/  {"seq": 17, "answers": {"12": "B"}, "time_left": 1410}
+
+On PostgreSQL the delta is merged into the stored ``answers``/``flagged`` jsonb
+columns by a single conditional UPDATE, so the row is never loaded into Python.
+The same UPDATE only matches while ``sync_seq < seq``, which makes a late or
+duplicated request a no-op that the view reports as out-of-order.
+"""
+import json
+
+from django.db import connection, models, transaction
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import ListeningTestSession, ReadingTestSession
+
+DELTA_APPLIED = 'applied'
+DELTA_STALE = 'stale'
+DELTA_CLOSED = 'closed'
+DELTA_NOT_FOUND = 'not_found'
+
+# sync_seq is a PositiveIntegerField: a larger seq would fail in the UPDATE
+MAX_SYNC_SEQ = 2 ** 31 - 1
+
+# model -> (finished flag, time left field, flagged field or None)
+SESSION_SYNC_FIELDS = {
+    ListeningTestSession: ('submitted', 'time_left', 'flagged'),
+    ReadingTestSession: ('completed', 'time_left_seconds', None),
+}
+
+
+def parse_sync_seq(value):
+    """Returns the delta sequence number as a positive int, raises ValueError otherwise."""
+    if isinstance(value, bool):
+        raise ValueError('seq must be a positive integer')
+    seq = int(value)
+    if not 1 <= seq <= MAX_SYNC_SEQ:
+        raise ValueError('seq must be a positive integer')
+    return seq
+
+
+def merge_answers(existing, delta):
+    """
+    Python version of the answers merge: nested dicts (gap_fill, table, matching)
+    are merged one level deep, everything else is replaced.
+    """
+    merged = dict(existing) if isinstance(existing, dict) else {}
+    for question_id, answer_value in delta.items():
+        current = merged.get(question_id)
+        if isinstance(answer_value, dict) and isinstance(current, dict):
+            merged[question_id] = {**current, **answer_value}
+        else:
+            merged[question_id] = answer_value
+    return merged
+
+
+def _parse_time_left(time_left):
+    if time_left is None:
+        return None
+    try:
+        return max(0, int(time_left))
+    except (TypeError, ValueError):
+        return None
+
+
+def _jsonb_object_sql(column):
+    return f"(CASE WHEN jsonb_typeof({column}) = 'object' THEN {column} ELSE '{{}}'::jsonb END)"
+
+
+def _jsonb_answers_merge(column_name, delta):
+    """
+    Builds `answers || flat_delta` and wraps it in one jsonb_set per nested answer,
+    so that `{"5": {"gap3": "x"}}` only touches gap3 of question 5.
+    """
+    column = connection.ops.quote_name(column_name)
+    flat = {key: value for key, value in delta.items() if not isinstance(value, dict)}
+    sql = f'{_jsonb_object_sql(column)} || %s::jsonb'
+    params = [json.dumps(flat)]
+    for key, value in delta.items():
+        if not isinstance(value, dict):
+            continue
+        value_json = json.dumps(value)
+        sql = (
+            f'jsonb_set({sql}, ARRAY[%s]::text[], '
+            f"CASE WHEN jsonb_typeof({column} -> %s) = 'object' "
+            f'THEN ({column} -> %s) || %s::jsonb ELSE %s::jsonb END)'
+        )
+        params += [str(key), str(key), str(key), value_json, value_json]
+    return RawSQL(sql, params, output_field=models.JSONField())
+
+
+def _jsonb_shallow_merge(column_name, delta):
+    column = connection.ops.quote_name(column_name)
+    return RawSQL(f'{_jsonb_object_sql(column)} || %s::jsonb', [json.dumps(delta)],
+                  output_field=models.JSONField())
+
+
+def apply_session_delta(model, session_id, user, seq, answers=None, flagged=None, time_left=None):
+    """
+    Applies one sync delta to a session.
+    Returns (outcome, sync_seq) where outcome is one of the DELTA_* constants
+    and sync_seq is the session's sequence number after the call.
+    """
+    done_field, time_field, flagged_field = SESSION_SYNC_FIELDS[model]
+    answers = answers if isinstance(answers, dict) else {}
+    flagged = flagged if isinstance(flagged, dict) and flagged_field else {}
+    time_left = _parse_time_left(time_left)
+
+    if connection.vendor != 'postgresql':
+        return _apply_session_delta_locked(model, session_id, user, seq, answers, flagged, time_left)
+
+    values = {'sync_seq': seq, 'last_updated': timezone.now()}
+    if answers:
+        values['answers'] = _jsonb_answers_merge('answers', answers)
+    if flagged:
+        values[flagged_field] = _jsonb_shallow_merge(flagged_field, flagged)
+    if time_left is not None:
+        values[time_field] = time_left
+
+    updated = model.objects.filter(
+        pk=session_id, user=user, sync_seq__lt=seq, **{done_field: False}
+    ).update(**values)
+    if updated:
+        return DELTA_APPLIED, seq
+
+    # Nothing matched: find out why (only on the rejection path).
+    row = model.objects.filter(pk=session_id, user=user).values_list(done_field, 'sync_seq').first()
+    if row is None:
+        return DELTA_NOT_FOUND, None
+    is_done, current_seq = row
+    return (DELTA_CLOSED if is_done else DELTA_STALE), current_seq
+
+
+def _apply_session_delta_locked(model, session_id, user, seq, answers, flagged, time_left):
+    """Fallback for non-PostgreSQL databases (local SQLite): row lock + Python merge."""
+    done_field, time_field, flagged_field = SESSION_SYNC_FIELDS[model]
+    with transaction.atomic():
+        session = model.objects.select_for_update().filter(pk=session_id, user=user).first()
+        if session is None:
+            return DELTA_NOT_FOUND, None
+        if getattr(session, done_field):
+            return DELTA_CLOSED, session.sync_seq
+        if seq <= session.sync_seq:
+            return DELTA_STALE, session.sync_seq
+
+        update_fields = ['sync_seq', 'last_updated']
+        session.sync_seq = seq
+        if answers:
+            session.answers = merge_answers(session.answers, answers)
+            update_fields.append('answers')
+        if flagged:
+            current = getattr(session, flagged_field)
+            setattr(session, flagged_field, {**(current if isinstance(current, dict) else {}), **flagged})
+            update_fields.append(flagged_field)
+        if time_left is not None:
+            setattr(session, time_field, time_left)
+            update_fields.append(time_field)
+        session.save(update_fields=update_fields)
+    return DELTA_APPLIED, seq
@@ -0,0 +1,64 @@
+"""
+Serialized student-facing test structure (parts -> questions -> options).
+
+The payload only changes when an admin edits the test, and every edit bumps
+``test.updated_at`` (see the revision tracking in core.answer_keys), so it is
+cached per process under (kind, test id) together with the revision it was
+built from; a stale revision is rebuilt on next use. The admin write
+serializers also drop the entry explicitly after saving.
+
+Responses carry an ETag derived from the revision, so a client that already
+holds the current structure gets a 304 without anything being serialized.
+"""
+import hashlib
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache_utils import TTLCache
+
+LISTENING_KINDS = ('listening', 'listening_detail')
+READING_KINDS = ('reading',)
+
+# (kind, test_id) -> (revision, payload)
+_structures = TTLCache(maxsize=128)
+
+
+def structure_etag(kind, test):
+    revision = test.updated_at.isoformat() if test.updated_at else ''
+    digest = hashlib.sha1(f'{kind}:{test.pk}:{revision}'.encode()).hexdigest()[:16]
+    return f'"{kind}-{test.pk}-{digest}"'
+
+
+def get_test_structure(kind, test, build):
+    """Cached ``build(test)`` for the test's current revision."""
+    key = (kind, test.pk)
+    entry = _structures.get(key)
+    if entry is None or entry[0] != test.updated_at:
+        entry = (test.updated_at, build(test))
+        _structures.set(key, entry)
+    return entry[1]
+
+
+def invalidate_test_structure(test_id, kinds):
+    for kind in kinds:
+        _structures.delete((kind, test_id))
+
+
+def clear_test_structure_cache():
+    _structures.clear()
+
+
+def structure_response(request, kind, test, build):
+    """200 with the cached structure, or 304 when If-None-Match holds the current ETag."""
+    etag = structure_etag(kind, test)
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(get_test_structure(kind, test, build))
+    response['ETag'] = etag
+    # Revalidate on every use; the ETag makes that cheap
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,324 @@
+"""
+Write-coalescing buffer for session autosave (SESSION_SYNC_BUFFER = True).
+
+Sync PATCHes for Listening/Reading/Writing sessions are merged into a per-session
+state kept in the ``session_sync`` cache instead of being written straight to the
+DB. Every PATCH also appends the state key to a journal; ``flush_pending`` walks
+the journal and writes all touched sessions back in one SELECT ... FOR UPDATE and
+one bulk UPDATE per model and batch. One sync request per
+SESSION_SYNC_FLUSH_INTERVAL seconds claims the flush (``cache.add`` with a TTL, so
+exactly one across workers) and writes at most SESSION_SYNC_FLUSH_REQUEST_LIMIT
+journal entries; the ``flush_session_sync`` command drains the rest. Submit and
+resume call ``flush_session`` first, so grading and the student's reload always
+see the latest answers.
+
+The read-modify-write of a session's state runs under a per-session lock
+(``cache.add`` of a lock key with an owner token), so overlapping syncs of one
+session cannot both pass the ``seq`` check against the same state and drop each
+other's answers. A sync that cannot get the lock within SESSION_LOCK_WAIT
+seconds raises SessionSyncBusy, which DRF answers with a 503.
+
+The buffer only turns on with a cache shared by all workers (Redis or
+Memcached, see SHARED_CACHE_BACKENDS); with the local-memory fallback each
+gunicorn worker would hold its own answers, so syncs keep going to the DB.
+
+A buffered state holds everything changed since the session was first buffered,
+and re-applying it is idempotent, so a state is only dropped after a forced flush.
+"""
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from .models import ListeningTestSession, ReadingTestSession, WritingTestSession
+from .session_sync import (
+    merge_answers, DELTA_APPLIED, DELTA_STALE, DELTA_CLOSED, DELTA_NOT_FOUND,
+)
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'session-sync'
+JOURNAL_HEAD_KEY = f'{KEY_PREFIX}:journal:head'
+JOURNAL_CURSOR_KEY = f'{KEY_PREFIX}:journal:cursor'
+# Set by the first sync: the periodic flush starts one interval later
+LAST_FLUSH_KEY = f'{KEY_PREFIX}:last-flush'
+FLUSH_CLAIM_KEY = f'{KEY_PREFIX}:flush-claim'
+FLUSH_LOCK_KEY = f'{KEY_PREFIX}:flush-lock'
+FLUSH_LOCK_TIMEOUT = 120  # seconds
+SESSION_LOCK_TIMEOUT = 10  # seconds a session lock is held at most
+SESSION_LOCK_WAIT = 5  # seconds a sync waits for it
+# Cache backends shared by every worker, with an atomic add() for the locks and the flush claim
+SHARED_CACHE_BACKENDS = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+)
+_local_cache_warned = False
+
+# kind -> (model, finished flag, fields written back on flush).
+# Writing drafts were never gated on completion, so they are not here either.
+SYNC_KINDS = {
+    'listening': (ListeningTestSession, 'submitted', ['answers', 'flagged', 'time_left', 'sync_seq', 'last_updated']),
+    'reading': (ReadingTestSession, 'completed', ['answers', 'time_left_seconds', 'sync_seq', 'last_updated']),
+    'writing': (WritingTestSession, None, ['task1_draft', 'task2_draft', 'time_left_seconds']),
+}
+MODEL_KINDS = {model: kind for kind, (model, _, _) in SYNC_KINDS.items()}
+
+
+class SessionSyncBusy(APIException):
+    """Another sync of the same session held its lock for longer than SESSION_LOCK_WAIT (503, retry)."""
+    status_code = 503
+    default_detail = 'Session is being saved by another request, retry.'
+    default_code = 'session_sync_busy'
+
+
+def is_enabled():
+    if not getattr(settings, 'SESSION_SYNC_BUFFER', False):
+        return False
+    # In a per-process cache, submit can flush in a worker that never saw the buffered answers
+    if settings.CACHES['session_sync']['BACKEND'] not in SHARED_CACHE_BACKENDS:
+        global _local_cache_warned
+        if not _local_cache_warned:
+            logger.warning('SESSION_SYNC_BUFFER is on but the session_sync cache is not shared '
+                           'between workers (set REDIS_URL); syncs are written to the database directly')
+            _local_cache_warned = True
+        return False
+    return True
+
+
+def _cache():
+    return caches['session_sync']
+
+
+def _state_key(kind, session_id):
+    return f'{KEY_PREFIX}:{kind}:{session_id}'
+
+
+def _journal_key(index):
+    return f'{KEY_PREFIX}:journal:{index}'
+
+
+@contextmanager
+def _session_lock(cache, state_key):
+    lock_key = f'{state_key}:lock'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + SESSION_LOCK_WAIT
+    while not cache.add(lock_key, token, timeout=SESSION_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            raise SessionSyncBusy()
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        # Only release our own lock (it may have expired and been taken over)
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def _save_state(cache, state_key, state):
+    ttl = settings.SESSION_SYNC_STATE_TTL
+    cache.set(state_key, state, timeout=ttl)
+    cache.add(JOURNAL_HEAD_KEY, 0, timeout=None)
+    index = cache.incr(JOURNAL_HEAD_KEY)
+    cache.set(_journal_key(index), state_key, timeout=ttl)
+
+
+def buffer_answers(model, session_id, user, answers=None, flagged=None, time_left=None, seq=None):
+    """
+    Buffers one Listening/Reading sync. ``seq`` is checked like in delta sync.
+    Returns (outcome, sync_seq) with the DELTA_* outcomes of core.session_sync.
+    """
+    kind = MODEL_KINDS[model]
+    cache = _cache()
+    state_key = _state_key(kind, session_id)
+    with _session_lock(cache, state_key):
+        result = _buffer_answers(cache, state_key, model, kind, session_id, user, answers, flagged, time_left, seq)
+    maybe_flush()
+    return result
+
+
+def _buffer_answers(cache, state_key, model, kind, session_id, user, answers, flagged, time_left, seq):
+    _, done_field, _ = SYNC_KINDS[kind]
+    state = cache.get(state_key)
+    if state is None or state['user_id'] != user.pk:
+        row = model.objects.filter(pk=session_id, user=user).values_list(done_field, 'sync_seq').first()
+        if row is None:
+            return DELTA_NOT_FOUND, None
+        is_done, current_seq = row
+        if is_done:
+            return DELTA_CLOSED, current_seq
+        state = {'user_id': user.pk, 'seq': current_seq, 'answers': {}, 'replace': [], 'flagged': {}, 'time_left': None}
+
+    if seq is not None:
+        if seq <= state['seq']:
+            return DELTA_STALE, state['seq']
+        state['seq'] = seq
+
+    if isinstance(answers, dict):
+        replace = set(state['replace'])
+        for question_id, answer_value in answers.items():
+            current = state['answers'].get(question_id)
+            if isinstance(answer_value, dict) and question_id in state['answers'] and not isinstance(current, dict):
+                # Applied one by one this dict would have replaced the buffered value,
+                # so it must not be merged into the stored answer on flush either.
+                replace.add(question_id)
+        state['answers'] = merge_answers(state['answers'], answers)
+        state['replace'] = sorted(replace)
+    if isinstance(flagged, dict):
+        state['flagged'].update(flagged)
+    if time_left is not None:
+        try:
+            state['time_left'] = max(0, int(time_left))
+        except (TypeError, ValueError):
+            pass
+
+    _save_state(cache, state_key, state)
+    return DELTA_APPLIED, state['seq']
+
+
+def buffer_writing_drafts(session_id, user, task1_text=None, task2_text=None, time_left=None):
+    """Buffers one Writing draft sync; returns the buffered drafts or None if there is no such session."""
+    cache = _cache()
+    state_key = _state_key('writing', session_id)
+    with _session_lock(cache, state_key):
+        state = _buffer_writing_drafts(cache, state_key, session_id, user, task1_text, task2_text, time_left)
+    if state is not None:
+        maybe_flush()
+    return state
+
+
+def _buffer_writing_drafts(cache, state_key, session_id, user, task1_text, task2_text, time_left):
+    state = cache.get(state_key)
+    if state is None or state['user_id'] != user.pk:
+        row = (
+            WritingTestSession.objects.filter(pk=session_id, user=user)
+            .values_list('task1_draft', 'task2_draft', 'time_left_seconds').first()
+        )
+        if row is None:
+            return None
+        state = {'user_id': user.pk, 'task1_draft': row[0], 'task2_draft': row[1], 'time_left_seconds': row[2]}
+
+    if task1_text is not None:
+        state['task1_draft'] = task1_text
+    if task2_text is not None:
+        state['task2_draft'] = task2_text
+    if time_left is not None:
+        state['time_left_seconds'] = time_left
+
+    _save_state(cache, state_key, state)
+    return state
+
+
+def _apply_state(kind, session, state):
+    if kind == 'writing':
+        session.task1_draft = state['task1_draft']
+        session.task2_draft = state['task2_draft']
+        session.time_left_seconds = state['time_left_seconds']
+        return
+
+    answers = merge_answers(session.answers, state['answers'])
+    for question_id in state['replace']:
+        answers[question_id] = state['answers'][question_id]
+    session.answers = answers
+    if state['time_left'] is not None:
+        if kind == 'listening':
+            session.time_left = state['time_left']
+        else:
+            session.time_left_seconds = state['time_left']
+    if kind == 'listening' and state['flagged']:
+        flagged = session.flagged if isinstance(session.flagged, dict) else {}
+        session.flagged = {**flagged, **state['flagged']}
+    session.sync_seq = max(session.sync_seq, state['seq'])
+    session.last_updated = timezone.now()
+
+
+def _write_states(kind, states):
+    """Writes {session_id: state} for one kind in a single locked batch; returns rows written."""
+    model, done_field, fields = SYNC_KINDS[kind]
+    with transaction.atomic():
+        open_only = {done_field: False} if done_field else {}
+        sessions = list(model.objects.select_for_update().filter(pk__in=list(states), **open_only))
+        sessions = [s for s in sessions if s.user_id == states[s.pk]['user_id']]
+        for session in sessions:
+            _apply_state(kind, session, states[session.pk])
+        if sessions:
+            model.objects.bulk_update(sessions, fields)
+    return len(sessions)
+
+
+def flush_session(model, session_id):
+    """
+    Forced flush of one session, used before submit/resume.
+    Returns True if buffered state was written.
+    """
+    if not is_enabled():
+        return False
+    kind = MODEL_KINDS[model]
+    cache = _cache()
+    state_key = _state_key(kind, session_id)
+    with _session_lock(cache, state_key):
+        state = cache.get(state_key)
+        if state is None:
+            return False
+        written = _write_states(kind, {int(session_id): state})
+        cache.delete(state_key)
+    return bool(written)
+
+
+def flush_pending(batch_size=500, max_entries=None):
+    """
+    Writes every session touched since the last flush, or the sessions of the
+    next ``max_entries`` journal entries. Returns the number of rows written.
+    """
+    cache = _cache()
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=FLUSH_LOCK_TIMEOUT):
+        return 0  # another worker is flushing
+    written = 0
+    try:
+        cursor = cache.get(JOURNAL_CURSOR_KEY, 0)
+        head = cache.get(JOURNAL_HEAD_KEY, 0)
+        if max_entries is not None:
+            head = min(head, cursor + max_entries)
+        while cursor < head:
+            upto = min(head, cursor + batch_size)
+            entry_keys = [_journal_key(i) for i in range(cursor + 1, upto + 1)]
+            state_keys = set(cache.get_many(entry_keys).values())
+
+            by_kind = {}
+            for state_key, state in cache.get_many(list(state_keys)).items():
+                _, kind, session_id = state_key.rsplit(':', 2)
+                by_kind.setdefault(kind, {})[int(session_id)] = state
+            for kind, states in by_kind.items():
+                written += _write_states(kind, states)
+
+            cache.delete_many(entry_keys)
+            cursor = upto
+            cache.set(JOURNAL_CURSOR_KEY, cursor, timeout=None)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+    return written
+
+
+def maybe_flush():
+    """
+    Runs a bounded flush_pending from the one request that claims the current
+    SESSION_SYNC_FLUSH_INTERVAL. The claim is a ``cache.add`` expiring after the
+    interval, so concurrent requests cannot both win it.
+    """
+    cache = _cache()
+    now = time.time()
+    started = cache.add(LAST_FLUSH_KEY, now, timeout=None)
+    claimed = cache.add(FLUSH_CLAIM_KEY, now, timeout=settings.SESSION_SYNC_FLUSH_INTERVAL)
+    if started or not claimed:
+        return
+    try:
+        flush_pending(max_entries=settings.SESSION_SYNC_FLUSH_REQUEST_LIMIT)
+    except Exception as e:
+        # The journal cursor is only advanced after a successful write, so the next flush retries.
+        logger.error(f"Session sync flush failed: {e}")
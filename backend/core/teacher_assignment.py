@@ -0,0 +1,170 @@
+"""
+Teacher -> student assignment through ``User.assigned_teacher``.
+
+Students used to be linked to their teacher only by the free-text
+``User.teacher`` field holding the teacher's first name (or student_id when
+the teacher has no first name). Teacher queues and curator filters now join
+on the indexed ``assigned_teacher`` foreign key instead; the text field is
+kept for display and is synced with the FK whenever a student is saved.
+``python manage.py backfill_assigned_teachers`` links existing students.
+
+Students whose name matches no teacher account, or several, stay unlinked.
+They keep being matched by the text field (``students_of_teacher``,
+``is_students_teacher``), so nobody drops out of a queue until they are linked.
+"""
+from django.db.models import Q
+from django.db.models.signals import post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import User
+
+TEACHER_ROLES = ('teacher', 'speaking_mentor')
+
+
+def teacher_label(teacher):
+    """The name students carry in User.teacher for this teacher."""
+    return teacher.first_name or teacher.student_id
+
+
+def students_of_teacher(teacher, prefix=''):
+    """
+    Q for the students of ``teacher``: linked through the FK, or unlinked with
+    the teacher's label in the text field. ``prefix`` is the path to the
+    student ('user__' for essays and sessions).
+    """
+    q = Q(**{f'{prefix}assigned_teacher': teacher})
+    label = teacher_label(teacher)
+    if label:
+        q |= Q(**{f'{prefix}assigned_teacher__isnull': True, f'{prefix}teacher': label})
+    return q
+
+
+def is_students_teacher(student, teacher):
+    """In-memory counterpart of students_of_teacher for ownership checks."""
+    if student.assigned_teacher_id is not None:
+        return student.assigned_teacher_id == teacher.id
+    label = teacher_label(teacher)
+    return bool(label) and student.teacher == label
+
+
+def teacher_ids_for_name(name, partial=False, user_model=User):
+    """Ids of the teacher accounts whose label matches a User.teacher string."""
+    name = (name or '').strip()
+    if not name:
+        return []
+    lookup = 'icontains' if partial else 'iexact'
+    no_first_name = Q(first_name__isnull=True) | Q(first_name='')
+    return list(
+        user_model.objects.filter(role__in=TEACHER_ROLES)
+        .filter(Q(**{f'first_name__{lookup}': name}) | (no_first_name & Q(**{f'student_id__{lookup}': name})))
+        .values_list('id', flat=True)
+    )
+
+
+def build_teacher_index(user_model=User):
+    """{lowercased label: [teacher ids]} for every teacher account."""
+    index = {}
+    for teacher_id, first_name, student_id in (
+        user_model.objects.filter(role__in=TEACHER_ROLES).values_list('id', 'first_name', 'student_id')
+    ):
+        label = (first_name or student_id or '').strip().lower()
+        if label:
+            index.setdefault(label, []).append(teacher_id)
+    return index
+
+
+def backfill_assigned_teachers(user_model=User, overwrite=False, dry_run=False, batch_size=500):
+    """
+    Sets assigned_teacher from the teacher string of every student. Names that
+    match no teacher account, or several, are left alone (still matched by
+    name) and counted.
+    Returns counts of assigned, unchanged, unmatched and ambiguous students.
+    """
+    index = build_teacher_index(user_model)
+    stats = {'assigned': 0, 'unchanged': 0, 'unmatched': 0, 'ambiguous': 0}
+    students = user_model.objects.filter(role='student').exclude(teacher__isnull=True).exclude(teacher='')
+    if not overwrite:
+        students = students.filter(assigned_teacher__isnull=True)
+
+    pending = []
+    for student in students.only('id', 'teacher', 'assigned_teacher').iterator(chunk_size=batch_size):
+        teacher_ids = index.get(student.teacher.strip().lower(), [])
+        if not teacher_ids:
+            stats['unmatched'] += 1
+        elif len(teacher_ids) > 1:
+            stats['ambiguous'] += 1
+        elif teacher_ids[0] == student.assigned_teacher_id:
+            stats['unchanged'] += 1
+        else:
+            student.assigned_teacher_id = teacher_ids[0]
+            pending.append(student)
+            stats['assigned'] += 1
+        if len(pending) >= batch_size:
+            if not dry_run:
+                user_model.objects.bulk_update(pending, ['assigned_teacher'])
+            pending = []
+    if pending and not dry_run:
+        user_model.objects.bulk_update(pending, ['assigned_teacher'])
+    return stats
+
+
+def filter_students_by_teacher(students, name, partial=False):
+    """
+    Curator ``teacher`` filter. The value is the teacher name shown in the UI;
+    it is resolved to teacher accounts once and the students are filtered on
+    the FK. Unlinked students, and names without a teacher account, fall back
+    to the text field.
+    """
+    by_name = Q(teacher__icontains=name) if partial else Q(teacher=name)
+    teacher_ids = teacher_ids_for_name(name, partial=partial)
+    if not teacher_ids:
+        return students.filter(by_name)
+    return students.filter(Q(assigned_teacher_id__in=teacher_ids) | (Q(assigned_teacher__isnull=True) & by_name))
+
+
+ASSIGNMENT_FIELDS = ('teacher', 'assigned_teacher_id')
+
+
+def _remember_assignment(instance):
+    values = instance.__dict__
+    if all(name in values for name in ASSIGNMENT_FIELDS):
+        instance._saved_assignment = {name: values[name] for name in ASSIGNMENT_FIELDS}
+
+
+@receiver(post_init, sender=User)
+def _assignment_loaded(sender, instance, **kwargs):
+    # Values as loaded, so a save can tell what changed without re-reading the row
+    _remember_assignment(instance)
+
+
+@receiver(post_save, sender=User)
+def _assignment_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None:
+        _remember_assignment(instance)
+    elif {'teacher', 'assigned_teacher'} & set(update_fields):
+        # Partly saved: the next full save reads the stored values
+        instance.__dict__.pop('_saved_assignment', None)
+
+
+@receiver(pre_save, sender=User)
+def _sync_assigned_teacher(sender, instance, update_fields=None, raw=False, **kwargs):
+    """
+    Keeps a student's assigned_teacher and teacher string in agreement: a new
+    assigned_teacher rewrites the string, a new string is resolved to the FK.
+    """
+    if raw or update_fields is not None or instance.role != 'student':
+        return
+    previous = None
+    if not instance._state.adding:
+        previous = getattr(instance, '_saved_assignment', None)
+        if previous is None:
+            # Loaded with .only()/.defer(): read the stored values
+            previous = User.objects.filter(pk=instance.pk).values(*ASSIGNMENT_FIELDS).first()
+    teacher_changed = previous is None or previous['teacher'] != instance.teacher
+    assigned_changed = previous is None or previous['assigned_teacher_id'] != instance.assigned_teacher_id
+
+    if assigned_changed and instance.assigned_teacher_id:
+        instance.teacher = teacher_label(instance.assigned_teacher)
+    elif teacher_changed:
+        teacher_ids = teacher_ids_for_name(instance.teacher)
+        instance.assigned_teacher_id = teacher_ids[0] if len(teacher_ids) == 1 else None
@@ -3,12 +3,14 @@
 Security and authentication tests for the IELTS platform.
 Tests critical security paths identified in the security audit.
 """
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from unittest.mock import patch, MagicMock
 from core.models import User
 from core.utils import sanitize_ai_input, validate_file_content_type
+from core.query_guard import QueryBudgetMixin
 from io import BytesIO
 
 
@@ -175,3 +177,1826 @@ class RateLimitingTests(APITestCase):
         
         self.assertIn('DEFAULT_THROTTLE_CLASSES', rest_settings)
         self.assertIn('DEFAULT_THROTTLE_RATES', rest_settings)
+
+
+class VerifiedTokenCacheTests(TestCase):
+    """Tests for the verified-token and uid->User caches in the auth path."""
+
+    def setUp(self):
+        from core.firebase_config import clear_verified_token_cache
+        from core.auth import clear_user_cache
+        clear_verified_token_cache()
+        clear_user_cache()
+        self.student = User.objects.create(uid='cached_uid', role='student', first_name='Cached')
+
+    @patch('core.firebase_config.auth.verify_id_token')
+    def test_repeat_token_skips_verification(self, mock_verify):
+        """Same token should be verified cryptographically only once."""
+        import time
+        from core.firebase_config import verify_firebase_token
+        mock_verify.return_value = {'uid': 'cached_uid', 'exp': time.time() + 3600}
+
+        self.assertEqual(verify_firebase_token('token-a')['uid'], 'cached_uid')
+        self.assertEqual(verify_firebase_token('token-a')['uid'], 'cached_uid')
+        self.assertEqual(mock_verify.call_count, 1)
+
+    @patch('core.firebase_config.auth.verify_id_token')
+    def test_expired_token_not_cached(self, mock_verify):
+        """Tokens past their exp must be re-verified."""
+        import time
+        from core.firebase_config import verify_firebase_token
+        mock_verify.return_value = {'uid': 'cached_uid', 'exp': time.time() - 1}
+
+        verify_firebase_token('token-b')
+        verify_firebase_token('token-b')
+        self.assertEqual(mock_verify.call_count, 2)
+
+    @patch('core.auth.verify_firebase_token')
+    def test_repeat_authentication_skips_user_query(self, mock_verify):
+        """Second authentication for the same uid should not hit the database."""
+        from core.auth import FirebaseAuthentication
+        mock_verify.return_value = {'uid': 'cached_uid'}
+        request = MagicMock()
+        request.META = {'HTTP_AUTHORIZATION': 'Bearer token-c'}
+
+        FirebaseAuthentication().authenticate(request)
+        with self.assertNumQueries(0):
+            user, _ = FirebaseAuthentication().authenticate(request)
+        self.assertEqual(user.uid, 'cached_uid')
+
+    @patch('core.auth.verify_firebase_token')
+    def test_user_save_evicts_cache(self, mock_verify):
+        """Saving a user must drop the cached copy."""
+        from core.auth import FirebaseAuthentication
+        mock_verify.return_value = {'uid': 'cached_uid'}
+        request = MagicMock()
+        request.META = {'HTTP_AUTHORIZATION': 'Bearer token-d'}
+
+        FirebaseAuthentication().authenticate(request)
+        self.student.role = 'teacher'
+        self.student.save()
+        user, _ = FirebaseAuthentication().authenticate(request)
+        self.assertEqual(user.role, 'teacher')
+
+
+class LocalTokenVerificationTests(TestCase):
+    """Tests for in-process ID token verification against a stand-in key set."""
+
+    PROJECT_ID = 'test-project'
+
+    def setUp(self):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from core.firebase_config import FirebasePublicKeySet
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.public_pem = self.private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+        self.key_set = FirebasePublicKeySet(url='http://invalid.local')
+        self.key_set.set_keys({'kid-1': self.public_pem})
+
+    def _make_token(self, kid='kid-1', **overrides):
+        import time
+        import jwt
+        now = int(time.time())
+        claims = {
+            'iss': f'https://securetoken.google.com/{self.PROJECT_ID}',
+            'aud': self.PROJECT_ID,
+            'sub': 'local_uid',
+            'iat': now,
+            'auth_time': now,
+            'exp': now + 3600,
+        }
+        claims.update(overrides)
+        return jwt.encode(claims, self.private_key, algorithm='RS256', headers={'kid': kid})
+
+    def test_valid_token(self):
+        """A correctly signed token should decode with uid set from sub."""
+        from core.firebase_config import verify_token_locally
+        decoded = verify_token_locally(self._make_token(), self.key_set, self.PROJECT_ID)
+        self.assertEqual(decoded['uid'], 'local_uid')
+
+    def test_unknown_kid_rejected(self):
+        """Tokens signed with a key outside the key set must fail."""
+        import jwt
+        from core.firebase_config import verify_token_locally
+        with self.assertRaises(jwt.InvalidTokenError):
+            verify_token_locally(self._make_token(kid='other'), self.key_set, self.PROJECT_ID)
+
+    def test_wrong_audience_rejected(self):
+        """Tokens issued for another project must fail."""
+        import jwt
+        from core.firebase_config import verify_token_locally
+        with self.assertRaises(jwt.InvalidTokenError):
+            verify_token_locally(self._make_token(aud='other-project'), self.key_set, self.PROJECT_ID)
+
+    def test_load_key_set_from_file(self):
+        """Key set should load from a local Google-format JSON file."""
+        import json
+        import tempfile
+        from core.firebase_config import FirebasePublicKeySet, verify_token_locally
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'kid-1': self.public_pem}, f)
+        key_set = FirebasePublicKeySet(url='http://invalid.local', cache_file=f.name)
+        self.assertTrue(key_set.load_file())
+        decoded = verify_token_locally(self._make_token(), key_set, self.PROJECT_ID)
+        self.assertEqual(decoded['uid'], 'local_uid')
+
+
+class CompiledAnswerKeyTests(TestCase):
+    """Tests for the per-revision compiled Reading/Listening answer keys."""
+
+    def setUp(self):
+        from core.models import (
+            ReadingTest, ReadingPart, ReadingQuestion, ReadingAnswerOption, ReadingTestSession,
+        )
+        from core.answer_keys import clear_answer_key_cache
+        clear_answer_key_cache()
+        self.student = User.objects.create(uid='key_uid', role='student')
+        self.test = ReadingTest.objects.create(title='Compiled')
+        part = ReadingPart.objects.create(test=self.test, part_number=1)
+        self.gap_question = ReadingQuestion.objects.create(
+            part=part, order=1, question_type='gap_fill', question_text='[[1]] [[2]]',
+            correct_answers=[{'number': 1, 'answer': 'Bank St.|bank street'}, {'number': 2, 'answer': 'river'}],
+        )
+        choice = ReadingQuestion.objects.create(part=part, order=2, question_type='multiple_choice')
+        ReadingAnswerOption.objects.create(question=choice, label='A', text='one')
+        ReadingAnswerOption.objects.create(question=choice, label='B', text='two', is_correct=True)
+        self.session = ReadingTestSession.objects.create(
+            user=self.student, test=self.test,
+            answers={
+                str(self.gap_question.id): {'gap1': ' bank  STREET ', 'gap2': 'lake'},
+                str(choice.id): {'text': 'B'},
+            },
+        )
+
+    def _fresh_session(self):
+        from core.models import ReadingTestSession
+        return ReadingTestSession.objects.select_related('test').get(pk=self.session.pk)
+
+    def test_scores_alternatives(self):
+        """Alternatives separated by | should match after normalization."""
+        from core.serializers import create_detailed_breakdown
+        result = create_detailed_breakdown(self._fresh_session(), 'reading')
+        self.assertEqual(result['raw_score'], 2)
+        self.assertEqual(result['total_score'], 3)
+
+    def test_compiled_key_reused_without_queries(self):
+        """Scoring and rendering the same test revision again should not query the test structure."""
+        from core.serializers import create_detailed_breakdown, get_test_render_structure
+        create_detailed_breakdown(self._fresh_session(), 'reading')
+        session = self._fresh_session()
+        with self.assertNumQueries(0):
+            create_detailed_breakdown(session, 'reading')
+            get_test_render_structure(None, session)
+
+    def test_question_edit_recompiles_key(self):
+        """Editing a question should bump the test revision and change the score."""
+        from core.serializers import create_detailed_breakdown
+        create_detailed_breakdown(self._fresh_session(), 'reading')
+        self.gap_question.correct_answers = [{'number': 1, 'answer': 'x'}, {'number': 2, 'answer': 'lake'}]
+        self.gap_question.save()
+        result = create_detailed_breakdown(self._fresh_session(), 'reading')
+        self.assertEqual(result['raw_score'], 2)
+        self.assertEqual(result['total_score'], 3)
+
+
+    def test_failing_question_is_logged_and_scored_as_error(self):
+        from core.answer_keys import get_answer_key
+        answer_key = get_answer_key(self.test, 'reading')
+        question_key = next(key for part in answer_key.parts for key in part.questions
+                            if key.question.id == self.gap_question.id)
+        with patch.object(question_key, 'score', side_effect=ValueError('bad key')), \
+                self.assertLogs('core.answer_keys', level='ERROR') as logs:
+            entry = question_key.evaluate(self.session.answers)
+        self.assertIn(f'Error processing question {self.gap_question.id}', logs.output[0])
+        self.assertEqual(entry['sub_questions'][0]['sub_id'], 'error')
+
+class RegradeCommandTests(TestCase):
+    """Tests for the bulk `regrade` management command."""
+
+    def setUp(self):
+        from core.models import ReadingTest, ReadingPart, ReadingQuestion, ReadingTestSession, ReadingTestResult
+        from core.answer_keys import clear_answer_key_cache
+        clear_answer_key_cache()
+        student = User.objects.create(uid='regrade_uid', role='student')
+        self.test = ReadingTest.objects.create(title='Regrade')
+        part = ReadingPart.objects.create(test=self.test, part_number=1)
+        question = ReadingQuestion.objects.create(
+            part=part, order=1, question_type='gap_fill', question_text='[[1]]',
+            correct_answers=[{'number': 1, 'answer': 'river'}],
+        )
+        answers = {str(question.id): {'gap1': 'river'}}
+        self.graded = ReadingTestSession.objects.create(user=student, test=self.test, completed=True, answers=answers)
+        self.stale = ReadingTestResult.objects.create(session=self.graded, raw_score=0, total_score=1, band_score=2.0)
+        self.ungraded = ReadingTestSession.objects.create(user=student, test=self.test, completed=True, answers=answers)
+        ReadingTestSession.objects.create(user=student, test=self.test, completed=False, answers=answers)
+
+    def _run(self, *extra, workers=1):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('regrade', '--module', 'reading', '--test', str(self.test.id), '--workers', str(workers),
+                     *extra, stdout=out)
+        return out.getvalue()
+
+    def test_regrade_updates_and_creates_results(self):
+        """Completed sessions should be rescored; stale rows updated and missing rows created."""
+        from core.models import ReadingTestResult
+        output = self._run()
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.raw_score, 1)
+        self.assertEqual(self.stale.band_score, 9.0)
+        self.assertTrue(ReadingTestResult.objects.filter(session=self.ungraded, raw_score=1).exists())
+        self.assertEqual(ReadingTestResult.objects.count(), 2)
+        self.assertIn('Band score changed for 1 session(s)', output)
+
+    def test_dry_run_does_not_write(self):
+        """--dry-run should report diffs without touching results."""
+        from core.models import ReadingTestResult
+        output = self._run('--dry-run')
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.band_score, 2.0)
+        self.assertEqual(ReadingTestResult.objects.count(), 1)
+        self.assertIn('+7.0: 1', output)
+
+    def test_worker_pool_forks_without_an_open_connection(self):
+        """With --workers 2 no query runs between closing the connections and the first (forking) submit."""
+        from concurrent.futures import Future
+        from django.db import connection, connections
+        from core.models import ReadingTestResult
+        events = []
+
+        class InlinePool:
+            # Stands in for the fork pool: the SQLite test database cannot be shared with children
+            def __init__(self, max_workers, mp_context, initializer, initargs):
+                initializer(*initargs)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def submit(self, fn, session_ids):
+                if 'fork' not in events:
+                    events.append('fork')
+                future = Future()
+                future.set_result(fn(session_ids))
+                return future
+
+        def record_query(execute, sql, params, many, context):
+            events.append('query')
+            return execute(sql, params, many, context)
+
+        close_all = connections.close_all
+
+        def record_close():
+            events.append('close')
+            close_all()
+
+        with patch('core.management.commands.regrade.ProcessPoolExecutor', InlinePool), \
+                patch('core.management.commands.regrade.connection', MagicMock(vendor='postgresql')), \
+                patch('core.management.commands.regrade.connections.close_all', side_effect=record_close), \
+                patch('core.management.commands.regrade.multiprocessing.get_context'), \
+                connection.execute_wrapper(record_query):
+            self._run('--chunk-size', '1', workers=2)
+
+        fork = events.index('fork')
+        self.assertEqual(events[fork - 1], 'close')
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.band_score, 9.0)
+        self.assertTrue(ReadingTestResult.objects.filter(session=self.ungraded, raw_score=1).exists())
+
+
+class DeltaSessionSyncTests(APITestCase):
+    """Tests for delta autosave (`seq` + changed keys only) on Listening/Reading sessions."""
+
+    def setUp(self):
+        from core.models import ListeningTest, ListeningTestSession, ReadingTest, ReadingTestSession
+        self.student = User.objects.create(uid='delta_uid', role='student')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.student)
+        self.listening = ListeningTestSession.objects.create(
+            user=self.student, test=ListeningTest.objects.create(title='L'),
+            answers={'1': 'A', '2': {'gap1': 'x', 'gap2': 'y'}}, flagged={'1': True},
+        )
+        self.reading = ReadingTestSession.objects.create(
+            user=self.student, test=ReadingTest.objects.create(title='R'), answers={'7': 'TRUE'},
+        )
+
+    def test_listening_delta_merges_changed_keys(self):
+        """Only the sent keys change; nested answers are merged one level deep."""
+        url = f'/api/listening-sessions/{self.listening.id}/sync/'
+        response = self.client.patch(url, {
+            'seq': 1, 'answers': {'2': {'gap2': 'z'}, '3': 'C'}, 'flagged': {'3': True}, 'time_left': 1200,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['seq'], 1)
+        self.listening.refresh_from_db()
+        self.assertEqual(self.listening.answers, {'1': 'A', '2': {'gap1': 'x', 'gap2': 'z'}, '3': 'C'})
+        self.assertEqual(self.listening.flagged, {'1': True, '3': True})
+        self.assertEqual(self.listening.time_left, 1200)
+        self.assertEqual(self.listening.sync_seq, 1)
+
+    def test_out_of_order_delta_is_rejected(self):
+        """A delta with a seq not above the stored one must not overwrite newer answers."""
+        url = f'/api/reading-sessions/{self.reading.id}/sync/'
+        self.assertEqual(self.client.patch(url, {'seq': 5, 'answers': {'7': 'FALSE'}}, format='json').status_code, 200)
+        response = self.client.patch(url, {'seq': 4, 'answers': {'7': 'NOT GIVEN'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['seq'], 5)
+        self.reading.refresh_from_db()
+        self.assertEqual(self.reading.answers, {'7': 'FALSE'})
+
+    def test_out_of_range_seq_is_rejected(self):
+        for url in (f'/api/listening-sessions/{self.listening.id}/sync/', f'/api/reading-sessions/{self.reading.id}/sync/'):
+            for seq in (0, 2 ** 31, 10 ** 20, '1e3', True):
+                with self.subTest(url=url, seq=seq):
+                    response = self.client.patch(url, {'seq': seq, 'answers': {'7': 'x'}}, format='json')
+                    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.patch(url, {'seq': 2 ** 31 - 1, 'answers': {'7': 'x'}}, format='json').status_code, 200)
+
+    def test_delta_on_completed_session_is_rejected(self):
+        self.reading.completed = True
+        self.reading.save()
+        response = self.client.patch(f'/api/reading-sessions/{self.reading.id}/sync/', {'seq': 1, 'answers': {'7': 'x'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(SESSION_SYNC_BUFFER=True, SESSION_SYNC_FLUSH_INTERVAL=3600)
+class SessionSyncBufferTests(APITestCase):
+    """Tests for the write-coalescing sync buffer (core.sync_buffer)."""
+
+    def setUp(self):
+        from django.core.cache import caches
+        from core.models import ReadingTest, ReadingPart, ReadingQuestion, ReadingTestSession
+        caches['session_sync'].clear()
+        # The test runner is a single process, so its local-memory cache counts as shared
+        shared = patch('core.sync_buffer.SHARED_CACHE_BACKENDS', ('django.core.cache.backends.locmem.LocMemCache',))
+        shared.start()
+        self.addCleanup(shared.stop)
+        self.student = User.objects.create(uid='buffer_uid', role='student')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.student)
+        test = ReadingTest.objects.create(title='Buffered')
+        part = ReadingPart.objects.create(test=test, part_number=1)
+        self.question = ReadingQuestion.objects.create(
+            part=part, order=1, question_type='gap_fill', question_text='[[1]] [[2]]',
+            correct_answers=[{'number': 1, 'answer': 'river'}, {'number': 2, 'answer': 'bank'}],
+        )
+        self.session = ReadingTestSession.objects.create(user=self.student, test=test)
+        self.url = f'/api/reading-sessions/{self.session.id}/sync/'
+
+    def test_syncs_are_coalesced_until_flush(self):
+        """Several PATCHes should not touch the row; one flush writes the merged state."""
+        from core.sync_buffer import flush_pending
+        qid = str(self.question.id)
+        self.client.patch(self.url, {'answers': {qid: {'gap1': 'river'}}, 'time_left': 3000}, format='json')
+        response = self.client.patch(self.url, {'answers': {qid: {'gap2': 'bank'}}, 'time_left': 2990}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.answers, {})
+
+        self.assertEqual(flush_pending(), 1)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.answers, {qid: {'gap1': 'river', 'gap2': 'bank'}})
+        self.assertEqual(self.session.time_left_seconds, 2990)
+
+    def test_process_local_cache_keeps_the_buffer_off(self):
+        """Without a shared cache another worker could grade stale answers: syncs go straight to the DB."""
+        qid = str(self.question.id)
+        with patch('core.sync_buffer.SHARED_CACHE_BACKENDS', ()):
+            response = self.client.patch(self.url, {'answers': {qid: {'gap1': 'river'}}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.answers, {qid: {'gap1': 'river'}})
+
+    def test_submit_forces_flush_before_grading(self):
+        """Answers still sitting in the buffer must be graded on submit."""
+        qid = str(self.question.id)
+        self.client.patch(self.url, {'answers': {qid: {'gap1': 'river', 'gap2': 'bank'}}}, format='json')
+        response = self.client.put(f'/api/reading-sessions/{self.session.id}/submit/', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['raw_score'], 2)
+        self.assertEqual(
+            self.client.patch(self.url, {'answers': {qid: 'x'}}, format='json').status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    def test_overlapping_syncs_of_one_session_are_serialized(self):
+        """A sync waits for the session lock instead of overwriting the state it is based on."""
+        import threading
+        from django.core.cache import caches
+        from core import sync_buffer
+        from core.models import ReadingTestSession
+        qid = str(self.question.id)
+        self.client.patch(self.url, {'seq': 1, 'answers': {qid: {'gap1': 'river'}}}, format='json')
+        cache = caches['session_sync']
+        state_key = sync_buffer._state_key('reading', self.session.id)
+
+        results = []
+        with sync_buffer._session_lock(cache, state_key):
+            worker = threading.Thread(target=lambda: results.append(sync_buffer.buffer_answers(
+                ReadingTestSession, self.session.id, self.student, answers={qid: {'gap2': 'bank'}}, seq=2)))
+            worker.start()
+            worker.join(0.2)
+            self.assertTrue(worker.is_alive())
+            self.assertEqual(cache.get(state_key)['seq'], 1)
+        worker.join()
+        self.assertEqual(results, [(sync_buffer.DELTA_APPLIED, 2)])
+        self.assertEqual(cache.get(state_key)['answers'], {qid: {'gap1': 'river', 'gap2': 'bank'}})
+
+        with sync_buffer._session_lock(cache, state_key), patch.object(sync_buffer, 'SESSION_LOCK_WAIT', 0):
+            response = self.client.patch(self.url, {'seq': 3, 'answers': {qid: 'x'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_periodic_flush_is_claimed_once_and_bounded(self):
+        from django.core.cache import caches
+        from core import sync_buffer
+        qid = str(self.question.id)
+        for seq in (1, 2, 3):
+            self.client.patch(self.url, {'seq': seq, 'answers': {qid: {'gap1': str(seq)}}}, format='json')
+        cache = caches['session_sync']
+        # The interval is over: the claim is free again
+        cache.delete(sync_buffer.FLUSH_CLAIM_KEY)
+        with override_settings(SESSION_SYNC_FLUSH_REQUEST_LIMIT=2), \
+                patch.object(sync_buffer, 'flush_pending', wraps=sync_buffer.flush_pending) as flush:
+            sync_buffer.maybe_flush()
+            sync_buffer.maybe_flush()
+        flush.assert_called_once_with(max_entries=2)
+        self.assertEqual(cache.get(sync_buffer.JOURNAL_CURSOR_KEY), 2)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.answers, {qid: {'gap1': '3'}})
+
+
+class PerformanceRollupTests(APITestCase):
+    """Tests for the per student x module x week rollups behind the curator dashboards."""
+
+    def setUp(self):
+        from core.models import ListeningTest, ListeningTestSession, ReadingTest, ReadingTestSession
+        self.curator = User.objects.create(uid='rollup_curator', role='curator')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.curator)
+        self.students = [
+            User.objects.create(uid=f'rollup_s{i}', role='student', group=group, student_id=f'R{i}')
+            for i, group in enumerate(['A', 'A', 'B'])
+        ]
+        listening = ListeningTest.objects.create(title='L')
+        reading = ReadingTest.objects.create(title='R')
+        self.sessions = []
+        for student, bands in zip(self.students, [(6.0, 7.0), (5.0,), (8.0, 8.5)]):
+            for band in bands:
+                self.sessions.append((ListeningTestSession.objects.create(
+                    user=student, test=listening, submitted=True, completed_at=timezone.now()), band))
+            ReadingTestSession.objects.create(user=student, test=reading, completed=True, end_time=timezone.now())
+
+    def _create_results(self):
+        from core.models import ListeningTestResult
+        for session, band in self.sessions:
+            ListeningTestResult.objects.create(session=session, raw_score=20, band_score=band)
+
+    def test_result_save_refreshes_student_rollup(self):
+        from core.models import StudentPerformanceRollup
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_results()
+        rows = StudentPerformanceRollup.objects.filter(student=self.students[0], module='listening')
+        self.assertEqual(sum(r.attempts for r in rows), 2)
+        self.assertEqual(sum(r.band_sum for r in rows), 13.0)
+
+    def test_ranking_from_rollups_matches_raw_tables(self):
+        """The rollup path and the raw (date filtered) path must rank groups identically."""
+        from io import StringIO
+        from django.core.management import call_command
+        self._create_results()
+        call_command('rebuild_rollups', stdout=StringIO())
+        from_rollups = self.client.get('/api/curator/groups-ranking/').data['groups']
+        from_raw = self.client.get('/api/curator/groups-ranking/', {'date_from': '2000-01-01'}).data['groups']
+        self.assertEqual(from_rollups, from_raw)
+        self.assertEqual(from_rollups[0]['group'], 'B')
+        self.assertEqual(from_rollups[0]['avg_listening_band'], 8.5)
+
+        weekly = self.client.get('/api/curator/weekly-overview/').data
+        weekly_raw = self.client.get('/api/curator/weekly-overview/', {'date_from': '2000-01-01'}).data
+        self.assertEqual(weekly['summary'], weekly_raw['summary'])
+        self.assertEqual(weekly['groups'], weekly_raw['groups'])
+
+    def test_students_and_overview_rollups_match_live_queries(self):
+        """Inactive tests, essays outside the scope and unfinished speaking sessions count the same way on both paths."""
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from core.models import (
+            Essay, ListeningTest, ListeningTestSession, ReadingTest, SpeakingSession, WritingPrompt, WritingTest,
+            WritingTestSession,
+        )
+        self._create_results()
+        ListeningTest.objects.update(is_active=True)
+        ReadingTest.objects.update(is_active=True)
+        student = self.students[0]
+        hidden = ListeningTest.objects.create(title='Hidden')
+        ListeningTestSession.objects.create(user=student, test=hidden, submitted=True, completed_at=timezone.now())
+        # Started long before it was submitted: last activity is the submission
+        late = ListeningTestSession.objects.create(user=student, test=ListeningTest.objects.get(title='L'),
+                                                   submitted=True, completed_at=timezone.now())
+        ListeningTestSession.objects.filter(pk=late.pk).update(started_at=timezone.now() - timedelta(days=20))
+
+        prompt = WritingPrompt.objects.create(task_type='task2', prompt_text='P', is_active=True)
+        writing = WritingTest.objects.create(title='W', is_active=True)
+        session = WritingTestSession.objects.create(user=student, test=writing, completed=True)
+        Essay.objects.create(user=student, task_type='task2', question_text='Q', submitted_text='E',
+                             prompt=prompt, overall_band=6.0)
+        Essay.objects.create(user=student, task_type='task2', question_text='Q', submitted_text='E',
+                             test_session=session, overall_band=7.0)
+        Essay.objects.create(user=student, task_type='task2', question_text='Q', submitted_text='E', overall_band=4.0)
+        SpeakingSession.objects.create(student=student, teacher=self.curator, completed=True, overall_band_score=6.0)
+        SpeakingSession.objects.create(student=student, teacher=self.curator, completed=False, overall_band_score=5.0)
+        call_command('rebuild_rollups', stdout=StringIO())
+
+        for url in ('/api/curator/students/', '/api/curator/overview/'):
+            from_rollups = self.client.get(url).data
+            from_raw = self.client.get(url, {'date_from': '2000-01-01'}).data
+            self.assertEqual(from_rollups, from_raw, url)
+        students = self.client.get('/api/curator/students/').data['students']
+        row = next(r for r in students if r['id'] == student.id)
+        self.assertEqual(row['test_counts'], {'writing': 1, 'listening': 3, 'reading': 1})
+
+    def test_refresh_locks_the_student_before_replacing_rows(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.rollups import refresh_student_rollup
+        self._create_results()
+        with CaptureQueriesContext(connection) as queries:
+            refresh_student_rollup(self.students[0].id, 'listening', timezone.now())
+        statements = [q['sql'] for q in queries.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertIn('FROM "core_user"', statements[0])
+        self.assertTrue(statements[1].startswith('DELETE'))
+
+    def test_full_rebuild_in_batches_matches_single_batch(self):
+        from core.models import StudentPerformanceRollup
+        from core.rollups import rebuild_rollups
+        self._create_results()
+        fields = ('student_id', 'module', 'week_start', 'attempts', 'band_sum', 'band_count')
+        rebuild_rollups()
+        single = sorted(StudentPerformanceRollup.objects.values_list(*fields))
+        with patch('core.rollups.REBUILD_BATCH_SIZE', 1):
+            rebuild_rollups()
+        self.assertEqual(sorted(StudentPerformanceRollup.objects.values_list(*fields)), single)
+        self.assertEqual(len(single), 6)
+
+    def test_rebuild_missing_fills_weeks_without_rows(self):
+        from datetime import date
+        from io import StringIO
+        from django.core.management import call_command
+        from core.models import StudentPerformanceRollup
+        self._create_results()
+        call_command('rebuild_rollups', stdout=StringIO())
+        expected = sorted(StudentPerformanceRollup.objects.values_list('student_id', 'module', 'attempts', 'band_sum'))
+        # As after a migration that clears the table, except one student refreshed since
+        StudentPerformanceRollup.objects.exclude(student=self.students[0], module='listening').delete()
+        kept = StudentPerformanceRollup.objects.get()
+        # ...and one student with activity in another week only partly rebuilt
+        reading = StudentPerformanceRollup.objects.create(
+            student=self.students[1], module='reading', week_start=date(2020, 1, 6), attempts=1)
+        out = StringIO()
+        call_command('rebuild_rollups', '--missing', stdout=out)
+        self.assertIn('Wrote 5 rollup rows', out.getvalue())
+        self.assertTrue(StudentPerformanceRollup.objects.filter(pk=kept.pk).exists())
+        reading.delete()
+        self.assertEqual(
+            sorted(StudentPerformanceRollup.objects.values_list('student_id', 'module', 'attempts', 'band_sum')), expected)
+        out = StringIO()
+        call_command('rebuild_rollups', '--missing', stdout=out)
+        self.assertIn('Wrote 0 rollup rows', out.getvalue())
+
+    def test_refresh_recomputes_only_the_affected_week(self):
+        from datetime import date
+        from core.models import StudentPerformanceRollup
+        old = StudentPerformanceRollup.objects.create(
+            student=self.students[0], module='listening', week_start=date(2020, 1, 6), attempts=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_results()
+        self.assertTrue(StudentPerformanceRollup.objects.filter(pk=old.pk).exists())
+        current = StudentPerformanceRollup.objects.filter(student=self.students[0], module='listening').exclude(pk=old.pk)
+        self.assertEqual([(r.attempts, r.band_sum) for r in current], [(2, 13.0)])
+
+
+class StreamingCSVExportTests(APITestCase):
+    """CSV exports are streamed row by row instead of being built in memory."""
+
+    def setUp(self):
+        self.curator = User.objects.create(uid='csv_curator', role='curator')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.curator)
+        self.students = [
+            User.objects.create(uid=f'csv_s{i}', role='student', student_id=f'C{i}', first_name='Ann',
+                                last_name=f'S{i}', group='A', teacher='T')
+            for i in range(3)
+        ]
+
+    def _read_csv(self, response):
+        import csv
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        return content, list(csv.reader(content.lstrip('\ufeff').splitlines()))
+
+    def test_speaking_export_streams_all_rows(self):
+        from core.models import SpeakingSession
+        for student in self.students:
+            SpeakingSession.objects.create(student=student, teacher=self.curator, completed=True,
+                                           overall_band_score=6.5, conducted_at=timezone.now())
+        response = self.client.get('/api/curator/speaking-export-csv/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('speaking_sessions_export.csv', response['Content-Disposition'])
+        content, rows = self._read_csv(response)
+        self.assertTrue(content.startswith('\ufeff'))
+        self.assertEqual(rows[0][0], 'Student ID')
+        self.assertEqual(sorted(r[0] for r in rows[1:]), ['C0', 'C1', 'C2'])
+        self.assertEqual({r[6] for r in rows[1:]}, {'6.5'})
+
+    def test_reading_export_streams_results(self):
+        from core.models import ReadingTest, ReadingTestSession, ReadingTestResult
+        test = ReadingTest.objects.create(title='R')
+        for student in self.students[:2]:
+            session = ReadingTestSession.objects.create(user=student, test=test, completed=True, end_time=timezone.now())
+            ReadingTestResult.objects.create(session=session, raw_score=30, total_score=40, band_score=7.0, breakdown={
+                '1': {'is_correct': True}, '2': {'sub_questions': [{'is_correct': False}, {'is_correct': True}]},
+            })
+        response = self.client.get(f'/api/admin/reading-test/{test.pk}/export-csv/')
+        self.assertEqual(response.status_code, 200)
+        content, rows = self._read_csv(response)
+        self.assertFalse(content.startswith('\ufeff'))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][8:10], ['1;3', '2'])
+
+
+class ListeningExportFromStoredResultsTests(APITestCase):
+    """The Listening CSV export reads stored results unless ?recompute=1 is given."""
+
+    def setUp(self):
+        from core.models import ListeningTest, ListeningPart, ListeningQuestion, ListeningTestSession, ListeningTestResult
+        from core.answer_keys import clear_answer_key_cache
+        from core.serializers import create_listening_detailed_breakdown
+        clear_answer_key_cache()
+        self.curator = User.objects.create(uid='lexport_curator', role='curator')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.curator)
+        self.test = ListeningTest.objects.create(title='L')
+        part = ListeningPart.objects.create(test=self.test, part_number=1)
+        self.question = ListeningQuestion.objects.create(
+            part=part, order=1, question_type='gap_fill', question_text='[[1]] [[2]]',
+            correct_answers=['river', 'bank'],
+        )
+        for i in range(3):
+            student = User.objects.create(uid=f'lexport_s{i}', role='student', student_id=f'L{i}')
+            session = ListeningTestSession.objects.create(
+                user=student, test=self.test, submitted=True, completed_at=timezone.now(),
+                answers={str(self.question.id): {'gap1': 'river', 'gap2': 'lake'}},
+            )
+            if i < 2:  # the last one was submitted before results were stored
+                results = create_listening_detailed_breakdown(session)
+                session.total_questions_count = results['total_score']
+                session.save()
+                ListeningTestResult.objects.create(session=session, raw_score=results['raw_score'],
+                                                   band_score=results['band_score'],
+                                                   breakdown=results['detailed_breakdown'])
+
+    def _export(self, **params):
+        import csv
+        response = self.client.get(f'/api/admin/listening-test/{self.test.pk}/export-csv/', params)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf-8').lstrip('\ufeff')
+        return {row[0]: row[5:10] for row in list(csv.reader(content.splitlines()))[1:]}
+
+    def test_stored_and_recomputed_exports_match(self):
+        stored = self._export()
+        self.assertEqual(stored['L0'], ['1', '2', '2.5', '1', '2'])
+        self.assertEqual(stored, self._export(recompute='1'))
+
+    def test_recompute_uses_current_answer_key(self):
+        self.question.correct_answers = ['river', 'lake']
+        self.question.save()
+        self.assertEqual(self._export()['L0'][0], '1')
+        self.assertEqual(self._export(recompute='1')['L0'][0], '2')
+
+    def test_scoring_error_is_marked_not_zeroed(self):
+        failing_key = MagicMock()
+        failing_key.score.side_effect = ValueError('broken key')
+        with patch('core.views.get_answer_key', return_value=failing_key), \
+                self.assertLogs('core.views', level='ERROR'):
+            rows = self._export(recompute='1')
+        self.assertEqual(rows['L0'][:3], ['', '', 'scoring error'])
+
+
+@override_settings(ESSAY_SCORING_ASYNC=True, ESSAY_SCORING_MAX_ATTEMPTS=2)
+class EssayScoringQueueTests(APITestCase):
+    """Tests for the DB-backed AI essay scoring queue (core.scoring_jobs)."""
+
+    SCORES = {'task_response': 6.0, 'coherence': 6.0, 'lexical': 7.0, 'grammar': 7.0, 'feedback': 'Good'}
+    FAILED = {'task_response': None, 'coherence': None, 'lexical': None, 'grammar': None,
+              'feedback': 'AI scoring failed: timeout'}
+
+    def setUp(self):
+        from core.models import WritingTestSession, Essay
+        self.student = User.objects.create(uid='scoring_uid', role='student')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.student)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer token')
+        self.session = WritingTestSession.objects.create(user=self.student)
+        for task_type in ('task1', 'task2'):
+            Essay.objects.create(user=self.student, test_session=self.session, task_type=task_type,
+                                 question_text='Q', submitted_text='essay text')
+
+    def _finish(self):
+        with patch('core.views.verify_firebase_token', return_value={'uid': 'scoring_uid'}):
+            return self.client.post('/api/finish-writing-session/', {'session_id': self.session.id}, format='json')
+
+    def _status(self):
+        with patch('core.views.verify_firebase_token', return_value={'uid': 'scoring_uid'}):
+            return self.client.get(f'/api/writing-sessions/{self.session.id}/scoring-status/').data
+
+    @patch('core.scoring_jobs.ai_score_essay')
+    def test_finish_enqueues_and_worker_scores(self, ai_score):
+        from io import StringIO
+        from django.core.management import call_command
+        from core.models import EssayScoringJob
+        ai_score.return_value = self.SCORES
+
+        response = self._finish()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'pending')
+        ai_score.assert_not_called()
+        self._finish()  # finishing again must not queue the essays twice
+        self.assertEqual(EssayScoringJob.objects.filter(status='queued').count(), 2)
+
+        call_command('run_scoring_worker', '--once', stdout=StringIO())
+        self.assertEqual(ai_score.call_count, 2)
+        result = self._status()
+        self.assertEqual(result['status'], 'done')
+        self.assertEqual(result['overall_band'], 6.5)
+        self.assertEqual(self._finish().status_code, status.HTTP_200_OK)
+
+    @patch('core.scoring_jobs.ai_score_essay')
+    def test_failed_attempts_back_off_then_fail(self, ai_score):
+        from datetime import timedelta
+        from core.models import EssayScoringJob
+        from core.scoring_jobs import claim_jobs, run_job
+        ai_score.return_value = self.FAILED
+        self._finish()
+
+        for job in claim_jobs('w1', limit=1):
+            self.assertFalse(run_job(job, 'w1'))
+        job = EssayScoringJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual([j.pk for j in claim_jobs('w1', limit=5)], [j.pk for j in EssayScoringJob.objects.exclude(pk=job.pk)])
+
+        EssayScoringJob.objects.filter(pk=job.pk).update(run_after=timezone.now() - timedelta(seconds=1))
+        [job] = claim_jobs('w1', limit=1)
+        self.assertFalse(run_job(job, 'w1'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(self._status()['essays'][0]['last_error'], 'AI scoring failed: timeout')
+
+    @patch('core.scoring_jobs.ai_score_essay')
+    def test_expired_claim_is_taken_over(self, ai_score):
+        from datetime import timedelta
+        from core.models import EssayScoringJob
+        from core.scoring_jobs import claim_jobs, run_job
+        ai_score.return_value = self.SCORES
+        self._finish()
+        stale = claim_jobs('w1', limit=2)
+        self.assertEqual(claim_jobs('w2', limit=2), [])
+
+        EssayScoringJob.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        taken = claim_jobs('w2', limit=2)
+        self.assertEqual(len(taken), 2)
+        self.assertTrue(run_job(stale[0], 'w1'))  # the stale owner's outcome is not recorded
+        self.assertEqual(EssayScoringJob.objects.get(pk=stale[0].pk).status, 'running')
+        for job in taken:
+            self.assertTrue(run_job(job, 'w2'))
+        self.assertEqual(self._status()['status'], 'done')
+
+
+class ConcurrentEssayScoringTests(APITestCase):
+    """Task 1 and Task 2 are scored in parallel when the session is finished in-request."""
+
+    def setUp(self):
+        from core.models import WritingTestSession, Essay
+        self.student = User.objects.create(uid='parallel_uid', role='student')
+        self.session = WritingTestSession.objects.create(user=self.student)
+        self.essays = {
+            task_type: Essay.objects.create(user=self.student, test_session=self.session, task_type=task_type,
+                                            question_text='Q', submitted_text=task_type)
+            for task_type in ('task1', 'task2')
+        }
+
+    @staticmethod
+    def _slow_scorer(delays):
+        import time
+
+        def score(question_text, essay_text, task_type, image_url=None, timeout=None):
+            time.sleep(delays[task_type])
+            return {'task_response': 7.0, 'coherence': 7.0, 'lexical': 7.0, 'grammar': 7.0, 'feedback': 'ok'}
+        return score
+
+    def test_essays_are_scored_in_parallel(self):
+        import threading
+        # Each scorer waits for the other: run one after the other, the barrier times out and scoring fails
+        barrier = threading.Barrier(2, timeout=5)
+
+        def score(question_text, essay_text, task_type, image_url=None, timeout=None):
+            barrier.wait()
+            return {'task_response': 7.0, 'coherence': 7.0, 'lexical': 7.0, 'grammar': 7.0, 'feedback': 'ok'}
+
+        client = APIClient()
+        client.force_authenticate(user=self.student)
+        with patch('core.scoring_jobs.ai_score_essay', side_effect=score), \
+                patch('core.views.verify_firebase_token', return_value={'uid': 'parallel_uid'}):
+            response = client.post('/api/finish-writing-session/', {'session_id': self.session.id},
+                                   format='json', HTTP_AUTHORIZATION='Bearer token')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(barrier.broken)
+        self.assertEqual(response.data['overall_band'], 7.0)
+
+    def test_deadline_keeps_finished_essay(self):
+        from core.scoring_jobs import score_essays_concurrently
+        with patch('core.scoring_jobs.ai_score_essay', side_effect=self._slow_scorer({'task1': 0.05, 'task2': 1.0})):
+            errors = score_essays_concurrently(self.essays.values(), deadline=0.3)
+        self.assertEqual(list(errors), [self.essays['task2'].pk])
+        self.essays['task1'].refresh_from_db()
+        self.essays['task2'].refresh_from_db()
+        self.assertEqual(self.essays['task1'].overall_band, 7.0)
+        self.assertIsNone(self.essays['task2'].overall_band)
+
+
+class AIScoreCacheTests(TestCase):
+    """Identical scoring inputs are answered from AIScoreCacheEntry instead of OpenAI."""
+
+    SCORES = {'task_response': 6.0, 'coherence': 6.0, 'lexical': 6.0, 'grammar': 7.0, 'feedback': 'Fine'}
+
+    def _essay(self, text='Same essay text'):
+        from core.models import Essay
+        student = User.objects.create(uid=f'cache_{User.objects.count()}', role='student')
+        return Essay.objects.create(user=student, task_type='task2', question_text='Q', submitted_text=text)
+
+    @patch('core.scoring_jobs.ai_score_essay')
+    def test_identical_essay_is_scored_once(self, ai_score):
+        from core.models import AIScoreCacheEntry
+        from core.scoring_jobs import score_essay, score_essays_concurrently
+        ai_score.return_value = self.SCORES
+        score_essay(self._essay())
+        repeat = self._essay()
+        self.assertEqual(score_essays_concurrently([repeat]), {})
+        self.assertEqual(ai_score.call_count, 1)
+        self.assertEqual(repeat.overall_band, 6.5)
+        self.assertEqual(AIScoreCacheEntry.objects.get().hits, 1)
+
+        score_essay(self._essay('Other essay text'))
+        self.assertEqual(ai_score.call_count, 2)
+
+    @patch('core.scoring_jobs.ai_score_essay')
+    def test_prompt_version_and_failures_invalidate(self, ai_score):
+        from core.scoring_jobs import score_essay
+        ai_score.return_value = {**self.SCORES, 'grammar': None}
+        score_essay(self._essay())
+        ai_score.return_value = self.SCORES
+        score_essay(self._essay())
+        self.assertEqual(ai_score.call_count, 2)  # the partial result was not cached
+
+        with patch('core.utils.AI_SCORING_PROMPT_VERSION', 'essay_score_v2'):
+            score_essay(self._essay())
+        self.assertEqual(ai_score.call_count, 3)
+
+
+class CuratorMissingTestsTests(APITestCase):
+    """The missing-tests lists are built with a fixed number of queries and paginated in the DB."""
+
+    def setUp(self):
+        from datetime import timedelta
+        from core.models import (
+            Essay, ListeningTest, ListeningTestSession, ReadingTest, ReadingTestSession,
+            SpeakingSession, WritingTestSession,
+        )
+        self.curator = User.objects.create(uid='missing_curator', role='curator')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.curator)
+        self.students = [
+            User.objects.create(uid=f'missing_s{i}', role='student', student_id=f'M{i}', group='A')
+            for i in range(4)
+        ]
+        self.now = timezone.now()
+        complete, partial = self.students[0], self.students[1]
+        listening = ListeningTest.objects.create(title='L')
+        reading = ReadingTest.objects.create(title='R')
+        for student in (complete, partial):
+            ListeningTestSession.objects.create(user=student, test=listening, submitted=True,
+                                                completed_at=self.now - timedelta(days=3))
+        ReadingTestSession.objects.create(user=complete, test=reading, completed=True, end_time=self.now)
+        session = WritingTestSession.objects.create(user=complete)
+        Essay.objects.create(user=complete, test_session=session, task_type='task2', question_text='Q', submitted_text='E')
+        SpeakingSession.objects.create(student=partial, teacher=self.curator, completed=True)
+        self.spoke_at = self.now - timedelta(days=1)
+        SpeakingSession.objects.filter(student=partial).update(conducted_at=self.spoke_at)
+
+    def test_missing_modules_and_last_activity(self):
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/curator/missing-tests/').data
+        self.assertEqual(data['count'], 3)
+        rows = {row['student_id']: row for row in data['students']}
+        self.assertNotIn('M0', rows)
+        self.assertEqual(rows['M1']['missing_modules'], ['writing', 'reading'])
+        self.assertEqual(rows['M2']['missing_modules'], ['writing', 'listening', 'reading'])
+        self.assertEqual(rows['M1']['last_activity'], timezone.localtime(self.spoke_at).isoformat())
+        self.assertIsNone(rows['M2']['last_activity'])
+
+        page = self.client.get('/api/curator/missing-tests/', {'page': 2, 'page_size': 2}).data
+        self.assertEqual([row['student_id'] for row in page['students']], ['M3'])
+        self.assertEqual(page['total_pages'], 2)
+
+        # Sessions outside the date range do not count as taken
+        data = self.client.get('/api/curator/missing-tests/', {'date_from': self.now.date().isoformat()}).data
+        self.assertEqual(data['count'], 4)
+
+    def test_missing_speaking(self):
+        data = self.client.get('/api/curator/missing-speaking/', {'search': 'M'}).data
+        self.assertEqual([row['student_id'] for row in data['students']], ['M0', 'M2', 'M3'])
+        self.assertEqual(data['students'][0]['last_activity'], timezone.localtime(
+            self.students[0].essay_set.get().submitted_at).isoformat())
+
+
+class ListeningTestListQueryTests(APITestCase):
+    """The routed Listening test list serves counts, not the nested structure, in a constant number of queries."""
+
+    def setUp(self):
+        from core.models import ListeningTest, ListeningPart, ListeningQuestion, ListeningTestSession
+        self.student = User.objects.create(uid='llist_uid', role='student')
+        self.tests = [ListeningTest.objects.create(title=f'L{i}', is_active=True) for i in range(5)]
+        for part_number in (1, 2, 3):
+            part = ListeningPart.objects.create(test=self.tests[0], part_number=part_number)
+            for order in (1, 2):
+                ListeningQuestion.objects.create(part=part, order=order, correct_answers=['a'])
+        ListeningTestSession.objects.create(user=self.student, test=self.tests[1], submitted=True)
+        ListeningTestSession.objects.create(user=self.student, test=self.tests[2], submitted=False)
+
+    def list_tests(self):
+        with patch('core.auth.verify_firebase_token', side_effect=lambda token: {'uid': token}), \
+                patch('core.views.verify_firebase_token', side_effect=lambda token: {'uid': token}):
+            return self.client.get('/api/listening-tests/', HTTP_AUTHORIZATION='Bearer llist_uid')
+
+    def test_list_serves_counts_without_the_structure(self):
+        response = self.list_tests()
+        self.assertEqual(response.status_code, 200)
+        rows = {row['id']: row for row in response.data}
+        self.assertEqual((rows[self.tests[0].id]['parts_count'], rows[self.tests[0].id]['questions_count']), (3, 6))
+        self.assertEqual((rows[self.tests[3].id]['parts_count'], rows[self.tests[3].id]['questions_count']), (0, 0))
+        self.assertNotIn('parts', rows[self.tests[0].id])
+        self.assertEqual([t.id for t in self.tests if rows[t.id]['user_completed']], [self.tests[1].id])
+
+    def test_list_queries_do_not_grow_with_the_structure(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.models import ListeningPart
+        self.list_tests()  # warms the uid -> User cache
+        with CaptureQueriesContext(connection) as before:
+            self.list_tests()
+        for test in self.tests[1:]:
+            ListeningPart.objects.create(test=test, part_number=1)
+        with CaptureQueriesContext(connection) as after:
+            self.list_tests()
+        self.assertEqual(len(after), len(before))
+
+
+class TestListAnswerKeyTests(APITestCase):
+    """The public Listening and Reading test lists carry counts, never the answer keys."""
+
+    def setUp(self):
+        from core.models import (
+            ListeningTest, ListeningPart, ListeningQuestion, ReadingTest, ReadingPart, ReadingQuestion,
+            ReadingAnswerOption,
+        )
+        User.objects.create(uid='keys_student', role='student')
+        listening = ListeningTest.objects.create(title='L', is_active=True)
+        ListeningQuestion.objects.create(part=ListeningPart.objects.create(test=listening, part_number=1),
+                                         order=1, correct_answers=['secretlisten'])
+        reading = ReadingTest.objects.create(title='R', is_active=True)
+        part = ReadingPart.objects.create(test=reading, part_number=1)
+        for order in (1, 2):
+            question = ReadingQuestion.objects.create(part=part, order=order, correct_answers=['secretread'])
+        ReadingAnswerOption.objects.create(question=question, label='A', text='secretoption', is_correct=True)
+
+    def test_lists_have_no_answer_keys(self):
+        for url in ('/api/listening-tests/', '/api/reading-tests/'):
+            for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer keys_student'}):
+                with self.subTest(url=url, authenticated=bool(headers)):
+                    with patch('core.auth.verify_firebase_token', side_effect=lambda token: {'uid': token}), \
+                            patch('core.views.verify_firebase_token', side_effect=lambda token: {'uid': token}):
+                        response = self.client.get(url, **headers)
+                    self.assertEqual(response.status_code, 200)
+                    body = response.content.decode()
+                    for leaked in ('secretlisten', 'secretread', 'secretoption', 'is_correct', 'correct_answers', '"parts"'):
+                        self.assertNotIn(leaked, body)
+                    self.assertEqual(response.data[0]['parts_count'], 1)
+
+    def test_reading_list_counts(self):
+        response = self.client.get('/api/reading-tests/')
+        self.assertEqual((response.data[0]['parts_count'], response.data[0]['questions_count']), (1, 2))
+
+
+class TeacherAssignmentTests(APITestCase):
+    """Students are linked to teachers through the assigned_teacher FK (core.teacher_assignment)."""
+
+    def setUp(self):
+        self.teacher = User.objects.create(uid='assign_t1', role='teacher', first_name='Aida')
+        self.other = User.objects.create(uid='assign_t2', role='teacher', first_name='Dana')
+
+    def test_backfill_matches_teacher_names(self):
+        from io import StringIO
+        from django.core.management import call_command
+        User.objects.create(uid='assign_dup', role='teacher', first_name='Dana')
+        students = [
+            User.objects.create(uid=f'assign_s{i}', role='student', student_id=f'AS{i}')
+            for i in range(4)
+        ]
+        # Legacy rows: only the text field is set
+        for student, name in zip(students, [' aida', 'Dana', 'Unknown', 'Aida']):
+            User.objects.filter(pk=student.pk).update(teacher=name, assigned_teacher=None)
+
+        out = StringIO()
+        call_command('backfill_assigned_teachers', stdout=out)
+        self.assertIn('Assigned 2 students', out.getvalue())
+        self.assertEqual(
+            list(User.objects.filter(role='student').order_by('id').values_list('assigned_teacher_id', flat=True)),
+            [self.teacher.id, None, None, self.teacher.id],
+        )
+
+    def test_save_keeps_fk_and_name_in_sync(self):
+        student = User.objects.create(uid='assign_sync', role='student', teacher='Aida')
+        self.assertEqual(student.assigned_teacher_id, self.teacher.id)
+        student.assigned_teacher = self.other
+        student.save()
+        self.assertEqual(student.teacher, 'Dana')
+        student.teacher = 'Nobody'
+        student.save()
+        self.assertIsNone(student.assigned_teacher_id)
+
+    def test_teacher_queue_and_curator_filter_use_fk(self):
+        from core.models import Essay
+        mine = User.objects.create(uid='assign_mine', role='student', student_id='M1', teacher='Aida')
+        theirs = User.objects.create(uid='assign_theirs', role='student', student_id='T1', teacher='Dana')
+        for student in (mine, theirs):
+            Essay.objects.create(user=student, task_type='task2', question_text='Q', submitted_text='E')
+
+        client = APIClient()
+        client.force_authenticate(user=self.teacher)
+        with patch('core.views.verify_firebase_token', return_value={'uid': 'assign_t1'}):
+            response = client.get('/api/teacher/writing/essays/', HTTP_AUTHORIZATION='Bearer token')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual([item['user']['student_id'] for item in results], ['M1'])
+
+        curator = User.objects.create(uid='assign_curator', role='curator')
+        client.force_authenticate(user=curator)
+        data = client.get('/api/curator/missing-speaking/', {'teacher': 'dana'}).data
+        self.assertEqual([row['student_id'] for row in data['students']], ['T1'])
+
+    def test_unlinked_students_fall_back_to_teacher_name(self):
+        from core.models import Essay
+        twin = User.objects.create(uid='assign_twin', role='teacher', first_name='Dana')
+        student = User.objects.create(uid='assign_ambiguous', role='student', student_id='D1', teacher='Dana')
+        self.assertIsNone(student.assigned_teacher_id)
+        essay = Essay.objects.create(user=student, task_type='task2', question_text='Q', submitted_text='E')
+
+        client = APIClient()
+        for teacher in (self.other, twin):
+            client.force_authenticate(user=teacher)
+            with patch('core.views.verify_firebase_token', return_value={'uid': teacher.uid}):
+                response = client.get('/api/teacher/writing/essays/', HTTP_AUTHORIZATION='Bearer token')
+                detail = client.get(f'/api/teacher/writing/essays/{essay.pk}/', HTTP_AUTHORIZATION='Bearer token')
+            results = response.data['results'] if isinstance(response.data, dict) else response.data
+            self.assertEqual([item['user']['student_id'] for item in results], ['D1'])
+            self.assertEqual(detail.status_code, 200)
+        with patch('core.views.verify_firebase_token', return_value={'uid': self.teacher.uid}):
+            detail = client.get(f'/api/teacher/writing/essays/{essay.pk}/', HTTP_AUTHORIZATION='Bearer token')
+        self.assertEqual(detail.status_code, 403)
+
+        curator = User.objects.create(uid='assign_curator2', role='curator')
+        client.force_authenticate(user=curator)
+        data = client.get('/api/curator/missing-speaking/', {'teacher': 'Dana'}).data
+        self.assertEqual([row['student_id'] for row in data['students']], ['D1'])
+
+    def test_save_does_not_reread_the_row(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        student = User.objects.get(pk=User.objects.create(uid='assign_reread', role='student', teacher='Aida').pk)
+        student.first_name = 'Renamed'
+        with CaptureQueriesContext(connection) as queries:
+            student.save()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(student.assigned_teacher_id, self.teacher.id)
+
+
+class DateRangeFilterTests(TestCase):
+    """apply_date_range_filter compares raw timestamps (index friendly) on local-day bounds."""
+
+    def test_bounds_match_local_days(self):
+        from datetime import datetime, timedelta
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from core.models import ListeningTest, ListeningTestSession
+        from core.views import apply_date_range_filter
+        student = User.objects.create(uid='range_uid', role='student')
+        test = ListeningTest.objects.create(title='L')
+        day_start = timezone.make_aware(datetime(2025, 3, 10))
+        for when in (day_start - timedelta(minutes=1), day_start, day_start + timedelta(hours=23, minutes=59),
+                     day_start + timedelta(days=1)):
+            ListeningTestSession.objects.create(user=student, test=test, submitted=True, completed_at=when)
+
+        request = Request(APIRequestFactory().get('/', {'date_from': '2025-03-10', 'date_to': '2025-03-10'}))
+        qs = apply_date_range_filter(ListeningTestSession.objects.all(), request, 'completed_at')
+        self.assertEqual(qs.count(), 2)
+        sql = str(qs.query)
+        self.assertNotIn('cast_date', sql)  # SQLite __date lookup
+        self.assertNotIn('::date', sql)  # PostgreSQL __date lookup
+
+
+class UserSearchTests(APITestCase):
+    """Student search goes through the normalized User.search_text column (core.user_search)."""
+
+    def test_search_text_follows_saves_and_filters_views(self):
+        from core.user_search import search_users
+        student = User.objects.create(uid='search_s1', role='student', first_name='Aru', last_name='Seitova',
+                                      student_id='ST-77', email='Aru.S@example.com', group='A')
+        User.objects.create(uid='search_s2', role='student', first_name='Dias', student_id='ST-12', group='A')
+        self.assertEqual(student.search_text, 'aru seitova st-77 aru.s@example.com')
+        students = User.objects.filter(role='student')
+        self.assertEqual(list(search_users(students, '  SEITOVA ').values_list('uid', flat=True)), ['search_s1'])
+        self.assertEqual(search_users(students, 'st-').count(), 2)
+        self.assertEqual(search_users(students, '').count(), 2)
+
+        student.last_name = 'Nurlanova'
+        student.save()
+        self.assertFalse(search_users(students, 'seitova').exists())
+
+        curator = User.objects.create(uid='search_curator', role='curator')
+        self.client.force_authenticate(user=curator)
+        data = self.client.get('/api/curator/missing-tests/', {'search': 'aru nurlanova'}).data
+        self.assertEqual([row['student_id'] for row in data['students']], ['ST-77'])
+
+
+class TestStructureCacheTests(APITestCase):
+    """Student-facing test detail is served from a revision-keyed cache with ETags (core.structure_cache)."""
+
+    def setUp(self):
+        from core.models import ReadingTest, ReadingPart, ReadingQuestion
+        from core.structure_cache import clear_test_structure_cache
+        clear_test_structure_cache()
+        self.client.force_authenticate(User.objects.create(uid='structure_admin', role='admin'))
+        self.test = ReadingTest.objects.create(title='R', is_active=True)
+        part = ReadingPart.objects.create(test=self.test, part_number=1, passage_text='Passage')
+        self.question = ReadingQuestion.objects.create(part=part, order=1, question_type='gap_fill',
+                                                       question_text='Old text')
+
+    def test_cache_hits_etag_and_revision_change(self):
+        url = f'/api/reading-tests/{self.test.pk}/'
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        with self.assertNumQueries(1):  # only the test row
+            second = self.client.get(url)
+        self.assertEqual(second.data, first.data)
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+        # Editing a question bumps the test revision: new ETag, fresh payload
+        self.question.question_text = 'New text'
+        self.question.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(changed.data['parts'][0]['questions'][0]['question_text'], 'New text')
+
+    def test_full_structure_is_admin_only(self):
+        url = f'/api/reading-tests/{self.test.pk}/'
+        self.client.force_authenticate(User.objects.create(uid='structure_student', role='student'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertIn(self.client.get(url).status_code, (401, 403))
+
+    def test_write_serializer_invalidates(self):
+        from core.models import ListeningTest
+        from core.serializers import ListeningTestSerializer
+        from core.structure_cache import get_test_structure
+        test = ListeningTest.objects.create(title='Old', is_active=True)
+        built = []
+        get_test_structure('listening', test, lambda t: built.append(t.title) or {'title': t.title})
+        revision = test.updated_at
+        serializer = ListeningTestSerializer(test, data={'title': 'New'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        # Same revision as the stale entry: only the explicit invalidation forces a rebuild
+        updated = serializer.save()
+        updated.updated_at = revision
+        get_test_structure('listening', updated, lambda t: built.append(t.title) or {'title': t.title})
+        self.assertEqual(built, ['Old', 'New'])
+
+class PublishedTestPayloadTests(APITestCase):
+    """Activation publishes an answer-key-free student payload that is served as stored (core.published_tests)."""
+
+    def setUp(self):
+        from core.models import ReadingTest, ReadingPart, ReadingQuestion, ReadingAnswerOption
+        self.admin = User.objects.create(uid='publish_admin', role='admin')
+        self.test = ReadingTest.objects.create(title='R')
+        part = ReadingPart.objects.create(test=self.test, part_number=1, passage_text='Passage')
+        self.question = ReadingQuestion.objects.create(
+            part=part, order=1, question_type='multiple_choice', question_text='Pick one',
+            correct_answers=['B'],
+            extra_data={'gaps': [{'number': 1, 'answer': 'river'}], 'answers': {'1': 'river'}, 'statements': ['S']},
+        )
+        ReadingAnswerOption.objects.create(question=self.question, label='A', text='Lake')
+        ReadingAnswerOption.objects.create(question=self.question, label='B', text='River', is_correct=True)
+        self.url = f'/api/reading-tests/{self.test.pk}/student/'
+
+    def test_activate_publishes_payload_without_answer_keys(self):
+        import gzip
+        import json
+        from core.models import PublishedTestPayload
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        self.assertEqual(client.post(f'/api/reading-tests/{self.test.pk}/activate/').status_code, 200)
+        stored = PublishedTestPayload.objects.get(test_type='reading', test_id=self.test.pk)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response.content, bytes(stored.payload))
+
+        payload = json.loads(gzip.decompress(response.content))
+        question = payload['parts'][0]['questions'][0]
+        self.assertNotIn('correct_answers', question)
+        self.assertEqual(question['extra_data'], {'gaps': [{'number': 1}], 'statements': ['S']})
+        self.assertEqual(question['answer_options'], [
+            {'id': option.pk, 'label': option.label, 'text': option.text}
+            for option in self.question.answer_options.order_by('pk')
+        ])
+
+        plain = self.client.get(self.url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(json.loads(plain.content), payload)
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_stale_or_missing_payload_is_republished(self):
+        import json
+        from core.models import ReadingTest
+        # Inactive tests are not served, diagnostic templates are
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        ReadingTest.objects.filter(pk=self.test.pk).update(is_diagnostic_template=True)
+        # Never activated: published on first request
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.question.question_text = 'Edited'
+        self.question.save()
+        second = self.client.get(self.url)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(json.loads(second.content)['parts'][0]['questions'][0]['question_text'], 'Edited')
+        self.assertEqual(self.client.get('/api/reading-tests/999999/student/').status_code, 404)
+
+
+class RequestMetricsTests(APITestCase):
+    """RequestMetricsMiddleware records per-route latency and query counts (core.request_metrics)."""
+
+    def setUp(self):
+        from core.models import ReadingTest
+        from core.request_metrics import registry
+        registry.reset()
+        self.test = ReadingTest.objects.create(title='R', is_active=True)
+        self.admin = User.objects.create(uid='metrics_admin', role='admin')
+
+    def test_records_route_and_serves_admin_snapshot(self):
+        self.client.get(f'/api/reading-tests/{self.test.pk}/student/')
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/api/admin/request-metrics/')
+        self.assertEqual(response.status_code, 200)
+        row = next(r for r in response.data['routes'] if r['route'] == 'reading-test-student')
+        self.assertEqual((row['method'], row['requests']), ('GET', 1))
+        self.assertGreaterEqual(row['max_queries'], 1)
+        self.assertGreater(row['mean_response_bytes'], 0)
+
+        student = User.objects.create(uid='metrics_student', role='student')
+        client.force_authenticate(student)
+        self.assertEqual(client.get('/api/admin/request-metrics/').status_code, 403)
+
+    def test_prometheus_endpoint_requires_token(self):
+        self.client.get(f'/api/reading-tests/{self.test.pk}/student/')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 404)
+        with override_settings(REQUEST_METRICS_TOKEN='scrape-secret'):
+            self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+            response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('# TYPE ielts_request_duration_seconds histogram', text)
+        self.assertIn('ielts_request_db_queries_count{route="reading-test-student",method="GET"', text)
+
+    def test_sampling_and_slow_request_log(self):
+        from core.request_metrics import metrics_snapshot
+        with override_settings(REQUEST_METRICS_SAMPLE_RATE=0.0):
+            self.client.get(f'/api/reading-tests/{self.test.pk}/student/')
+        self.assertEqual(metrics_snapshot()['routes'], [])
+        with override_settings(REQUEST_METRICS_SLOW_MS=0), self.assertLogs('core.request_metrics', 'WARNING') as logs:
+            self.client.get(f'/api/reading-tests/{self.test.pk}/student/')
+        self.assertIn('reading-test-student', logs.output[0])
+        self.assertEqual(metrics_snapshot()['routes'][0]['slow_requests'], 1)
+
+
+class QueryGuardTests(TestCase):
+    """Statement fingerprinting and the repeated-query guard (core.query_guard)."""
+
+    def test_fingerprint_collapses_literals_and_in_lists(self):
+        from core.query_guard import fingerprint
+        self.assertEqual(
+            fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s, %s, %s) AND "x" = 5 AND "y" = \'z\''),
+            fingerprint('SELECT "a"  FROM "t" WHERE "id" IN (%s) AND "x" = 7 AND "y" = \'w\''),
+        )
+
+    def test_guard_flags_per_row_queries(self):
+        from core.query_guard import NPlusOneError, QueryGuard
+        for i in range(4):
+            User.objects.create(uid=f'guard_{i}', role='student')
+        with self.assertRaises(NPlusOneError):
+            with QueryGuard(threshold=3):
+                for pk in User.objects.values_list('pk', flat=True):
+                    User.objects.get(pk=pk)
+        with QueryGuard(threshold=3) as guard:
+            list(User.objects.all())
+        self.assertEqual(guard.count, 1)
+        with self.assertLogs('core.query_guard', 'WARNING'):
+            with QueryGuard(threshold=1, mode='warn'):
+                User.objects.filter(uid='guard_0').exists()
+                User.objects.filter(uid='guard_1').exists()
+
+
+class EndpointQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Pins the query count of the most used endpoints against a seeded dataset
+    and fails on any statement shape repeated more than REPEAT_THRESHOLD times
+    (an N+1 over the students/sessions). Budgets are the current counts; lower
+    them when an endpoint gets cheaper, never raise them to make a test pass.
+    """
+    STUDENTS = 8
+    REPEAT_THRESHOLD = 3
+    # Endpoints that still run per-row queries; only their total is pinned until they are reworked
+    KNOWN_N_PLUS_ONE = {
+        '/api/teacher/writing/essays/',
+        '/api/curator/writing-overview/',
+        '/api/curator/listening-overview/',
+        '/api/curator/reading-overview/',
+        '/api/batch/students/latest-test-details/',
+        '/api/batch/students/test-results/',
+        '/api/batch/students/test-results-week/',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        from core.models import (
+            Essay, ListeningAnswerOption, ListeningPart, ListeningQuestion, ListeningTest, ListeningTestResult,
+            ListeningTestSession, ReadingAnswerOption, ReadingPart, ReadingQuestion, ReadingTest, ReadingTestResult,
+            ReadingTestSession, SpeakingSession, WritingTask, WritingTest, WritingTestSession,
+        )
+        cls.admin = User.objects.create(uid='budget_admin', role='admin', email='admin@example.com')
+        cls.curator = User.objects.create(uid='budget_curator', role='curator', email='curator@example.com')
+        cls.teacher = User.objects.create(uid='budget_teacher', role='teacher', first_name='Aida')
+        cls.students = [
+            User.objects.create(
+                uid=f'budget_student_{i}', role='student', student_id=f'BS{i:03d}', email=f'student{i}@example.com',
+                first_name=f'Student{i}', last_name='Budget', group=f'G{i % 2}', teacher='Aida',
+            )
+            for i in range(cls.STUDENTS)
+        ]
+
+        writing = WritingTest.objects.create(title='W', is_active=True)
+        for task_type in ('task1', 'task2'):
+            WritingTask.objects.create(test=writing, task_type=task_type, task_text=f'{task_type} text')
+        listening = ListeningTest.objects.create(title='L', is_active=True)
+        l_part = ListeningPart.objects.create(test=listening, part_number=1)
+        ListeningQuestion.objects.create(part=l_part, order=1, question_type='gap_fill',
+                                         question_text='The [[1]] flows', correct_answers=['river'])
+        l_choice = ListeningQuestion.objects.create(part=l_part, order=2, question_type='multiple_choice',
+                                                    question_text='Pick', correct_answers=['B'])
+        for label in 'AB':
+            ListeningAnswerOption.objects.create(question=l_choice, label=label, text=label)
+        reading = ReadingTest.objects.create(title='R', is_active=True)
+        r_part = ReadingPart.objects.create(test=reading, part_number=1, passage_text='Passage')
+        r_choice = ReadingQuestion.objects.create(part=r_part, order=1, question_type='multiple_choice',
+                                                  question_text='Pick')
+        for label in 'AB':
+            ReadingAnswerOption.objects.create(question=r_choice, label=label, text=label, is_correct=label == 'B')
+
+        now = timezone.now()
+        for student in cls.students:
+            session = WritingTestSession.objects.create(user=student, test=writing, completed=True, band_score=6.5)
+            for task in writing.tasks.all():
+                Essay.objects.create(user=student, test_session=session, task=task, task_type=task.task_type,
+                                     question_text=task.task_text, submitted_text='Essay', overall_band=6.5)
+            l_session = ListeningTestSession.objects.create(
+                user=student, test=listening, submitted=True, completed_at=now,
+                answers={f'{l_choice.id}__B': True}, score=1,
+            )
+            ListeningTestResult.objects.create(session=l_session, raw_score=1, band_score=4.5)
+            r_session = ReadingTestSession.objects.create(
+                user=student, test=reading, completed=True, end_time=now, answers={str(r_choice.id): {'text': 'B'}},
+            )
+            ReadingTestResult.objects.create(session=r_session, raw_score=1, total_score=1, band_score=4.5)
+            SpeakingSession.objects.create(student=student, teacher=cls.teacher, completed=True, overall_band_score=6)
+        cls.listening_session = l_session
+        cls.reading_session = r_session
+
+    def setUp(self):
+        from core.auth import clear_user_cache
+        clear_user_cache()
+        # Bearer tokens are the uids themselves
+        for target in ('core.views.verify_firebase_token', 'core.auth.verify_firebase_token'):
+            patcher = patch(target, side_effect=lambda token: {'uid': token})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def endpoints(self):
+        from datetime import timedelta
+        student = self.students[-1]
+        emails = {'emails': [s.email for s in self.students]}
+        today = timezone.localdate()
+        week = dict(emails, weekStart=(today - timedelta(days=today.weekday())).isoformat())
+        # (user, method, url, data, max queries)
+        return [
+            (student, 'get', '/api/dashboard/summary/', None, 24),
+            (student, 'get', '/api/diagnostic/summary/', None, 6),
+            (student, 'get', '/api/user/profile/', None, 2),
+            (student, 'get', '/api/essays/', None, 7),
+            (student, 'get', '/api/listening/sessions/', None, 4),
+            (student, 'get', '/api/reading/sessions/', None, 3),
+            (student, 'get', '/api/speaking/sessions/', None, 4),
+            (student, 'get', '/api/writing-tests/', None, 6),
+            (student, 'get', '/api/listening-tests/', None, 4),
+            (student, 'get', '/api/reading-tests/', None, 4),
+            (student, 'get', f'/api/listening-sessions/{self.listening_session.pk}/result/', None, 5),
+            (student, 'get', f'/api/reading-sessions/{self.reading_session.pk}/result/', None, 8),
+            (self.teacher, 'get', '/api/teacher/writing/essays/', None, 19),
+            (self.teacher, 'get', '/api/teacher/speaking/students/', None, 3),
+            (self.teacher, 'get', '/api/teacher/speaking/sessions/', None, 3),
+            (self.curator, 'get', '/api/curator/students/', None, 5),
+            (self.curator, 'get', '/api/curator/writing-overview/', None, 72),
+            (self.curator, 'get', '/api/curator/listening-overview/', None, 33),
+            (self.curator, 'get', '/api/curator/reading-overview/', None, 33),
+            (self.curator, 'get', '/api/curator/speaking-overview/', None, 16),
+            (self.curator, 'get', '/api/curator/overview/', None, 32),
+            (self.curator, 'get', '/api/curator/weekly-overview/', None, 3),
+            (self.curator, 'get', '/api/curator/groups-ranking/', None, 3),
+            (self.curator, 'get', '/api/curator/missing-tests/', None, 3),
+            (self.curator, 'get', '/api/curator/missing-speaking/', None, 3),
+            (self.curator, 'get', f'/api/curator/student-detail/{student.pk}/', None, 19),
+            (self.curator, 'post', '/api/batch/students/profiles/', emails, 3),
+            (self.curator, 'post', '/api/batch/students/latest-test-details/', emails, 51),
+            (self.curator, 'post', '/api/batch/students/test-results/', emails, 59),
+            (self.curator, 'post', '/api/batch/students/test-results-week/', week, 59),
+            (self.admin, 'get', '/api/admin/students/', None, 2),
+            (self.admin, 'get', f'/api/admin/listening-sessions/?student_id={student.student_id}', None, 4),
+        ]
+
+    def test_endpoint_query_budgets(self):
+        for user, method, url, data, budget in self.endpoints():
+            with self.subTest(url=url):
+                from core.auth import clear_user_cache
+                clear_user_cache()
+                threshold = budget if url in self.KNOWN_N_PLUS_ONE else self.REPEAT_THRESHOLD
+                with self.assertQueryBudget(budget, repeat_threshold=threshold, label=url):
+                    response = getattr(self.client, method)(url, data, format='json',
+                                                             HTTP_AUTHORIZATION=f'Bearer {user.uid}')
+                self.assertEqual(response.status_code, 200, url)
+
+
+class SyntheticDataCommandTests(TestCase):
+    """The `generate_synthetic_data` load dataset command."""
+
+    def _run(self, *extra):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('generate_synthetic_data', '--students', '6', '--teachers', '2', '--groups', '3',
+                     '--tests', '2', '--sessions', '2', '--speaking', '1', '--until', '2026-06-01', *extra, stdout=out)
+        return out.getvalue()
+
+    def _snapshot(self):
+        from core.models import Essay, ListeningTestResult, ReadingTestResult, SpeakingSession
+        return (
+            list(ListeningTestResult.objects.order_by('session__user__uid', 'session__started_at')
+                 .values_list('session__user__uid', 'session__started_at', 'raw_score')),
+            list(ReadingTestResult.objects.order_by('session__user__uid', 'session__start_time')
+                 .values_list('session__user__uid', 'raw_score', 'band_score')),
+            list(Essay.objects.order_by('user__uid', 'submitted_at', 'task_type')
+                 .values_list('user__uid', 'submitted_at', 'overall_band')),
+            list(SpeakingSession.objects.order_by('student__uid').values_list('student__uid', 'overall_band_score')),
+        )
+
+    def test_generates_population_matching_the_scorer(self):
+        from core.models import (
+            ListeningTestSession, ReadingTestSession, SpeakingSession, StudentPerformanceRollup, WritingTestSession,
+        )
+        from core.serializers import create_detailed_breakdown
+        output = self._run()
+        self.assertIn('6 students', output)
+
+        students = User.objects.filter(role='student', uid__startswith='synthetic_')
+        self.assertEqual(students.count(), 6)
+        self.assertFalse(students.filter(assigned_teacher__isnull=True).exists())
+        self.assertTrue(all(student.search_text for student in students))
+        self.assertEqual(ListeningTestSession.objects.count(), 12)
+        self.assertEqual(ReadingTestSession.objects.count(), 12)
+        self.assertEqual(WritingTestSession.objects.filter(essay__isnull=False).distinct().count(), 12)
+        self.assertEqual(SpeakingSession.objects.count(), 6)
+        self.assertTrue(StudentPerformanceRollup.objects.filter(student__in=students).exists())
+        # Backdated, not stamped with the time of the run
+        self.assertTrue(WritingTestSession.objects.filter(started_at__lt=timezone.now() - timezone.timedelta(days=1)).exists())
+
+        for session in ListeningTestSession.objects.select_related('test', 'listeningtestresult')[:4]:
+            self.assertEqual(create_detailed_breakdown(session, 'listening')['raw_score'],
+                             session.listeningtestresult.raw_score)
+        for session in ReadingTestSession.objects.select_related('test', 'result')[:4]:
+            scored = create_detailed_breakdown(session, 'reading')
+            self.assertEqual((scored['raw_score'], scored['total_score']),
+                             (session.result.raw_score, session.result.total_score))
+
+    def test_same_seed_gives_same_data(self):
+        from django.core.management.base import CommandError
+        self._run()
+        first = self._snapshot()
+        with self.assertRaises(CommandError):
+            self._run()
+        self._run('--clear')
+        self.assertEqual(self._snapshot(), first)
+        self._run('--clear', '--seed', '2')
+        self.assertNotEqual(self._snapshot(), first)
+
+
+class TestEditorBulkSaveTests(APITestCase):
+    """Editor saves apply per-table diffs in bulk (core.editor_save)."""
+
+    def setUp(self):
+        self.admin = User.objects.create(uid='editor_admin', role='admin')
+        self.client.force_authenticate(self.admin)
+
+    def _listening_payload(self, parts=4, questions=10):
+        return {'title': 'Editor', 'parts': [{
+            'id': f'part-{p}', 'part_number': p, 'audio': '', 'questions': [{
+                'id': f'q-{p}-{q}', 'order': q, 'question_type': 'multiple_choice',
+                'question_text': f'Q{p}.{q}', 'correct_answers': ['A'],
+                'options': [{'label': label, 'text': f'{label}{q}'} for label in 'ABC'],
+            } for q in range(1, questions + 1)],
+        } for p in range(1, parts + 1)]}
+
+    def _put(self, url, payload):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(url, payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response, len(queries)
+
+    def test_listening_save_keeps_unchanged_rows_and_bounds_queries(self):
+        from core.models import ListeningAnswerOption, ListeningQuestion, ListeningTest
+        created = self.client.post('/api/listening-tests/', self._listening_payload(), format='json')
+        self.assertEqual(created.status_code, 201, created.data)
+        test = ListeningTest.objects.get(pk=created.data['id'])
+        self.assertEqual(ListeningQuestion.objects.filter(part__test=test).count(), 40)
+        self.assertEqual(ListeningAnswerOption.objects.filter(question__part__test=test).count(), 120)
+        url = f'/api/listening-tests/{test.pk}/'
+
+        payload = self._listening_payload()
+        stored = list(ListeningQuestion.objects.filter(part__test=test).order_by('part__part_number', 'order'))
+        for question, data in zip(stored, [q for part in payload['parts'] for q in part['questions']]):
+            data['id'] = question.pk
+        first_part = payload['parts'][0]['questions']
+        first_part[0]['question_text'] = 'Edited'
+        first_part[1]['options'] = [{'label': 'A', 'text': 'Changed'}, {'label': 'B', 'text': 'B2'}]
+        dropped = first_part.pop(2)['id']
+        first_part.append({'id': 'q-new', 'order': 11, 'question_type': 'gap_fill',
+                           'question_text': '[[1]]', 'correct_answers': ['river']})
+        revision = test.updated_at
+
+        _, query_count = self._put(url, payload)
+        self.assertLessEqual(query_count, 25)
+        self.assertEqual(
+            set(ListeningQuestion.objects.filter(part__test=test).values_list('id', flat=True)) - {q.pk for q in stored},
+            {ListeningQuestion.objects.get(part__test=test, question_text='[[1]]').pk},
+        )
+        self.assertFalse(ListeningQuestion.objects.filter(pk=dropped).exists())
+        self.assertEqual(ListeningQuestion.objects.get(pk=stored[0].pk).question_text, 'Edited')
+        self.assertEqual(
+            list(ListeningAnswerOption.objects.filter(question=stored[1]).order_by('label').values_list('label', 'text')),
+            [('A', 'Changed'), ('B', 'B2')],
+        )
+        test.refresh_from_db()
+        self.assertGreater(test.updated_at, revision)
+
+        # Resending the same tree writes nothing below the test row
+        _, unchanged_count = self._put(url, payload | {'parts': [
+            dict(part, questions=[dict(q, id=stored_id) for q, stored_id in zip(
+                part['questions'],
+                ListeningQuestion.objects.filter(part__part_number=part['part_number'], part__test=test)
+                .order_by('order').values_list('id', flat=True),
+            )]) for part in payload['parts']
+        ]})
+        self.assertLess(unchanged_count, query_count)
+
+    def test_reading_save_matches_by_part_number_and_ids(self):
+        from core.models import ReadingAnswerOption, ReadingPart, ReadingQuestion, ReadingTest
+        test = ReadingTest.objects.create(title='R')
+        part = ReadingPart.objects.create(test=test, part_number=1, passage_text='Old')
+        other = ReadingPart.objects.create(test=test, part_number=2)
+        question = ReadingQuestion.objects.create(part=part, order=1, question_type='multiple_choice')
+        keep = ReadingAnswerOption.objects.create(question=question, label='A', text='Lake')
+        drop = ReadingAnswerOption.objects.create(question=question, label='B', text='River', is_correct=True)
+        url = f'/api/reading-tests/{test.pk}/'
+
+        payload = {'title': 'R', 'parts': [{
+            'part_number': 1, 'passage_text': 'New', 'questions': [{
+                'id': question.pk, 'order': 1, 'question_type': 'multiple_choice', 'question_text': 'Pick',
+                'answer_options': [
+                    {'id': keep.pk, 'label': 'A', 'text': 'Lake', 'is_correct': True},
+                    {'label': 'C', 'text': 'Sea'},
+                ],
+            }],
+        }]}
+        self._put(url, payload)
+        self.assertEqual(ReadingPart.objects.get(pk=part.pk).passage_text, 'New')
+        self.assertFalse(ReadingPart.objects.filter(pk=other.pk).exists())
+        self.assertEqual(ReadingQuestion.objects.get(pk=question.pk).question_text, 'Pick')
+        self.assertEqual(
+            list(ReadingAnswerOption.objects.filter(question=question).order_by('label')
+                 .values_list('id', 'label', 'is_correct')),
+            [(keep.pk, 'A', True), (ReadingAnswerOption.objects.get(label='C').pk, 'C', False)],
+        )
+        self.assertFalse(ReadingAnswerOption.objects.filter(pk=drop.pk).exists())
+
+        payload['parts'][0]['questions'][0]['answer_options'][1]['reading_points'] = 'many'
+        response = self.client.put(url, payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(ReadingAnswerOption.objects.filter(question=question, label='C').exists())
+
+
+class TestCloneTests(APITestCase):
+    """Listening/Reading tests are deep-copied with one bulk insert per table (core.cloning)."""
+
+    def setUp(self):
+        self.admin = User.objects.create(uid='clone_admin', role='admin')
+        self.client.force_authenticate(self.admin)
+
+    def _listening_test(self, parts):
+        from core.models import ListeningAnswerOption, ListeningPart, ListeningQuestion, ListeningTest
+        test = ListeningTest.objects.create(title='Source', is_active=True)
+        for number in range(1, parts + 1):
+            part = ListeningPart.objects.create(test=test, part_number=number, audio=f'listening/audio{number}.mp3')
+            for order in range(1, 4):
+                question = ListeningQuestion.objects.create(
+                    part=part, order=order, question_type='multiple_choice', correct_answers=['A'],
+                    image_file=f'listening/questions/q{number}{order}.png',
+                )
+                for label in 'AB':
+                    ListeningAnswerOption.objects.create(question=question, label=label, text=f'{label}{order}')
+        return test
+
+    def _clone(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data, len(queries)
+
+    def _tree(self, test, kind):
+        from core.cloning import CLONE_STRUCTURES
+        structure = CLONE_STRUCTURES[kind]
+        options = 'options' if kind == 'listening' else 'answer_options'
+        return [
+            (part.part_number, [
+                (question.order, question.question_type, question.image_file.name,
+                 [(option.label, option.text) for option in getattr(question, options).order_by('id')])
+                for question in part.questions.order_by('order')
+            ])
+            for part in structure.parts.model.objects.filter(test=test).order_by('part_number')
+        ]
+
+    def test_listening_clone_copies_tree_in_constant_queries(self):
+        from core.models import ListeningTest, ListeningTestClone
+        small = self._listening_test(parts=1)
+        large = self._listening_test(parts=4)
+        _, small_count = self._clone(f'/api/listening-tests/{small.pk}/clone/')
+        data, large_count = self._clone(f'/api/listening-tests/{large.pk}/clone/')
+        self.assertEqual(small_count, large_count)
+
+        copy = ListeningTest.objects.get(pk=data['cloned_test_id'])
+        self.assertEqual((copy.title, copy.is_active), ('Source (Copy)', False))
+        self.assertEqual(self._tree(copy, 'listening'), self._tree(large, 'listening'))
+        self.assertEqual(copy.parts.get(part_number=2).audio, 'listening/audio2.mp3')
+        self.assertTrue(ListeningTestClone.objects.filter(pk=data['clone_record_id'], source_test=large).exists())
+
+        data, _ = self._clone(f'/api/listening-clones/{small.pk}/clone/')
+        self.assertEqual(self._tree(ListeningTest.objects.get(pk=data['cloned_test_id']), 'listening'),
+                         self._tree(small, 'listening'))
+
+    def test_reading_clone(self):
+        from core.models import ReadingAnswerOption, ReadingPart, ReadingQuestion, ReadingTest
+        source = ReadingTest.objects.create(title='Reading', time_limit=45, is_diagnostic_template=True)
+        part = ReadingPart.objects.create(test=source, part_number=1, passage_text='Passage')
+        question = ReadingQuestion.objects.create(
+            part=part, order=1, question_type='multiple_choice', image_file='reading/questions/map.png')
+        ReadingAnswerOption.objects.create(question=question, label='A', text='Lake', is_correct=True)
+        data, _ = self._clone(f'/api/reading-tests/{source.pk}/clone/')
+        copy = ReadingTest.objects.get(pk=data['cloned_test_id'])
+        self.assertEqual((copy.time_limit, copy.is_diagnostic_template), (45, False))
+        self.assertEqual(self._tree(copy, 'reading'), self._tree(source, 'reading'))
+        self.assertTrue(ReadingAnswerOption.objects.get(question__part__test=copy).is_correct)
+
+        self.client.force_authenticate(User.objects.create(uid='clone_student', role='student'))
+        self.assertEqual(self.client.post(f'/api/reading-tests/{source.pk}/clone/').status_code, 403)
+
+
+class TeacherSpeakingStudentsQueryTests(APITestCase):
+    """Speaking stats of /api/teacher/speaking/students/ come from one annotated, keyset-paginated query."""
+
+    def setUp(self):
+        from datetime import timedelta
+        from core.models import SpeakingSession
+        self.teacher = User.objects.create(uid='speaking_teacher', role='teacher')
+        self.other = User.objects.create(uid='speaking_other', role='teacher')
+        self.mentor = User.objects.create(uid='speaking_mentor', role='speaking_mentor')
+        self.students = [
+            User.objects.create(uid=f'speaking_student_{i}', role='student', first_name=f'S{i}', last_name='Speak',
+                                assigned_teacher=self.teacher)
+            for i in range(5)
+        ]
+        now = timezone.now()
+        first = self.students[0]
+        for days, score, completed, teacher in ((3, 5, True, self.teacher), (1, 6.5, True, self.teacher),
+                                                (0, None, False, self.teacher), (0, 8, True, self.other)):
+            session = SpeakingSession.objects.create(student=first, teacher=teacher, completed=completed,
+                                                     overall_band_score=score)
+            SpeakingSession.objects.filter(pk=session.pk).update(conducted_at=now - timedelta(days=days))
+        for target in ('core.views.verify_firebase_token', 'core.auth.verify_firebase_token'):
+            patcher = patch(target, side_effect=lambda token: {'uid': token})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _get(self, user, **params):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.auth import clear_user_cache
+        clear_user_cache()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/teacher/speaking/students/', params,
+                                       HTTP_AUTHORIZATION=f'Bearer {user.uid}')
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(queries)
+
+    def test_stats_are_scoped_to_the_teacher(self):
+        data, _ = self._get(self.teacher)
+        row = data['students'][0]
+        self.assertEqual((row['id'], row['total_sessions'], row['completed_sessions'], row['latest_score']),
+                         (self.students[0].id, 3, 2, 6.5))
+        self.assertEqual(data['students'][1]['total_sessions'], 0)
+        self.assertIsNone(data['next_cursor'])
+
+        data, _ = self._get(self.mentor)
+        row = next(row for row in data['students'] if row['id'] == self.students[0].id)
+        self.assertEqual((row['total_sessions'], row['completed_sessions'], row['latest_score']), (4, 3, 8))
+
+    def test_cursor_pages_cover_every_student_once(self):
+        ids, cursor, pages = [], None, 0
+        while True:
+            params = {'page_size': 2, **({'cursor': cursor} if cursor else {})}
+            data, _ = self._get(self.teacher, **params)
+            ids += [row['id'] for row in data['students']]
+            pages += 1
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, [s.id for s in self.students])
+
+    def test_tampered_cursor_reads_as_first_page(self):
+        from core.views import encode_cursor
+        first_page, _ = self._get(self.teacher, page_size=2)
+        for values in (['a', 'b', 'x'], ['a', 'b', None], [1, 'b', 3], ['a', 'b', True], ['a', 'b']):
+            with self.subTest(cursor=values):
+                data, _ = self._get(self.teacher, page_size=2, cursor=encode_cursor(values))
+                self.assertEqual(data, first_page)
+
+    def test_query_count_does_not_grow_with_students(self):
+        _, small = self._get(self.teacher)
+        for i in range(5, 25):
+            User.objects.create(uid=f'speaking_student_{i}', role='student', assigned_teacher=self.teacher)
+        data, large = self._get(self.teacher)
+        self.assertEqual(len(data['students']), 25)
+        self.assertEqual(small, large)
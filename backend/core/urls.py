@@ -11,6 +11,7 @@ from .views import (
     SubmitTaskView,
     FinishWritingSessionView,
     WritingSessionSyncView,
+    WritingScoringStatusView,
     WritingPromptViewSet,
     WritingTestViewSet,
     WritingTaskViewSet,
@@ -120,7 +121,9 @@ from .views import (
     PlacementTestQuestionsView,
     PlacementTestSubmitView,
     AdminPlacementTestResultsView,
+    AdminRequestMetricsView,
 )
+from .request_metrics import prometheus_metrics_view
 
 router = DefaultRouter()
 router.register(r'writing-tests', WritingTestViewSet, basename='writing-test')
@@ -169,6 +172,7 @@ urlpatterns = router.urls + [
     path('submit-task/', SubmitTaskView.as_view(), name='submit-task'),
     path('finish-writing-session/', FinishWritingSessionView.as_view(), name='finish-writing-session'),
     path('writing-sessions/<int:session_id>/sync/', WritingSessionSyncView.as_view(), name='writing-session-sync'),
+    path('writing-sessions/<int:session_id>/scoring-status/', WritingScoringStatusView.as_view(), name='writing-scoring-status'),
     
     # Admin endpoints
     path('admin/essays/', AdminEssayListView.as_view(), name='admin-essay-list'),
@@ -268,4 +272,8 @@ urlpatterns += [
     path('placement-test/questions/', PlacementTestQuestionsView.as_view(), name='placement-test-questions'),
     path('placement-test/submit/', PlacementTestSubmitView.as_view(), name='placement-test-submit'),
     path('admin/placement-test-results/', AdminPlacementTestResultsView.as_view(), name='admin-placement-test-results'),
+
+    # Request instrumentation (core.request_metrics)
+    path('admin/request-metrics/', AdminRequestMetricsView.as_view(), name='admin-request-metrics'),
+    path('metrics/', prometheus_metrics_view, name='prometheus-metrics'),
 ]
@@ -0,0 +1,40 @@
+"""
+Student search over ``User.search_text``.
+
+The curator, teacher and admin student filters used to OR four ``icontains``
+predicates (first_name, last_name, student_id, email), which PostgreSQL can
+only answer with a sequential scan. ``search_text`` holds those fields
+lowercased and space-joined; it is refreshed on every save and, on
+PostgreSQL, covered by a pg_trgm GIN index (migration 0048) that serves the
+``LIKE '%term%'`` produced by ``search_users``. Other backends (SQLite in
+tests) run the same filter without the index.
+"""
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from .models import User
+
+SEARCH_FIELDS = ('first_name', 'last_name', 'student_id', 'email')
+
+
+def normalize_search(value):
+    return ' '.join(str(value or '').split()).lower()
+
+
+def build_search_text(user):
+    return normalize_search(' '.join(getattr(user, field) or '' for field in SEARCH_FIELDS))
+
+
+def search_users(queryset, term, prefix=''):
+    """Filters ``queryset`` to users whose name, student_id or email contains ``term``.
+    ``prefix`` is the lookup path to the user (e.g. ``'user__'`` for essays)."""
+    term = normalize_search(term)
+    if not term:
+        return queryset
+    return queryset.filter(**{f'{prefix}search_text__contains': term})
+
+
+@receiver(pre_save, sender=User)
+def _refresh_search_text(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance.search_text = build_search_text(instance)
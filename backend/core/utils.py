@@ -100,6 +100,8 @@ def validate_file_content_type(file_obj, allowed_types):
 # -------------------------------------
 # Ваши вспомогательные функции для тестов
 # -------------------------------------
+import hashlib
+import json
 import openai
 import os
 import re
@@ -155,8 +157,112 @@ def sanitize_ai_input(text, max_length=10000):
     return text.strip()
 
 
+# Bump when the scoring prompts or their parsing change; part of the AI score cache key
+AI_SCORING_PROMPT_VERSION = "essay_score_v1"
+AI_SCORING_MODEL = "gpt-4o"
+
+TASK1_SYSTEM_PROMPT = (
+    "You are an expert IELTS Writing Task 1 examiner with 10+ years of experience. "
+    "Task 1 requires describing data, charts, graphs, or processes in 150+ words. "
+    "You will be given a writing task and a student's essay. "
+    "Evaluate the essay according to official IELTS Task 1 criteria:\n\n"
+    "1. TASK ACHIEVEMENT (0-9):\n"
+    "- Band 9: Fully satisfies all requirements, clearly presents key features\n"
+    "- Band 7: Covers key features, some detail may be missing\n"
+    "- Band 5: Addresses task but format may be inappropriate, key features missing\n"
+    "- Band 3: Fails to address task, no clear overview\n\n"
+    "2. COHERENCE & COHESION (0-9):\n"
+    "- Band 9: Logical organization, clear progression, excellent linking\n"
+    "- Band 7: Clear overall progression, good use of cohesive devices\n"
+    "- Band 5: Some organization but may lack progression, limited linking\n"
+    "- Band 3: No clear organization, minimal linking\n\n"
+    "3. LEXICAL RESOURCE (0-9):\n"
+    "- Band 9: Wide range of vocabulary, precise and natural\n"
+    "- Band 7: Sufficient range, some flexibility and precision\n"
+    "- Band 5: Limited range, some errors in word choice\n"
+    "- Band 3: Very limited range, frequent errors\n\n"
+    "4. GRAMMATICAL RANGE & ACCURACY (0-9):\n"
+    "- Band 9: Wide range of structures, very few errors\n"
+    "- Band 7: Variety of complex structures, some errors\n"
+    "- Band 5: Mix of simple and complex structures, frequent errors\n"
+    "- Band 3: Limited range, many errors\n\n"
+    "OVERALL BAND: Average of the four criteria, rounded to nearest 0.5\n\n"
+    "FEEDBACK REQUIREMENTS:\n"
+    "- Write 4-6 sentences of detailed feedback\n"
+    "- Start with overall impression and main strength\n"
+    "- Identify 2-3 specific areas for improvement\n"
+    "- Provide concrete, actionable suggestions\n"
+    "- Mention vocabulary and grammar improvements\n"
+    "- Be encouraging but honest about weaknesses\n"
+    "- Use specific examples from the essay\n"
+    "- End with a positive note and encouragement\n\n"
+    "Respond ONLY with valid JSON, no explanations, no extra text, no markdown, no comments. "
+    "Do NOT include any text before or after the JSON. "
+    "Format: {\"task_achievement\":..., \"coherence\":..., \"lexical\":..., \"grammar\":..., \"feedback\":...}"
+)
+
+TASK2_SYSTEM_PROMPT = (
+    "You are an expert IELTS Writing Task 2 examiner with 10+ years of experience. "
+    "Task 2 requires writing an argumentative essay of 250+ words on a given topic. "
+    "You will be given a writing task and a student's essay. "
+    "Evaluate the essay according to official IELTS Task 2 criteria:\n\n"
+    "1. TASK RESPONSE (0-9):\n"
+    "- Band 9: Fully addresses all parts, presents clear position, develops ideas fully\n"
+    "- Band 7: Addresses all parts, presents clear position, develops ideas\n"
+    "- Band 5: Addresses task but may not cover all parts, position unclear\n"
+    "- Band 3: Does not address task, no clear position\n\n"
+    "2. COHERENCE & COHESION (0-9):\n"
+    "- Band 9: Logical organization, clear progression, excellent linking\n"
+    "- Band 7: Clear overall progression, good use of cohesive devices\n"
+    "- Band 5: Some organization but may lack progression, limited linking\n"
+    "- Band 3: No clear organization, minimal linking\n\n"
+    "3. LEXICAL RESOURCE (0-9):\n"
+    "- Band 9: Wide range of vocabulary, precise and natural\n"
+    "- Band 7: Sufficient range, some flexibility and precision\n"
+    "- Band 5: Limited range, some errors in word choice\n"
+    "- Band 3: Very limited range, frequent errors\n\n"
+    "4. GRAMMATICAL RANGE & ACCURACY (0-9):\n"
+    "- Band 9: Wide range of structures, very few errors\n"
+    "- Band 7: Variety of complex structures, some errors\n"
+    "- Band 5: Mix of simple and complex structures, frequent errors\n"
+    "- Band 3: Limited range, many errors\n\n"
+    "OVERALL BAND: Average of the four criteria, rounded to nearest 0.5\n\n"
+    "FEEDBACK REQUIREMENTS:\n"
+    "- Write 4-6 sentences of detailed feedback\n"
+    "- Start with overall impression and main strength\n"
+    "- Identify 2-3 specific areas for improvement\n"
+    "- Provide concrete, actionable suggestions\n"
+    "- Mention argument development and structure\n"
+    "- Comment on vocabulary and grammar improvements\n"
+    "- Be encouraging but honest about weaknesses\n"
+    "- Use specific examples from the essay\n"
+    "- End with a positive note and encouragement\n\n"
+    "Respond ONLY with valid JSON, no explanations, no extra text, no markdown, no comments. "
+    "Do NOT include any text before or after the JSON. "
+    "Format: {\"task_response\":..., \"coherence\":..., \"lexical\":..., \"grammar\":..., \"feedback\":...}"
+)
+
+
+def ai_score_cache_key(question_text, essay_text, task_type, image_url=None):
+    """
+    Content hash of everything that decides an ai_score_essay result: prompt
+    version, model and system prompt plus the inputs as they are sent (sanitized).
+    """
+    system_prompt = TASK1_SYSTEM_PROMPT if task_type == 'task1' else TASK2_SYSTEM_PROMPT
+    material = json.dumps([
+        AI_SCORING_PROMPT_VERSION,
+        AI_SCORING_MODEL,
+        system_prompt,
+        task_type,
+        sanitize_ai_input(question_text, max_length=2000),
+        sanitize_ai_input(essay_text, max_length=15000),
+        image_url if task_type == 'task1' else None,  # only Task 1 prompts include the image
+    ], ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
 # IELTS Writing AI scoring (GPT-4 Vision)
-def ai_score_essay(question_text, essay_text, task_type, image_url=None):
+def ai_score_essay(question_text, essay_text, task_type, image_url=None, timeout=None):
     if not OPENAI_API_KEY:
         raise RuntimeError('OPENAI_API_KEY not set in environment')
     openai.api_key = OPENAI_API_KEY
@@ -180,91 +286,14 @@ def ai_score_essay(question_text, essay_text, task_type, image_url=None):
 
     # Формируем промпт в зависимости от типа задания
     if task_type == 'task1':
-        system_prompt = (
-            "You are an expert IELTS Writing Task 1 examiner with 10+ years of experience. "
-            "Task 1 requires describing data, charts, graphs, or processes in 150+ words. "
-            "You will be given a writing task and a student's essay. "
-            "Evaluate the essay according to official IELTS Task 1 criteria:\n\n"
-            "1. TASK ACHIEVEMENT (0-9):\n"
-            "- Band 9: Fully satisfies all requirements, clearly presents key features\n"
-            "- Band 7: Covers key features, some detail may be missing\n"
-            "- Band 5: Addresses task but format may be inappropriate, key features missing\n"
-            "- Band 3: Fails to address task, no clear overview\n\n"
-            "2. COHERENCE & COHESION (0-9):\n"
-            "- Band 9: Logical organization, clear progression, excellent linking\n"
-            "- Band 7: Clear overall progression, good use of cohesive devices\n"
-            "- Band 5: Some organization but may lack progression, limited linking\n"
-            "- Band 3: No clear organization, minimal linking\n\n"
-            "3. LEXICAL RESOURCE (0-9):\n"
-            "- Band 9: Wide range of vocabulary, precise and natural\n"
-            "- Band 7: Sufficient range, some flexibility and precision\n"
-            "- Band 5: Limited range, some errors in word choice\n"
-            "- Band 3: Very limited range, frequent errors\n\n"
-            "4. GRAMMATICAL RANGE & ACCURACY (0-9):\n"
-            "- Band 9: Wide range of structures, very few errors\n"
-            "- Band 7: Variety of complex structures, some errors\n"
-            "- Band 5: Mix of simple and complex structures, frequent errors\n"
-            "- Band 3: Limited range, many errors\n\n"
-            "OVERALL BAND: Average of the four criteria, rounded to nearest 0.5\n\n"
-            "FEEDBACK REQUIREMENTS:\n"
-            "- Write 4-6 sentences of detailed feedback\n"
-            "- Start with overall impression and main strength\n"
-            "- Identify 2-3 specific areas for improvement\n"
-            "- Provide concrete, actionable suggestions\n"
-            "- Mention vocabulary and grammar improvements\n"
-            "- Be encouraging but honest about weaknesses\n"
-            "- Use specific examples from the essay\n"
-            "- End with a positive note and encouragement\n\n"
-            "Respond ONLY with valid JSON, no explanations, no extra text, no markdown, no comments. "
-            "Do NOT include any text before or after the JSON. "
-            "Format: {\"task_achievement\":..., \"coherence\":..., \"lexical\":..., \"grammar\":..., \"feedback\":...}"
-        )
+        system_prompt = TASK1_SYSTEM_PROMPT
         user_prompt = (
             f"TASK 1 INSTRUCTIONS: {question_text}\n\n"
             f"STUDENT'S ESSAY:\n{essay_text}\n\n"
             f"Evaluate this Task 1 response according to IELTS criteria."
         )
     else:  # task_type == 'task2'
-        system_prompt = (
-            "You are an expert IELTS Writing Task 2 examiner with 10+ years of experience. "
-            "Task 2 requires writing an argumentative essay of 250+ words on a given topic. "
-            "You will be given a writing task and a student's essay. "
-            "Evaluate the essay according to official IELTS Task 2 criteria:\n\n"
-            "1. TASK RESPONSE (0-9):\n"
-            "- Band 9: Fully addresses all parts, presents clear position, develops ideas fully\n"
-            "- Band 7: Addresses all parts, presents clear position, develops ideas\n"
-            "- Band 5: Addresses task but may not cover all parts, position unclear\n"
-            "- Band 3: Does not address task, no clear position\n\n"
-            "2. COHERENCE & COHESION (0-9):\n"
-            "- Band 9: Logical organization, clear progression, excellent linking\n"
-            "- Band 7: Clear overall progression, good use of cohesive devices\n"
-            "- Band 5: Some organization but may lack progression, limited linking\n"
-            "- Band 3: No clear organization, minimal linking\n\n"
-            "3. LEXICAL RESOURCE (0-9):\n"
-            "- Band 9: Wide range of vocabulary, precise and natural\n"
-            "- Band 7: Sufficient range, some flexibility and precision\n"
-            "- Band 5: Limited range, some errors in word choice\n"
-            "- Band 3: Very limited range, frequent errors\n\n"
-            "4. GRAMMATICAL RANGE & ACCURACY (0-9):\n"
-            "- Band 9: Wide range of structures, very few errors\n"
-            "- Band 7: Variety of complex structures, some errors\n"
-            "- Band 5: Mix of simple and complex structures, frequent errors\n"
-            "- Band 3: Limited range, many errors\n\n"
-            "OVERALL BAND: Average of the four criteria, rounded to nearest 0.5\n\n"
-            "FEEDBACK REQUIREMENTS:\n"
-            "- Write 4-6 sentences of detailed feedback\n"
-            "- Start with overall impression and main strength\n"
-            "- Identify 2-3 specific areas for improvement\n"
-            "- Provide concrete, actionable suggestions\n"
-            "- Mention argument development and structure\n"
-            "- Comment on vocabulary and grammar improvements\n"
-            "- Be encouraging but honest about weaknesses\n"
-            "- Use specific examples from the essay\n"
-            "- End with a positive note and encouragement\n\n"
-            "Respond ONLY with valid JSON, no explanations, no extra text, no markdown, no comments. "
-            "Do NOT include any text before or after the JSON. "
-            "Format: {\"task_response\":..., \"coherence\":..., \"lexical\":..., \"grammar\":..., \"feedback\":...}"
-        )
+        system_prompt = TASK2_SYSTEM_PROMPT
         user_prompt = (
             f"TASK 2 INSTRUCTIONS: {question_text}\n\n"
             f"STUDENT'S ESSAY:\n{essay_text}\n\n"
@@ -290,15 +319,17 @@ def ai_score_essay(question_text, essay_text, task_type, image_url=None):
         messages[1]["content"] = user_prompt
     
     # Используем gpt-4o для всех случаев (поддерживает и текст, и изображения)
-    model = "gpt-4o"
+    model = AI_SCORING_MODEL
 
     try:
         # Вызываем OpenAI
+        request_options = {'timeout': timeout} if timeout is not None else {}
         response = openai.chat.completions.create(
             model=model,
             messages=messages,
             max_tokens=512,
             temperature=0.2,
+            **request_options,
         )
         text = response.choices[0].message.content
         
@@ -8,6 +8,7 @@ import logging
 import magic
 
 security_logger = logging.getLogger('security')
+logger = logging.getLogger(__name__)
 
 def ielts_round_score(score):
     if score is None:
@@ -31,7 +32,7 @@ def compute_ielts_average(values):
     avg = sum(nums) / len(nums)
     return ielts_round_score(avg)
 from .utils import CsrfExemptAPIView
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from .firebase_config import verify_firebase_token
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView, RetrieveAPIView, RetrieveUpdateDestroyAPIView
@@ -58,14 +59,17 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.utils import timezone
 from datetime import timedelta, datetime
+import base64
 import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from rest_framework.exceptions import PermissionDenied
 from django.shortcuts import render, get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from django.middleware.csrf import get_token
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from .models import (
-    ListeningTest, ListeningPart, ListeningQuestion, ListeningAnswerOption,
+    ListeningTest, ListeningPart, ListeningQuestion,
     ListeningTestSession, ListeningStudentAnswer, ListeningTestResult, ListeningTestClone
 )
 from .serializers import (
@@ -83,8 +87,26 @@ from .serializers import UserSerializer
 import firebase_admin
 from firebase_admin import auth as firebase_auth
 from .models import ReadingTest, ReadingPart, ReadingQuestion, ReadingAnswerOption, ReadingTestSession, ReadingTestResult
-from .serializers import ReadingTestSerializer, ReadingPartSerializer, ReadingQuestionSerializer, ReadingAnswerOptionSerializer, ReadingTestSessionSerializer, ReadingTestResultSerializer, ReadingTestReadSerializer
+from .serializers import ReadingTestSerializer, ReadingPartSerializer, ReadingQuestionSerializer, ReadingAnswerOptionSerializer, ReadingTestSessionSerializer, ReadingTestResultSerializer, ReadingTestReadSerializer, ReadingTestListSerializer
 from .utils import ai_score_essay
+from .answer_keys import build_reading_results, build_listening_results, get_answer_key
+from .session_sync import (
+    apply_session_delta, parse_sync_seq, DELTA_NOT_FOUND, DELTA_CLOSED, DELTA_STALE,
+)
+from .rollups import ESSAYS_OF_PROMPTS, ESSAYS_OF_SESSIONS, ROLLUP_MODULES, rollup_totals, rollup_mean
+from .teacher_assignment import filter_students_by_teacher, is_students_teacher, students_of_teacher
+from .user_search import search_users
+from .structure_cache import get_test_structure, structure_response
+from .published_tests import publish_test, published_response
+from .cloning import clone_test
+from .request_metrics import metrics_snapshot, registry as request_metrics_registry
+from .scoring_jobs import (
+    enqueue_essay_scoring, needs_scoring, score_essays_concurrently, session_scoring_status, writing_overall_band,
+    is_enabled as scoring_queue_enabled,
+)
+from .sync_buffer import (
+    buffer_answers, buffer_writing_drafts, flush_session, is_enabled as sync_buffer_enabled,
+)
 from .ai_feedback import (
     build_feedback_payload,
     generate_ai_feedback,
@@ -93,7 +115,8 @@ from .ai_feedback import (
 )
 from .models import TeacherSatisfactionSurvey
 from .serializers import TeacherSatisfactionSurveySerializer
-from django.db import models, transaction
+from django.db import connection, models, transaction
+from django.db.models.functions import Coalesce, Greatest
 from .permissions import IsCurator, IsTeacherOrCurator
 from django.utils import timezone
 from datetime import timedelta
@@ -122,15 +145,51 @@ def _parse_date_body(value):
         return None
 
 
+def _local_day_start(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
 def apply_date_range_filter(queryset, request, field_name):
+    # Same days as field__date__gte/lte in the current time zone, but compared on the raw
+    # column so the session/essay indexes can serve the range
     date_from = _parse_date_param(request.query_params.get('date_from'))
     date_to = _parse_date_param(request.query_params.get('date_to'))
     if date_from:
-        queryset = queryset.filter(**{f'{field_name}__date__gte': date_from})
+        queryset = queryset.filter(**{f'{field_name}__gte': _local_day_start(date_from)})
     if date_to:
-        queryset = queryset.filter(**{f'{field_name}__date__lte': date_to})
+        queryset = queryset.filter(**{f'{field_name}__lt': _local_day_start(date_to + timedelta(days=1))})
     return queryset
 
+CSV_EXPORT_CHUNK_SIZE = 500
+CSV_EXPORT_RECOMPUTE_WORKERS = 4
+# Band Score cell of a Listening export row whose session could not be scored
+EXPORT_SCORING_ERROR = 'scoring error'
+
+
+class _CSVEcho:
+    """File-like object whose write() hands the formatted CSV line back to the generator."""
+    def write(self, value):
+        return value
+
+
+def streaming_csv_response(filename, header, rows, bom=True):
+    """
+    CSV download that is generated while it is sent: ``rows`` is an iterable
+    (usually a generator over ``queryset.iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE)``),
+    so neither the queryset nor the file is held in memory.
+    """
+    writer = csv.writer(_CSVEcho())
+
+    def generate():
+        if bom:
+            yield '\ufeff'  # UTF-8 BOM
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(generate(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 def _require_roles(request, allowed_roles=('admin', 'curator')):
     """Bearer Firebase auth + role check; returns (user, error_response_or_none)."""
     auth_header = request.META.get('HTTP_AUTHORIZATION', '')
@@ -149,6 +208,23 @@ def _require_roles(request, allowed_roles=('admin', 'curator')):
         return None, Response({'error': 'Access forbidden'}, status=403)
     return user, None
 
+def _rollup_completion_stats(students, field, completed_students):
+    """Per group/teacher completion counts and rates from rollup completion sets (CuratorOverviewView)."""
+    buckets = {}
+    for student_id, key in students.values_list('id', field):
+        if key:
+            buckets.setdefault(key, []).append(student_id)
+    stats = []
+    for key, student_ids in buckets.items():
+        total = len(student_ids)
+        row = {field: key, 'total_students': total}
+        for module in ('writing', 'listening', 'reading', 'speaking'):
+            row[f'{module}_completed'] = sum(1 for sid in student_ids if sid in completed_students[module])
+        for module in ('writing', 'listening', 'reading', 'speaking'):
+            row[f'{module}_rate'] = round((row[f'{module}_completed'] / total * 100), 1) if total > 0 else 0
+        stats.append(row)
+    return stats
+
 def _normalize_emails(emails):
     seen = set()
     result = []
@@ -220,16 +296,17 @@ class DashboardSummaryView(APIView):
 
         now = timezone.now()
         since_30d = now - timedelta(days=30)
+        # All-time totals come from the precomputed rollups (core.rollups)
+        rollups = rollup_totals([user.pk]).get(user.pk, {})
 
         # Listening aggregates
         listen_qs = ListeningTestSession.objects.filter(user=user)
         listen_30_qs = listen_qs.filter(models.Q(completed_at__gte=since_30d) | models.Q(started_at__gte=since_30d))
 
-        listening_completed_all = listen_qs.filter(submitted=True).count()
+        listening_completed_all = rollups.get('listening', {}).get('attempts', 0)
         listening_completed_30d = listen_30_qs.filter(submitted=True).count()
 
-        listen_results = ListeningTestResult.objects.filter(session__in=listen_qs)
-        listen_band_all = listen_results.aggregate(avg=models.Avg('band_score'))['avg']
+        listen_band_all = rollup_mean(rollups.get('listening'))
         listen_results_30 = ListeningTestResult.objects.filter(session__in=listen_30_qs)
         listen_band_30d = listen_results_30.aggregate(avg=models.Avg('band_score'))['avg']
 
@@ -283,11 +360,11 @@ class DashboardSummaryView(APIView):
         reading_qs = ReadingTestSession.objects.filter(user=user)
         reading_30_qs = reading_qs.filter(models.Q(end_time__gte=since_30d) | models.Q(start_time__gte=since_30d))
 
-        reading_completed_all = reading_qs.filter(completed=True).count()
+        reading_completed_all = rollups.get('reading', {}).get('attempts', 0)
         reading_completed_30d = reading_30_qs.filter(completed=True).count()
 
         read_results = ReadingTestResult.objects.filter(session__in=reading_qs)
-        read_band_all = read_results.aggregate(avg=models.Avg('band_score'))['avg']
+        read_band_all = rollup_mean(rollups.get('reading'))
         read_score_all = read_results.aggregate(avg=models.Avg('total_score'))['avg']
         read_results_30 = ReadingTestResult.objects.filter(session__in=reading_30_qs)
         read_band_30d = read_results_30.aggregate(avg=models.Avg('band_score'))['avg']
@@ -331,11 +408,11 @@ class DashboardSummaryView(APIView):
         # Writing aggregates
         essays_qs = Essay.objects.filter(user=user)
         essays_30_qs = essays_qs.filter(submitted_at__gte=since_30d)
-        essays_count_all = essays_qs.count()
+        essays_count_all = rollups.get('writing', {}).get('attempts', 0)
         essays_count_30d = essays_30_qs.count()
         sessions_30d = essays_30_qs.exclude(test_session__isnull=True).values('test_session').distinct().count()
 
-        write_avg_all = essays_qs.aggregate(avg=models.Avg('overall_band'))['avg']
+        write_avg_all = rollup_mean(rollups.get('writing'))
         write_avg_30d = essays_30_qs.aggregate(avg=models.Avg('overall_band'))['avg']
 
         last_essay = essays_qs.order_by('-submitted_at').first()
@@ -577,16 +654,11 @@ class CuratorDiagnosticResultsView(APIView):
         if group:
             students_qs = students_qs.filter(group=group)
         if teacher:
-            students_qs = students_qs.filter(teacher=teacher)
+            students_qs = filter_students_by_teacher(students_qs, teacher)
         if search:
             search = search.strip()
             if search:
-                students_qs = students_qs.filter(
-                    models.Q(first_name__icontains=search) |
-                    models.Q(last_name__icontains=search) |
-                    models.Q(student_id__icontains=search) |
-                    models.Q(email__icontains=search)
-                )
+                students_qs = search_users(students_qs, search)
 
         diagnostic_students = set()
         diagnostic_students.update(listening_diag_qs.filter(user__in=students_qs).values_list('user_id', flat=True))
@@ -729,18 +801,8 @@ class TeacherEssayListView(ListAPIView):
             return Essay.objects.none()
         qs = Essay.objects.select_related('user', 'prompt', 'test_session')
         
-        # Связываем студентов с учителем через поле teacher (по имени)
-        # Ищем студентов, у которых в поле teacher указано имя текущего учителя
-        teacher_name = teacher.first_name
-        if not teacher_name:
-            # Если у учителя нет first_name, попробуем использовать student_id или полное имя
-            teacher_name = teacher.student_id or f"{teacher.first_name} {teacher.last_name}".strip()
-        
-        if teacher_name:
-            qs = qs.filter(user__teacher=teacher_name)
-        else:
-            # Если у учителя нет никакого идентификатора, возвращаем пустой queryset
-            return qs.none()
+        # Студенты учителя — по индексированному FK assigned_teacher (core.teacher_assignment)
+        qs = qs.filter(students_of_teacher(teacher, prefix='user__'))
         prompt_id = self.request.query_params.get('prompt_id')
         task_type = self.request.query_params.get('task_type')
         student_id = self.request.query_params.get('student_id')
@@ -776,12 +838,7 @@ class TeacherEssayListView(ListAPIView):
         if search:
             s = search.strip()
             if s:
-                qs = qs.filter(
-                    models.Q(user__first_name__icontains=s) |
-                    models.Q(user__last_name__icontains=s) |
-                    models.Q(user__student_id__icontains=s) |
-                    models.Q(user__email__icontains=s)
-                )
+                qs = search_users(qs, s, prefix='user__')
         return qs.order_by('-submitted_at')
 
 class TeacherEssayDetailView(APIView):
@@ -793,9 +850,8 @@ class TeacherEssayDetailView(APIView):
             return error_response
             
         essay = get_object_or_404(Essay.objects.select_related('user', 'prompt'), pk=essay_id)
-        # Проверяем, что студент принадлежит этому учителю (по имени)
-        teacher_name = teacher.first_name or teacher.student_id
-        if essay.user.teacher != teacher_name:
+        # Проверяем, что студент принадлежит этому учителю (core.teacher_assignment)
+        if not is_students_teacher(essay.user, teacher):
             return Response({'error': 'Not allowed'}, status=403)
         feedback = getattr(essay, 'teacher_feedback', None)
         return Response({
@@ -812,9 +868,8 @@ class TeacherFeedbackSaveView(APIView):
             return error_response
             
         essay = get_object_or_404(Essay.objects.select_related('user'), pk=essay_id)
-        # Проверяем, что студент принадлежит этому учителю (по имени)
-        teacher_name = teacher.first_name or teacher.student_id
-        if essay.user.teacher != teacher_name:
+        # Проверяем, что студент принадлежит этому учителю (core.teacher_assignment)
+        if not is_students_teacher(essay.user, teacher):
             return Response({'error': 'Not allowed'}, status=403)
         upsert = TeacherFeedbackUpsertSerializer(data=request.data)
         upsert.is_valid(raise_exception=True)
@@ -855,9 +910,8 @@ class TeacherFeedbackPublishView(APIView):
             return error_response
             
         essay = get_object_or_404(Essay.objects.select_related('user'), pk=essay_id)
-        # Проверяем, что студент принадлежит этому учителю (по имени)
-        teacher_name = teacher.first_name or teacher.student_id
-        if essay.user.teacher != teacher_name:
+        # Проверяем, что студент принадлежит этому учителю (core.teacher_assignment)
+        if not is_students_teacher(essay.user, teacher):
             return Response({'error': 'Not allowed'}, status=403)
         upsert = TeacherFeedbackUpsertSerializer(data=request.data)
         upsert.is_valid(raise_exception=True)
@@ -930,8 +984,7 @@ class TeacherSessionFeedbackView(APIView):
         if error_response:
             return error_response
         session = get_object_or_404(WritingTestSession.objects.select_related('user', 'test'), pk=session_id)
-        teacher_name = teacher.first_name or teacher.student_id
-        if session.user.teacher != teacher_name:
+        if not is_students_teacher(session.user, teacher):
             return Response({'error': 'Not allowed'}, status=403)
 
         essays = Essay.objects.filter(test_session=session).select_related('prompt').order_by('task_type')
@@ -949,8 +1002,7 @@ class TeacherSessionFeedbackView(APIView):
         if error_response:
             return error_response
         session = get_object_or_404(WritingTestSession.objects.select_related('user'), pk=session_id)
-        teacher_name = teacher.first_name or teacher.student_id
-        if session.user.teacher != teacher_name:
+        if not is_students_teacher(session.user, teacher):
             return Response({'error': 'Not allowed'}, status=403)
 
         payload = request.data if isinstance(request.data, dict) else {}
@@ -964,7 +1016,7 @@ class TeacherSessionFeedbackView(APIView):
             essay = get_object_or_404(Essay.objects.select_related('user'), pk=essay_id)
             if essay.test_session_id != session.id:
                 return Response({'error': 'Essay does not belong to session'}, status=400)
-            if essay.user.teacher != teacher_name:
+            if not is_students_teacher(essay.user, teacher):
                 return Response({'error': 'Not allowed'}, status=403)
 
             upsert = TeacherFeedbackUpsertSerializer(data=item.get('feedback', {}))
@@ -1008,8 +1060,7 @@ class TeacherSessionPublishView(APIView):
         if error_response:
             return error_response
         session = get_object_or_404(WritingTestSession.objects.select_related('user'), pk=session_id)
-        teacher_name = teacher.first_name or teacher.student_id
-        if session.user.teacher != teacher_name:
+        if not is_students_teacher(session.user, teacher):
             return Response({'error': 'Not allowed'}, status=403)
 
         from django.utils import timezone as dj_tz
@@ -1080,10 +1131,33 @@ from .serializers import (
     SpeakingSessionHistorySerializer
 )
 
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """The list encode_cursor packed into ``token``, or None for a missing or malformed cursor."""
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
 class TeacherSpeakingStudentsView(APIView):
-    """Get list of students assigned to the teacher for speaking assessment"""
+    """
+    Students assigned to the teacher (every student for a speaking mentor) with
+    their speaking stats, computed in the same query as the student page:
+    session counts as filtered Counts and the latest band as a Subquery.
+    Pages are keyset-paginated on (first name, last name, id); ``next_cursor``
+    is passed back as ``cursor`` for the following page.
+    """
     permission_classes = [AllowAny]
-    
+    DEFAULT_PAGE_SIZE = 200
+    MAX_PAGE_SIZE = 500
+
     def get(self, request):
         teacher, error_response = get_teacher_from_request(request, allowed_roles=('teacher', 'speaking_mentor'))
         if error_response:
@@ -1095,34 +1169,41 @@ class TeacherSpeakingStudentsView(APIView):
         last_days = request.query_params.get('last_days')
         last_from = _parse_date_param(request.query_params.get('last_from'))
         last_to = _parse_date_param(request.query_params.get('last_to'))
+        try:
+            page_size = int(request.query_params.get('page_size', self.DEFAULT_PAGE_SIZE))
+        except (TypeError, ValueError):
+            page_size = self.DEFAULT_PAGE_SIZE
+        page_size = min(max(page_size, 1), self.MAX_PAGE_SIZE)
         
         if teacher.role == 'speaking_mentor':
-            students = User.objects.filter(role='student').order_by('first_name', 'last_name')
+            students = User.objects.filter(role='student')
         else:
-            teacher_name = teacher.first_name
-            if not teacher_name:
-                teacher_name = teacher.student_id or f"{teacher.first_name} {teacher.last_name}".strip()
-            if not teacher_name:
-                return Response({'students': []})
-            students = User.objects.filter(role='student', teacher=teacher_name).order_by('first_name', 'last_name')
+            students = User.objects.filter(students_of_teacher(teacher), role='student')
 
         if search:
             s = search.strip()
             if s:
-                students = students.filter(
-                    models.Q(first_name__icontains=s) |
-                    models.Q(last_name__icontains=s) |
-                    models.Q(student_id__icontains=s) |
-                    models.Q(email__icontains=s)
-                )
+                students = search_users(students, s)
         if group:
             students = students.filter(group__icontains=group.strip())
 
-        # Annotate latest completed speaking session date (teacher-scoped for teachers)
-        session_filter = models.Q(speaking_sessions__completed=True)
+        # Speaking stats (teacher-scoped for teachers)
+        scope = models.Q()
+        latest_sessions = SpeakingSession.objects.filter(student=models.OuterRef('pk'), completed=True)
         if teacher.role != 'speaking_mentor':
-            session_filter &= models.Q(speaking_sessions__teacher=teacher)
-        students = students.annotate(latest_session_date=models.Max('speaking_sessions__conducted_at', filter=session_filter))
+            scope = models.Q(speaking_sessions__teacher=teacher)
+            latest_sessions = latest_sessions.filter(teacher=teacher)
+        completed = scope & models.Q(speaking_sessions__completed=True)
+        students = students.annotate(
+            latest_session_date=models.Max('speaking_sessions__conducted_at', filter=completed),
+            total_sessions=models.Count('speaking_sessions', filter=scope),
+            completed_sessions=models.Count('speaking_sessions', filter=completed),
+            latest_score=models.Subquery(
+                latest_sessions.order_by('-conducted_at', '-id').values('overall_band_score')[:1]
+            ),
+            sort_first=Coalesce('first_name', models.Value('')),
+            sort_last=Coalesce('last_name', models.Value('')),
+        )
 
         if has_session:
             hs = str(has_session).strip().lower()
@@ -1143,30 +1224,38 @@ class TeacherSpeakingStudentsView(APIView):
             students = students.filter(latest_session_date__date__gte=last_from)
         if last_to:
             students = students.filter(latest_session_date__date__lte=last_to)
-        
-        students_data = []
-        for student in students:
-            if teacher.role == 'speaking_mentor':
-                sessions = SpeakingSession.objects.filter(student=student)
-            else:
-                sessions = SpeakingSession.objects.filter(student=student, teacher=teacher)
-            completed_sessions = sessions.filter(completed=True)
-            latest_session = completed_sessions.order_by('-conducted_at').first()
-            
-            students_data.append({
-                'id': student.id,
-                'student_id': student.student_id,
-                'first_name': student.first_name,
-                'last_name': student.last_name,
-                'email': student.email,
-                'group': student.group,
-                'total_sessions': sessions.count(),
-                'completed_sessions': completed_sessions.count(),
-                'latest_score': latest_session.overall_band_score if latest_session else None,
-                'latest_date': latest_session.conducted_at if latest_session else None
-            })
-        
-        return Response({'students': students_data})
+
+        cursor = decode_cursor(request.query_params.get('cursor'))
+        # A tampered cursor (other shape or types) reads as no cursor, like a malformed one
+        if cursor and [type(value) for value in cursor] == [str, str, int]:
+            first, last, last_id = cursor
+            students = students.filter(
+                models.Q(sort_first__gt=first)
+                | models.Q(sort_first=first, sort_last__gt=last)
+                | models.Q(sort_first=first, sort_last=last, id__gt=last_id)
+            )
+        # One row past the page tells whether there is a next one
+        page = list(students.order_by('sort_first', 'sort_last', 'id')[:page_size + 1])
+        next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            tail = page[-1]
+            next_cursor = encode_cursor([tail.sort_first, tail.sort_last, tail.id])
+
+        students_data = [{
+            'id': student.id,
+            'student_id': student.student_id,
+            'first_name': student.first_name,
+            'last_name': student.last_name,
+            'email': student.email,
+            'group': student.group,
+            'total_sessions': student.total_sessions,
+            'completed_sessions': student.completed_sessions,
+            'latest_score': student.latest_score,
+            'latest_date': student.latest_session_date,
+        } for student in page]
+
+        return Response({'students': students_data, 'next_cursor': next_cursor})
 
 
 class TeacherSpeakingSessionsView(APIView):
@@ -1200,12 +1289,7 @@ class TeacherSpeakingSessionsView(APIView):
         if search:
             s = search.strip()
             if s:
-                sessions = sessions.filter(
-                    models.Q(student__first_name__icontains=s) |
-                    models.Q(student__last_name__icontains=s) |
-                    models.Q(student__student_id__icontains=s) |
-                    models.Q(student__email__icontains=s)
-                )
+                sessions = search_users(sessions, s, prefix='student__')
         if group:
             sessions = sessions.filter(student__group__icontains=group.strip())
         if last_days:
@@ -1243,8 +1327,7 @@ class TeacherSpeakingSessionsView(APIView):
         
         # Check if student belongs to this teacher
         if teacher.role != 'speaking_mentor':
-            teacher_name = teacher.first_name or teacher.student_id
-            if student.teacher != teacher_name:
+            if not is_students_teacher(student, teacher):
                 return Response({'error': 'Student does not belong to this teacher'}, status=403)
         
         # Set student and teacher
@@ -1761,6 +1844,7 @@ class FinishWritingSessionView(APIView):
         if not session_id:
             return Response({'error': 'Session ID required'}, status=400)
 
+        flush_session(WritingTestSession, session_id)
         with transaction.atomic():
             try:
                 session = WritingTestSession.objects.select_for_update().get(id=session_id, user=user)
@@ -1775,79 +1859,28 @@ class FinishWritingSessionView(APIView):
         if not (has_task1 and has_task2):
             return Response({'error': 'Both tasks must be submitted with text'}, status=400)
 
-        # AI-оценка для всех эссе, если ещё не оценены
-        from .utils import ai_score_essay
-        for essay in essays:
-            if essay.overall_band is None or essay.feedback is None:
-                # Use WritingTask instead of WritingPrompt
-                task = essay.task
-                image_url = None
-                if task and getattr(task, 'image', None):
-                    try:
-                        # Формируем полный URL
-                        if task.image.url.startswith('http'):
-                            image_url = task.image.url
-                        else:
-                            # Убираем лишние слэши и корректно формируем URL
-                            base_url = "https://ielts.mastereducation.kz"
-                            clean_path = task.image.url.lstrip('/')
-                            image_url = f"{base_url}/{clean_path}"
-                    except Exception as e:
-                        image_url = None
-                try:
-                    ai_result = ai_score_essay(essay.question_text, essay.submitted_text, essay.task_type, image_url)
-                    
-                    # AI функция всегда возвращает task_response (даже для Task 1)
-                    essay.score_task = ai_result.get('task_response')
-                    
-                    essay.score_coherence = ai_result.get('coherence')
-                    essay.score_lexical = ai_result.get('lexical')
-                    essay.score_grammar = ai_result.get('grammar')
-                    # НЕ сохраняем overall_band от AI - будем рассчитывать сами
-                    essay.feedback = ai_result.get('feedback')
-                    
-                    # Рассчитываем individual band для этого эссе с правильным IELTS округлением
-                    individual_scores = [essay.score_task, essay.score_coherence, essay.score_lexical, essay.score_grammar]
-                    if all(score is not None for score in individual_scores):
-                        raw_individual = sum(individual_scores) / len(individual_scores)
-                        # IELTS округление: < 0.25 → вниз, ≥ 0.25 и < 0.75 → 0.5, ≥ 0.75 → вверх
-                        decimal_part = raw_individual - int(raw_individual)
-                        if decimal_part < 0.25:
-                            essay.overall_band = int(raw_individual)
-                        elif decimal_part < 0.75:
-                            essay.overall_band = int(raw_individual) + 0.5
-                        else:
-                            essay.overall_band = int(raw_individual) + 1.0
-                    
-                    essay.save()
-                except Exception as e:
-                    essay.feedback = f"AI scoring failed: {str(e)}"
-                    essay.save()
-                    return Response({'error': 'AI scoring failed', 'detail': str(e)}, status=500)
+        if scoring_queue_enabled():
+            # Scored by run_scoring_worker; the client polls WritingScoringStatusView
+            enqueue_essay_scoring(essays)
+            scoring_status = session_scoring_status(session)
+            if scoring_status['status'] == 'pending':
+                return Response({
+                    **scoring_status,
+                    'message': 'Session completed, essays queued for AI scoring'
+                }, status=status.HTTP_202_ACCEPTED)
+
+        # AI-оценка для всех эссе, если ещё не оценены (Task 1 и Task 2 параллельно)
+        unscored = [essay for essay in essays if needs_scoring(essay)]
+        errors = score_essays_concurrently(unscored)
+        if errors:
+            for essay in unscored:
+                if essay.pk in errors:
+                    essay.feedback = f"AI scoring failed: {errors[essay.pk]}"
+                    essay.save(update_fields=['feedback'])
+            return Response({'error': 'AI scoring failed', 'detail': '; '.join(errors.values())}, status=500)
 
         # Считаем общий band по формуле IELTS (простое среднее арифметическое)
-        band1 = band2 = None
-        for essay in essays:
-            if essay.task_type == 'task1':
-                band1 = essay.overall_band
-            elif essay.task_type == 'task2':
-                band2 = essay.overall_band
-        
-        if band1 is not None and band2 is not None:
-            # Правильная формула IELTS: простое среднее арифметическое
-            raw_score = (band1 + band2) / 2
-            
-            # IELTS округление: < 0.25 → вниз, ≥ 0.25 и < 0.75 → 0.5, ≥ 0.75 → вверх
-            decimal_part = raw_score - int(raw_score)
-            
-            if decimal_part < 0.25:
-                overall_band = int(raw_score)
-            elif decimal_part < 0.75:
-                overall_band = int(raw_score) + 0.5
-            else:
-                overall_band = int(raw_score) + 1.0
-        else:
-            overall_band = None
+        overall_band = writing_overall_band(essays)
 
         return Response({
             'session_id': session.id,
@@ -1857,10 +1890,11 @@ class FinishWritingSessionView(APIView):
         })
 
 
-class WritingSessionSyncView(APIView):
+class WritingScoringStatusView(APIView):
+    """Polled after finishing a session while its essays are in the AI scoring queue."""
     permission_classes = [AllowAny]
 
-    def patch(self, request, session_id):
+    def get(self, request, session_id):
         auth_header = request.META.get('HTTP_AUTHORIZATION', '')
         if not auth_header.startswith('Bearer '):
             return Response({'error': 'Authentication required'}, status=401)
@@ -1878,11 +1912,51 @@ class WritingSessionSyncView(APIView):
             session = WritingTestSession.objects.get(id=session_id, user=user)
         except WritingTestSession.DoesNotExist:
             return Response({'error': 'Session not found'}, status=404)
+        return Response(session_scoring_status(session))
+
+
+class WritingSessionSyncView(APIView):
+    permission_classes = [AllowAny]
+
+    def patch(self, request, session_id):
+        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+        if not auth_header.startswith('Bearer '):
+            return Response({'error': 'Authentication required'}, status=401)
+        id_token = auth_header.split(' ')[1]
+        decoded = verify_firebase_token(id_token)
+        if not decoded:
+            return Response({'error': 'Invalid token'}, status=401)
+        uid = decoded['uid']
+        try:
+            user = User.objects.get(uid=uid)
+        except User.DoesNotExist:
+            return Response({'error': 'User not found'}, status=401)
 
         task1_text = request.data.get('task1_text')
         task2_text = request.data.get('task2_text')
         time_left = request.data.get('time_left')
 
+        if sync_buffer_enabled():
+            tl = None
+            if time_left is not None:
+                try:
+                    tl = max(0, int(float(time_left)))
+                except (TypeError, ValueError):
+                    return Response({'error': 'Invalid time_left'}, status=400)
+            state = buffer_writing_drafts(session_id, user, task1_text, task2_text, tl)
+            if state is None:
+                return Response({'error': 'Session not found'}, status=404)
+            return Response({
+                'task1_text': state['task1_draft'],
+                'task2_text': state['task2_draft'],
+                'time_left_seconds': state['time_left_seconds']
+            })
+
+        try:
+            session = WritingTestSession.objects.get(id=session_id, user=user)
+        except WritingTestSession.DoesNotExist:
+            return Response({'error': 'Session not found'}, status=404)
+
         if task1_text is not None:
             session.task1_draft = task1_text
         if task2_text is not None:
@@ -2133,6 +2207,7 @@ class WritingTestSessionDetailView(APIView):
         except User.DoesNotExist:
             return Response({'error': 'User not found'}, status=401)
 
+        flush_session(WritingTestSession, session_id)
         try:
             session = WritingTestSession.objects.get(id=session_id, user=user)
             serializer = WritingTestSessionSerializer(session)
@@ -2171,71 +2246,41 @@ class WritingTestExportCSVView(APIView):
             test_session__test=test
         ).select_related('user', 'test_session', 'task').order_by('user__student_id', '-submitted_at')
 
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="writing_test_{test.id}_{test.title.replace(" ", "_")}_results.csv"'
-        response.write('\ufeff'.encode('utf8'))  # UTF-8 BOM
-        
-        writer = csv.writer(response)
-
         header = [
             'Student ID', 'First Name', 'Last Name', 'Group', 'Teacher',
             'Test Title', 'Task Type', 'Essay Text', 'Task Text', 'Word Count',
             'Task Response Score', 'Coherence Score', 'Lexical Score', 'Grammar Score',
             'Overall Band', 'AI Feedback', 'Date Submitted'
         ]
-        writer.writerow(header)
-
-        for essay in essays:
-            user = essay.user
-            word_count = len(essay.submitted_text.split()) if essay.submitted_text else 0
-            
-            writer.writerow([
-                user.student_id or '',
-                user.first_name or '',
-                user.last_name or '',
-                user.group or '',
-                user.teacher or '',
-                test.title,
-                essay.task.task_type.upper() if essay.task else essay.task_type or '',
-                essay.submitted_text or '',
-                essay.task.task_text if essay.task else essay.question_text or '',
-                word_count,
-                essay.score_task or '',
-                essay.score_coherence or '',
-                essay.score_lexical or '',
-                essay.score_grammar or '',
-                essay.overall_band or '',
-                essay.feedback or '',
-                essay.submitted_at.strftime('%Y-%m-%d %H:%M:%S') if essay.submitted_at else ''
-            ])
-
-        return response
 
+        def rows():
+            for essay in essays.iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE):
+                user = essay.user
+                word_count = len(essay.submitted_text.split()) if essay.submitted_text else 0
+                yield [
+                    user.student_id or '',
+                    user.first_name or '',
+                    user.last_name or '',
+                    user.group or '',
+                    user.teacher or '',
+                    test.title,
+                    essay.task.task_type.upper() if essay.task else essay.task_type or '',
+                    essay.submitted_text or '',
+                    essay.task.task_text if essay.task else essay.question_text or '',
+                    word_count,
+                    essay.score_task or '',
+                    essay.score_coherence or '',
+                    essay.score_lexical or '',
+                    essay.score_grammar or '',
+                    essay.overall_band or '',
+                    essay.feedback or '',
+                    essay.submitted_at.strftime('%Y-%m-%d %H:%M:%S') if essay.submitted_at else ''
+                ]
 
+        return streaming_csv_response(
+            f'writing_test_{test.id}_{test.title.replace(" ", "_")}_results.csv', header, rows()
+        )
 
-class ListeningTestListView(ListAPIView):
-    serializer_class = ListeningTestListSerializer
-    permission_classes = [AllowAny]
-
-    def get_queryset(self):
-        auth_header = self.request.META.get('HTTP_AUTHORIZATION', '')
-        if auth_header.startswith('Bearer '):
-            id_token = auth_header.split(' ')[1]
-            decoded = verify_firebase_token(id_token)
-            if decoded:
-                uid = decoded['uid']
-                try:
-                    user = User.objects.get(uid=uid)
-                    if user.role == 'admin':
-                        return ListeningTest.objects.all().order_by('-created_at')
-                except User.DoesNotExist:
-                    pass
-        return ListeningTest.objects.filter(is_active=True).order_by('-created_at')
-
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        context['request'] = self.request
-        return context
 
 
 class ListeningTestDetailView(RetrieveAPIView):
@@ -2248,6 +2293,10 @@ class ListeningTestDetailView(RetrieveAPIView):
         context['request'] = self.request
         return context
 
+    def retrieve(self, request, *args, **kwargs):
+        test = self.get_object()
+        return structure_response(request, 'listening_detail', test, lambda t: self.get_serializer(t).data)
+
 
 class StartListeningTestView(APIView):
     permission_classes = [AllowAny]
@@ -2316,6 +2365,7 @@ class SubmitListeningTestView(APIView):
         except User.DoesNotExist:
             return Response({'error': 'User not found'}, status=401)
 
+        flush_session(ListeningTestSession, session_id)
         try:
             session = ListeningTestSession.objects.get(id=session_id, user=user)
         except ListeningTestSession.DoesNotExist:
@@ -2416,7 +2466,9 @@ class ListeningTestViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
 
     def get_serializer_class(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action == 'list':
+            return ListeningTestListSerializer
+        if self.action == 'retrieve':
             from .serializers import ListeningTestReadSerializer
             return ListeningTestReadSerializer
         return ListeningTestSerializer
@@ -2427,20 +2479,44 @@ class ListeningTestViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
-        from .serializers import ListeningTestReadSerializer
-        read_serializer = ListeningTestReadSerializer(self.get_object())
-        return Response(read_serializer.data, status=status.HTTP_200_OK)
+        test = self._saved_test(instance.pk)
+        if test.is_active:
+            publish_test('listening', test)
+        return Response(self._saved_structure(test), status=status.HTTP_200_OK)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         instance = serializer.save()
+        return Response(self._saved_structure(self._saved_test(instance.pk)), status=status.HTTP_201_CREATED)
+
+    def _saved_test(self, pk):
+        return ListeningTest.objects.prefetch_related('parts__questions__options').get(pk=pk)
+
+    def _saved_structure(self, test):
+        # Also primes the structure cache the editor reads back right after saving
         from .serializers import ListeningTestReadSerializer
-        read_serializer = ListeningTestReadSerializer(instance)
-        return Response(read_serializer.data, status=status.HTTP_201_CREATED)
+        return get_test_structure('listening', test, lambda t: ListeningTestReadSerializer(t).data)
 
     def get_queryset(self):
-        return ListeningTest.objects.all().order_by('-created_at')
+        queryset = ListeningTest.objects.all().order_by('-created_at')
+        if self.action == 'list':
+            # The list shows counts only; the nested structure is served by retrieve
+            queryset = queryset.annotate(
+                parts_count=models.Count('parts', distinct=True),
+                questions_count=models.Count('parts__questions', distinct=True),
+            )
+        return queryset
+
+    def get_permissions(self):
+        # The full structure carries the answer keys: builders only. Students read .../student/
+        if self.action == 'retrieve':
+            return [IsAdmin()]
+        return super().get_permissions()
+
+    def retrieve(self, request, *args, **kwargs):
+        test = self.get_object()
+        return structure_response(request, 'listening', test, lambda t: self.get_serializer(t).data)
 
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
@@ -2473,8 +2549,14 @@ class ListeningTestViewSet(viewsets.ModelViewSet):
         test = self.get_object()
         test.is_active = True
         test.save()
+        publish_test('listening', test)
         return Response({'message': 'Test activated successfully'})
 
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    def student(self, request, pk=None):
+        """Published student payload without answer keys (see core.published_tests)."""
+        return published_response(request, 'listening', pk)
+
     @action(detail=True, methods=['post'], permission_classes=[IsAdmin])
     def deactivate(self, request, pk=None):
         test = self.get_object()
@@ -2485,51 +2567,8 @@ class ListeningTestViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], permission_classes=[IsAdmin])
     def clone(self, request, pk=None):
         source_test = self.get_object()
-        
-        # Create new test with cloned data
-        cloned_test = ListeningTest.objects.create(
-            title=f"{source_test.title} (Copy)",
-            description=source_test.description,
-            is_active=False  # Cloned tests start as inactive
-        )
-        
-        # Clone all parts and their questions
-        for part in source_test.parts.all().order_by('part_number'):
-            cloned_part = ListeningPart.objects.create(
-                test=cloned_test,
-                part_number=part.part_number,
-                audio=part.audio,  # Reference to same audio file
-                audio_duration=part.audio_duration,
-                instructions=part.instructions
-            )
-            
-            # Clone questions for this part
-            for question in part.questions.all().order_by('order'):
-                cloned_question = ListeningQuestion.objects.create(
-                    part=cloned_part,
-                    question_type=question.question_type,
-                    question_text=question.question_text,
-                    order=question.order,
-                    extra_data=question.extra_data,
-                    correct_answers=question.correct_answers,
-                    header=question.header,
-                    instruction=question.instruction,
-                    task_prompt=question.task_prompt,
-                    image=question.image,
-                    image_file=question.image_file,  # Reference to same image file
-                    points=question.points,
-                    scoring_mode=question.scoring_mode
-                )
-                
-                # Clone answer options
-                for option in question.options.all():
-                    ListeningAnswerOption.objects.create(
-                        question=cloned_question,
-                        label=option.label,
-                        text=option.text,
-                        points=option.points
-                    )
-        
+        cloned_test = clone_test(source_test, 'listening')
+
         # Create clone record
         clone_record = ListeningTestClone.objects.create(
             source_test=source_test,
@@ -2607,6 +2646,8 @@ class ListeningTestSessionView(APIView):
                     created = True
                 else:
                     session = last_session
+                    if flush_session(ListeningTestSession, session.pk):
+                        session.refresh_from_db()
                     # If diagnostic requested and session is diagnostic but flag not set, set it
                     if diagnostic_flag and not session.is_diagnostic:
                         session.is_diagnostic = True
@@ -2627,6 +2668,8 @@ class ListeningTestSessionView(APIView):
 
         # Если session_id есть - это сабмит.
         if session_id:
+            # Buffered autosave must be in the DB before grading
+            flush_session(ListeningTestSession, session_id)
             with transaction.atomic():
                 session = ListeningTestSession.objects.select_for_update().get(pk=session_id, user=request.user)
                 if session.submitted:
@@ -2690,6 +2733,8 @@ class ListeningTestSessionView(APIView):
 
     def patch(self, request, session_id=None):
         # Sync answers (save progress)
+        if 'seq' in request.data or sync_buffer_enabled():
+            return self._patch_delta(request, session_id)
         session = get_object_or_404(ListeningTestSession, pk=session_id, user=request.user)
         
         if session.submitted:
@@ -2728,6 +2773,34 @@ class ListeningTestSessionView(APIView):
         
         return Response({'detail': 'Progress saved'}, status=status.HTTP_200_OK)
 
+    def _patch_delta(self, request, session_id):
+        # Delta sync: only changed answers/flags + seq, merged in the DB (see core.session_sync).
+        # With SESSION_SYNC_BUFFER every sync goes to the write buffer instead (core.sync_buffer).
+        seq = None
+        if 'seq' in request.data:
+            try:
+                seq = parse_sync_seq(request.data.get('seq'))
+            except (TypeError, ValueError):
+                return Response({'error': 'seq must be a positive integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        sync = buffer_answers if sync_buffer_enabled() else apply_session_delta
+        outcome, current_seq = sync(
+            ListeningTestSession, session_id, request.user,
+            answers=request.data.get('answers'),
+            flagged=request.data.get('flagged'),
+            time_left=request.data.get('time_left'),
+            seq=seq,
+        )
+        if outcome == DELTA_NOT_FOUND:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if outcome == DELTA_CLOSED:
+            return Response({'error': 'Cannot sync a submitted session.'}, status=status.HTTP_400_BAD_REQUEST)
+        if outcome == DELTA_STALE:
+            return Response({'error': 'Out-of-order delta.', 'seq': current_seq}, status=status.HTTP_409_CONFLICT)
+        if seq is None:
+            return Response({'detail': 'Progress saved'}, status=status.HTTP_200_OK)
+        return Response({'detail': 'Progress saved', 'seq': current_seq}, status=status.HTTP_200_OK)
+
 # --- ListeningTestResult: student/admin view ---
 class ListeningTestResultView(APIView):
     permission_classes = [IsAuthenticated]
@@ -2780,55 +2853,12 @@ class ListeningTestCloneViewSet(viewsets.ModelViewSet):
     serializer_class = ListeningTestCloneSerializer
     permission_classes = [AllowAny]
 
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['post'], permission_classes=[IsAdmin])
     def clone(self, request, pk=None):
-        # Get source test
-        source_test = self.get_object()
-        
-        # Create new test with cloned data
-        cloned_test = ListeningTest.objects.create(
-            title=f"{source_test.title} (Copy)",
-            description=source_test.description,
-            is_active=False  # Cloned tests start as inactive
-        )
-        
-        # Clone all parts and their questions
-        for part in source_test.parts.all().order_by('part_number'):
-            cloned_part = ListeningPart.objects.create(
-                test=cloned_test,
-                part_number=part.part_number,
-                audio=part.audio,  # Reference to same audio file
-                audio_duration=part.audio_duration,
-                instructions=part.instructions
-            )
-            
-            # Clone questions for this part
-            for question in part.questions.all().order_by('order'):
-                cloned_question = ListeningQuestion.objects.create(
-                    part=cloned_part,
-                    question_type=question.question_type,
-                    question_text=question.question_text,
-                    order=question.order,
-                    extra_data=question.extra_data,
-                    correct_answers=question.correct_answers,
-                    header=question.header,
-                    instruction=question.instruction,
-                    task_prompt=question.task_prompt,
-                    image=question.image,
-                    image_file=question.image_file,  # Reference to same image file
-                    points=question.points,
-                    scoring_mode=question.scoring_mode
-                )
-                
-                # Clone answer options
-                for option in question.options.all():
-                    ListeningAnswerOption.objects.create(
-                        question=cloned_question,
-                        label=option.label,
-                        text=option.text,
-                        points=option.points
-                    )
-        
+        # pk is the id of the test to copy, not of a clone record
+        source_test = get_object_or_404(ListeningTest, pk=pk)
+        cloned_test = clone_test(source_test, 'listening')
+
         # Create clone record
         clone_record = ListeningTestClone.objects.create(
             source_test=source_test,
@@ -3007,89 +3037,130 @@ class ListeningTestExportCSVView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher=teacher)
+            students = filter_students_by_teacher(students, teacher)
 
         test = get_object_or_404(ListeningTest, pk=test_id)
         sessions = ListeningTestSession.objects.filter(
             test=test, 
             submitted=True, 
             user__in=students
-        ).select_related('user').order_by('user__student_id')
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="listening_test_{test_id}_results.csv"'
-        response.write(u'\ufeff'.encode('utf8'))
-        
-        writer = csv.writer(response)
+        ).select_related('user', 'listeningtestresult').order_by('user__student_id')
 
         header = [
             'Student ID', 'First Name', 'Last Name', 'Group', 'Teacher',
             'Raw Score', 'Total Score', 'Band Score',
             'Correct Questions', 'Incorrect Questions', 'Date Submitted'
         ]
-        writer.writerow(header)
 
-        for session in sessions:
-            user = session.user
-            
-            # Получаем breakdown через ту же функцию что используется в результатах
-            from .serializers import create_listening_detailed_breakdown
-            results = create_listening_detailed_breakdown(session)
-            
-            raw_score = results.get('raw_score', 0)
-            total_score = results.get('total_score', 0)
-            band_score = results.get('band_score', 0)
-            detailed_breakdown = results.get('detailed_breakdown', [])
-            
-            # Извлекаем правильные и неправильные вопросы из breakdown
-            correct_questions = []
-            incorrect_questions = []
-            
-            # Используем смешанную логику: total_sub_questions для multiple_response, иначе sub_questions
-            question_counter = 1
-            
-            if detailed_breakdown:
-                for part in detailed_breakdown:
-                    for question in part.get('questions', []):
-                        question_type = question.get('question_type', '')
-                        
-                        if question_type in ['multiple_response', 'checkbox', 'multi_select', 'multipleresponse']:
-                            # Для multiple response: используем total_sub_questions (всегда 1)
-                            total_sub_questions = question.get('total_sub_questions', 1)
-                            correct_sub_questions = question.get('correct_sub_questions', 0)
-                            
-                            for i in range(total_sub_questions):
-                                if correct_sub_questions > 0:
-                                    correct_questions.append(str(question_counter))
-                                else:
-                                    incorrect_questions.append(str(question_counter))
-                                question_counter += 1
+        # By default the scores stored at submit time are exported; ?recompute=1
+        # re-scores every session against the test's current answer key.
+        recompute = request.query_params.get('recompute') in ('1', 'true')
+        answer_key = get_answer_key(test, 'listening')
+
+        def score_session(session):
+            try:
+                results = build_listening_results(answer_key.score(session.answers or {}))
+            except Exception:
+                # A zero would read as a real result: leave the scores blank and mark the band
+                logger.exception('Listening export: scoring session %s of test %s failed', session.pk, test.pk)
+                return self._export_row(session, '', '', EXPORT_SCORING_ERROR, [])
+            return self._export_row(
+                session, results['raw_score'], results['total_score'], results['band_score'],
+                results['detailed_breakdown']
+            )
+
+        def stored_row(session):
+            result = getattr(session, 'listeningtestresult', None)
+            if result is None:
+                # Submitted before results were stored
+                return score_session(session)
+            return self._export_row(
+                session, result.raw_score, session.total_questions_count or 0, result.band_score,
+                result.breakdown if isinstance(result.breakdown, list) else []
+            )
+
+        def score_chunk(chunk):
+            return [score_session(session) for session in chunk]
+
+        def rows():
+            session_iter = sessions.iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE)
+            if not recompute:
+                for session in session_iter:
+                    yield stored_row(session)
+                return
+            # Chunks are scored on a small pool while the next chunk is fetched;
+            # at most `workers` chunks are in flight, so memory stays bounded.
+            workers = CSV_EXPORT_RECOMPUTE_WORKERS
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                chunk = []
+                for session in session_iter:
+                    chunk.append(session)
+                    if len(chunk) >= CSV_EXPORT_CHUNK_SIZE // workers:
+                        pending.append(pool.submit(score_chunk, chunk))
+                        chunk = []
+                        if len(pending) >= workers:
+                            yield from pending.popleft().result()
+                if chunk:
+                    pending.append(pool.submit(score_chunk, chunk))
+                while pending:
+                    yield from pending.popleft().result()
+
+        return streaming_csv_response(f'listening_test_{test_id}_results.csv', header, rows())
+
+    @staticmethod
+    def _question_numbers(detailed_breakdown):
+        """Splits the running question numbers of a breakdown into correct and incorrect."""
+        correct_questions = []
+        incorrect_questions = []
+
+        # Используем смешанную логику: total_sub_questions для multiple_response, иначе sub_questions
+        question_counter = 1
+
+        for part in detailed_breakdown or []:
+            for question in part.get('questions', []):
+                question_type = question.get('question_type', '')
+
+                if question_type in ['multiple_response', 'checkbox', 'multi_select', 'multipleresponse']:
+                    # Для multiple response: используем total_sub_questions (всегда 1)
+                    total_sub_questions = question.get('total_sub_questions', 1)
+                    correct_sub_questions = question.get('correct_sub_questions', 0)
+
+                    for i in range(total_sub_questions):
+                        if correct_sub_questions > 0:
+                            correct_questions.append(str(question_counter))
                         else:
-                            # Для остальных типов: используем sub_questions
-                            sub_questions = question.get('sub_questions', [])
-                            
-                            for sub_question in sub_questions:
-                                if sub_question.get('is_correct', False):
-                                    correct_questions.append(str(question_counter))
-                                else:
-                                    incorrect_questions.append(str(question_counter))
-                                question_counter += 1
-            
-            writer.writerow([
-                user.student_id or '',
-                user.first_name or '',
-                user.last_name or '',
-                user.group or '',
-                user.teacher or '',
-                raw_score,
-                total_score,
-                band_score,
-                ';'.join(correct_questions),
-                ';'.join(incorrect_questions),
-                session.completed_at.strftime('%Y-%m-%d %H:%M:%S') if session.completed_at else ''
-            ])
+                            incorrect_questions.append(str(question_counter))
+                        question_counter += 1
+                else:
+                    # Для остальных типов: используем sub_questions
+                    sub_questions = question.get('sub_questions', [])
 
-        return response
+                    for sub_question in sub_questions:
+                        if sub_question.get('is_correct', False):
+                            correct_questions.append(str(question_counter))
+                        else:
+                            incorrect_questions.append(str(question_counter))
+                        question_counter += 1
+        return correct_questions, incorrect_questions
+
+    @classmethod
+    def _export_row(cls, session, raw_score, total_score, band_score, detailed_breakdown):
+        user = session.user
+        correct_questions, incorrect_questions = cls._question_numbers(detailed_breakdown)
+        return [
+            user.student_id or '',
+            user.first_name or '',
+            user.last_name or '',
+            user.group or '',
+            user.teacher or '',
+            raw_score,
+            total_score,
+            band_score,
+            ';'.join(correct_questions),
+            ';'.join(incorrect_questions),
+            session.completed_at.strftime('%Y-%m-%d %H:%M:%S') if session.completed_at else ''
+        ]
 
 
 class ReadingTestExportCSVView(APIView):
@@ -3113,7 +3184,7 @@ class ReadingTestExportCSVView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher=teacher)
+            students = filter_students_by_teacher(students, teacher)
 
         try:
             test = ReadingTest.objects.get(id=test_id)
@@ -3127,64 +3198,61 @@ class ReadingTestExportCSVView(APIView):
             user__in=students
         ).select_related('user', 'result').order_by('-end_time')
 
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="reading_test_{test_id}_results.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
+        header = [
             'Student ID', 'First Name', 'Last Name', 'Group', 'Teacher',
             'Raw Score', 'Total Score', 'Band Score', 
             'Correct Questions', 'Incorrect Questions', 'Date Submitted'
-        ])
+        ]
 
-        for session in sessions:
-            result = getattr(session, 'result', None)
-            if not result:
-                continue
-                
-            user = session.user
-            
-            # Извлекаем правильные и неправильные вопросы из breakdown
-            correct_questions = []
-            incorrect_questions = []
-            
-            # Упрощенная логика: просто нумеруем подвопросы по порядку
-            question_counter = 1
-            
-            if result.breakdown:
-                for question_id, data in result.breakdown.items():
-                    sub_questions = data.get('sub_questions', [])
-                    if sub_questions:
-                        # Для вопросов с подвопросами - нумеруем каждый отдельно
-                        for sub in sub_questions:
-                            if sub.get('is_correct'):
+        def rows():
+            for session in sessions.iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE):
+                result = getattr(session, 'result', None)
+                if not result:
+                    continue
+
+                user = session.user
+
+                # Извлекаем правильные и неправильные вопросы из breakdown
+                correct_questions = []
+                incorrect_questions = []
+
+                # Упрощенная логика: просто нумеруем подвопросы по порядку
+                question_counter = 1
+
+                if result.breakdown:
+                    for question_id, data in result.breakdown.items():
+                        sub_questions = data.get('sub_questions', [])
+                        if sub_questions:
+                            # Для вопросов с подвопросами - нумеруем каждый отдельно
+                            for sub in sub_questions:
+                                if sub.get('is_correct'):
+                                    correct_questions.append(str(question_counter))
+                                else:
+                                    incorrect_questions.append(str(question_counter))
+                                question_counter += 1
+                        else:
+                            # Для простых вопросов - один номер на вопрос
+                            if data.get('is_correct'):
                                 correct_questions.append(str(question_counter))
                             else:
                                 incorrect_questions.append(str(question_counter))
                             question_counter += 1
-                    else:
-                        # Для простых вопросов - один номер на вопрос
-                        if data.get('is_correct'):
-                            correct_questions.append(str(question_counter))
-                        else:
-                            incorrect_questions.append(str(question_counter))
-                        question_counter += 1
-            
-            writer.writerow([
-                user.student_id or '',
-                user.first_name or '',
-                user.last_name or '',
-                user.group or '',
-                user.teacher or '',
-                result.raw_score,
-                result.total_score,
-                result.band_score,
-                ';'.join(correct_questions),
-                ';'.join(incorrect_questions),
-                session.end_time.strftime('%Y-%m-%d %H:%M:%S') if session.end_time else ''
-            ])
 
-        return response
+                yield [
+                    user.student_id or '',
+                    user.first_name or '',
+                    user.last_name or '',
+                    user.group or '',
+                    user.teacher or '',
+                    result.raw_score,
+                    result.total_score,
+                    result.band_score,
+                    ';'.join(correct_questions),
+                    ';'.join(incorrect_questions),
+                    session.end_time.strftime('%Y-%m-%d %H:%M:%S') if session.end_time else ''
+                ]
+
+        return streaming_csv_response(f'reading_test_{test_id}_results.csv', header, rows(), bom=False)
 
 class AdminCreateStudentView(APIView):
     permission_classes = [IsAdmin]
@@ -3383,6 +3451,17 @@ class AdminCuratorsListView(APIView):
         serializer = UserSerializer(curators, many=True)
         return Response(serializer.data)
 
+class AdminRequestMetricsView(APIView):
+    """Per-route latency/query aggregates of this worker (core.request_metrics); DELETE resets them."""
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return Response(metrics_snapshot())
+
+    def delete(self, request):
+        request_metrics_registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class AdminStudentListView(ListAPIView):
     permission_classes = [IsAdmin]
     serializer_class = UserSerializer
@@ -3401,7 +3480,9 @@ class ReadingTestViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
 
     def get_serializer_class(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action == 'list':
+            return ReadingTestListSerializer
+        if self.action == 'retrieve':
             return ReadingTestReadSerializer
         return ReadingTestSerializer
 
@@ -3411,20 +3492,44 @@ class ReadingTestViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
-        from .serializers import ReadingTestReadSerializer
-        read_serializer = ReadingTestReadSerializer(self.get_object())
-        return Response(read_serializer.data, status=status.HTTP_200_OK)
+        test = self._saved_test(instance.pk)
+        if test.is_active:
+            publish_test('reading', test)
+        return Response(self._saved_structure(test), status=status.HTTP_200_OK)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         instance = serializer.save()
+        return Response(self._saved_structure(self._saved_test(instance.pk)), status=status.HTTP_201_CREATED)
+
+    def _saved_test(self, pk):
+        return ReadingTest.objects.prefetch_related('parts__questions__answer_options').get(pk=pk)
+
+    def _saved_structure(self, test):
+        # Also primes the structure cache the editor reads back right after saving
         from .serializers import ReadingTestReadSerializer
-        read_serializer = ReadingTestReadSerializer(instance)
-        return Response(read_serializer.data, status=status.HTTP_201_CREATED)
+        return get_test_structure('reading', test, lambda t: ReadingTestReadSerializer(t).data)
 
     def get_queryset(self):
-        return ReadingTest.objects.all().order_by('-created_at')
+        queryset = ReadingTest.objects.all().order_by('-created_at')
+        if self.action == 'list':
+            # The list shows counts only; the nested structure (answer keys included) is served by retrieve
+            queryset = queryset.annotate(
+                parts_count=models.Count('parts', distinct=True),
+                questions_count=models.Count('parts__questions', distinct=True),
+            )
+        return queryset
+
+    def get_permissions(self):
+        # The full structure carries the answer keys: builders only. Students read .../student/
+        if self.action == 'retrieve':
+            return [IsAdmin()]
+        return super().get_permissions()
+
+    def retrieve(self, request, *args, **kwargs):
+        test = self.get_object()
+        return structure_response(request, 'reading', test, lambda t: self.get_serializer(t).data)
 
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
@@ -3457,8 +3562,14 @@ class ReadingTestViewSet(viewsets.ModelViewSet):
         test = self.get_object()
         test.is_active = True
         test.save()
+        publish_test('reading', test)
         return Response({'message': 'Test activated successfully'})
 
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    def student(self, request, pk=None):
+        """Published student payload without answer keys (see core.published_tests)."""
+        return published_response(request, 'reading', pk)
+
     @action(detail=True, methods=['post'], permission_classes=[IsAdmin])
     def deactivate(self, request, pk=None):
         test = self.get_object()
@@ -3466,6 +3577,14 @@ class ReadingTestViewSet(viewsets.ModelViewSet):
         test.save()
         return Response({'message': 'Test deactivated successfully'})
 
+    @action(detail=True, methods=['post'], permission_classes=[IsAdmin])
+    def clone(self, request, pk=None):
+        cloned_test = clone_test(self.get_object(), 'reading')
+        return Response({
+            'message': 'Test cloned successfully',
+            'cloned_test_id': cloned_test.id,
+        }, status=status.HTTP_201_CREATED)
+
 
 class ReadingPartViewSet(viewsets.ModelViewSet):
     queryset = ReadingPart.objects.all()
@@ -3547,6 +3666,8 @@ class ReadingTestSessionView(APIView):
         )
 
         if existing_session:
+            if flush_session(ReadingTestSession, existing_session.pk):
+                existing_session.refresh_from_db()
             serializer = ReadingTestSessionSerializer(existing_session)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -3560,6 +3681,8 @@ class ReadingTestSessionView(APIView):
         """
         Submit answers for a session (finish test).
         """
+        # Buffered autosave must be in the DB before grading
+        flush_session(ReadingTestSession, session_id)
         with transaction.atomic():
             session = ReadingTestSession.objects.select_for_update().get(pk=session_id, user=request.user)
             if session.completed:
@@ -3597,7 +3720,10 @@ class ReadingTestSessionView(APIView):
     def patch(self, request, session_id):
         """
         Sync answers periodically.
+        With "seq" in the body only the changed answers are sent (delta sync).
         """
+        if 'seq' in request.data or sync_buffer_enabled():
+            return self._patch_delta(request, session_id)
         session = get_object_or_404(ReadingTestSession, pk=session_id, user=request.user)
         if session.completed:
             return Response({'error': 'Cannot sync a completed session.'}, status=status.HTTP_400_BAD_REQUEST)
@@ -3634,122 +3760,46 @@ class ReadingTestSessionView(APIView):
 
         return Response({'message': 'Progress saved'}, status=status.HTTP_200_OK)
 
+    def _patch_delta(self, request, session_id):
+        seq = None
+        if 'seq' in request.data:
+            try:
+                seq = parse_sync_seq(request.data.get('seq'))
+            except (TypeError, ValueError):
+                return Response({'error': 'seq must be a positive integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        sync = buffer_answers if sync_buffer_enabled() else apply_session_delta
+        outcome, current_seq = sync(
+            ReadingTestSession, session_id, request.user,
+            answers=request.data.get('answers'),
+            time_left=request.data.get('time_left'),
+            seq=seq,
+        )
+        if outcome == DELTA_NOT_FOUND:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if outcome == DELTA_CLOSED:
+            return Response({'error': 'Cannot sync a completed session.'}, status=status.HTTP_400_BAD_REQUEST)
+        if outcome == DELTA_STALE:
+            return Response({'error': 'Out-of-order delta.', 'seq': current_seq}, status=status.HTTP_409_CONFLICT)
+        if seq is None:
+            return Response({'message': 'Progress saved'}, status=status.HTTP_200_OK)
+        return Response({'message': 'Progress saved', 'seq': current_seq}, status=status.HTTP_200_OK)
+
     def _calculate_and_save_results(self, session):
         # Используем новую функцию create_detailed_breakdown для правильного подсчета баллов
         from .serializers import create_detailed_breakdown
         
         # Используем create_detailed_breakdown для правильного подсчета
         breakdown_result = create_detailed_breakdown(session, 'reading')
-        
-        raw_score = breakdown_result['raw_score']
-        total_possible_score = breakdown_result['total_score']
-        
-        # Преобразуем массив частей в объект с вопросами для фронтенда
-        full_breakdown = {}
-        for part in breakdown_result['breakdown']:
-            for question in part['questions']:
-                question_id = str(question['question_id'])
-                
-                # Для multiple_response вопросов создаем специальную структуру
-                if question['question_type'] == 'multiple_response':
-                    # Обрабатываем новую структуру multiple_response (один элемент с опциями)
-                    multiple_response_data = None
-                    for sub_question in question['sub_questions']:
-                        if sub_question.get('type') == 'multiple_response':
-                            multiple_response_data = sub_question
-                            break
-                    
-                    if multiple_response_data:
-                        # Используем данные из нового формата
-                        full_breakdown[question_id] = {
-                            'question_text': question['question_text'],
-                            'question_type': question['question_type'],
-                            'header': question['header'],
-                            'instruction': question['instruction'],
-                            'part_number': part.get('part_number'),
-                            'sub_questions': [{
-                                'id': question_id,
-                                'question_text': question['question_text'],
-                                'type': 'multiple_response',
-                                'options': multiple_response_data.get('options', []),
-                                'scoring_mode': multiple_response_data.get('scoring_mode', 'total'),
-                                'final_score': question['correct_sub_questions'],
-                                'max_score': question['total_sub_questions'],
-                                'is_correct': multiple_response_data.get('is_correct', False)
-                            }]
-                        }
-                    else:
-                        # Fallback для старой структуры (если она еще используется)
-                        full_breakdown[question_id] = {
-                            'question_text': question['question_text'],
-                            'question_type': question['question_type'],
-                            'header': question['header'],
-                            'instruction': question['instruction'],
-                            'part_number': part.get('part_number'),
-                            'sub_questions': [{
-                                'id': question_id,
-                                'question_text': question['question_text'],
-                                'type': 'multiple_response',
-                                'options': [],
-                                'scoring_mode': question.get('scoring_mode', 'total'),
-                                'final_score': question['correct_sub_questions'],
-                                'max_score': question['total_sub_questions']
-                            }]
-                        }
-                        
-                        # Добавляем опции из старой структуры
-                        for sub_question in question['sub_questions']:
-                            if 'sub_id' in sub_question:  # Проверяем что это старая структура
-                                full_breakdown[question_id]['sub_questions'][0]['options'].append({
-                                    'label': sub_question['sub_id'],
-                                    'text': sub_question['label'],
-                                    'is_correct_option': sub_question['correct_answer'] == 'Should be selected',
-                                    'student_selected': sub_question['user_answer'] == 'Selected',
-                                    'points': sub_question.get('points', 1)
-                                })
-                else:
-                    # Для обычных вопросов используем стандартную структуру
-                    full_breakdown[question_id] = {
-                        'question_text': question['question_text'],
-                        'question_type': question['question_type'],
-                        'header': question['header'],
-                        'instruction': question['instruction'],
-                        'part_number': part.get('part_number'),
-                        'sub_questions': question['sub_questions']
-                    }
-
-        def get_reading_band_score(raw_score, total_score=40):
-            # Официальная таблица IELTS Reading band score
-            # Приводим к стандартной шкале из 40 вопросов
-            if total_score != 40 and total_score > 0:
-                normalized_score = (raw_score / total_score) * 40
-            else:
-                normalized_score = raw_score
-            
-            # Официальная таблица IELTS Reading
-            if normalized_score >= 39: return 9.0
-            if normalized_score >= 37: return 8.5
-            if normalized_score >= 35: return 8.0
-            if normalized_score >= 33: return 7.5
-            if normalized_score >= 30: return 7.0
-            if normalized_score >= 27: return 6.5
-            if normalized_score >= 23: return 6.0
-            if normalized_score >= 19: return 5.5
-            if normalized_score >= 15: return 5.0
-            if normalized_score >= 13: return 4.5
-            if normalized_score >= 10: return 4.0
-            if normalized_score >= 8: return 3.5
-            if normalized_score >= 6: return 3.0
-            if normalized_score >= 4: return 2.5
-            return 2.0  # Минимальный band score
+        scored = build_reading_results(breakdown_result)
 
         result, created = ReadingTestResult.objects.update_or_create(
             session=session,
             defaults={
-                'raw_score': raw_score,
-                'total_score': total_possible_score,
-                'band_score': get_reading_band_score(raw_score, total_possible_score),
-                'breakdown': full_breakdown
+                'raw_score': scored['raw_score'],
+                'total_score': scored['total_score'],
+                'band_score': scored['band_score'],
+                'breakdown': scored['breakdown']
             }
         )
         return result
@@ -5089,14 +5139,9 @@ class CuratorStudentsView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher=teacher)
+            students = filter_students_by_teacher(students, teacher)
         if search:
-            students = students.filter(
-                models.Q(first_name__icontains=search) |
-                models.Q(last_name__icontains=search) |
-                models.Q(student_id__icontains=search) |
-                models.Q(email__icontains=search)
-            )
+            students = search_users(students, search)
         
         # Get unique groups and teachers for filter options
         groups = User.objects.filter(role='student').values_list('group', flat=True).distinct().exclude(group__isnull=True).exclude(group='')
@@ -5115,9 +5160,45 @@ class CuratorStudentsView(APIView):
         if reading_test_id:
             active_reading_tests = active_reading_tests.filter(id=reading_test_id)
         
+        # Without test/date filters counts and last activity come from the rollups
+        use_rollups = not (
+            writing_prompt_id or writing_test_id or listening_test_id or reading_test_id
+            or request.query_params.get('date_from') or request.query_params.get('date_to')
+        )
+        # Same scoping as the queries below: active tests, essays of active prompts
+        rollups = rollup_totals(students, active_only=True, essays=ESSAYS_OF_PROMPTS) if use_rollups else None
+
         # Get basic student info with last activity
         students_data = []
         for student in students:
+            if rollups is not None:
+                student_rollups = rollups.get(student.id, {})
+                test_counts = {
+                    module: student_rollups.get(module, {}).get('attempts', 0)
+                    for module in ('writing', 'listening', 'reading')
+                }
+                last_activities = [
+                    (module, student_rollups[module]['last_activity'])
+                    for module in ('writing', 'listening', 'reading')
+                    if module in student_rollups and student_rollups[module]['last_activity']
+                ]
+                last_activity = max(last_activities, key=lambda x: x[1]) if last_activities else None
+                students_data.append({
+                    'id': student.id,
+                    'student_id': student.student_id,
+                    'first_name': student.first_name,
+                    'last_name': student.last_name,
+                    'email': student.email,
+                    'group': student.group,
+                    'teacher': student.teacher,
+                    'test_counts': test_counts,
+                    'last_activity': {
+                        'type': last_activity[0] if last_activity else None,
+                        'date': last_activity[1] if last_activity else None
+                    }
+                })
+                continue
+
             writing_qs = apply_date_range_filter(
                 Essay.objects.filter(user=student, prompt__in=active_writing_prompts),
                 request,
@@ -5182,182 +5263,149 @@ class CuratorStudentsView(APIView):
         })
 
 
+def curator_student_queryset(request):
+    """Active students narrowed by the curator list filters (group, teacher, search)."""
+    group = request.query_params.get('group')
+    teacher = request.query_params.get('teacher')
+    search = request.query_params.get('search')
+
+    students = User.objects.filter(role='student', is_active=True)
+    if group:
+        students = students.filter(group=group)
+    if teacher:
+        students = filter_students_by_teacher(students, teacher)
+    if search:
+        search = search.strip()
+        if search:
+            students = search_users(students, search)
+    return students
+
+
+def _latest_activity_subquery(queryset, user_field, field_name):
+    """Per-student Max(field_name) of a queryset already filtered on ``user_field=OuterRef('pk')``."""
+    return models.Subquery(
+        queryset.order_by().values(user_field).annotate(latest=models.Max(field_name)).values('latest')[:1],
+        output_field=models.DateTimeField(),
+    )
+
+
+def annotate_last_activity(students):
+    """
+    Adds ``last_activity_at``: the latest essay, listening, reading or speaking
+    timestamp of each student, or None without any activity.
+    """
+    latest = [
+        _latest_activity_subquery(
+            Essay.objects.filter(user=models.OuterRef('pk'), test_session__is_diagnostic=False),
+            'user', 'submitted_at'
+        ),
+        _latest_activity_subquery(
+            ListeningTestSession.objects.filter(user=models.OuterRef('pk'), is_diagnostic=False),
+            'user', 'completed_at'
+        ),
+        _latest_activity_subquery(
+            ReadingTestSession.objects.filter(user=models.OuterRef('pk'), is_diagnostic=False),
+            'user', 'end_time'
+        ),
+        _latest_activity_subquery(
+            SpeakingSession.objects.filter(student=models.OuterRef('pk')),
+            'student', 'conducted_at'
+        ),
+    ]
+    if connection.vendor == 'postgresql':
+        # PostgreSQL's GREATEST skips NULLs (modules without sessions)
+        return students.annotate(last_activity_at=Greatest(*latest))
+    # Elsewhere (SQLite) any NULL argument makes the result NULL: coalescing every term
+    # with the others keeps modules without sessions out, and all-NULL stays NULL
+    return students.annotate(last_activity_at=Greatest(*[
+        Coalesce(term, *[other for other in latest if other is not term])
+        for term in latest
+    ]))
+
+
+def paginate_curator_students(request, students, serialize):
+    """Slices an ordered student queryset in the DB and builds the curator list response."""
+    page = int(request.query_params.get('page', 1))
+    page_size = int(request.query_params.get('page_size', 10))
+
+    total_count = students.count()
+    start = max((page - 1) * page_size, 0)
+    paginated = students[start:start + page_size] if page_size > 0 else []
+
+    return Response({
+        'students': [serialize(student) for student in paginated],
+        'count': total_count,
+        'page': page,
+        'page_size': page_size,
+        'total_pages': (total_count + page_size - 1) // page_size if page_size > 0 else 1
+    })
+
+
+def _curator_student_row(student):
+    first_name = student.first_name or ''
+    last_name = student.last_name or ''
+    name = f"{first_name} {last_name}".strip() or f"Student {student.student_id or student.id}"
+    return {
+        'id': student.id,
+        'student_id': student.student_id or '',
+        'name': name,
+        'group': student.group or '',
+        'teacher': student.teacher or '',
+        'last_activity': timezone.localtime(student.last_activity_at).isoformat() if student.last_activity_at else None,
+    }
+
+
 class CuratorMissingTestsView(APIView):
     permission_classes = [IsTeacherOrCurator]
 
     def get(self, request):
-        group = request.query_params.get('group')
-        teacher = request.query_params.get('teacher')
-        search = request.query_params.get('search')
-        page = int(request.query_params.get('page', 1))
-        page_size = int(request.query_params.get('page_size', 10))
-        
-        students = User.objects.filter(role='student', is_active=True)
-        if group:
-            students = students.filter(group=group)
-        if teacher:
-            students = students.filter(teacher=teacher)
-        if search:
-            search = search.strip()
-            if search:
-                students = students.filter(
-                    models.Q(first_name__icontains=search) |
-                    models.Q(last_name__icontains=search) |
-                    models.Q(student_id__icontains=search) |
-                    models.Q(email__icontains=search)
-                )
-
-        missing_list = []
-        for student in students:
-            writing_qs = apply_date_range_filter(
-                Essay.objects.filter(user=student, test_session__is_diagnostic=False),
+        students = curator_student_queryset(request).annotate(
+            has_writing=models.Exists(apply_date_range_filter(
+                Essay.objects.filter(user=models.OuterRef('pk'), test_session__is_diagnostic=False),
                 request,
                 'submitted_at'
-            )
-            listening_qs = apply_date_range_filter(
-                ListeningTestSession.objects.filter(user=student, submitted=True, is_diagnostic=False),
+            )),
+            has_listening=models.Exists(apply_date_range_filter(
+                ListeningTestSession.objects.filter(user=models.OuterRef('pk'), submitted=True, is_diagnostic=False),
                 request,
                 'completed_at'
-            )
-            reading_qs = apply_date_range_filter(
-                ReadingTestSession.objects.filter(user=student, completed=True, is_diagnostic=False),
+            )),
+            has_reading=models.Exists(apply_date_range_filter(
+                ReadingTestSession.objects.filter(user=models.OuterRef('pk'), completed=True, is_diagnostic=False),
                 request,
                 'end_time'
-            )
-
-            missing = []
-            if writing_qs.count() == 0:
-                missing.append('writing')
-            if listening_qs.count() == 0:
-                missing.append('listening')
-            if reading_qs.count() == 0:
-                missing.append('reading')
-
-            if missing:
-                last_activity = self._last_activity(student)
-                first_name = student.first_name or ''
-                last_name = student.last_name or ''
-                name = f"{first_name} {last_name}".strip() or f"Student {student.student_id or student.id}"
-                missing_list.append({
-                    'id': student.id,
-                    'student_id': student.student_id or '',
-                    'name': name,
-                    'group': student.group or '',
-                    'teacher': student.teacher or '',
-                    'missing_modules': missing,
-                    'last_activity': last_activity
-                })
-
-        total_count = len(missing_list)
-        start = (page - 1) * page_size
-        end = start + page_size
-        paginated_list = missing_list[start:end]
-
-        return Response({
-            'students': paginated_list,
-            'count': total_count,
-            'page': page,
-            'page_size': page_size,
-            'total_pages': (total_count + page_size - 1) // page_size if page_size > 0 else 1
-        })
-
-    def _last_activity(self, student):
-        activity_times = []
-        essays = Essay.objects.filter(user=student, test_session__is_diagnostic=False).order_by('-submitted_at').first()
-        if essays and essays.submitted_at:
-            activity_times.append(essays.submitted_at)
-        listen = ListeningTestSession.objects.filter(user=student, is_diagnostic=False).order_by('-completed_at').first()
-        if listen and listen.completed_at:
-            activity_times.append(listen.completed_at)
-        read = ReadingTestSession.objects.filter(user=student, is_diagnostic=False).order_by('-end_time').first()
-        if read and read.end_time:
-            activity_times.append(read.end_time)
-        speak = SpeakingSession.objects.filter(student=student).order_by('-conducted_at').first()
-        if speak and speak.conducted_at:
-            activity_times.append(speak.conducted_at)
-        if not activity_times:
-            return None
-        latest = max(activity_times)
-        return timezone.localtime(latest).isoformat()
+            )),
+        ).filter(
+            models.Q(has_writing=False) | models.Q(has_listening=False) | models.Q(has_reading=False)
+        )
+        students = annotate_last_activity(students).order_by('id')
+        return paginate_curator_students(request, students, self._row)
+
+    def _row(self, student):
+        row = _curator_student_row(student)
+        row['missing_modules'] = [
+            module for module, present in (
+                ('writing', student.has_writing),
+                ('listening', student.has_listening),
+                ('reading', student.has_reading),
+            ) if not present
+        ]
+        return row
 
 
 class CuratorMissingSpeakingView(APIView):
     permission_classes = [IsTeacherOrCurator]
 
     def get(self, request):
-        group = request.query_params.get('group')
-        teacher = request.query_params.get('teacher')
-        search = request.query_params.get('search')
-        page = int(request.query_params.get('page', 1))
-        page_size = int(request.query_params.get('page_size', 10))
-        
-        students = User.objects.filter(role='student', is_active=True)
-        if group:
-            students = students.filter(group=group)
-        if teacher:
-            students = students.filter(teacher=teacher)
-        if search:
-            search = search.strip()
-            if search:
-                students = students.filter(
-                    models.Q(first_name__icontains=search) |
-                    models.Q(last_name__icontains=search) |
-                    models.Q(student_id__icontains=search) |
-                    models.Q(email__icontains=search)
-                )
-
-        missing_list = []
-        for student in students:
-            speaking_qs = apply_date_range_filter(
-                SpeakingSession.objects.filter(student=student, completed=True),
+        students = curator_student_queryset(request).annotate(
+            has_speaking=models.Exists(apply_date_range_filter(
+                SpeakingSession.objects.filter(student=models.OuterRef('pk'), completed=True),
                 request,
                 'conducted_at'
-            )
-            if speaking_qs.count() == 0:
-                last_activity = self._last_activity(student)
-                first_name = student.first_name or ''
-                last_name = student.last_name or ''
-                name = f"{first_name} {last_name}".strip() or f"Student {student.student_id or student.id}"
-                missing_list.append({
-                    'id': student.id,
-                    'student_id': student.student_id or '',
-                    'name': name,
-                    'group': student.group or '',
-                    'teacher': student.teacher or '',
-                    'last_activity': last_activity
-                })
-
-        total_count = len(missing_list)
-        start = (page - 1) * page_size
-        end = start + page_size
-        paginated_list = missing_list[start:end]
-
-        return Response({
-            'students': paginated_list,
-            'count': total_count,
-            'page': page,
-            'page_size': page_size,
-            'total_pages': (total_count + page_size - 1) // page_size if page_size > 0 else 1
-        })
-
-    def _last_activity(self, student):
-        activity_times = []
-        essays = Essay.objects.filter(user=student, test_session__is_diagnostic=False).order_by('-submitted_at').first()
-        if essays and essays.submitted_at:
-            activity_times.append(essays.submitted_at)
-        listen = ListeningTestSession.objects.filter(user=student, is_diagnostic=False).order_by('-completed_at').first()
-        if listen and listen.completed_at:
-            activity_times.append(listen.completed_at)
-        read = ReadingTestSession.objects.filter(user=student, is_diagnostic=False).order_by('-end_time').first()
-        if read and read.end_time:
-            activity_times.append(read.end_time)
-        speak = SpeakingSession.objects.filter(student=student).order_by('-conducted_at').first()
-        if speak and speak.conducted_at:
-            activity_times.append(speak.conducted_at)
-        if not activity_times:
-            return None
-        latest = max(activity_times)
-        return timezone.localtime(latest).isoformat()
+            )),
+        ).filter(has_speaking=False)
+        students = annotate_last_activity(students).order_by('id')
+        return paginate_curator_students(request, students, _curator_student_row)
 
 
 class CuratorStudentDetailView(APIView):
@@ -5384,6 +5432,8 @@ class CuratorStudentDetailView(APIView):
                 return None
             return result_model.objects.filter(session=session).first()
 
+        latest_listening = latest_result(listening_qs, ListeningTestResult, 'completed_at')
+        latest_reading = latest_result(reading_qs, ReadingTestResult, 'end_time')
         detail = {
             'student': {
                 'id': student.id,
@@ -5403,16 +5453,16 @@ class CuratorStudentDetailView(APIView):
                 'listening': {
                     'sessions': listening_qs.count(),
                     'latest': {
-                        'score': latest_result(listening_qs, ListeningTestResult, 'completed_at').score if latest_result(listening_qs, ListeningTestResult, 'completed_at') else None,
-                        'band': latest_result(listening_qs, ListeningTestResult, 'completed_at').band_score if latest_result(listening_qs, ListeningTestResult, 'completed_at') else None,
+                        'score': latest_listening.raw_score if latest_listening else None,
+                        'band': latest_listening.band_score if latest_listening else None,
                         'completed_at': listening_qs.order_by('-completed_at').values_list('completed_at', flat=True).first()
                     }
                 },
                 'reading': {
                     'sessions': reading_qs.count(),
                     'latest': {
-                        'raw_score': latest_result(reading_qs, ReadingTestResult, 'end_time').raw_score if latest_result(reading_qs, ReadingTestResult, 'end_time') else None,
-                        'band_score': latest_result(reading_qs, ReadingTestResult, 'end_time').band_score if latest_result(reading_qs, ReadingTestResult, 'end_time') else None,
+                        'raw_score': latest_reading.raw_score if latest_reading else None,
+                        'band_score': latest_reading.band_score if latest_reading else None,
                         'end_time': reading_qs.order_by('-end_time').values_list('end_time', flat=True).first()
                     }
                 },
@@ -5460,7 +5510,7 @@ class CuratorWritingOverviewView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher=teacher)
+            students = filter_students_by_teacher(students, teacher)
         
         total_students = students.count()
         # Новый режим: отталкиваемся от WritingTestSession
@@ -5650,7 +5700,7 @@ class CuratorListeningOverviewView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher=teacher)
+            students = filter_students_by_teacher(students, teacher)
         
         # Get Listening statistics
         total_students = students.count()
@@ -5784,7 +5834,7 @@ class CuratorReadingOverviewView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher=teacher)
+            students = filter_students_by_teacher(students, teacher)
         
         # Get Reading statistics
         total_students = students.count()
@@ -5909,7 +5959,7 @@ class CuratorOverviewView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher=teacher)
+            students = filter_students_by_teacher(students, teacher)
         
         total_students = students.count()
         
@@ -5970,13 +6020,36 @@ class CuratorOverviewView(APIView):
         speaking_completed = speaking_sessions.filter(completed=True).count()
         speaking_pending = speaking_sessions.filter(completed=False).count()
         
+        # Without test/date filters the per-student numbers come from the rollups
+        use_rollups = not (
+            writing_test_id or listening_test_id or reading_test_id
+            or request.query_params.get('date_from') or request.query_params.get('date_to')
+        )
+        # Same scoping as the session querysets above: active tests, essays of active writing tests
+        rollups = rollup_totals(students, active_only=True, essays=ESSAYS_OF_SESSIONS) if use_rollups else None
+
         # Average scores
-        avg_writing_score = essays.aggregate(avg=models.Avg('overall_band'))['avg'] or 0
-        # Use band_score from ListeningTestResult instead of raw score from session
-        listening_results = ListeningTestResult.objects.filter(session__in=listening_sessions)
-        avg_listening_score = listening_results.aggregate(avg=models.Avg('band_score'))['avg'] or 0
-        avg_reading_score = ReadingTestResult.objects.filter(session__in=reading_sessions).aggregate(avg=models.Avg('band_score'))['avg'] or 0
-        avg_speaking_score = speaking_sessions.aggregate(avg=models.Avg('overall_band_score'))['avg'] or 0
+        if rollups is not None:
+            module_totals = {m: {'band_sum': 0, 'band_count': 0} for m in ROLLUP_MODULES}
+            completed_students = {m: set() for m in ROLLUP_MODULES}
+            for student_id, student_rollups in rollups.items():
+                for module, totals in student_rollups.items():
+                    module_totals[module]['band_sum'] += totals['band_sum']
+                    module_totals[module]['band_count'] += totals['band_count']
+                    # Writing counts as completed once an essay is scored, the rest once submitted
+                    if totals['band_count'] if module == 'writing' else totals['attempts']:
+                        completed_students[module].add(student_id)
+            avg_writing_score = rollup_mean(module_totals['writing']) or 0
+            avg_listening_score = rollup_mean(module_totals['listening']) or 0
+            avg_reading_score = rollup_mean(module_totals['reading']) or 0
+            avg_speaking_score = rollup_mean(module_totals['speaking']) or 0
+        else:
+            avg_writing_score = essays.aggregate(avg=models.Avg('overall_band'))['avg'] or 0
+            # Use band_score from ListeningTestResult instead of raw score from session
+            listening_results = ListeningTestResult.objects.filter(session__in=listening_sessions)
+            avg_listening_score = listening_results.aggregate(avg=models.Avg('band_score'))['avg'] or 0
+            avg_reading_score = ReadingTestResult.objects.filter(session__in=reading_sessions).aggregate(avg=models.Avg('band_score'))['avg'] or 0
+            avg_speaking_score = speaking_sessions.aggregate(avg=models.Avg('overall_band_score'))['avg'] or 0
         
         # Submission statistics by test
         writing_submissions = writing_sessions.count()
@@ -6019,18 +6092,24 @@ class CuratorOverviewView(APIView):
         }
         
         # Completion rates - count unique students who completed each test
-        writing_completed_students = students.filter(
-            id__in=essays.filter(overall_band__isnull=False).values('user')
-        ).count()
-        listening_completed_students = students.filter(
-            id__in=listening_sessions.filter(submitted=True).values('user')
-        ).count()
-        reading_completed_students = students.filter(
-            id__in=reading_sessions.filter(completed=True).values('user')
-        ).count()
-        speaking_completed_students = students.filter(
-            id__in=speaking_sessions.filter(completed=True).values('student')
-        ).count()
+        if rollups is not None:
+            writing_completed_students = len(completed_students['writing'])
+            listening_completed_students = len(completed_students['listening'])
+            reading_completed_students = len(completed_students['reading'])
+            speaking_completed_students = len(completed_students['speaking'])
+        else:
+            writing_completed_students = students.filter(
+                id__in=essays.filter(overall_band__isnull=False).values('user')
+            ).count()
+            listening_completed_students = students.filter(
+                id__in=listening_sessions.filter(submitted=True).values('user')
+            ).count()
+            reading_completed_students = students.filter(
+                id__in=reading_sessions.filter(completed=True).values('user')
+            ).count()
+            speaking_completed_students = students.filter(
+                id__in=speaking_sessions.filter(completed=True).values('student')
+            ).count()
         
         writing_rate = round((writing_completed_students / total_students * 100), 1) if total_students > 0 else 0
         listening_rate = round((listening_completed_students / total_students * 100), 1) if total_students > 0 else 0
@@ -6181,70 +6260,74 @@ class CuratorOverviewView(APIView):
                             'last_activity': latest_session.end_time.strftime('%Y-%m-%d %H:%M:%S') if latest_session and latest_session.end_time else None
                         })
 
-        # Group statistics
-        group_stats = []
-        for group_name in students.values_list('group', flat=True).distinct():
-            if group_name:
-                group_students = students.filter(group=group_name)
-                # Count unique students who completed each test type
-                group_writing_students = group_students.filter(
-                    id__in=essays.filter(overall_band__isnull=False).values('user')
-                ).count()
-                group_listening_students = group_students.filter(
-                    id__in=listening_sessions.filter(submitted=True).values('user')
-                ).count()
-                group_reading_students = group_students.filter(
-                    id__in=reading_sessions.filter(completed=True).values('user')
-                ).count()
-                group_speaking_students = group_students.filter(
-                    id__in=speaking_sessions.filter(completed=True).values('student')
-                ).count()
+        if rollups is not None:
+            group_stats = _rollup_completion_stats(students, 'group', completed_students)
+            teacher_stats = _rollup_completion_stats(students, 'teacher', completed_students)
+        else:
+            # Group statistics
+            group_stats = []
+            for group_name in students.values_list('group', flat=True).distinct():
+                if group_name:
+                    group_students = students.filter(group=group_name)
+                    # Count unique students who completed each test type
+                    group_writing_students = group_students.filter(
+                        id__in=essays.filter(overall_band__isnull=False).values('user')
+                    ).count()
+                    group_listening_students = group_students.filter(
+                        id__in=listening_sessions.filter(submitted=True).values('user')
+                    ).count()
+                    group_reading_students = group_students.filter(
+                        id__in=reading_sessions.filter(completed=True).values('user')
+                    ).count()
+                    group_speaking_students = group_students.filter(
+                        id__in=speaking_sessions.filter(completed=True).values('student')
+                    ).count()
                 
-                group_stats.append({
-                    'group': group_name,
-                    'total_students': group_students.count(),
-                    'writing_completed': group_writing_students,
-                    'listening_completed': group_listening_students,
-                    'reading_completed': group_reading_students,
-                    'speaking_completed': group_speaking_students,
-                    'writing_rate': round((group_writing_students / group_students.count() * 100), 1) if group_students.count() > 0 else 0,
-                    'listening_rate': round((group_listening_students / group_students.count() * 100), 1) if group_students.count() > 0 else 0,
-                    'reading_rate': round((group_reading_students / group_students.count() * 100), 1) if group_students.count() > 0 else 0,
-                    'speaking_rate': round((group_speaking_students / group_students.count() * 100), 1) if group_students.count() > 0 else 0
-                })
-        
-        # Teacher statistics
-        teacher_stats = []
-        for teacher_name in students.values_list('teacher', flat=True).distinct():
-            if teacher_name:
-                teacher_students = students.filter(teacher=teacher_name)
-                # Count unique students who completed each test type
-                teacher_writing_students = teacher_students.filter(
-                    id__in=essays.filter(overall_band__isnull=False).values('user')
-                ).count()
-                teacher_listening_students = teacher_students.filter(
-                    id__in=listening_sessions.filter(submitted=True).values('user')
-                ).count()
-                teacher_reading_students = teacher_students.filter(
-                    id__in=reading_sessions.filter(completed=True).values('user')
-                ).count()
-                teacher_speaking_students = teacher_students.filter(
-                    id__in=speaking_sessions.filter(completed=True).values('student')
-                ).count()
+                    group_stats.append({
+                        'group': group_name,
+                        'total_students': group_students.count(),
+                        'writing_completed': group_writing_students,
+                        'listening_completed': group_listening_students,
+                        'reading_completed': group_reading_students,
+                        'speaking_completed': group_speaking_students,
+                        'writing_rate': round((group_writing_students / group_students.count() * 100), 1) if group_students.count() > 0 else 0,
+                        'listening_rate': round((group_listening_students / group_students.count() * 100), 1) if group_students.count() > 0 else 0,
+                        'reading_rate': round((group_reading_students / group_students.count() * 100), 1) if group_students.count() > 0 else 0,
+                        'speaking_rate': round((group_speaking_students / group_students.count() * 100), 1) if group_students.count() > 0 else 0
+                    })
+        
+            # Teacher statistics
+            teacher_stats = []
+            for teacher_name in students.values_list('teacher', flat=True).distinct():
+                if teacher_name:
+                    teacher_students = students.filter(teacher=teacher_name)
+                    # Count unique students who completed each test type
+                    teacher_writing_students = teacher_students.filter(
+                        id__in=essays.filter(overall_band__isnull=False).values('user')
+                    ).count()
+                    teacher_listening_students = teacher_students.filter(
+                        id__in=listening_sessions.filter(submitted=True).values('user')
+                    ).count()
+                    teacher_reading_students = teacher_students.filter(
+                        id__in=reading_sessions.filter(completed=True).values('user')
+                    ).count()
+                    teacher_speaking_students = teacher_students.filter(
+                        id__in=speaking_sessions.filter(completed=True).values('student')
+                    ).count()
                 
-                teacher_stats.append({
-                    'teacher': teacher_name,
-                    'total_students': teacher_students.count(),
-                    'writing_completed': teacher_writing_students,
-                    'listening_completed': teacher_listening_students,
-                    'reading_completed': teacher_reading_students,
-                    'speaking_completed': teacher_speaking_students,
-                    'writing_rate': round((teacher_writing_students / teacher_students.count() * 100), 1) if teacher_students.count() > 0 else 0,
-                    'listening_rate': round((teacher_listening_students / teacher_students.count() * 100), 1) if teacher_students.count() > 0 else 0,
-                    'reading_rate': round((teacher_reading_students / teacher_students.count() * 100), 1) if teacher_students.count() > 0 else 0,
-                    'speaking_rate': round((teacher_speaking_students / teacher_students.count() * 100), 1) if teacher_students.count() > 0 else 0
-                })
-        
+                    teacher_stats.append({
+                        'teacher': teacher_name,
+                        'total_students': teacher_students.count(),
+                        'writing_completed': teacher_writing_students,
+                        'listening_completed': teacher_listening_students,
+                        'reading_completed': teacher_reading_students,
+                        'speaking_completed': teacher_speaking_students,
+                        'writing_rate': round((teacher_writing_students / teacher_students.count() * 100), 1) if teacher_students.count() > 0 else 0,
+                        'listening_rate': round((teacher_listening_students / teacher_students.count() * 100), 1) if teacher_students.count() > 0 else 0,
+                        'reading_rate': round((teacher_reading_students / teacher_students.count() * 100), 1) if teacher_students.count() > 0 else 0,
+                        'speaking_rate': round((teacher_speaking_students / teacher_students.count() * 100), 1) if teacher_students.count() > 0 else 0
+                    })
+
         return Response({
             'overview': {
                 'total_students': total_students,
@@ -6292,14 +6375,9 @@ class CuratorWeeklyOverviewView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher=teacher)
+            students = filter_students_by_teacher(students, teacher)
         if search:
-            students = students.filter(
-                models.Q(first_name__icontains=search) |
-                models.Q(last_name__icontains=search) |
-                models.Q(student_id__icontains=search) |
-                models.Q(email__icontains=search)
-            )
+            students = search_users(students, search)
 
         students = students.order_by('group', 'teacher', 'first_name', 'last_name')
 
@@ -6318,88 +6396,129 @@ class CuratorWeeklyOverviewView(APIView):
             reading_sessions = reading_sessions.filter(test_id=reading_test_id)
         reading_sessions = apply_date_range_filter(reading_sessions, request, 'end_time')
 
-        essays = Essay.objects.filter(test_session__in=writing_sessions)
+        student_map = {}
+        total_students = 0
+        latest_writing_session = {}
+        latest_writing_essay = {}
 
-        listening_results = ListeningTestResult.objects.filter(session__in=listening_sessions)
-        reading_results = ReadingTestResult.objects.filter(session__in=reading_sessions)
-        teacher_feedbacks = TeacherFeedback.objects.filter(essay__in=essays)
+        if not (writing_test_id or listening_test_id or reading_test_id or has_date_filter):
+            # Whole history: read the precomputed per-week rollups instead of every session
+            rollups = rollup_totals(students, include_diagnostic=False, essays=ESSAYS_OF_SESSIONS)
+            student_rows = students.annotate(
+                latest_writing_session_id=models.Subquery(
+                    WritingTestSession.objects.filter(user=models.OuterRef('pk'), is_diagnostic=False)
+                    .order_by('-started_at').values('id')[:1]
+                ),
+                latest_writing_essay_id=models.Subquery(
+                    Essay.objects.filter(user=models.OuterRef('pk'), test_session__is_diagnostic=False)
+                    .order_by('-submitted_at').values('id')[:1]
+                ),
+            )
+            for s in student_rows:
+                total_students += 1
+                student_rollups = rollups.get(s.id, {})
+                listening = student_rollups.get('listening')
+                reading = student_rollups.get('reading')
+                writing = student_rollups.get('writing')
+                listening_mean = rollup_mean(listening)
+                reading_mean = rollup_mean(reading)
+                writing_teacher_mean = rollup_mean(writing, 'teacher_band')
+                student_map[s.id] = {
+                    'id': s.id,
+                    'student_id': s.student_id,
+                    'first_name': s.first_name,
+                    'last_name': s.last_name,
+                    'group': s.group,
+                    'teacher': s.teacher,
+                    'listening_bands': [listening_mean] if listening_mean is not None else [],
+                    'reading_bands': [reading_mean] if reading_mean is not None else [],
+                    'writing_teacher_scores': [writing_teacher_mean] if writing_teacher_mean is not None else [],
+                    'has_listening_attempt': bool(listening and listening['attempts']),
+                    'has_reading_attempt': bool(reading and reading['attempts']),
+                    'has_writing_attempt': bool(writing and writing['attempts']),
+                    'has_writing_feedback': bool(writing and writing['feedback_count']),
+                    'latest_writing_session_id': s.latest_writing_session_id,
+                    'latest_writing_essay_id': s.latest_writing_essay_id,
+                }
+        else:
+            essays = Essay.objects.filter(test_session__in=writing_sessions)
 
-        active_student_ids = set()
-        active_student_ids.update(writing_sessions.values_list('user_id', flat=True))
-        active_student_ids.update(listening_sessions.values_list('user_id', flat=True))
-        active_student_ids.update(reading_sessions.values_list('user_id', flat=True))
+            listening_results = ListeningTestResult.objects.filter(session__in=listening_sessions)
+            reading_results = ReadingTestResult.objects.filter(session__in=reading_sessions)
+            teacher_feedbacks = TeacherFeedback.objects.filter(essay__in=essays)
 
-        student_map = {}
-        total_students = 0
-        for s in students:
-            if has_date_filter and s.id not in active_student_ids:
-                continue
-            total_students += 1
-            student_map[s.id] = {
-                'id': s.id,
-                'student_id': s.student_id,
-                'first_name': s.first_name,
-                'last_name': s.last_name,
-                'group': s.group,
-                'teacher': s.teacher,
-                'listening_bands': [],
-                'reading_bands': [],
-                'writing_teacher_scores': [],
-                'has_listening_attempt': False,
-                'has_reading_attempt': False,
-                'has_writing_attempt': False,
-                'has_writing_feedback': False,
-                'latest_writing_session_id': None,
-                'latest_writing_essay_id': None,
-            }
+            active_student_ids = set()
+            active_student_ids.update(writing_sessions.values_list('user_id', flat=True))
+            active_student_ids.update(listening_sessions.values_list('user_id', flat=True))
+            active_student_ids.update(reading_sessions.values_list('user_id', flat=True))
 
-        latest_writing_session = {}
-        for sess in writing_sessions.only('id', 'user_id', 'started_at'):
-            cur = latest_writing_session.get(sess.user_id)
-            if not cur or (sess.started_at and cur.started_at and sess.started_at > cur.started_at) or (sess.started_at and not cur):
-                latest_writing_session[sess.user_id] = sess
+            for s in students:
+                if has_date_filter and s.id not in active_student_ids:
+                    continue
+                total_students += 1
+                student_map[s.id] = {
+                    'id': s.id,
+                    'student_id': s.student_id,
+                    'first_name': s.first_name,
+                    'last_name': s.last_name,
+                    'group': s.group,
+                    'teacher': s.teacher,
+                    'listening_bands': [],
+                    'reading_bands': [],
+                    'writing_teacher_scores': [],
+                    'has_listening_attempt': False,
+                    'has_reading_attempt': False,
+                    'has_writing_attempt': False,
+                    'has_writing_feedback': False,
+                    'latest_writing_session_id': None,
+                    'latest_writing_essay_id': None,
+                }
 
-        latest_writing_essay = {}
-        for es in essays.only('id', 'user_id', 'submitted_at'):
-            cur = latest_writing_essay.get(es.user_id)
-            if not cur or (es.submitted_at and cur.submitted_at and es.submitted_at > cur.submitted_at) or (es.submitted_at and not cur):
-                latest_writing_essay[es.user_id] = es
-
-        for sess in listening_sessions.only('id', 'user_id'):
-            data = student_map.get(sess.user_id)
-            if data:
-                data['has_listening_attempt'] = True
-
-        for sess in reading_sessions.only('id', 'user_id'):
-            data = student_map.get(sess.user_id)
-            if data:
-                data['has_reading_attempt'] = True
-
-        for es in essays.only('id', 'user_id'):
-            data = student_map.get(es.user_id)
-            if data:
-                data['has_writing_attempt'] = True
-
-        for res in listening_results.select_related('session__user'):
-            user_id = res.session.user_id
-            data = student_map.get(user_id)
-            if data and res.band_score is not None:
-                data['listening_bands'].append(res.band_score)
-
-        for res in reading_results.select_related('session__user'):
-            user_id = res.session.user_id
-            data = student_map.get(user_id)
-            if data and res.band_score is not None:
-                data['reading_bands'].append(res.band_score)
-
-        for fb in teacher_feedbacks.select_related('essay__user'):
-            user_id = fb.essay.user_id
-            data = student_map.get(user_id)
-            if not data:
-                continue
-            data['has_writing_feedback'] = True
-            if fb.teacher_overall_score is not None:
-                data['writing_teacher_scores'].append(fb.teacher_overall_score)
+            for sess in writing_sessions.only('id', 'user_id', 'started_at'):
+                cur = latest_writing_session.get(sess.user_id)
+                if not cur or (sess.started_at and cur.started_at and sess.started_at > cur.started_at) or (sess.started_at and not cur):
+                    latest_writing_session[sess.user_id] = sess
+
+            for es in essays.only('id', 'user_id', 'submitted_at'):
+                cur = latest_writing_essay.get(es.user_id)
+                if not cur or (es.submitted_at and cur.submitted_at and es.submitted_at > cur.submitted_at) or (es.submitted_at and not cur):
+                    latest_writing_essay[es.user_id] = es
+
+            for sess in listening_sessions.only('id', 'user_id'):
+                data = student_map.get(sess.user_id)
+                if data:
+                    data['has_listening_attempt'] = True
+
+            for sess in reading_sessions.only('id', 'user_id'):
+                data = student_map.get(sess.user_id)
+                if data:
+                    data['has_reading_attempt'] = True
+
+            for es in essays.only('id', 'user_id'):
+                data = student_map.get(es.user_id)
+                if data:
+                    data['has_writing_attempt'] = True
+
+            for res in listening_results.select_related('session__user'):
+                user_id = res.session.user_id
+                data = student_map.get(user_id)
+                if data and res.band_score is not None:
+                    data['listening_bands'].append(res.band_score)
+
+            for res in reading_results.select_related('session__user'):
+                user_id = res.session.user_id
+                data = student_map.get(user_id)
+                if data and res.band_score is not None:
+                    data['reading_bands'].append(res.band_score)
+
+            for fb in teacher_feedbacks.select_related('essay__user'):
+                user_id = fb.essay.user_id
+                data = student_map.get(user_id)
+                if not data:
+                    continue
+                data['has_writing_feedback'] = True
+                if fb.teacher_overall_score is not None:
+                    data['writing_teacher_scores'].append(fb.teacher_overall_score)
 
         def module_status(has_attempt, band):
             if band is not None:
@@ -6668,16 +6787,11 @@ class CuratorGroupsRankingView(APIView):
         if group_filter:
             students = students.filter(group=group_filter)
         if teacher_filter:
-            students = students.filter(teacher=teacher_filter)
+            students = filter_students_by_teacher(students, teacher_filter)
         if search:
             search = search.strip()
             if search:
-                students = students.filter(
-                    models.Q(first_name__icontains=search) |
-                    models.Q(last_name__icontains=search) |
-                    models.Q(student_id__icontains=search) |
-                    models.Q(email__icontains=search)
-                )
+                students = search_users(students, search)
 
         students = students.order_by('group', 'teacher', 'first_name', 'last_name')
 
@@ -6696,38 +6810,55 @@ class CuratorGroupsRankingView(APIView):
             reading_sessions = reading_sessions.filter(test_id=reading_test_id)
         reading_sessions = apply_date_range_filter(reading_sessions, request, 'end_time')
 
-        essays = Essay.objects.filter(test_session__in=writing_sessions)
-        listening_results = ListeningTestResult.objects.filter(session__in=listening_sessions)
-        reading_results = ReadingTestResult.objects.filter(session__in=reading_sessions)
-        teacher_feedbacks = TeacherFeedback.objects.filter(essay__in=essays)
-
         student_map = {}
-        for s in students:
-            student_map[s.id] = {
-                'id': s.id,
-                'group': s.group or '',
-                'listening_bands': [],
-                'reading_bands': [],
-                'writing_teacher_scores': [],
-            }
+        has_date_filter = bool(request.query_params.get('date_from') or request.query_params.get('date_to'))
+        if not (writing_test_id or listening_test_id or reading_test_id or has_date_filter):
+            # Whole history: read the precomputed per-week rollups instead of every session
+            rollups = rollup_totals(students, include_diagnostic=False, essays=ESSAYS_OF_SESSIONS)
+            for s in students:
+                student_rollups = rollups.get(s.id, {})
+                listening_mean = rollup_mean(student_rollups.get('listening'))
+                reading_mean = rollup_mean(student_rollups.get('reading'))
+                writing_teacher_mean = rollup_mean(student_rollups.get('writing'), 'teacher_band')
+                student_map[s.id] = {
+                    'id': s.id,
+                    'group': s.group or '',
+                    'listening_bands': [listening_mean] if listening_mean is not None else [],
+                    'reading_bands': [reading_mean] if reading_mean is not None else [],
+                    'writing_teacher_scores': [writing_teacher_mean] if writing_teacher_mean is not None else [],
+                }
+        else:
+            essays = Essay.objects.filter(test_session__in=writing_sessions)
+            listening_results = ListeningTestResult.objects.filter(session__in=listening_sessions)
+            reading_results = ReadingTestResult.objects.filter(session__in=reading_sessions)
+            teacher_feedbacks = TeacherFeedback.objects.filter(essay__in=essays)
+
+            for s in students:
+                student_map[s.id] = {
+                    'id': s.id,
+                    'group': s.group or '',
+                    'listening_bands': [],
+                    'reading_bands': [],
+                    'writing_teacher_scores': [],
+                }
 
-        for res in listening_results.select_related('session__user'):
-            user_id = res.session.user_id
-            data = student_map.get(user_id)
-            if data and res.band_score is not None:
-                data['listening_bands'].append(res.band_score)
+            for res in listening_results.select_related('session__user'):
+                user_id = res.session.user_id
+                data = student_map.get(user_id)
+                if data and res.band_score is not None:
+                    data['listening_bands'].append(res.band_score)
 
-        for res in reading_results.select_related('session__user'):
-            user_id = res.session.user_id
-            data = student_map.get(user_id)
-            if data and res.band_score is not None:
-                data['reading_bands'].append(res.band_score)
+            for res in reading_results.select_related('session__user'):
+                user_id = res.session.user_id
+                data = student_map.get(user_id)
+                if data and res.band_score is not None:
+                    data['reading_bands'].append(res.band_score)
 
-        for fb in teacher_feedbacks.select_related('essay__user'):
-            user_id = fb.essay.user_id
-            data = student_map.get(user_id)
-            if data and fb.teacher_overall_score is not None:
-                data['writing_teacher_scores'].append(fb.teacher_overall_score)
+            for fb in teacher_feedbacks.select_related('essay__user'):
+                user_id = fb.essay.user_id
+                data = student_map.get(user_id)
+                if data and fb.teacher_overall_score is not None:
+                    data['writing_teacher_scores'].append(fb.teacher_overall_score)
 
         groups_buckets = {}
         for student_id, data in student_map.items():
@@ -6794,14 +6925,9 @@ class CuratorSpeakingOverviewView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher__icontains=teacher)
+            students = filter_students_by_teacher(students, teacher, partial=True)
         if search:
-            students = students.filter(
-                models.Q(first_name__icontains=search) |
-                models.Q(last_name__icontains=search) |
-                models.Q(student_id__icontains=search) |
-                models.Q(email__icontains=search)
-            )
+            students = search_users(students, search)
 
         base_sessions = SpeakingSession.objects.filter(student__in=students)
         all_sessions = apply_date_range_filter(base_sessions, request, 'conducted_at')
@@ -6912,49 +7038,38 @@ class CuratorSpeakingExportCSVView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher__icontains=teacher)
+            students = filter_students_by_teacher(students, teacher, partial=True)
         if search:
-            students = students.filter(
-                models.Q(first_name__icontains=search) |
-                models.Q(last_name__icontains=search) |
-                models.Q(student_id__icontains=search) |
-                models.Q(email__icontains=search)
-            )
+            students = search_users(students, search)
         
         sessions = SpeakingSession.objects.filter(student__in=students).select_related('student', 'teacher')
         sessions = apply_date_range_filter(sessions, request, 'conducted_at').order_by('-conducted_at')
         
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="speaking_sessions_export.csv"'
-        response.write('\ufeff'.encode('utf8'))  # UTF-8 BOM
-        
-        writer = csv.writer(response)
-        
         header = [
             'Student ID', 'Student Name', 'Group', 'Teacher',
             'Session ID', 'Completed', 'Overall Band', 'Fluency Score', 'Lexical Score', 
             'Grammar Score', 'Pronunciation Score', 'Duration (seconds)', 'Conducted At'
         ]
-        writer.writerow(header)
-        
-        for session in sessions:
-            writer.writerow([
-                session.student.student_id or '',
-                f"{session.student.first_name} {session.student.last_name}",
-                session.student.group or '',
-                session.student.teacher or '',
-                session.id,
-                'Yes' if session.completed else 'No',
-                ielts_round_score(session.overall_band_score) or '',
-                ielts_round_score(session.fluency_coherence_score) or '',
-                ielts_round_score(session.lexical_resource_score) or '',
-                ielts_round_score(session.grammatical_range_score) or '',
-                ielts_round_score(session.pronunciation_score) or '',
-                session.duration_seconds or '',
-                session.conducted_at.strftime('%Y-%m-%d %H:%M:%S') if session.conducted_at else ''
-            ])
-        
-        return response
+
+        def rows():
+            for session in sessions.iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE):
+                yield [
+                    session.student.student_id or '',
+                    f"{session.student.first_name} {session.student.last_name}",
+                    session.student.group or '',
+                    session.student.teacher or '',
+                    session.id,
+                    'Yes' if session.completed else 'No',
+                    ielts_round_score(session.overall_band_score) or '',
+                    ielts_round_score(session.fluency_coherence_score) or '',
+                    ielts_round_score(session.lexical_resource_score) or '',
+                    ielts_round_score(session.grammatical_range_score) or '',
+                    ielts_round_score(session.pronunciation_score) or '',
+                    session.duration_seconds or '',
+                    session.conducted_at.strftime('%Y-%m-%d %H:%M:%S') if session.conducted_at else ''
+                ]
+
+        return streaming_csv_response('speaking_sessions_export.csv', header, rows())
 
 
 class CuratorOverviewExportCSVView(APIView):
@@ -6974,7 +7089,7 @@ class CuratorOverviewExportCSVView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher=teacher)
+            students = filter_students_by_teacher(students, teacher)
         
         # Get active tests
         active_writing_tests = WritingTest.objects.filter(is_active=True)
@@ -6998,12 +7113,6 @@ class CuratorOverviewExportCSVView(APIView):
         # Get essays from writing sessions
         essays = Essay.objects.filter(test_session__in=writing_sessions)
         
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="curator_overview_export.csv"'
-        response.write('\ufeff'.encode('utf8'))  # UTF-8 BOM
-        
-        writer = csv.writer(response)
-        
         header = [
             'Student ID', 'Student Name', 'Group', 'Teacher',
             'Writing Sessions', 'Writing Completed', 'Writing Avg Score',
@@ -7012,78 +7121,78 @@ class CuratorOverviewExportCSVView(APIView):
             'Speaking Sessions', 'Speaking Completed', 'Speaking Avg Score',
             'Last Activity Date', 'Last Activity Type'
         ]
-        writer.writerow(header)
-        
-        for student in students:
-            # Writing data
-            student_writing_sessions = writing_sessions.filter(user=student)
-            student_essays = essays.filter(user=student)
-            writing_completed = student_essays.filter(overall_band__isnull=False).count()
-            writing_avg = ielts_round_score(student_essays.aggregate(avg=models.Avg('overall_band'))['avg'])
-            
-            # Listening data
-            student_listening_sessions = listening_sessions.filter(user=student)
-            listening_submitted = student_listening_sessions.filter(submitted=True).count()
-            listening_avg_score = student_listening_sessions.aggregate(avg=models.Avg('score'))['avg'] or 0
-            listening_results = ListeningTestResult.objects.filter(session__in=student_listening_sessions)
-            listening_avg_band = ielts_round_score(listening_results.aggregate(avg=models.Avg('band_score'))['avg'] or 0)
-            
-            # Reading data
-            student_reading_sessions = reading_sessions.filter(user=student)
-            reading_completed = student_reading_sessions.filter(completed=True).count()
-            reading_results = ReadingTestResult.objects.filter(session__in=student_reading_sessions)
-            reading_avg_score = reading_results.aggregate(avg=models.Avg('raw_score'))['avg'] or 0
-            reading_avg_band = ielts_round_score(reading_results.aggregate(avg=models.Avg('band_score'))['avg'] or 0)
-            
-            # Speaking data
-            student_speaking_sessions = speaking_sessions.filter(student=student)
-            speaking_completed = student_speaking_sessions.filter(completed=True).count()
-            speaking_avg = ielts_round_score(student_speaking_sessions.aggregate(avg=models.Avg('overall_band_score'))['avg'] or 0)
-            
-            # Last activity
-            last_activities = []
-            if student_writing_sessions.exists():
-                last_writing = student_writing_sessions.order_by('-started_at').first()
-                last_activities.append(('Writing', last_writing.started_at))
-            if student_listening_sessions.exists():
-                last_listening = student_listening_sessions.order_by('-completed_at').first()
-                if last_listening and last_listening.completed_at:
-                    last_activities.append(('Listening', last_listening.completed_at))
-            if student_reading_sessions.exists():
-                last_reading = student_reading_sessions.order_by('-end_time').first()
-                if last_reading and last_reading.end_time:
-                    last_activities.append(('Reading', last_reading.end_time))
-            if student_speaking_sessions.exists():
-                last_speaking = student_speaking_sessions.order_by('-conducted_at').first()
-                if last_speaking and last_speaking.conducted_at:
-                    last_activities.append(('Speaking', last_speaking.conducted_at))
-            
-            last_activity = max(last_activities, key=lambda x: x[1]) if last_activities else (None, None)
-            
-            writer.writerow([
-                student.student_id or '',
-                f"{student.first_name} {student.last_name}",
-                student.group or '',
-                student.teacher or '',
-                student_writing_sessions.count(),
-                writing_completed,
-                writing_avg or 0,
-                student_listening_sessions.count(),
-                listening_submitted,
-                round(listening_avg_score, 1),
-                listening_avg_band or 0,
-                student_reading_sessions.count(),
-                reading_completed,
-                round(reading_avg_score, 1),
-                reading_avg_band or 0,
-                student_speaking_sessions.count(),
-                speaking_completed,
-                speaking_avg or 0,
-                last_activity[1].strftime('%Y-%m-%d %H:%M:%S') if last_activity[1] else '',
-                last_activity[0] or ''
-            ])
-        
-        return response
+
+        def rows():
+            for student in students.iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE):
+                # Writing data
+                student_writing_sessions = writing_sessions.filter(user=student)
+                student_essays = essays.filter(user=student)
+                writing_completed = student_essays.filter(overall_band__isnull=False).count()
+                writing_avg = ielts_round_score(student_essays.aggregate(avg=models.Avg('overall_band'))['avg'])
+
+                # Listening data
+                student_listening_sessions = listening_sessions.filter(user=student)
+                listening_submitted = student_listening_sessions.filter(submitted=True).count()
+                listening_avg_score = student_listening_sessions.aggregate(avg=models.Avg('score'))['avg'] or 0
+                listening_results = ListeningTestResult.objects.filter(session__in=student_listening_sessions)
+                listening_avg_band = ielts_round_score(listening_results.aggregate(avg=models.Avg('band_score'))['avg'] or 0)
+
+                # Reading data
+                student_reading_sessions = reading_sessions.filter(user=student)
+                reading_completed = student_reading_sessions.filter(completed=True).count()
+                reading_results = ReadingTestResult.objects.filter(session__in=student_reading_sessions)
+                reading_avg_score = reading_results.aggregate(avg=models.Avg('raw_score'))['avg'] or 0
+                reading_avg_band = ielts_round_score(reading_results.aggregate(avg=models.Avg('band_score'))['avg'] or 0)
+
+                # Speaking data
+                student_speaking_sessions = speaking_sessions.filter(student=student)
+                speaking_completed = student_speaking_sessions.filter(completed=True).count()
+                speaking_avg = ielts_round_score(student_speaking_sessions.aggregate(avg=models.Avg('overall_band_score'))['avg'] or 0)
+
+                # Last activity
+                last_activities = []
+                if student_writing_sessions.exists():
+                    last_writing = student_writing_sessions.order_by('-started_at').first()
+                    last_activities.append(('Writing', last_writing.started_at))
+                if student_listening_sessions.exists():
+                    last_listening = student_listening_sessions.order_by('-completed_at').first()
+                    if last_listening and last_listening.completed_at:
+                        last_activities.append(('Listening', last_listening.completed_at))
+                if student_reading_sessions.exists():
+                    last_reading = student_reading_sessions.order_by('-end_time').first()
+                    if last_reading and last_reading.end_time:
+                        last_activities.append(('Reading', last_reading.end_time))
+                if student_speaking_sessions.exists():
+                    last_speaking = student_speaking_sessions.order_by('-conducted_at').first()
+                    if last_speaking and last_speaking.conducted_at:
+                        last_activities.append(('Speaking', last_speaking.conducted_at))
+
+                last_activity = max(last_activities, key=lambda x: x[1]) if last_activities else (None, None)
+
+                yield [
+                    student.student_id or '',
+                    f"{student.first_name} {student.last_name}",
+                    student.group or '',
+                    student.teacher or '',
+                    student_writing_sessions.count(),
+                    writing_completed,
+                    writing_avg or 0,
+                    student_listening_sessions.count(),
+                    listening_submitted,
+                    round(listening_avg_score, 1),
+                    listening_avg_band or 0,
+                    student_reading_sessions.count(),
+                    reading_completed,
+                    round(reading_avg_score, 1),
+                    reading_avg_band or 0,
+                    student_speaking_sessions.count(),
+                    speaking_completed,
+                    speaking_avg or 0,
+                    last_activity[1].strftime('%Y-%m-%d %H:%M:%S') if last_activity[1] else '',
+                    last_activity[0] or ''
+                ]
+
+        return streaming_csv_response('curator_overview_export.csv', header, rows())
 
 
 class CuratorWritingExportCSVView(APIView):
@@ -7101,7 +7210,7 @@ class CuratorWritingExportCSVView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher=teacher)
+            students = filter_students_by_teacher(students, teacher)
         
         # Get writing sessions
         sessions = WritingTestSession.objects.filter(user__in=students)
@@ -7109,13 +7218,9 @@ class CuratorWritingExportCSVView(APIView):
             sessions = sessions.filter(test_id=writing_test_id)
         
         # Get essays from writing sessions
-        essays = Essay.objects.filter(test_session__in=sessions).select_related('user', 'test_session', 'teacher_feedback')
-        
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="curator_writing_export.csv"'
-        response.write('\ufeff'.encode('utf8'))  # UTF-8 BOM
-        
-        writer = csv.writer(response)
+        essays = Essay.objects.filter(test_session__in=sessions).select_related(
+            'user', 'test_session__test', 'teacher_feedback__teacher'
+        )
         
         header = [
             'Student ID', 'Student Name', 'Group', 'Teacher',
@@ -7124,40 +7229,40 @@ class CuratorWritingExportCSVView(APIView):
             'Teacher Task Score', 'Teacher Coherence Score', 'Teacher Lexical Score', 'Teacher Grammar Score', 'Teacher Overall Score',
             'Feedback Status', 'Feedback Published', 'Teacher Name', 'Feedback Created At', 'Feedback Published At'
         ]
-        writer.writerow(header)
-        
-        for essay in essays:
-            user = essay.user
-            word_count = len(essay.submitted_text.split()) if essay.submitted_text else 0
-            feedback = getattr(essay, 'teacher_feedback', None)
-            
-            writer.writerow([
-                user.student_id or '',
-                f"{user.first_name} {user.last_name}",
-                user.group or '',
-                user.teacher or '',
-                essay.test_session.test.title if essay.test_session and essay.test_session.test else '',
-                essay.task_type.upper(),
-                essay.submitted_at.strftime('%Y-%m-%d %H:%M:%S') if essay.submitted_at else '',
-                word_count,
-                ielts_round_score(essay.score_task) or '',
-                ielts_round_score(essay.score_coherence) or '',
-                ielts_round_score(essay.score_lexical) or '',
-                ielts_round_score(essay.score_grammar) or '',
-                ielts_round_score(essay.overall_band) or '',
-                ielts_round_score(feedback.teacher_task_score) if feedback else '',
-                ielts_round_score(feedback.teacher_coherence_score) if feedback else '',
-                ielts_round_score(feedback.teacher_lexical_score) if feedback else '',
-                ielts_round_score(feedback.teacher_grammar_score) if feedback else '',
-                ielts_round_score(feedback.teacher_overall_score) if feedback else '',
-                'Published' if feedback and feedback.published else ('Draft' if feedback else 'No Feedback'),
-                'Yes' if feedback and feedback.published else 'No',
-                f"{feedback.teacher.first_name} {feedback.teacher.last_name}" if feedback and feedback.teacher else '',
-                feedback.created_at.strftime('%Y-%m-%d %H:%M:%S') if feedback and feedback.created_at else '',
-                feedback.published_at.strftime('%Y-%m-%d %H:%M:%S') if feedback and feedback.published_at else ''
-            ])
-        
-        return response
+
+        def rows():
+            for essay in essays.iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE):
+                user = essay.user
+                word_count = len(essay.submitted_text.split()) if essay.submitted_text else 0
+                feedback = getattr(essay, 'teacher_feedback', None)
+
+                yield [
+                    user.student_id or '',
+                    f"{user.first_name} {user.last_name}",
+                    user.group or '',
+                    user.teacher or '',
+                    essay.test_session.test.title if essay.test_session and essay.test_session.test else '',
+                    essay.task_type.upper(),
+                    essay.submitted_at.strftime('%Y-%m-%d %H:%M:%S') if essay.submitted_at else '',
+                    word_count,
+                    ielts_round_score(essay.score_task) or '',
+                    ielts_round_score(essay.score_coherence) or '',
+                    ielts_round_score(essay.score_lexical) or '',
+                    ielts_round_score(essay.score_grammar) or '',
+                    ielts_round_score(essay.overall_band) or '',
+                    ielts_round_score(feedback.teacher_task_score) if feedback else '',
+                    ielts_round_score(feedback.teacher_coherence_score) if feedback else '',
+                    ielts_round_score(feedback.teacher_lexical_score) if feedback else '',
+                    ielts_round_score(feedback.teacher_grammar_score) if feedback else '',
+                    ielts_round_score(feedback.teacher_overall_score) if feedback else '',
+                    'Published' if feedback and feedback.published else ('Draft' if feedback else 'No Feedback'),
+                    'Yes' if feedback and feedback.published else 'No',
+                    f"{feedback.teacher.first_name} {feedback.teacher.last_name}" if feedback and feedback.teacher else '',
+                    feedback.created_at.strftime('%Y-%m-%d %H:%M:%S') if feedback and feedback.created_at else '',
+                    feedback.published_at.strftime('%Y-%m-%d %H:%M:%S') if feedback and feedback.published_at else ''
+                ]
+
+        return streaming_csv_response('curator_writing_export.csv', header, rows())
 
 
 class ReadingTestResultView(APIView):
@@ -7230,7 +7335,7 @@ class CuratorTestComparisonView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher=teacher)
+            students = filter_students_by_teacher(students, teacher)
         
         # Get test data for each test
         tests_data = []
@@ -7662,7 +7767,7 @@ class CuratorTestComparisonExportCSVView(APIView):
         if group:
             students = students.filter(group=group)
         if teacher:
-            students = students.filter(teacher=teacher)
+            students = filter_students_by_teacher(students, teacher)
         
         # Get comparison data
         comparison_view = CuratorTestComparisonView()
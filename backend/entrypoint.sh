@@ -12,6 +12,15 @@ fi
 
 python manage.py collectstatic --noinput
 python manage.py migrate --noinput
+# Fill in dashboard rollups for students without rows (new or cleared by a migration)
+python manage.py rebuild_rollups --missing
+
+# Session sync buffer: drain the journal the request-triggered flushes leave behind
+case "$SESSION_SYNC_BUFFER" in
+  [Tt][Rr][Uu][Ee])
+    python manage.py flush_session_sync --interval "${SESSION_SYNC_FLUSH_INTERVAL:-15}" &
+    ;;
+esac
 
 exec gunicorn ielts_platform.wsgi:application \
   --bind 0.0.0.0:8000 \
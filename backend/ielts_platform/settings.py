@@ -32,6 +32,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',  # Security headers first
+    'core.request_metrics.RequestMetricsMiddleware',  # Per-view latency and query counts
+    'core.query_guard.QueryGuardMiddleware',  # Repeated-query (N+1) warnings, see QUERY_GUARD_MODE
     'corsheaders.middleware.CorsMiddleware',
     'csp.middleware.CSPMiddleware',  # Content Security Policy
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -176,6 +178,67 @@ CSP_FRAME_ANCESTORS = ("'none'",)  # Prevent clickjacking
 
 FIREBASE_CERT_PATH = BASE_DIR / "core" / "firebase_credentials.json"
 
+# Verified-token and uid->User caches used by core.auth.FirebaseAuthentication
+FIREBASE_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv('FIREBASE_TOKEN_CACHE_MAX_ENTRIES', '10000'))
+FIREBASE_USER_CACHE_MAX_ENTRIES = int(os.getenv('FIREBASE_USER_CACHE_MAX_ENTRIES', '5000'))
+FIREBASE_USER_CACHE_TTL = int(os.getenv('FIREBASE_USER_CACHE_TTL', '60'))  # seconds
+
+# ID token verification: 'firebase_admin' (default) or 'local' (in-process, prefetched key set)
+FIREBASE_TOKEN_VERIFICATION = os.getenv('FIREBASE_TOKEN_VERIFICATION', 'firebase_admin')
+FIREBASE_PROJECT_ID = os.getenv('FIREBASE_PROJECT_ID', '')
+FIREBASE_PUBLIC_KEYS_URL = os.getenv(
+    'FIREBASE_PUBLIC_KEYS_URL',
+    'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com',
+)
+FIREBASE_PUBLIC_KEYS_FILE = os.getenv('FIREBASE_PUBLIC_KEYS_FILE', str(BASE_DIR / "core" / "firebase_public_keys.json"))
+
+# Session sync buffer (core.sync_buffer): coalesce autosave PATCHes in a shared cache
+# and write them to the DB in periodic batches. Needs a cache shared by all gunicorn
+# workers (set REDIS_URL); with the local-memory fallback the buffer stays off.
+REDIS_URL = os.getenv('REDIS_URL', '')
+SESSION_SYNC_BUFFER = os.getenv('SESSION_SYNC_BUFFER', 'False').lower() == 'true'
+SESSION_SYNC_FLUSH_INTERVAL = int(os.getenv('SESSION_SYNC_FLUSH_INTERVAL', '15'))  # seconds
+# Journal entries written by the flush a sync request triggers; `manage.py flush_session_sync`
+# (started next to gunicorn by entrypoint.sh when the buffer is on) drains whatever is left
+SESSION_SYNC_FLUSH_REQUEST_LIMIT = int(os.getenv('SESSION_SYNC_FLUSH_REQUEST_LIMIT', '200'))
+SESSION_SYNC_STATE_TTL = int(os.getenv('SESSION_SYNC_STATE_TTL', str(6 * 60 * 60)))  # seconds
+
+# Essay scoring queue (core.scoring_jobs): finishing a writing session only enqueues
+# the AI scoring; `python manage.py run_scoring_worker` must be running to process it.
+ESSAY_SCORING_ASYNC = os.getenv('ESSAY_SCORING_ASYNC', 'False').lower() == 'true'
+ESSAY_SCORING_MAX_ATTEMPTS = int(os.getenv('ESSAY_SCORING_MAX_ATTEMPTS', '5'))
+ESSAY_SCORING_RETRY_BASE = int(os.getenv('ESSAY_SCORING_RETRY_BASE', '15'))  # seconds, doubled per attempt
+ESSAY_SCORING_RETRY_MAX = int(os.getenv('ESSAY_SCORING_RETRY_MAX', '600'))  # seconds
+ESSAY_SCORING_VISIBILITY_TIMEOUT = int(os.getenv('ESSAY_SCORING_VISIBILITY_TIMEOUT', '300'))  # seconds
+# Shared deadline for the parallel Task 1/Task 2 calls when scoring inside the request
+# (kept below the gunicorn --timeout of 120s)
+ESSAY_SCORING_DEADLINE = int(os.getenv('ESSAY_SCORING_DEADLINE', '90'))  # seconds
+
+# Request instrumentation (core.request_metrics): per-route latency/query histograms,
+# JSON at /api/admin/request-metrics/, Prometheus text at /api/metrics/ (needs the token)
+REQUEST_METRICS_ENABLED = os.getenv('REQUEST_METRICS_ENABLED', 'True').lower() == 'true'
+REQUEST_METRICS_SAMPLE_RATE = float(os.getenv('REQUEST_METRICS_SAMPLE_RATE', '1.0'))  # share of requests recorded
+REQUEST_METRICS_SLOW_MS = int(os.getenv('REQUEST_METRICS_SLOW_MS', '1000'))  # log requests slower than this
+REQUEST_METRICS_TOKEN = os.getenv('REQUEST_METRICS_TOKEN', '')
+
+# N+1 detection (core.query_guard): 'warn' logs, 'raise' fails the request, 'off' disables.
+# A statement shape repeated more than QUERY_GUARD_THRESHOLD times in one request is reported.
+QUERY_GUARD_MODE = os.getenv('QUERY_GUARD_MODE', 'warn' if DEBUG else 'off')
+QUERY_GUARD_THRESHOLD = int(os.getenv('QUERY_GUARD_THRESHOLD', '10'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'session_sync': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'session-sync',
+    },
+}
+
 # Настройки логирования - убираем лишние логи в production
 LOGGING = {
     'version': 1,
@@ -220,5 +283,15 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'core.request_metrics': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'core.query_guard': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
\ No newline at end of file
@@ -191,7 +191,7 @@ const ListeningTestPlayer = () => {
 
   const loadTest = async () => {
     try {
-      const response = await api.get(`/listening-tests/${testId}/`);
+      const response = await api.get(`/listening-tests/${testId}/student/`);
       const testData = response.data;
       // Нормализуем вопросы для каждой части
       if (Array.isArray(testData.parts)) {
@@ -298,7 +298,7 @@ const ReadingTestPlayer = ({ testId: propTestId, onComplete }) => {
             setAnswers(migratedAnswers);
             answersRef.current = migratedAnswers;
 
-            const testResponse = await api.get(`/reading-tests/${testId}/`);
+            const testResponse = await api.get(`/reading-tests/${testId}/student/`);
             const testData = testResponse.data;
             
             // Сортируем части по part_number для правильного порядка
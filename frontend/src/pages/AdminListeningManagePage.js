@@ -162,12 +162,12 @@ const AdminListeningManagePage = () => {
                         size="small"
                       />
                       <Chip 
-                        label={`${test.parts?.length || 0} sections`} 
+                        label={`${test.parts_count || 0} sections`} 
                         variant="outlined"
                         size="small"
                       />
                       <Chip 
-                        label={`${test.parts?.reduce((total, part) => total + (part.questions?.length || 0), 0) || 0} questions`} 
+                        label={`${test.questions_count || 0} questions`} 
                         variant="outlined"
                         size="small"
                       />
@@ -130,12 +130,12 @@ const AdminReadingManagePage = () => {
                         size="small"
                       />
                       <Chip
-                        label={`${test.parts?.length || 0} parts`}
+                        label={`${test.parts_count || 0} parts`}
                         variant="outlined"
                         size="small"
                       />
                       <Chip
-                        label={`${test.parts?.reduce((total, part) => total + (part.questions?.length || 0), 0) || 0} questions`}
+                        label={`${test.questions_count || 0} questions`}
                         variant="outlined"
                         size="small"
                       />
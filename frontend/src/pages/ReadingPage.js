@@ -200,7 +200,7 @@ const ReadingPage = () => {
                                         </svg>
                                     </div>
                                     <span className="font-bold text-base md:text-lg text-gray-800">
-                                        {test.parts?.length || 0}
+                                        {test.parts_count || 0}
                                     </span>
                                     <span className="text-[10px] md:text-xs text-gray-600 font-medium">Parts</span>
                                 </div>
@@ -11,6 +11,8 @@ const TeacherSpeakingPage = () => {
   const [sessions, setSessions] = useState([]);
   const [loading, setLoading] = useState(true);
   const [studentsLoading, setStudentsLoading] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedStudentId, setSelectedStudentId] = useState('');
   const [showFilters, setShowFilters] = useState(false);
   const [studentFilters, setStudentFilters] = useState({
@@ -22,23 +24,45 @@ const TeacherSpeakingPage = () => {
     last_to: ''
   });
 
+  const fetchStudents = async (filters, cursor) => {
+    const params = new URLSearchParams();
+    Object.entries(filters || {}).forEach(([key, value]) => {
+      if (value) params.append(key, value);
+    });
+    if (cursor) params.append('cursor', cursor);
+    const response = await api.get(`/teacher/speaking/students/?${params.toString()}`);
+    return response.data;
+  };
+
   const loadStudents = async (filters = studentFilters) => {
     setStudentsLoading(true);
     try {
-      const params = new URLSearchParams();
-      Object.entries(filters || {}).forEach(([key, value]) => {
-        if (value) params.append(key, value);
-      });
-      const response = await api.get(`/teacher/speaking/students/?${params.toString()}`);
-      setStudents(response.data.students || []);
+      const data = await fetchStudents(filters);
+      setStudents(data.students || []);
+      setNextCursor(data.next_cursor || null);
     } catch (error) {
       console.error('Error loading students:', error);
       setStudents([]);
+      setNextCursor(null);
     } finally {
       setStudentsLoading(false);
     }
   };
 
+  const loadMoreStudents = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const data = await fetchStudents(studentFilters, nextCursor);
+      setStudents(prev => [...prev, ...(data.students || [])]);
+      setNextCursor(data.next_cursor || null);
+    } catch (error) {
+      console.error('Error loading more students:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const loadSessions = async (filters = studentFilters, studentId = selectedStudentId) => {
     try {
       const params = new URLSearchParams();
@@ -141,7 +165,7 @@ const TeacherSpeakingPage = () => {
             <div className="mt-6 sm:mt-0 flex items-center space-x-4">
               <div className="bg-white px-4 py-2 rounded-lg shadow-sm border">
                 <div className="text-sm text-gray-600">Total Students</div>
-                <div className="text-2xl font-bold text-indigo-600">{students.length}</div>
+                <div className="text-2xl font-bold text-indigo-600">{students.length}{nextCursor ? '+' : ''}</div>
               </div>
               <div className="bg-white px-4 py-2 rounded-lg shadow-sm border">
                 <div className="text-sm text-gray-600">Completed Sessions</div>
@@ -250,15 +274,28 @@ const TeacherSpeakingPage = () => {
                 {studentsLoading ? (
                   <LoadingSpinner text="Loading students..." />
                 ) : students.length > 0 ? (
-                  <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
-                    {students.map((student) => (
-                      <StudentCard
-                        key={student.id}
-                        student={student}
-                        onStartNewSession={handleStartNewSession}
-                      />
-                    ))}
-                  </div>
+                  <>
+                    <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
+                      {students.map((student) => (
+                        <StudentCard
+                          key={student.id}
+                          student={student}
+                          onStartNewSession={handleStartNewSession}
+                        />
+                      ))}
+                    </div>
+                    {nextCursor && (
+                      <div className="mt-6 text-center">
+                        <button
+                          onClick={loadMoreStudents}
+                          disabled={loadingMore}
+                          className="px-6 py-2 border border-gray-300 rounded-lg text-sm font-medium text-gray-700 hover:bg-gray-50 disabled:opacity-50 transition-colors"
+                        >
+                          {loadingMore ? 'Loading...' : 'Load more'}
+                        </button>
+                      </div>
+                    )}
+                  </>
                 ) : (
                   <div className="text-center py-12">
                     <div className="w-16 h-16 bg-gray-100 rounded-full flex items-center justify-center mx-auto mb-4">
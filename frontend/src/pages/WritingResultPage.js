@@ -27,6 +27,22 @@ const roundToIELTSBand = (score) => {
   }
 };
 
+const SCORING_POLL_INTERVAL_MS = 3000;
+const SCORING_POLL_MAX_TRIES = 60;
+
+// Polls the scoring status until the session's essays leave the AI scoring queue
+const waitForScoring = async (sessionId) => {
+  for (let i = 0; i < SCORING_POLL_MAX_TRIES; i++) {
+    try {
+      const res = await api.get(`/writing-sessions/${sessionId}/scoring-status/`);
+      if (res.data.status !== 'pending') return;
+    } catch (err) {
+      return;
+    }
+    await new Promise((resolve) => setTimeout(resolve, SCORING_POLL_INTERVAL_MS));
+  }
+};
+
 const WritingResultPage = () => {
   const { sessionId, essayId } = useParams();
   const [essays, setEssays] = useState([]);
@@ -48,6 +64,9 @@ const WritingResultPage = () => {
         setEssays([res.data]);
         setOverallBand(roundToIELTSBand(res.data.overall_band));
       } else if (sessionId) {
+        // Essays may still be in the AI scoring queue
+        await waitForScoring(sessionId);
+
         // Get session with test info first
         const sessionRes = await api.get(`/writing-test-sessions/${sessionId}/`);
         const session = sessionRes.data;